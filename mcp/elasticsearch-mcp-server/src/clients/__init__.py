@@ -25,12 +25,23 @@ def create_search_client(engine_type: str) -> SearchClient:
     username = os.environ.get(f"{prefix}_USERNAME")
     password = os.environ.get(f"{prefix}_PASSWORD")
     verify_certs = os.environ.get(f"{prefix}_VERIFY_CERTS", "false").lower() == "true"
+    # Connection pool and transport tuning
+    pool_maxsize = int(os.environ.get(f"{prefix}_POOL_MAXSIZE", "10"))
+    keepalive_expiry = float(os.environ.get(f"{prefix}_KEEPALIVE_EXPIRY", "30"))
+    http_compress = os.environ.get(f"{prefix}_HTTP_COMPRESS", "false").lower() == "true"
+    retry_on_timeout = os.environ.get(f"{prefix}_RETRY_ON_TIMEOUT", "false").lower() == "true"
+    max_retries = int(os.environ.get(f"{prefix}_MAX_RETRIES", "3"))
     
     config = {
         "hosts": hosts,
         "username": username,
         "password": password,
-        "verify_certs": verify_certs
+        "verify_certs": verify_certs,
+        "pool_maxsize": pool_maxsize,
+        "keepalive_expiry": keepalive_expiry,
+        "http_compress": http_compress,
+        "retry_on_timeout": retry_on_timeout,
+        "max_retries": max_retries,
     }
     
     return SearchClient(config, engine_type)
@@ -4,9 +4,10 @@ import warnings
 from typing import Dict
 
 from elasticsearch import Elasticsearch
-import httpx
 from opensearchpy import OpenSearch
 
+from src.clients.rest import DEFAULT_KEEPALIVE_EXPIRY, DEFAULT_POOL_MAXSIZE, GeneralRestClient
+
 class SearchClientBase(ABC):
     def __init__(self, config: Dict, engine_type: str):
         """
@@ -25,6 +26,13 @@ class SearchClientBase(ABC):
         username = config.get("username")
         password = config.get("password")
         verify_certs = config.get("verify_certs", False)
+        pool_maxsize = config.get("pool_maxsize", DEFAULT_POOL_MAXSIZE)
+        keepalive_expiry = config.get("keepalive_expiry", DEFAULT_KEEPALIVE_EXPIRY)
+        transport_options = {
+            "http_compress": config.get("http_compress", False),
+            "retry_on_timeout": config.get("retry_on_timeout", False),
+            "max_retries": config.get("max_retries", 3),
+        }
         
         # Disable insecure request warnings if verify_certs is False
         if not verify_certs:
@@ -42,14 +50,18 @@ class SearchClientBase(ABC):
             self.client = Elasticsearch(
                 hosts=hosts,
                 basic_auth=(username, password) if username and password else None,
-                verify_certs=verify_certs
+                verify_certs=verify_certs,
+                connections_per_node=pool_maxsize,
+                **transport_options,
             )
             self.logger.info(f"Elasticsearch client initialized with hosts: {hosts}")
         elif engine_type == "opensearch":
             self.client = OpenSearch(
                 hosts=hosts,
                 http_auth=(username, password) if username and password else None,
-                verify_certs=verify_certs
+                verify_certs=verify_certs,
+                pool_maxsize=pool_maxsize,
+                **transport_options,
             )
             self.logger.info(f"OpenSearch client initialized with hosts: {hosts}")
         else:
@@ -62,26 +74,6 @@ class SearchClientBase(ABC):
             username=username,
             password=password,
             verify_certs=verify_certs,
+            pool_maxsize=pool_maxsize,
+            keepalive_expiry=keepalive_expiry,
         )
-
-class GeneralRestClient:
-    def __init__(self, base_url: str, username: str, password: str, verify_certs: bool):
-        self.base_url = base_url.rstrip("/")
-        self.auth = (username, password) if username and password else None
-        self.verify_certs = verify_certs
-
-    def request(self, method, path, params=None, body=None):
-        url = f"{self.base_url}/{path.lstrip('/')}"
-        with httpx.Client(verify=self.verify_certs) as client:
-            resp = client.request(
-                method=method.upper(),
-                url=url,
-                params=params,
-                json=body,
-                auth=self.auth
-            )
-            resp.raise_for_status()
-            ct = resp.headers.get("content-type", "")
-            if ct.startswith("application/json"):
-                return resp.json()
-            return resp.text
@@ -0,0 +1,73 @@
+import threading
+
+import httpx
+
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+DEFAULT_TIMEOUT = 5.0  # same as the httpx default
+
+class GeneralRestClient:
+    """
+    Plain REST client for APIs without a dedicated tool.
+
+    One pooled httpx.Client is shared by all requests, so connections (and the
+    TLS session) are kept alive and reused instead of being re-established for
+    every call.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        username: str,
+        password: str,
+        verify_certs: bool,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.auth = (username, password) if username and password else None
+        self.verify_certs = verify_certs
+        self.limits = httpx.Limits(
+            max_connections=pool_maxsize,
+            max_keepalive_connections=pool_maxsize,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> httpx.Client:
+        """The shared client (created on first use)."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        base_url=self.base_url,
+                        auth=self.auth,
+                        verify=self.verify_certs,
+                        limits=self.limits,
+                        timeout=self.timeout,
+                    )
+        return self._client
+
+    def request(self, method, path, params=None, body=None):
+        resp = self.client.request(
+            method=method.upper(),
+            url=f"/{path.lstrip('/')}",
+            params=params,
+            json=body,
+        )
+        resp.raise_for_status()
+        ct = resp.headers.get("content-type", "")
+        if ct.startswith("application/json"):
+            return resp.json()
+        return resp.text
+
+    def close(self):
+        """Close pooled connections."""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
@@ -45,7 +45,10 @@ class SearchMCPServer:
 
     def run(self):
         """Run the MCP server."""
-        self.mcp.run()
+        try:
+            self.mcp.run()
+        finally:
+            self.search_client.general_client.close()
 
 def run_search_server(engine_type):
     """Run search server with specified engine type."""
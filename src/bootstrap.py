@@ -1,23 +1,76 @@
 # src/bootstrap.py
+from typing import TYPE_CHECKING, Any, Optional, Set
+
 from elasticsearch import Elasticsearch
 
 from .config import AppConfig
+from .db.achievements import (
+    AchievementEngine,
+    find_achievement_engine,
+    get_achievement_engine,
+)
+from .db.attempt_store import AttemptStore, find_attempt_store, get_attempt_store
+from .db.book_watcher import BookSnapshot, RepositoryRegistry
+from .db.points import PointsEngine, find_points_engine, get_points_engine
 from .db.quest_repository import QuestRepository
+from .db.quest_stats import (
+    QuestStatsStore,
+    find_quest_stats_store,
+    get_quest_stats_store,
+)
+from .db.sqlite_quest_repository import book_name, get_sqlite_quest_repository
 from .es.client import get_es_client  # 実装は後述
+from .es.resilience import configure_resilience
 from .exceptions import ElasticsearchError
+from .services.core_logic import evict_quest_evaluators
+from .utils.executor import run_blocking
+from .utils.timing import span
+
+if TYPE_CHECKING:
+    from .services.recommender import Recommender
+
+_repository_registry: Optional[RepositoryRegistry] = None
+
+
+def _evict_changed_evaluators(snapshot: BookSnapshot, changed: Set[Any]) -> None:
+    """ブックの差し替え時に、変更されたクエストの Evaluator だけを破棄する"""
+    evict_quest_evaluators(changed)
+
+
+def get_repository_registry() -> RepositoryRegistry:
+    """
+    プロセス共通の RepositoryRegistry を返す (初回呼び出し時に作成)。
+
+    ブックは一度だけ読み込まれ、以降の変更は BookWatcher が検出して差し替える。
+    """
+    global _repository_registry
+    if _repository_registry is None:
+        _repository_registry = RepositoryRegistry()
+        _repository_registry.add_reload_listener(_evict_changed_evaluators)
+    return _repository_registry
 
 
 async def initialize_database(config: AppConfig) -> QuestRepository:
     """
     QuestRepository を取得して返す。
 
+    読み込み済みのブックの場合は、現在のスナップショットのリポジトリを返す。
+    カタログ (SQLite) を使う設定の場合は、book_path のブックのリポジトリを返す。
+
     Args:
         config: アプリケーション設定オブジェクト.
 
     Returns:
         初期化されたQuestRepositoryインスタンス.
     """
-    return QuestRepository(config.book_path)
+    with span("repository.load"):
+        if config.quest_repository_backend == "sqlite":
+            return await run_blocking(
+                get_sqlite_quest_repository,
+                config.catalog_path,
+                book_name(config.book_path),
+            )
+        return await get_repository_registry().get(config.book_path)
 
 
 async def initialize_elasticsearch(config: AppConfig) -> Elasticsearch:
@@ -34,9 +87,14 @@ async def initialize_elasticsearch(config: AppConfig) -> Elasticsearch:
         ElasticsearchError: Elasticsearchへの接続やクライアント初期化に失敗した場合.
     """
     try:
+        # 操作ごとのタイムアウトとサーキットブレーカーの設定
+        configure_resilience(config)
         # get_es_client は設定オブジェクトを受け取るように変更
-        es_client = get_es_client(config)
-        if not es_client.ping():
+        with span("es.client_init"):
+            es_client = await run_blocking(get_es_client, config)
+        with span("es.ping"):
+            is_alive = await run_blocking(es_client.ping)
+        if not is_alive:
             raise ElasticsearchError(
                 "Elasticsearch に接続できません。"
                 "設定とサーバーの状態を確認してください。"
@@ -61,6 +119,11 @@ class AppContainer:
         self._quest_repo = None
         self._es_client = None
 
+    @property
+    def book(self) -> str:
+        """設定のブックの名前 (提出の記録などでクエストIDと組にする)"""
+        return book_name(self.config.book_path)
+
     @property
     async def quest_repository(self) -> QuestRepository:
         if self._quest_repo is None:
@@ -73,5 +136,59 @@ class AppContainer:
             self._es_client = await initialize_elasticsearch(self.config)
         return self._es_client
 
+    @property
+    async def attempt_store(self) -> AttemptStore:
+        store = find_attempt_store(self.config.db_path)
+        if store is None:
+            # 初回のみ既存の記録を読み込むため、イベントループの外で作成する
+            store = await run_blocking(get_attempt_store, self.config.db_path)
+        return store
+
+    @property
+    async def points_engine(self) -> PointsEngine:
+        store = await self.attempt_store
+        engine = find_points_engine(store)
+        if engine is None:
+            # 初回のみ累計を読み込むため、イベントループの外で作成する
+            engine = await run_blocking(get_points_engine, store)
+        return engine
+
+    @property
+    async def quest_stats(self) -> QuestStatsStore:
+        attempt_store = await self.attempt_store
+        store = find_quest_stats_store(attempt_store)
+        if store is None:
+            # 初回のみ集計値を読み込むため、イベントループの外で作成する
+            store = await run_blocking(get_quest_stats_store, attempt_store)
+        return store
+
+    @property
+    async def achievement_engine(self) -> AchievementEngine:
+        store = await self.attempt_store
+        quest_repo = await self.quest_repository
+        engine = find_achievement_engine(store)
+        if engine is None:
+            # 初回のみ保存済みの状態を読み込むため、イベントループの外で作成する
+            engine = await run_blocking(
+                get_achievement_engine, store, quest_repo, self.book
+            )
+        else:
+            engine.register_quests(quest_repo, self.book)
+        return engine
+
+    @property
+    async def recommender(self) -> "Recommender":
+        # numpy の読み込みに時間がかかるため、初めて使うときに読み込む
+        from .services.recommender import find_recommender, get_recommender
+
+        store = await self.attempt_store
+        quest_repo = await self.quest_repository
+        book = self.book
+        recommender = find_recommender(store, book)
+        if recommender is None or recommender.quest_repo is not quest_repo:
+            # スキルグラフの計算はイベントループの外で行う
+            recommender = await run_blocking(get_recommender, store, book, quest_repo)
+        return recommender
+
     # 必要に応じて Service のインスタンスもここで生成・管理できる
     # def quest_service(self) -> QuestService: ...
@@ -1,6 +1,8 @@
 # src/cli.py (修正済みコード全体 - 2025-04-14)
 import asyncio
+import getpass
 import sys
+import time
 import traceback  # traceback をインポート
 from pathlib import Path
 
@@ -11,11 +13,17 @@ from .config import (  # 設定関連
     DEFAULT_DB_FILE_PATH,
     DEFAULT_INDEX_NAME,
     load_config,
+    load_env,
 )
+from .db.attempt_store import DEFAULT_USER_ID
+from .es.query_analyzer import QueryLimits
 from .exceptions import QuestCliError  # アプリケーション例外
 from .services.agent_service import AgentService  # サービス
 from .services.quest_service import QuestService  # サービス
+from .utils.log import configure_logging, correlation_scope
+from .utils.loop_monitor import ensure_loop_monitor
 from .utils.query_loader import load_query_from_source  # クエリローダー
+from .utils.timing import current_recorder, record_span, recording, span
 from .view import QuestView  # View
 
 
@@ -52,11 +60,12 @@ async def run_quest_flow(
 ):
     """クエスト実行の非同期フロー"""
     # 1. クエストを取得 (QuestService 内部でリポジトリ使用)
-    quest = quest_service.get_quest(quest_id)
+    with span("get_quest"):
+        quest = await quest_service.fetch_quest(quest_id)
     await view.display_quest_details(quest)
 
     # 2. ユーザーのクエリを取得
-    user_query_str = load_query_from_source(
+    user_query = load_query_from_source(
         query_str=query_str_arg,
         query_file=query_file_arg,
         # prompt_func=await view.prompt_for_query
@@ -64,7 +73,7 @@ async def run_quest_flow(
         # else None,
     )
     await view.display_info("\n--- 提出されたクエリ ---")
-    click.echo(user_query_str)
+    click.echo(user_query.pretty)
 
     # 3. クエリを実行し、ルールベースで評価 (QuestService 内部で ES クライアント使用)
     (
@@ -72,7 +81,7 @@ async def run_quest_flow(
         rule_eval_message,
         rule_feedback,
         es_response,
-    ) = await quest_service.execute_and_evaluate(quest, user_query_str)
+    ) = await quest_service.execute_and_evaluate(quest, user_query)
 
     # 4. 結果を表示
     await view.display_elasticsearch_response(es_response)
@@ -84,7 +93,7 @@ async def run_quest_flow(
         await view.display_info("\n🤖 LLMエージェントによる評価を実行中...")
         try:
             agent_feedback = await agent_service.run_evaluation_agent(
-                quest, user_query_str, rule_eval_message
+                quest, user_query, rule_eval_message
             )
             await view.display_feedback("🤖 AI評価フィードバック", agent_feedback)
         except QuestCliError as e:
@@ -100,6 +109,11 @@ async def run_quest_flow(
     else:
         await view.display_retry_message()
 
+    # 7. 処理時間の内訳 (計測が有効な場合のみ)
+    recorder = current_recorder()
+    if recorder is not None:
+        await view.display_timings(recorder)
+
 
 # --- 非同期処理のラッパー (初期化と例外処理担当) ---
 async def main_wrapper(
@@ -109,8 +123,28 @@ async def main_wrapper(
     query_str_arg: str | None,
     query_file_arg: Path | None,
     skip_agent: bool,
+    config_load_seconds: float = 0.0,
+    user_id: str | None = None,
 ):
     """非同期の初期化、実行、例外処理を行う"""
+    ensure_loop_monitor()
+    with correlation_scope(), recording("cli"):
+        # 設定のロードは非同期処理の前に済んでいるため計測済みの値を記録する
+        record_span("config.load", config_load_seconds)
+        await _main_wrapper(
+            config, view, quest_id, query_str_arg, query_file_arg, skip_agent, user_id
+        )
+
+
+async def _main_wrapper(
+    config: dict,
+    view: QuestView,
+    quest_id: int,
+    query_str_arg: str | None,
+    query_file_arg: Path | None,
+    skip_agent: bool,
+    user_id: str | None,
+):
     container = None  # エラーハンドリング用に初期化
     try:
         # --- DIコンテナの初期化 ---
@@ -123,9 +157,22 @@ async def main_wrapper(
         #       -> await container.quest_repository
         quest_repo = await container.quest_repository
         es_client = await container.es_client
+        attempt_store = await container.attempt_store
 
         # --- サービスのインスタンス化 ---
-        quest_service = QuestService(quest_repo, es_client, config.index_name)
+        quest_service = QuestService(
+            quest_repo,
+            es_client,
+            config.index_name,
+            attempt_store=attempt_store,
+            user_id=user_id or DEFAULT_USER_ID,
+            points_engine=await container.points_engine,
+            achievement_engine=await container.achievement_engine,
+            quest_stats=await container.quest_stats,
+            recommender=await container.recommender,
+            query_limits=QueryLimits.from_config(config),
+            book=container.book,
+        )
         agent_service = AgentService(config, view)
 
         # --- メインの非同期フローを実行 ---
@@ -158,6 +205,14 @@ async def main_wrapper(
             sys.exit(1)
 
 
+def _default_user_id() -> str:
+    """OS のユーザー名 (取得できない環境では匿名のユーザーID)"""
+    try:
+        return getpass.getuser()
+    except (OSError, KeyError):
+        return DEFAULT_USER_ID
+
+
 # --- CLIコマンド本体 (エントリーポイント、同期処理担当) ---
 @click.command()
 @click.argument("quest_id", type=int)
@@ -191,6 +246,13 @@ async def main_wrapper(
     default=False,
     help="LLMエージェントによる評価をスキップする。",
 )
+@click.option(
+    "--user_id",
+    type=str,
+    default=None,
+    help="提出を記録するユーザーID (デフォルト: OS のユーザー名)。"
+    "試行回数に応じてヒントが変わる。",
+)
 def cli(
     quest_id: int,
     query: str | None,
@@ -198,6 +260,7 @@ def cli(
     db_path: Path | None,
     index_name: str | None,
     skip_agent: bool,
+    user_id: str | None,
 ):
     """
     Elasticsearch Quest CLI: 指定されたIDのクエストに挑戦します。
@@ -207,14 +270,18 @@ def cli(
     # View は最初に同期的に初期化
     # (非同期処理内でエラーが出ても最低限の表示はできるように)
     view = QuestView()
+    load_env()
+    configure_logging()
 
     try:
         # 1. 設定のロード (同期処理)
         # ここで ValidationError などが発生する可能性あり
+        config_load_started = time.perf_counter()
         config = load_config(
             db_path_override=db_path,
             index_name_override=index_name,
         )
+        config_load_seconds = time.perf_counter() - config_load_started
 
         # 2. 非同期処理の実行 (初期化は main_wrapper 内で行う)
         # asyncio.run は、内部 (main_wrapper) で捕捉されなかった例外を再送出する
@@ -226,6 +293,8 @@ def cli(
                 query_str_arg=query,
                 query_file_arg=query_file,
                 skip_agent=skip_agent,
+                config_load_seconds=config_load_seconds,
+                user_id=user_id or _default_user_id(),
             )
         )
 
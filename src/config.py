@@ -1,20 +1,35 @@
 # src/config.py
 from pathlib import Path
+from typing import Literal
 
 from dotenv import load_dotenv
 from pydantic import AnyHttpUrl, ConfigDict, Field, FilePath, field_validator
 from pydantic_settings import BaseSettings
 
-# .env ファイルをロード (プロジェクトルートにある想定)
-load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / ".env")
-
 # --- 定数 ---
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DEFAULT_DATA_DIR = PROJECT_ROOT / "data"
 DEFAULT_DB_FILE_PATH = DEFAULT_DATA_DIR / "quests.db"
+DEFAULT_CATALOG_PATH = DEFAULT_DATA_DIR / "catalog.db"
 DEFAULT_FIXTURES_DIR = PROJECT_ROOT / "fixtures"
 DEFAULT_INDEX_NAME = "sample_books"
 DEFAULT_BOOK_FILE = DEFAULT_FIXTURES_DIR / "books" / "default.json"
+DEFAULT_ENV_FILE = PROJECT_ROOT / ".env"
+
+_env_loaded = False
+
+
+def load_env() -> None:
+    """
+    .env ファイル (プロジェクトルートにある想定) を環境変数にロードする。
+
+    インポート時ではなく、設定が必要になったときに1回だけ実行する。
+    ロギングなど load_config より前に環境変数を参照する処理の前にも呼び出す。
+    """
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv(dotenv_path=DEFAULT_ENV_FILE)
+        _env_loaded = True
 
 
 # --- 設定クラス ---
@@ -28,6 +43,69 @@ class AppConfig(BaseSettings):
         default=DEFAULT_INDEX_NAME, alias="ES_INDEX_NAME"
     )  # 環境変数名を指定
 
+    # クエストの読み込み元 ("json": ブックのファイル、"sqlite": 取り込み済みのカタログ)
+    # sqlite の場合は book_path のファイル名 (拡張子を除く) をブック名として使う
+    quest_repository_backend: Literal["json", "sqlite"] = Field(
+        default="json", alias="ES_QUEST_REPOSITORY_BACKEND"
+    )
+    catalog_path: Path = Field(
+        default=DEFAULT_CATALOG_PATH, alias="ES_QUEST_CATALOG_PATH"
+    )
+
+    # ユーザーのクエリを実行前に検査する制限 (src/es/query_analyzer.py)
+    query_limits_enabled: bool = Field(default=True, alias="ES_QUEST_QUERY_LIMITS")
+    query_max_size: int = Field(default=100, alias="ES_QUEST_QUERY_MAX_SIZE")
+    query_max_result_window: int = Field(
+        default=1000, alias="ES_QUEST_QUERY_MAX_RESULT_WINDOW"
+    )
+    query_max_aggregation_buckets: int = Field(
+        default=1000, alias="ES_QUEST_QUERY_MAX_AGGREGATION_BUCKETS"
+    )
+    query_max_knn_candidates: int = Field(
+        default=1000, alias="ES_QUEST_QUERY_MAX_KNN_CANDIDATES"
+    )
+    query_max_cost: float = Field(default=1000.0, alias="ES_QUEST_QUERY_MAX_COST")
+    # 使用を禁止するクエリの種類 (カンマ区切り。例: "regexp,script")
+    query_forbidden_types: str = Field(
+        default="", alias="ES_QUEST_QUERY_FORBIDDEN_TYPES"
+    )
+    # リクエストに付与する timeout (これより長い指定は置き換える)
+    query_timeout: str = Field(default="5s", alias="ES_QUEST_QUERY_TIMEOUT")
+    # シャードごとに収集するドキュメント数の上限 (0 の場合は付与しない)
+    query_terminate_after: int = Field(
+        default=100000, alias="ES_QUEST_QUERY_TERMINATE_AFTER"
+    )
+
+    # Elasticsearch の呼び出しのタイムアウト (秒) とサーキットブレーカー
+    # (src/es/resilience.py)。ブレーカーは連続した失敗の回数で開く (0 で無効)
+    es_request_timeout: float = Field(default=60.0, alias="ES_QUEST_ES_REQUEST_TIMEOUT")
+    es_search_timeout: float = Field(default=10.0, alias="ES_QUEST_ES_SEARCH_TIMEOUT")
+    es_mapping_timeout: float = Field(default=10.0, alias="ES_QUEST_ES_MAPPING_TIMEOUT")
+    es_bulk_timeout: float = Field(default=120.0, alias="ES_QUEST_ES_BULK_TIMEOUT")
+    es_breaker_failures: int = Field(default=5, alias="ES_QUEST_ES_BREAKER_FAILURES")
+    es_breaker_reset_seconds: float = Field(
+        default=30.0, alias="ES_QUEST_ES_BREAKER_RESET_SECONDS"
+    )
+
+    # 接続プールと転送の設定 (src/es/client.py)
+    # ノードごとに保持する接続数 (接続は keep-alive で使い回す)
+    es_connections_per_node: int = Field(
+        default=10, alias="ES_QUEST_ES_CONNECTIONS_PER_NODE"
+    )
+    # MCP Server の REST クライアントが空いた接続を保持する秒数
+    es_keepalive_expiry: float = Field(
+        default=30.0, alias="ES_QUEST_ES_KEEPALIVE_EXPIRY"
+    )
+    # リクエストとレスポンスを gzip で圧縮する
+    es_http_compress: bool = Field(default=False, alias="ES_QUEST_ES_HTTP_COMPRESS")
+    # 起動時とノードの障害時にクラスタのノードを取得する (Elastic Cloud では無効)
+    es_sniff: bool = Field(default=False, alias="ES_QUEST_ES_SNIFF")
+    # タイムアウトした場合も別のノードで再試行する
+    es_retry_on_timeout: bool = Field(
+        default=False, alias="ES_QUEST_ES_RETRY_ON_TIMEOUT"
+    )
+    es_max_retries: int = Field(default=3, alias="ES_QUEST_ES_MAX_RETRIES")
+
     # Elasticsearch接続情報
     elasticsearch_url: AnyHttpUrl | None = Field(
         default=None, alias="ELASTICSEARCH_URL"
@@ -89,6 +167,7 @@ def load_config(
     Raises:
         pydantic.ValidationError: 設定値のバリデーションに失敗した場合.
     """
+    load_env()
     # pydantic-settings は自動で環境変数を読み込む
     # CLI引数による上書きを考慮
     override_values = {}
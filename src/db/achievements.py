@@ -0,0 +1,625 @@
+# src/db/achievements.py
+"""
+アチーブメント (バッジ)。
+
+提出の評価結果を AttemptEvent として受け取り、ルールごとにユーザー単位の
+状態 (正解したクエストの集合、連続正解数など) を少しずつ更新する。
+過去の提出の履歴をたどり直すことはしない。
+
+ルールは「どのイベントのフィールドがどの値のときに状態が変わるか」
+(conditions) を宣言し、エンジンはそれを (フィールド, 値) で索引しておく。
+イベントが来たら索引から候補のルールだけを取り出して評価するため、
+ルールが増えても1回の提出で評価するルールは影響を受けるものに限られる。
+
+状態と獲得済みのアチーブメントは AttemptStore と同じ DB に、同じ書き込み
+スレッドで書き込む。ルールを追加・変更した場合は、サーバーを停止して
+提出の記録から状態を再構築できる。クエストIDはブックごとの番号なので、
+正解したクエストは (ブック, クエストID) の組で数える。再構築では使っている
+ブックをすべて指定する (省略した場合は fixtures/books のすべてのブック)。
+
+    python -m src.db.achievements --db data/quests.db \
+        --book fixtures/books/default.json --book fixtures/books/part2.json
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import click
+
+from src.config import DEFAULT_FIXTURES_DIR
+from src.db.attempt_store import DEFAULT_BOOK, AttemptStore
+from src.db.quest_repository import QuestRepository
+from src.db.sqlite_quest_repository import book_name
+from src.models.quest import Quest
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS achievement_states (
+    user_id TEXT NOT NULL,
+    achievement_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (user_id, achievement_id)
+);
+CREATE TABLE IF NOT EXISTS user_achievements (
+    user_id TEXT NOT NULL,
+    achievement_id TEXT NOT NULL,
+    unlocked_at REAL NOT NULL,
+    PRIMARY KEY (user_id, achievement_id)
+);
+"""
+
+_UPSERT_STATE = (
+    "INSERT OR REPLACE INTO achievement_states "
+    "(user_id, achievement_id, state, updated_at) VALUES (?, ?, ?, ?)"
+)
+_INSERT_UNLOCK = (
+    "INSERT OR IGNORE INTO user_achievements "
+    "(user_id, achievement_id, unlocked_at) VALUES (?, ?, ?)"
+)
+
+# (SQL 文, パラメータ) を書き込む関数 (AttemptStore.enqueue_write など)
+Writer = Callable[[str, Tuple], None]
+
+# ルールを索引するフィールドの優先順 (値の種類が多く、候補を絞り込めるものから)
+_INDEX_PRIORITY = (
+    "quest_id",
+    "attempt_number",
+    "difficulty",
+    "evaluation_type",
+    "book",
+    "is_correct",
+    "user_id",
+)
+
+
+def _solved_key(event: "AttemptEvent") -> List:
+    """状態に保存する正解済みのクエスト ([ブック, クエストID]、JSON で保存できる形)"""
+    return [event.book, event.quest_id]
+
+
+def _solved_keys(solved: List) -> List[List]:
+    """以前の形式 (クエストIDだけ) で保存された状態は既定のブックのものとして扱う"""
+    return [key if isinstance(key, list) else [DEFAULT_BOOK, key] for key in solved]
+
+
+@dataclass(frozen=True)
+class AttemptEvent:
+    """1回分の提出の評価結果"""
+
+    user_id: str
+    quest_id: int
+    attempt_number: int
+    is_correct: bool
+    difficulty: int
+    evaluation_type: str
+    created_at: float = field(default_factory=time.time)
+    # クエストのブック (クエストIDはブックごとの番号)
+    book: str = DEFAULT_BOOK
+
+    @classmethod
+    def from_result(
+        cls,
+        user_id: str,
+        quest: Quest,
+        attempt_number: int,
+        is_correct: bool,
+        created_at: Optional[float] = None,
+        book: str = DEFAULT_BOOK,
+    ) -> "AttemptEvent":
+        return cls(
+            user_id=user_id,
+            quest_id=quest.quest_id,
+            attempt_number=attempt_number,
+            is_correct=is_correct,
+            difficulty=quest.difficulty,
+            evaluation_type=quest.evaluation_type,
+            created_at=time.time() if created_at is None else created_at,
+            book=book,
+        )
+
+
+class AchievementRule:
+    """
+    アチーブメントの獲得条件。
+
+    conditions にはイベントのフィールドと、状態の更新が必要な値を指定する
+    (すべてのフィールドが一致したイベントだけが update に渡される)。
+    空の場合はすべてのイベントが渡される。状態は JSON で保存できる値にする。
+    """
+
+    achievement_id: str
+    title: str
+    description: str
+    conditions: Mapping[str, FrozenSet] = {}
+
+    def initial_state(self) -> Any:
+        return 0
+
+    def update(self, state: Any, event: AttemptEvent) -> Any:
+        raise NotImplementedError
+
+    def is_achieved(self, state: Any) -> bool:
+        raise NotImplementedError
+
+    def matches(self, event: AttemptEvent) -> bool:
+        return all(
+            getattr(event, name) in values for name, values in self.conditions.items()
+        )
+
+
+class QuestClearCountRule(AchievementRule):
+    """異なるクエストを count 個正解する (ブックが違えば別のクエスト)"""
+
+    def __init__(self, achievement_id: str, title: str, count: int):
+        self.achievement_id = achievement_id
+        self.title = title
+        self.description = f"{count} 個のクエストに正解する"
+        self.count = count
+        self.conditions = {"is_correct": frozenset([True])}
+
+    def initial_state(self) -> List[List]:
+        return []
+
+    def update(self, state: List, event: AttemptEvent) -> List[List]:
+        state = _solved_keys(state)
+        key = _solved_key(event)
+        if key in state:
+            return state
+        return state + [key]
+
+    def is_achieved(self, state: List) -> bool:
+        return len(state) >= self.count
+
+
+class QuestGroupRule(AchievementRule):
+    """ブックのクエスト群のすべてに正解する"""
+
+    def __init__(
+        self,
+        achievement_id: str,
+        title: str,
+        description: str,
+        quest_ids: Iterable,
+        book: str = DEFAULT_BOOK,
+    ):
+        self.achievement_id = achievement_id
+        self.title = title
+        self.description = description
+        self.quest_ids = frozenset(quest_ids)
+        self.book = book
+        self.conditions = {
+            "is_correct": frozenset([True]),
+            "quest_id": self.quest_ids,
+            "book": frozenset([book]),
+        }
+
+    def initial_state(self) -> List[int]:
+        return []
+
+    def update(self, state: List[int], event: AttemptEvent) -> List[int]:
+        if event.quest_id in state:
+            return state
+        return state + [event.quest_id]
+
+    def is_achieved(self, state: List[int]) -> bool:
+        return self.quest_ids.issubset(state)
+
+
+class FirstTryRule(AchievementRule):
+    """1回目の提出で正解することを count 回達成する"""
+
+    def __init__(self, achievement_id: str, title: str, count: int):
+        self.achievement_id = achievement_id
+        self.title = title
+        self.description = f"{count} 個のクエストに1回目の提出で正解する"
+        self.count = count
+        self.conditions = {
+            "is_correct": frozenset([True]),
+            "attempt_number": frozenset([1]),
+        }
+
+    def update(self, state: int, event: AttemptEvent) -> int:
+        return state + 1
+
+    def is_achieved(self, state: int) -> bool:
+        return state >= self.count
+
+
+class StreakRule(AchievementRule):
+    """
+    length 個のクエストに連続で正解する (不正解で途切れる)
+
+    数えるのは初めて正解した提出だけで、正解済みのクエストに正解を再提出しても
+    連続の回数は変わらない (同じ答えの貼り付けで達成できないようにする)。
+    状態は連続の回数と正解済みのクエスト ([ブック, クエストID]) を持つ。
+    """
+
+    def __init__(self, achievement_id: str, title: str, length: int):
+        self.achievement_id = achievement_id
+        self.title = title
+        self.description = f"{length} 個のクエストに連続で正解する"
+        self.length = length
+        # 正解・不正解のどちらでも状態が変わるため条件はない
+
+    def initial_state(self) -> Dict[str, Any]:
+        return {"streak": 0, "solved": []}
+
+    def update(self, state: Dict[str, Any], event: AttemptEvent) -> Dict[str, Any]:
+        if not isinstance(state, dict):
+            # 以前の形式 (回数だけ) で保存された状態は数え直す
+            state = self.initial_state()
+        solved = _solved_keys(state["solved"])
+        if not event.is_correct:
+            return {"streak": 0, "solved": solved}
+        key = _solved_key(event)
+        if key in solved:
+            return {"streak": state["streak"], "solved": solved}
+        return {"streak": state["streak"] + 1, "solved": solved + [key]}
+
+    def is_achieved(self, state: Dict[str, Any]) -> bool:
+        return isinstance(state, dict) and state["streak"] >= self.length
+
+
+class EvaluationTypeRule(AchievementRule):
+    """特定の評価タイプのクエストに初めて正解する"""
+
+    def __init__(
+        self, achievement_id: str, title: str, description: str, evaluation_type: str
+    ):
+        self.achievement_id = achievement_id
+        self.title = title
+        self.description = description
+        self.conditions = {
+            "is_correct": frozenset([True]),
+            "evaluation_type": frozenset([evaluation_type]),
+        }
+
+    def update(self, state: int, event: AttemptEvent) -> int:
+        return state + 1
+
+    def is_achieved(self, state: int) -> bool:
+        return state >= 1
+
+
+def default_rules() -> List[AchievementRule]:
+    """ブックによらないアチーブメント"""
+    return [
+        QuestClearCountRule("first_clear", "はじめの一歩", 1),
+        QuestClearCountRule("clear_10", "クエスト10個クリア", 10),
+        FirstTryRule("first_try_5", "一発正解の達人", 5),
+        StreakRule("streak_5", "5連続正解", 5),
+        EvaluationTypeRule(
+            "ranking_master",
+            "ランキングの探求者",
+            "検索結果の順序まで評価するクエストに正解する",
+            "doc_ids_in_order",
+        ),
+    ]
+
+
+def quest_group_rules(
+    quests: Iterable[Quest], book: str = DEFAULT_BOOK
+) -> List[AchievementRule]:
+    """
+    ブックの難易度ごとのクエスト群のアチーブメント。
+
+    ブックによってクエスト群が異なるため、ID にはクエストIDの集合の
+    ハッシュを含める (同じクエスト群なら同じ ID になる)。既定のブック以外は
+    ブック名もハッシュに含める (既定のブックの ID は以前と同じ)。
+    """
+    groups: Dict[int, Set[int]] = defaultdict(set)
+    for quest in quests:
+        groups[quest.difficulty].add(quest.quest_id)
+    rules: List[AchievementRule] = []
+    for difficulty, quest_ids in sorted(groups.items()):
+        key = ",".join(map(str, sorted(quest_ids)))
+        if book != DEFAULT_BOOK:
+            key = f"{book}:{key}"
+        digest = hashlib.blake2b(key.encode(), digest_size=4).hexdigest()
+        rules.append(
+            QuestGroupRule(
+                f"clear_difficulty_{difficulty}_{digest}",
+                f"難易度 {difficulty} 制覇",
+                f"難易度 {difficulty} のクエスト {len(quest_ids)} 個すべてに正解する",
+                quest_ids,
+                book,
+            )
+        )
+    return rules
+
+
+@dataclass(frozen=True)
+class Unlocked:
+    """獲得したアチーブメント"""
+
+    achievement_id: str
+    title: str
+    description: str
+
+    def message(self) -> str:
+        return f"🏅 アチーブメント獲得: {self.title} ({self.description})"
+
+
+class AchievementEngine:
+    """ルールを索引し、イベントごとに影響を受けるルールだけを評価する"""
+
+    def __init__(
+        self, rules: Iterable[AchievementRule] = (), writer: Optional[Writer] = None
+    ):
+        self.writer = writer
+        self._rules: Dict[str, AchievementRule] = {}
+        # (フィールド, 値) -> そのフィールドで索引したルール
+        self._index: Dict[Tuple[str, Any], List[AchievementRule]] = defaultdict(list)
+        self._unconditional: List[AchievementRule] = []
+        self._indexed_fields: Set[str] = set()
+        self._states: Dict[Tuple[str, str], Any] = {}
+        self._unlocked: Dict[str, Set[str]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._registered_repos: "weakref.WeakSet[QuestRepository]" = weakref.WeakSet()
+        self.add_rules(rules)
+
+    @property
+    def rules(self) -> List[AchievementRule]:
+        return list(self._rules.values())
+
+    def add_rules(self, rules: Iterable[AchievementRule]) -> None:
+        """ルールを追加する (同じ ID のルールが登録済みの場合は無視する)"""
+        with self._lock:
+            for rule in rules:
+                if rule.achievement_id in self._rules:
+                    continue
+                self._rules[rule.achievement_id] = rule
+                if not rule.conditions:
+                    self._unconditional.append(rule)
+                    continue
+                # 条件のうち最も絞り込めるフィールドで索引する
+                # (残りの条件は matches で確認する)
+                name = min(rule.conditions, key=_INDEX_PRIORITY.index)
+                self._indexed_fields.add(name)
+                for value in rule.conditions[name]:
+                    self._index[(name, value)].append(rule)
+
+    def register_quests(
+        self, quest_repo: QuestRepository, book: str = DEFAULT_BOOK
+    ) -> None:
+        """ブックのクエスト群のルールを追加する (同じリポジトリは1回だけ)"""
+        if quest_repo in self._registered_repos:
+            return
+        self.add_rules(quest_group_rules(quest_repo.quests, book))
+        self._registered_repos.add(quest_repo)
+
+    def _candidates(self, event: AttemptEvent) -> List[AchievementRule]:
+        candidates = list(self._unconditional)
+        for name in self._indexed_fields:
+            candidates.extend(self._index.get((name, getattr(event, name)), ()))
+        return candidates
+
+    def process(self, event: AttemptEvent) -> List[Unlocked]:
+        """イベントで状態を更新し、新たに獲得したアチーブメントを返す"""
+        unlocked: List[Unlocked] = []
+        writes: List[Tuple[str, Tuple]] = []
+        with self._lock:
+            done = self._unlocked[event.user_id]
+            for rule in self._candidates(event):
+                if rule.achievement_id in done or not rule.matches(event):
+                    continue
+                key = (event.user_id, rule.achievement_id)
+                state = self._states.get(key)
+                if state is None:
+                    state = rule.initial_state()
+                new_state = rule.update(state, event)
+                if new_state == state and key in self._states:
+                    continue
+                self._states[key] = new_state
+                writes.append(
+                    (
+                        _UPSERT_STATE,
+                        (*key, json.dumps(new_state), event.created_at),
+                    )
+                )
+                if rule.is_achieved(new_state):
+                    done.add(rule.achievement_id)
+                    writes.append((_INSERT_UNLOCK, (*key, event.created_at)))
+                    unlocked.append(
+                        Unlocked(rule.achievement_id, rule.title, rule.description)
+                    )
+        if self.writer is not None:
+            for sql, params in writes:
+                self.writer(sql, params)
+        return unlocked
+
+    def unlocked(self, user_id: str) -> List[str]:
+        """獲得済みのアチーブメントの ID"""
+        return sorted(self._unlocked.get(user_id, ()))
+
+    def state(self, user_id: str, achievement_id: str) -> Any:
+        return self._states.get((user_id, achievement_id))
+
+    def load(self, conn: sqlite3.Connection) -> None:
+        """保存済みの状態と獲得済みのアチーブメントを読み込む"""
+        conn.executescript(_SCHEMA)
+        with self._lock:
+            for user_id, achievement_id, state in conn.execute(
+                "SELECT user_id, achievement_id, state FROM achievement_states"
+            ):
+                self._states[(user_id, achievement_id)] = json.loads(state)
+            for user_id, achievement_id in conn.execute(
+                "SELECT user_id, achievement_id FROM user_achievements"
+            ):
+                self._unlocked[user_id].add(achievement_id)
+
+    def dump(self, conn: sqlite3.Connection) -> None:
+        """
+        登録済みのルールの状態と獲得済みのアチーブメントを、メモリ上の内容で
+        置き換える (登録していないルールの記録は残す)。
+        """
+        now = time.time()
+        owned = [(achievement_id,) for achievement_id in self._rules]
+        conn.executescript(_SCHEMA)
+        with conn:
+            conn.executemany(
+                "DELETE FROM achievement_states WHERE achievement_id = ?", owned
+            )
+            conn.executemany(
+                "DELETE FROM user_achievements WHERE achievement_id = ?", owned
+            )
+            conn.executemany(
+                _UPSERT_STATE,
+                [
+                    (user_id, achievement_id, json.dumps(state), now)
+                    for (user_id, achievement_id), state in self._states.items()
+                ],
+            )
+            conn.executemany(
+                _INSERT_UNLOCK,
+                [
+                    (user_id, achievement_id, now)
+                    for user_id, ids in self._unlocked.items()
+                    for achievement_id in ids
+                ],
+            )
+
+
+def rebuild_achievements(
+    db_path: Path,
+    books: Mapping[str, QuestRepository],
+    rules: Optional[Iterable[AchievementRule]] = None,
+) -> Dict[str, int]:
+    """
+    提出の記録 (attempts テーブル) を古い順に再生し、アチーブメントの状態を
+    作り直す。books はブック名とクエストのリポジトリの対応で、記録のブックが
+    books に無い場合や、クエストがブックに無い場合は読み飛ばす。
+    置き換えるのは rules (省略時は既定のルールと books のクエスト群のルール) の
+    記録だけなので、ブックによらないルールを正しく数えるには使っている
+    ブックをすべて指定する。
+
+    書き込み中の記録と競合しないよう、サーバーを停止してから実行する。
+
+    Returns:
+        再生した提出の数 (replayed)、読み飛ばした数 (skipped)、
+        獲得されたアチーブメントの数 (unlocked)。
+    """
+    quests = {
+        (book, quest.quest_id): quest
+        for book, quest_repo in books.items()
+        for quest in quest_repo.quests
+    }
+    if rules is None:
+        rules = default_rules()
+        for book, quest_repo in books.items():
+            rules += quest_group_rules(quest_repo.quests, book)
+    engine = AchievementEngine(rules)
+    stats = {"replayed": 0, "skipped": 0, "unlocked": 0}
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT user_id, book, quest_id, attempt_number, is_correct, created_at "
+            "FROM attempts ORDER BY attempt_id"
+        )
+        for user_id, book, quest_id, attempt_number, is_correct, created_at in rows:
+            quest = quests.get((book, quest_id))
+            if quest is None:
+                stats["skipped"] += 1
+                continue
+            event = AttemptEvent.from_result(
+                user_id, quest, attempt_number, bool(is_correct), created_at, book
+            )
+            stats["unlocked"] += len(engine.process(event))
+            stats["replayed"] += 1
+        engine.dump(conn)
+    finally:
+        conn.close()
+    return stats
+
+
+_engines: Dict[int, AchievementEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def find_achievement_engine(
+    attempt_store: AttemptStore,
+) -> Optional[AchievementEngine]:
+    """作成済みの AchievementEngine を返す (未作成の場合は None、I/O なし)"""
+    return _engines.get(id(attempt_store))
+
+
+def get_achievement_engine(
+    attempt_store: AttemptStore,
+    quest_repo: Optional[QuestRepository] = None,
+    book: str = DEFAULT_BOOK,
+) -> AchievementEngine:
+    """
+    attempt_store に対応する AchievementEngine を返す (初回呼び出し時に作成)。
+
+    quest_repo を指定した場合は、そのブック (book) のクエスト群のルールを追加する。
+    作成時に保存済みの状態を読み込むため、イベントループからはスレッドプールで
+    呼び出す。
+    """
+    engine = _engines.get(id(attempt_store))
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(id(attempt_store))
+            if engine is None:
+                engine = AchievementEngine(
+                    default_rules(), writer=attempt_store.enqueue_write
+                )
+                conn = sqlite3.connect(attempt_store.db_path)
+                try:
+                    engine.load(conn)
+                finally:
+                    conn.close()
+                _engines[id(attempt_store)] = engine
+    if quest_repo is not None:
+        engine.register_quests(quest_repo, book)
+    return engine
+
+
+@click.command()
+@click.option(
+    "--db",
+    "db_path",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=Path("data/quests.db"),
+    show_default=True,
+    help="提出の記録の DB",
+)
+@click.option(
+    "--book",
+    "book_paths",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    multiple=True,
+    help="再生するブック (複数指定可。省略時は fixtures/books のすべてのブック)",
+)
+def main(db_path: Path, book_paths: Tuple[Path, ...]):
+    """提出の記録からアチーブメントの状態を再構築する"""
+    if not book_paths:
+        book_paths = tuple(sorted((DEFAULT_FIXTURES_DIR / "books").glob("*.json")))
+    books = {book_name(path): QuestRepository(path) for path in book_paths}
+    stats = rebuild_achievements(db_path, books)
+    click.echo(
+        f"{db_path}: replayed {stats['replayed']} attempts "
+        f"(skipped {stats['skipped']}), {stats['unlocked']} achievements unlocked"
+    )
+
+
+if __name__ == "__main__":
+    main()
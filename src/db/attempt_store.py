@@ -0,0 +1,288 @@
+# src/db/attempt_store.py
+"""
+回答の提出 (試行) の記録。
+
+提出のたびに SQLite へ書き込むと回答の評価が書き込みを待つことになるため、
+記録はキューに積むだけにして、バックグラウンドのスレッドがまとめて
+書き込む (1トランザクションで executemany)。試行回数はユーザーとクエストの
+組ごとにメモリ上で数え、ヒントの出し分けにはこちらを使う。
+
+- 起動時に、既存の記録から試行回数を読み込む
+- 書き込みはバッチサイズに達したとき、または一定間隔ごとに行う
+- プロセスの終了時には残りを書き込んでから終了する
+- 同じ DB に記録する他の機能 (ポイントなど) も enqueue_write で書き込みを
+  相乗りできる (書き込みの順序は保たれる)。書き込む値が DB の内容で決まる
+  場合は、enqueue_call で書き込みスレッドのトランザクション内で関数を実行する
+
+複数のワーカープロセスで動かす場合、メモリ上の試行回数はプロセスごとに
+数える (スティッキーセッションにより、同じユーザーは同じワーカーに振り分けられる)。
+
+ブックごとにクエストIDが重なるため、記録はブック (カタログと同じ
+book_name(path) の名前) とクエストIDの組で区別する。book 列の追加前の記録は
+既定のブック (DEFAULT_BOOK) のものとして扱う (create_schema)。
+"""
+
+import atexit
+import itertools
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from src.utils.metrics import ATTEMPTS_PENDING, record_error
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_ID = "anonymous"
+# 既定のブック (fixtures/books/default.json) の名前
+DEFAULT_BOOK = "default"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    attempt_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    book TEXT NOT NULL,
+    quest_id INTEGER NOT NULL,
+    attempt_number INTEGER NOT NULL,
+    is_correct INTEGER NOT NULL,
+    query TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_attempts_user_book_quest
+    ON attempts (user_id, book, quest_id);
+"""
+
+_INSERT = (
+    "INSERT INTO attempts "
+    "(user_id, book, quest_id, attempt_number, is_correct, query, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+# キューの終端を表す値
+_STOP = object()
+
+
+def create_schema(conn: sqlite3.Connection, schema: str, tables: Sequence[str]) -> None:
+    """
+    スキーマを作成する。
+
+    tables のうち book 列の無い (追加前の) テーブルは作り直し、既存の行を
+    既定のブックのものとして移す。主キーに book を加えるため、列の追加ではなく
+    作り直す (1トランザクションで行う)。
+    """
+    script = []
+    moves = []
+    for table in tables:
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if columns and "book" not in columns:
+            names = ", ".join(columns)
+            script.append(f"ALTER TABLE {table} RENAME TO {table}_legacy;")
+            moves.append(
+                f"INSERT INTO {table} (book, {names}) "
+                f"SELECT '{DEFAULT_BOOK}', {names} FROM {table}_legacy;"
+                f"DROP TABLE {table}_legacy;"
+            )
+    if not script:
+        conn.executescript(schema)
+        return
+    conn.executescript("BEGIN;" + "".join(script) + schema + "".join(moves) + "COMMIT;")
+
+
+@dataclass(frozen=True)
+class Attempt:
+    """1回分の提出の記録"""
+
+    user_id: str
+    quest_id: int
+    attempt_number: int
+    is_correct: bool
+    query: str
+    created_at: float = field(default_factory=time.time)
+    book: str = DEFAULT_BOOK
+
+    def as_row(self) -> Tuple:
+        return (
+            self.user_id,
+            self.book,
+            self.quest_id,
+            self.attempt_number,
+            int(self.is_correct),
+            self.query,
+            self.created_at,
+        )
+
+
+class AttemptStore:
+    """試行回数をメモリ上で数え、記録はバックグラウンドでまとめて書き込むストア"""
+
+    def __init__(
+        self,
+        db_path: Path,
+        batch_size: int = 100,
+        flush_interval_seconds: float = 0.5,
+    ):
+        self.db_path = Path(db_path)
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        # (user_id, book, quest_id) -> 試行回数
+        self._counts: Dict[Tuple[str, str, int], int] = {}
+        self._counts_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # 接続は書き込みスレッド専用 (作成だけここで行い、スキーマと試行回数を読む)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        create_schema(self._conn, _SCHEMA, ["attempts"])
+        for user_id, book, quest_id, count in self._conn.execute(
+            "SELECT user_id, book, quest_id, MAX(attempt_number) FROM attempts "
+            "GROUP BY user_id, book, quest_id"
+        ):
+            self._counts[(user_id, book, quest_id)] = count
+
+        self._writer = threading.Thread(
+            target=self._write_loop, name="attempt-writer", daemon=True
+        )
+        self._writer.start()
+
+    def attempt_count(
+        self, user_id: str, quest_id: int, book: str = DEFAULT_BOOK
+    ) -> int:
+        """これまでの試行回数 (book のクエストへの提出だけを数える)"""
+        return self._counts.get((user_id, book, quest_id), 0)
+
+    def record(
+        self,
+        user_id: str,
+        quest_id: int,
+        is_correct: bool,
+        query: str,
+        book: str = DEFAULT_BOOK,
+    ) -> int:
+        """
+        提出を記録し、今回が何回目の試行かを返す。
+
+        書き込みはキューに積むだけなので、呼び出し元をブロックしない。
+        """
+        key = (user_id, book, quest_id)
+        with self._counts_lock:
+            attempt_number = self._counts.get(key, 0) + 1
+            self._counts[key] = attempt_number
+        attempt = Attempt(
+            user_id, quest_id, attempt_number, is_correct, query, book=book
+        )
+        self.enqueue_write(_INSERT, attempt.as_row())
+        return attempt_number
+
+    def enqueue_write(self, sql: str, params: Tuple) -> None:
+        """書き込みスレッドで実行する SQL 文をキューに積む"""
+        self._enqueue(sql, params)
+
+    def enqueue_call(self, func: Callable[..., None], *args: Any) -> None:
+        """
+        書き込みスレッドで func(接続, *args) を呼び出すようにキューに積む。
+
+        前後の SQL 文と同じトランザクションで実行される (例外が発生した場合は
+        バッチ全体がロールバックされる)。
+        """
+        self._enqueue(func, args)
+
+    def _enqueue(self, statement: Any, params: Tuple) -> None:
+        if self._closed:
+            logger.warning("attempt store is closed; write is not persisted")
+            return
+        self._queue.put((statement, params))
+        ATTEMPTS_PENDING.inc()
+
+    def _write_loop(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: List[Tuple[str, Tuple]] = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval_seconds)
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval_seconds
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(
+                        timeout=max(deadline - time.monotonic(), 0.0)
+                    )
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch: List[Tuple[str, Tuple]]) -> None:
+        if not batch:
+            return
+        try:
+            with self._conn:
+                # 連続する同じ SQL 文はまとめて実行する。同じ SQL 文は接続ごとに
+                # プリペアドステートメントとして再利用される
+                for sql, items in itertools.groupby(batch, key=lambda item: item[0]):
+                    if callable(sql):
+                        for _, args in items:
+                            sql(self._conn, *args)
+                    else:
+                        self._conn.executemany(sql, [params for _, params in items])
+        except sqlite3.Error as e:
+            record_error("attempt_store", e)
+            logger.error("failed to write %d attempts: %s", len(batch), e)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+            ATTEMPTS_PENDING.dec(len(batch))
+
+    def flush(self) -> None:
+        """キューに積まれた記録がすべて書き込まれるまで待つ"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """残りの記録を書き込んでから書き込みスレッドを終了する"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._conn.close()
+
+
+_stores: Dict[Path, AttemptStore] = {}
+_stores_lock = threading.Lock()
+
+
+def find_attempt_store(db_path: Path) -> Optional[AttemptStore]:
+    """作成済みの db_path の AttemptStore を返す (未作成の場合は None、I/O なし)"""
+    return _stores.get(Path(db_path).absolute())
+
+
+def get_attempt_store(db_path: Path) -> AttemptStore:
+    """
+    db_path の AttemptStore を返す (初回呼び出し時に作成)。
+
+    作成時に既存の記録を読み込むため、イベントループからはスレッドプールで呼び出す。
+    作成したストアはプロセスの終了時に閉じ、残りの記録を書き込む。
+    """
+    key = Path(db_path).absolute()
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None:
+                store = AttemptStore(key)
+                atexit.register(store.close)
+                _stores[key] = store
+    return store
@@ -1,26 +1,48 @@
 import json
 from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
 
+from src.db.compiled_book import CompiledBook, is_compiled_book
 from src.models.quest import Quest
+from src.utils.json_stream import iter_array_items, load_keys
+
+# これより小さい JSON のブックは逐次パースせずに一度に読み込む (その方が速い)
+STREAMING_THRESHOLD_BYTES = 1024 * 1024
 
 
 class BookRepository:
     """
     book.json を読み込んで管理するリポジトリクラス。
     'quests' キーの各要素を Quest オブジェクトのリストに変換します。
+    コンパイル済みブック (.eqb) も同じインターフェースで読み込めます。
+
+    大きな JSON のブックは必要なキーだけを逐次パースするため、クエストの読み込みで
+    sample_data を、sample_data の読み込みでクエストをメモリに展開しません。
     """
 
     def __init__(self, json_path: Path):
         self.json_path = json_path
 
+    def _load_small_book(self) -> Optional[Dict[str, Any]]:
+        """ブックが小さい場合は全体を読み込んで返し、大きい場合は None を返す"""
+        if self.json_path.stat().st_size >= STREAMING_THRESHOLD_BYTES:
+            return None
+        with self.json_path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
     def load_quests(self) -> list[Quest]:
         """
         book.json ファイルから 'quests' を読み込み、
         Quest オブジェクトのリストを返します。
         """
-        with self.json_path.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-        quests_data = data.get("quests", [])
+        if is_compiled_book(self.json_path):
+            with CompiledBook(self.json_path) as book:
+                return list(book.iter_quests())
+        book = self._load_small_book()
+        if book is not None:
+            quests_data = book.get("quests", [])
+        else:
+            quests_data = iter_array_items(self.json_path, "quests")
         quests = []
         for quest_dict in quests_data:
             if "evaluation_data" in quest_dict:
@@ -33,3 +55,35 @@ class BookRepository:
             _ = quest.hints
             quests.append(quest)
         return quests
+
+    def load_mappings(self) -> Dict[str, Any]:
+        """インデックス作成用のマッピング ('mappings' キー) を返します。"""
+        if is_compiled_book(self.json_path):
+            with CompiledBook(self.json_path) as book:
+                return book.metadata().get("mappings", {})
+        book = self._load_small_book()
+        if book is not None:
+            return book.get("mappings", {})
+        return load_keys(self.json_path, ["mappings"], default={})["mappings"]
+
+    def load_loadmap(self) -> List[Dict[str, Any]]:
+        """学習ロードマップの章のリスト ('loadmap' キー) を返します。"""
+        if is_compiled_book(self.json_path):
+            with CompiledBook(self.json_path) as book:
+                return book.metadata().get("loadmap", [])
+        book = self._load_small_book()
+        if book is not None:
+            return book.get("loadmap", [])
+        return load_keys(self.json_path, ["loadmap"], default=[])["loadmap"]
+
+    def iter_sample_data(self) -> Iterator[Dict[str, Any]]:
+        """インデックスに投入するドキュメント ('sample_data' キー) を返します。"""
+        if is_compiled_book(self.json_path):
+            with CompiledBook(self.json_path) as book:
+                yield from book.iter_sample_data()
+            return
+        book = self._load_small_book()
+        if book is not None:
+            yield from book.get("sample_data", [])
+            return
+        yield from iter_array_items(self.json_path, "sample_data")
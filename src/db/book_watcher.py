@@ -0,0 +1,263 @@
+# src/db/book_watcher.py
+"""
+ブックファイルのホットリロード。
+
+RepositoryRegistry はブックのパスごとに、読み込み済みの QuestRepository を
+不変のスナップショット (BookSnapshot) として保持する。BookWatcher が一定間隔で
+ファイルの更新日時とサイズを確認し、変更があればワーカースレッドで読み込みと
+検証を行ってから、スナップショットを丸ごと差し替える。
+
+- 差し替えは参照の付け替えだけで行うため、処理中のリクエストは開始時に
+  受け取ったリポジトリをそのまま使い続ける
+- 読み込みや検証に失敗した場合は以前のスナップショットを使い続ける
+- 差し替え時には、内容が変わったクエストの ID をリスナーに通知する
+  (Evaluator キャッシュの部分的な破棄などに使う)
+
+設定は環境変数で変更できる。
+    ES_QUEST_BOOK_WATCH_INTERVAL: 変更を確認する間隔 (秒、デフォルト: 1.0、0 で無効)
+"""
+
+import asyncio
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+from src.db.quest_repository import QuestRepository
+from src.utils.executor import run_blocking
+from src.utils.metrics import BOOK_RELOADS, record_error
+
+logger = logging.getLogger(__name__)
+
+WATCH_INTERVAL_ENV_VAR = "ES_QUEST_BOOK_WATCH_INTERVAL"
+DEFAULT_WATCH_INTERVAL = 1.0
+
+_watcher: Optional["BookWatcher"] = None
+
+
+@dataclass(frozen=True)
+class BookSnapshot:
+    """ある時点のブックから読み込んだリポジトリ。作成後は変更しない。"""
+
+    path: Path
+    repository: QuestRepository
+    signature: Tuple[int, int]  # (更新日時 ns, サイズ)
+    fingerprints: Mapping[Any, str]  # quest_id -> クエスト定義のハッシュ
+    version: int
+
+
+def book_signature(path: Path) -> Tuple[int, int]:
+    """変更の検出に使うファイルのシグネチャ (更新日時 ns, サイズ)"""
+    stat = Path(path).stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def quest_fingerprint(quest) -> str:
+    """クエスト定義のハッシュ。定義のどこかが変われば値も変わる。"""
+    encoded = json.dumps(
+        dataclasses.asdict(quest), sort_keys=True, ensure_ascii=False, default=str
+    ).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def record_fingerprint(record: bytes) -> str:
+    """コンパイル済みブックのクエストのレコード (エンコード済みの定義) のハッシュ"""
+    return hashlib.blake2b(record, digest_size=16).hexdigest()
+
+
+def load_snapshot(path: Path, version: int = 1) -> BookSnapshot:
+    """
+    ブックを読み込み、検証してスナップショットを作成する (ブロッキング)。
+
+    コンパイル済みブックはコンパイル時に検証済みのため、クエストをデコードせず
+    インデックスからたどったレコードのバイト列でハッシュを計算する。
+
+    Raises:
+        ValueError: クエストの定義が不正な場合や quest_id が重複している場合。
+        json.JSONDecodeError, OSError: ファイルが読めない場合。
+    """
+    path = Path(path)
+    # 読み込み中に書き換えられた場合は、次の確認で再度読み込まれる
+    signature = book_signature(path)
+    repository = QuestRepository(path)
+    fingerprints: Dict[Any, str] = {}
+    if repository.compiled_book is not None:
+        for quest_id, record in repository.compiled_book.iter_records():
+            fingerprints[quest_id] = record_fingerprint(record)
+        return BookSnapshot(path, repository, signature, fingerprints, version)
+    for quest in repository.quests:
+        # パース済みプロパティの評価を強制して、パースエラーを発生させる
+        _ = quest.evaluation_data
+        _ = quest.hints
+        if quest.quest_id in fingerprints:
+            raise ValueError(f"quest_id が重複しています: {quest.quest_id}")
+        fingerprints[quest.quest_id] = quest_fingerprint(quest)
+    return BookSnapshot(path, repository, signature, fingerprints, version)
+
+
+def changed_quest_ids(old: Mapping[Any, str], new: Mapping[Any, str]) -> Set[Any]:
+    """追加・削除・変更されたクエストの ID を返す"""
+    return {
+        quest_id
+        for quest_id in old.keys() | new.keys()
+        if old.get(quest_id) != new.get(quest_id)
+    }
+
+
+ReloadListener = Callable[[BookSnapshot, Set[Any]], None]
+
+
+class RepositoryRegistry:
+    """ブックのパスごとに現在のスナップショットを保持するレジストリ"""
+
+    def __init__(self):
+        self._snapshots: Dict[Path, BookSnapshot] = {}
+        # 読み込みに失敗したシグネチャ (ファイルが変わるまで再試行しない)
+        self._failed: Dict[Path, Tuple[int, int]] = {}
+        self._listeners: List[ReloadListener] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: Path) -> Path:
+        return Path(path).resolve()
+
+    def add_reload_listener(self, listener: ReloadListener) -> None:
+        """差し替え時に (新しいスナップショット, 変更されたクエストの ID) で呼ばれる"""
+        self._listeners.append(listener)
+
+    def paths(self) -> List[Path]:
+        """読み込み済みのブックのパス"""
+        return list(self._snapshots)
+
+    def snapshot(self, path: Path) -> Optional[BookSnapshot]:
+        """現在のスナップショット (未読み込みの場合は None)"""
+        return self._snapshots.get(self._key(path))
+
+    async def get(self, path: Path) -> QuestRepository:
+        """現在のリポジトリを返す。未読み込みの場合はここで読み込む。"""
+        key = self._key(path)
+        snapshot = self._snapshots.get(key)
+        if snapshot is None:
+            loaded = await run_blocking(load_snapshot, key)
+            with self._lock:
+                # 同時に読み込んだ場合は先に登録された方を使う
+                snapshot = self._snapshots.setdefault(key, loaded)
+        return snapshot.repository
+
+    async def reload_if_changed(self, path: Path) -> bool:
+        """
+        ファイルが変更されていれば読み込み直して差し替える。
+
+        Returns:
+            差し替えた場合は True。変更がない場合や読み込みに失敗した場合は False。
+        """
+        key = self._key(path)
+        current = self._snapshots.get(key)
+        if current is None:
+            return False
+        try:
+            signature = await run_blocking(book_signature, key)
+        except FileNotFoundError:
+            # エディタによっては保存時に一時的にファイルが無くなる
+            return False
+        if signature == current.signature or signature == self._failed.get(key):
+            return False
+
+        try:
+            loaded = await run_blocking(load_snapshot, key, current.version + 1)
+        except Exception as e:
+            self._failed[key] = signature
+            BOOK_RELOADS.inc(result="error")
+            record_error("book_reload", e)
+            logger.error(
+                "ブックの再読み込みに失敗しました。以前の内容を使い続けます: %s: %s",
+                key,
+                e,
+            )
+            return False
+
+        changed = changed_quest_ids(current.fingerprints, loaded.fingerprints)
+        with self._lock:
+            if self._snapshots.get(key) is not current:
+                # 他の呼び出しが先に差し替えた
+                return False
+            self._snapshots[key] = loaded
+            self._failed.pop(key, None)
+        BOOK_RELOADS.inc(result="ok")
+        logger.info(
+            "ブックを再読み込みしました: %s (version %d, 変更されたクエスト %d 件)",
+            key,
+            loaded.version,
+            len(changed),
+            extra={"changed_quests": sorted(changed, key=str)},
+        )
+        for listener in self._listeners:
+            listener(loaded, changed)
+        return True
+
+
+class BookWatcher:
+    """読み込み済みのブックの変更を定期的に確認するタスク"""
+
+    def __init__(
+        self,
+        registry: RepositoryRegistry,
+        loop: asyncio.AbstractEventLoop,
+        interval_seconds: float = DEFAULT_WATCH_INTERVAL,
+    ):
+        self.registry = registry
+        self.loop = loop
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """監視を開始する。イベントループのスレッドから呼び出すこと。"""
+        self._task = self.loop.create_task(self._run())
+
+    def stop(self) -> None:
+        """監視を終了する"""
+        if self._task is not None and not self.loop.is_closed():
+            self._task.cancel()
+        self._task = None
+
+    async def check(self) -> List[Path]:
+        """全てのブックを1回確認し、差し替えたパスを返す"""
+        reloaded = []
+        for path in self.registry.paths():
+            if await self.registry.reload_if_changed(path):
+                reloaded.append(path)
+        return reloaded
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("ブックの変更の確認中にエラーが発生しました。")
+
+
+def ensure_book_watcher(registry: RepositoryRegistry) -> Optional[BookWatcher]:
+    """
+    実行中のイベントループでブックの監視を開始する (環境変数で無効な場合は何もしない)。
+
+    同じループに対して何度呼び出しても監視は1つだけ。別のループで呼び出された
+    場合は前の監視を終了して付け替える。
+    """
+    global _watcher
+    interval = float(os.environ.get(WATCH_INTERVAL_ENV_VAR, DEFAULT_WATCH_INTERVAL))
+    if interval <= 0:
+        return None
+    loop = asyncio.get_running_loop()
+    if _watcher is not None and _watcher.loop is loop and _watcher.registry is registry:
+        return _watcher
+    if _watcher is not None:
+        _watcher.stop()
+    _watcher = BookWatcher(registry, loop, interval)
+    _watcher.start()
+    return _watcher
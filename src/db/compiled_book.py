@@ -0,0 +1,268 @@
+# src/db/compiled_book.py
+"""
+ブック (book.json) をコンパイルしたバイナリ形式 (.eqb) の読み書き。
+
+ファイルをメモリマップし、クエストは ID で引いたときに初めてデコードする。
+ファイルを開くコストはクエスト数によらず一定で、複数のワーカープロセスが
+同じファイルを開いた場合はページキャッシュを共有する。
+
+ファイル形式 (数値はすべてリトルエンディアン):
+
+    ヘッダー (56 バイト)
+        magic          8s  b"EQBOOK\\x00\\x00"
+        version        u32
+        quest_count    u32
+        index_offset   u64  インデックスの開始位置
+        meta_offset    u64  メタデータ (JSON) の開始位置
+        meta_length    u64
+        sample_offset  u64  sample_data (1行1ドキュメントの JSON) の開始位置
+        sample_length  u64
+    クエストのレコード (1件ごとに JSON を UTF-8 で格納)
+    インデックス (quest_id の昇順、1件 20 バイト)
+        quest_id i64, offset u64, length u32
+    メタデータ: quests と sample_data 以外のトップレベルのキー (mappings など)
+    sample_data: 1行1ドキュメントの JSON Lines
+
+使い方:
+    python -m src.db.compiled_book fixtures/books/default.json -o data/default.eqb
+"""
+
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import click
+
+from src.models.quest import Quest
+
+COMPILED_BOOK_SUFFIX = ".eqb"
+MAGIC = b"EQBOOK\x00\x00"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sIIQQQQQ")
+_INDEX_ENTRY = struct.Struct("<qQI")
+
+
+def is_compiled_book(path: Path) -> bool:
+    """コンパイル済みブックのパスかどうかを拡張子で判定する"""
+    return Path(path).suffix == COMPILED_BOOK_SUFFIX
+
+
+def _encode(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _normalize_quest(quest_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """ブックのクエスト定義を Quest のフィールド名にそろえ、パースできるか検証する"""
+    quest_dict = dict(quest_dict)
+    if "evaluation_data" in quest_dict:
+        quest_dict["evaluation_data_raw"] = quest_dict.pop("evaluation_data")
+    if "hints" in quest_dict:
+        quest_dict["hints_raw"] = quest_dict.pop("hints")
+    quest = Quest.from_dict(quest_dict)
+    # パース済みプロパティの評価を強制して、パースエラーをコンパイル時に検出する
+    _ = quest.evaluation_data
+    _ = quest.hints
+    return quest_dict
+
+
+def compile_book(book: Dict[str, Any], output_path: Path) -> int:
+    """
+    ブックの内容をコンパイル済み形式で書き出し、クエスト数を返す。
+
+    書き込みは一時ファイルに行ってから置き換えるため、読み込み中の
+    プロセスが壊れたファイルを見ることはない。
+    """
+    quests = sorted(
+        (_normalize_quest(q) for q in book.get("quests", [])),
+        key=lambda q: int(q["quest_id"]),
+    )
+    ids = [int(q["quest_id"]) for q in quests]
+    if len(set(ids)) != len(ids):
+        raise ValueError("quest_id が重複しています。")
+
+    records = [_encode(q) for q in quests]
+    meta = _encode(
+        {k: v for k, v in book.items() if k not in ("quests", "sample_data")}
+    )
+    sample = b"".join(_encode(doc) + b"\n" for doc in book.get("sample_data", []))
+
+    offset = _HEADER.size
+    index = bytearray()
+    for quest_id, record in zip(ids, records):
+        index += _INDEX_ENTRY.pack(quest_id, offset, len(record))
+        offset += len(record)
+    index_offset = offset
+    meta_offset = index_offset + len(index)
+    sample_offset = meta_offset + len(meta)
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        len(records),
+        index_offset,
+        meta_offset,
+        len(meta),
+        sample_offset,
+        len(sample),
+    )
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(header)
+        for record in records:
+            f.write(record)
+        f.write(index)
+        f.write(meta)
+        f.write(sample)
+    os.replace(tmp_path, output_path)
+    return len(records)
+
+
+def compile_book_file(json_path: Path, output_path: Optional[Path] = None) -> Path:
+    """book.json をコンパイルし、出力先のパスを返す"""
+    json_path = Path(json_path)
+    if output_path is None:
+        output_path = json_path.with_suffix(COMPILED_BOOK_SUFFIX)
+    with json_path.open("r", encoding="utf-8") as f:
+        book = json.load(f)
+    compile_book(book, output_path)
+    return Path(output_path)
+
+
+class CompiledBook:
+    """メモリマップしたコンパイル済みブック。クエストはアクセス時にデコードする。"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            # 空ファイルは mmap できないため、ヘッダー不足と同じ扱いにする
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise ValueError(f"コンパイル済みブックではありません: {self.path}")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            version,
+            self._count,
+            self._index_offset,
+            self._meta_offset,
+            self._meta_length,
+            self._sample_offset,
+            self._sample_length,
+        ) = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"コンパイル済みブックではありません: {self.path}")
+        if version != VERSION:
+            self.close()
+            raise ValueError(
+                f"未対応のコンパイル済みブックのバージョンです: {version} "
+                f"(対応: {VERSION})"
+            )
+        self._decoded: Dict[int, Quest] = {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def __enter__(self) -> "CompiledBook":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def _index_entry(self, position: int):
+        return _INDEX_ENTRY.unpack_from(
+            self._mmap, self._index_offset + position * _INDEX_ENTRY.size
+        )
+
+    def _find_position(self, quest_id: int) -> Optional[int]:
+        """インデックスを二分探索して quest_id の位置を返す"""
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            mid_id = self._index_entry(mid)[0]
+            if mid_id < quest_id:
+                low = mid + 1
+            elif mid_id > quest_id:
+                high = mid
+            else:
+                return mid
+        return None
+
+    def _decode(self, position: int) -> Quest:
+        quest_id, offset, length = self._index_entry(position)
+        quest = self._decoded.get(quest_id)
+        if quest is None:
+            data = json.loads(self._mmap[offset : offset + length])
+            quest = Quest.from_dict(data)
+            self._decoded[quest_id] = quest
+        return quest
+
+    def quest_ids(self) -> List[int]:
+        """全クエストの ID を昇順で返す"""
+        return [self._index_entry(i)[0] for i in range(self._count)]
+
+    def iter_records(self) -> Iterator[Tuple[int, bytes]]:
+        """全クエストの (ID, レコードのバイト列) を ID の昇順で返す (デコードしない)"""
+        for position in range(self._count):
+            quest_id, offset, length = self._index_entry(position)
+            yield quest_id, self._mmap[offset : offset + length]
+
+    def get_quest(self, quest_id) -> Optional[Quest]:
+        """ID でクエストを取得する (数値または数値の文字列)"""
+        try:
+            quest_id = int(quest_id)
+        except (TypeError, ValueError):
+            return None
+        position = self._find_position(quest_id)
+        return None if position is None else self._decode(position)
+
+    def iter_quests(self) -> Iterator[Quest]:
+        """全クエストを ID の昇順で返す"""
+        for position in range(self._count):
+            yield self._decode(position)
+
+    def metadata(self) -> Dict[str, Any]:
+        """quests と sample_data 以外のトップレベルの項目 (mappings など)"""
+        start = self._meta_offset
+        return json.loads(self._mmap[start : start + self._meta_length])
+
+    def iter_sample_data(self) -> Iterator[Dict[str, Any]]:
+        """sample_data のドキュメントを1件ずつデコードして返す"""
+        position = self._sample_offset
+        end = self._sample_offset + self._sample_length
+        while position < end:
+            line_end = self._mmap.find(b"\n", position, end)
+            if line_end == -1:
+                line_end = end
+            yield json.loads(self._mmap[position:line_end])
+            position = line_end + 1
+
+
+@click.command()
+@click.argument(
+    "book_path", type=click.Path(exists=True, dir_okay=False, path_type=Path)
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help=f"出力先 (デフォルト: 入力ファイルの拡張子を {COMPILED_BOOK_SUFFIX} に変更)",
+)
+def main(book_path: Path, output: Optional[Path]):
+    """book.json をコンパイル済みブック形式に変換する"""
+    output_path = compile_book_file(book_path, output)
+    with CompiledBook(output_path) as book:
+        click.echo(f"{output_path}: {len(book)} quests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# src/db/connection_pool.py
+"""
+SQLite の読み込み用コネクションプール。
+
+sqlite3 の接続はスレッド間で同時に使えないため、スレッドプール
+(run_blocking) から並行に読み込む場合は接続を貸し出して使い回す。
+接続ごとにプリペアドステートメントがキャッシュされる (cached_statements) ので、
+同じ SQL 文は毎回パースされない。
+
+    pool = ConnectionPool(Path("data/catalog.db"), size=4)
+    with pool.connection() as conn:
+        conn.execute("SELECT ...", (...,)).fetchone()
+"""
+
+import contextlib
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterator, List
+
+from src.exceptions import DatabaseError
+
+# 接続ごとにキャッシュするプリペアドステートメントの数
+CACHED_STATEMENTS = 256
+
+
+class ConnectionPool:
+    """読み込み専用の接続を最大 size 個まで作成して貸し出すプール"""
+
+    def __init__(self, path: Path, size: int = 4, timeout_seconds: float = 5.0):
+        if size < 1:
+            raise ValueError("size は 1 以上を指定してください。")
+        self.path = Path(path)
+        self.size = size
+        self.timeout_seconds = timeout_seconds
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f"{self.path.absolute().as_uri()}?mode=ro",
+            uri=True,
+            timeout=self.timeout_seconds,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+        )
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("connection pool is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = self._connect()
+                self._all.append(conn)
+                return conn
+        # 上限まで貸し出し中の場合は返却を待つ
+        try:
+            return self._idle.get(timeout=self.timeout_seconds)
+        except queue.Empty:
+            raise DatabaseError(
+                f"{self.path} の接続をすべて ({self.size} 個) 貸し出し中のため、"
+                f"{self.timeout_seconds} 秒待っても借りられませんでした。"
+            ) from None
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """接続を借りる (with を抜けると返却される)"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+
+    def close(self) -> None:
+        """貸し出していない接続を閉じる (貸し出し中の接続は返却時に閉じる)"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,286 @@
+# src/db/points.py
+"""
+ポイントとランキング。
+
+クエストを初めて正解したときに、難易度と試行回数に応じたポイントを付与する。
+ユーザーごとの累計はメモリ上で加算し、ランキングは IndexableSkiplist で
+保持するため、ポイントの更新も順位・上位 N 件の参照も全件を走査しない。
+
+正解済みかはブックとクエスト ID の組で判定する (ブックが違えば別のクエスト)。
+
+記録は AttemptStore と同じ DB に、同じ書き込みスレッドで書き込む。
+DB の累計は加算で更新し、加算するのは quest_clears への INSERT OR IGNORE が
+行を追加した (DB で初めての正解だった) 場合だけなので、複数のワーカーが
+同じ DB に書き込んでも二重に数えない。メモリ上の累計はこのワーカーが知っている
+範囲の暫定の値で、起動時には累計を DB から読み込み、sync() で他のプロセス
+(マルチワーカー構成の他のワーカー) が書き込んだ累計のうち、前回以降に
+更新されたものだけを取り込む。
+"""
+
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.db.attempt_store import DEFAULT_BOOK, AttemptStore, create_schema
+from src.models.quest import Quest
+from src.utils.skiplist import IndexableSkiplist
+
+BASE_POINTS_PER_DIFFICULTY = 100
+# 2回目以降の試行1回ごとの減点率と、最低でも付与する割合
+ATTEMPT_PENALTY_RATIO = 0.2
+MIN_POINTS_RATIO = 0.2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quest_clears (
+    user_id TEXT NOT NULL,
+    book TEXT NOT NULL,
+    quest_id INTEGER NOT NULL,
+    attempt_number INTEGER NOT NULL,
+    points INTEGER NOT NULL,
+    cleared_at REAL NOT NULL,
+    PRIMARY KEY (user_id, book, quest_id)
+);
+CREATE TABLE IF NOT EXISTS user_points (
+    user_id TEXT PRIMARY KEY,
+    points INTEGER NOT NULL,
+    quests_cleared INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_user_points_updated_at ON user_points (updated_at);
+"""
+
+_INSERT_CLEAR = (
+    "INSERT OR IGNORE INTO quest_clears "
+    "(user_id, book, quest_id, attempt_number, points, cleared_at) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+_ADD_TOTAL = (
+    "INSERT INTO user_points (user_id, points, quests_cleared, updated_at) "
+    "VALUES (?, ?, 1, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET points = points + excluded.points, "
+    "quests_cleared = quests_cleared + 1, updated_at = excluded.updated_at"
+)
+
+
+def calculate_points(difficulty: int, attempt_number: int) -> int:
+    """難易度と、何回目の試行で正解したかからポイントを計算する"""
+    ratio = max(1.0 - ATTEMPT_PENALTY_RATIO * (attempt_number - 1), MIN_POINTS_RATIO)
+    return max(round(max(difficulty, 1) * BASE_POINTS_PER_DIFFICULTY * ratio), 1)
+
+
+def _write_clear(
+    conn: sqlite3.Connection,
+    user_id: str,
+    book: str,
+    quest_id: int,
+    attempt_number: int,
+    points: int,
+    cleared_at: float,
+) -> None:
+    """
+    正解を DB に記録し、初めての正解なら累計に加える (書き込みスレッドで実行する)。
+
+    初めての正解かは quest_clears への INSERT OR IGNORE が行を追加したかで判定する。
+    """
+    inserted = conn.execute(
+        _INSERT_CLEAR, (user_id, book, quest_id, attempt_number, points, cleared_at)
+    ).rowcount
+    if inserted:
+        conn.execute(_ADD_TOTAL, (user_id, points, cleared_at))
+
+
+@dataclass(frozen=True)
+class Award:
+    """1回分のポイント付与の結果"""
+
+    user_id: str
+    quest_id: int
+    points: int
+    total: int
+    rank: int
+
+    def message(self) -> str:
+        return (
+            f"{self.points} ポイント獲得! (累計 {self.total} ポイント、{self.rank} 位)"
+        )
+
+
+@dataclass(frozen=True)
+class LeaderboardEntry:
+    rank: int
+    user_id: str
+    points: int
+
+
+class Leaderboard:
+    """ユーザーの累計ポイントと、その順位"""
+
+    def __init__(self):
+        self._scores: Dict[str, int] = {}
+        # (-ポイント, ユーザーID) の昇順 = ポイントの降順
+        self._ranking = IndexableSkiplist()
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def score(self, user_id: str) -> Optional[int]:
+        return self._scores.get(user_id)
+
+    def update(self, user_id: str, points: int) -> None:
+        """ユーザーの累計を points にする (O(log n))"""
+        old = self._scores.get(user_id)
+        if old == points:
+            return
+        if old is not None:
+            self._ranking.remove((-old, user_id))
+        self._scores[user_id] = points
+        self._ranking.insert((-points, user_id))
+
+    def rank(self, user_id: str) -> Optional[int]:
+        """順位 (同点は同順位)。ランキングにいない場合は None。"""
+        points = self._scores.get(user_id)
+        if points is None:
+            return None
+        # "" はどのユーザーIDよりも前に並ぶため、より高得点の人数が得られる
+        return self._ranking.bisect_left((-points, "")) + 1
+
+    def top(self, count: int, offset: int = 0) -> List[LeaderboardEntry]:
+        """offset 位以降の上位 count 件"""
+        entries: List[LeaderboardEntry] = []
+        previous = None
+        rank = 0
+        for position, (negative_points, user_id) in enumerate(
+            self._ranking.iter_from(offset), start=offset + 1
+        ):
+            if len(entries) >= count:
+                break
+            if negative_points != previous:
+                # 先頭は offset より前に同点がいる場合があるため、順位を引き直す
+                rank = (
+                    position
+                    if previous is not None
+                    else self._ranking.bisect_left((negative_points, "")) + 1
+                )
+                previous = negative_points
+            entries.append(LeaderboardEntry(rank, user_id, -negative_points))
+        return entries
+
+
+class PointsEngine:
+    """ポイントの付与とランキングの管理"""
+
+    def __init__(self, attempt_store: AttemptStore):
+        self.attempt_store = attempt_store
+        self.leaderboard = Leaderboard()
+        # (user_id, book, quest_id)
+        self._cleared: Set[Tuple[str, str, int]] = set()
+        self._cleared_counts: Dict[str, int] = {}
+        # 前回の sync 以降にこのワーカーでポイントを付与したユーザー
+        self._awarded: Set[str] = set()
+        self._lock = threading.Lock()
+        self._synced_until = 0.0
+
+        # 読み込み専用の接続 (書き込みは AttemptStore の書き込みスレッドが行う)
+        self._conn = sqlite3.connect(attempt_store.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        create_schema(self._conn, _SCHEMA, ["quest_clears"])
+        for user_id, book, quest_id in self._conn.execute(
+            "SELECT user_id, book, quest_id FROM quest_clears"
+        ):
+            self._cleared.add((user_id, book, quest_id))
+        self.sync()
+
+    def sync(self) -> int:
+        """
+        前回以降に DB で更新された累計を取り込み、取り込んだ件数を返す。
+
+        このプロセスの書き込み待ちの正解は、先に書き込んでから読み直す。
+        このワーカーでポイントを付与したユーザーの累計も DB の値に揃える
+        (他のワーカーが先に記録した正解は DB の累計に加算されないため)。
+        """
+        self.attempt_store.flush()
+        with self._lock:
+            awarded, self._awarded = self._awarded, set()
+            rows = self._conn.execute(
+                "SELECT user_id, points, quests_cleared, updated_at FROM user_points "
+                "WHERE updated_at >= ?",
+                (self._synced_until,),
+            ).fetchall()
+            awarded.difference_update(row[0] for row in rows)
+            if awarded:
+                placeholders = ", ".join("?" * len(awarded))
+                rows += self._conn.execute(
+                    "SELECT user_id, points, quests_cleared, updated_at "
+                    f"FROM user_points WHERE user_id IN ({placeholders})",
+                    tuple(awarded),
+                ).fetchall()
+            for user_id, points, quests_cleared, updated_at in rows:
+                self.leaderboard.update(user_id, points)
+                self._cleared_counts[user_id] = quests_cleared
+                self._synced_until = max(self._synced_until, updated_at)
+        return len(rows)
+
+    def award(
+        self,
+        user_id: str,
+        quest: Quest,
+        attempt_number: int,
+        book: str = DEFAULT_BOOK,
+    ) -> Optional[Award]:
+        """
+        正解したクエストのポイントを付与する。
+
+        同じブックの同じクエストで2回目以降の正解にはポイントを付与せず None を返す。
+        """
+        key = (user_id, book, quest.quest_id)
+        with self._lock:
+            if key in self._cleared:
+                return None
+            self._cleared.add(key)
+            points = calculate_points(quest.difficulty, attempt_number)
+            total = (self.leaderboard.score(user_id) or 0) + points
+            cleared = self._cleared_counts.get(user_id, 0) + 1
+            self._cleared_counts[user_id] = cleared
+            self._awarded.add(user_id)
+            self.leaderboard.update(user_id, total)
+            rank = self.leaderboard.rank(user_id)
+        self.attempt_store.enqueue_call(
+            _write_clear,
+            user_id,
+            book,
+            quest.quest_id,
+            attempt_number,
+            points,
+            time.time(),
+        )
+        return Award(user_id, quest.quest_id, points, total, rank)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+_engines: Dict[int, PointsEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def find_points_engine(attempt_store: AttemptStore) -> Optional[PointsEngine]:
+    """作成済みの PointsEngine を返す (未作成の場合は None、I/O なし)"""
+    return _engines.get(id(attempt_store))
+
+
+def get_points_engine(attempt_store: AttemptStore) -> PointsEngine:
+    """
+    attempt_store に対応する PointsEngine を返す (初回呼び出し時に作成)。
+
+    作成時に DB から累計を読み込むため、イベントループからはスレッドプールで呼び出す。
+    """
+    engine = _engines.get(id(attempt_store))
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(id(attempt_store))
+            if engine is None:
+                engine = PointsEngine(attempt_store)
+                _engines[id(attempt_store)] = engine
+    return engine
@@ -1,8 +1,9 @@
 # src/db/quest_repository.py
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from src.db.book_repository import BookRepository
+from src.db.compiled_book import CompiledBook, is_compiled_book
 from src.models.quest import Quest
 
 
@@ -13,9 +14,32 @@ class QuestRepository:
         """
         リポジトリを初期化し、BookRepository を利用してクエストのリストを内部
         に保持します。
+
+        コンパイル済みブック (.eqb) の場合はファイルをメモリマップするだけで、
+        クエストは取得時にデコードします。
         """
-        self.book_repo = BookRepository(book_json_path)
-        self.quests = self.book_repo.load_quests()
+        self.compiled_book: Optional[CompiledBook] = None
+        self._quests: Optional[List[Quest]] = None
+        if is_compiled_book(book_json_path):
+            self.book_repo = None
+            self.compiled_book = CompiledBook(book_json_path)
+        else:
+            self.book_repo = BookRepository(book_json_path)
+            self._quests = self.book_repo.load_quests()
+
+    @property
+    def quests(self) -> List[Quest]:
+        """全クエストのリスト (コンパイル済みブックの場合は初回アクセス時にデコード)"""
+        if self._quests is None:
+            self._quests = list(self.compiled_book.iter_quests())
+        return self._quests
+
+    @property
+    def loadmap(self) -> List[Dict[str, Any]]:
+        """ブックの学習ロードマップ (章のリスト)"""
+        if self.compiled_book is not None:
+            return self.compiled_book.metadata().get("loadmap", [])
+        return self.book_repo.load_loadmap()
 
     def _row_to_quest(self, row: dict) -> Optional[Quest]:
         """辞書をQuestオブジェクトに変換"""
@@ -46,6 +70,8 @@ class QuestRepository:
         Returns:
             Questオブジェクト、または見つからない場合はNone。
         """
+        if self.compiled_book is not None:
+            return self.compiled_book.get_quest(quest_id)
         for quest in self.quests:
             if str(quest.quest_id) == str(quest_id):
                 return quest
@@ -0,0 +1,447 @@
+# src/db/quest_stats.py
+"""
+クエストごとの統計 (正解率、正解までの試行回数と所要時間の中央値、直近の傾向)。
+
+提出の記録を毎回集計し直すと記録が増えるほど遅くなるため、提出のたびに
+(AttemptEvent ごとに) 集計値を少しずつ更新し、クエストごとの統計を
+計算済みの値として保持する。get() は辞書を引くだけ (O(1))。
+
+- 中央値はヒストグラム (試行回数は回数ごと、所要時間は 2 のべき乗秒ごとの
+  区間) から求める。所要時間は区間の中央の値で近似する
+- 直近の傾向は日ごとの集計を ROLLING_WINDOW_DAYS の期間だけ合計する
+
+統計はブックとクエスト ID の組ごとに持つ (ブックが違えば同じ ID でも別のクエスト)。
+ブックの列が無い DB の集計値は既定のブックのものとして扱う。
+
+集計値は AttemptStore と同じ DB に、同じ書き込みスレッドで書き込む。
+書き込みはすべて加算 (UPSERT で +1) なので、複数のワーカーが同じ DB に
+書き込んでも合計は正しくなる。ユーザー数の増分 (初めての挑戦・初めての正解)
+は、書き込みスレッドで quest_stats_progress への INSERT OR IGNORE と条件付きの
+UPDATE が行を変更したかで決めるため、同じユーザーが別々のワーカーで提出しても
+二重に数えない。メモリ上の増分はこのワーカーが知っている範囲の暫定の値で、
+refresh() で DB の値を読み直すと、他のワーカーの提出も統計に反映される。
+"""
+
+import math
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from src.db.achievements import AttemptEvent
+from src.db.attempt_store import DEFAULT_BOOK, AttemptStore, create_schema
+
+ROLLING_WINDOW_DAYS = (7, 30)
+# 試行回数のヒストグラムの上限 (これ以上はまとめて数える)
+MAX_ATTEMPT_BUCKET = 50
+SECONDS_PER_DAY = 86400
+# 他のワーカーの提出を反映するために DB を読み直す間隔
+REFRESH_INTERVAL_SECONDS = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quest_stats (
+    book TEXT NOT NULL,
+    quest_id INTEGER NOT NULL,
+    attempts INTEGER NOT NULL,
+    correct_attempts INTEGER NOT NULL,
+    attempted_users INTEGER NOT NULL,
+    solved_users INTEGER NOT NULL,
+    PRIMARY KEY (book, quest_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS quest_stats_histogram (
+    book TEXT NOT NULL,
+    quest_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (book, quest_id, kind, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS quest_stats_daily (
+    book TEXT NOT NULL,
+    quest_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    attempts INTEGER NOT NULL,
+    correct_attempts INTEGER NOT NULL,
+    solves INTEGER NOT NULL,
+    PRIMARY KEY (book, quest_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS quest_stats_progress (
+    user_id TEXT NOT NULL,
+    book TEXT NOT NULL,
+    quest_id INTEGER NOT NULL,
+    first_attempt_at REAL NOT NULL,
+    solved INTEGER NOT NULL,
+    PRIMARY KEY (user_id, book, quest_id)
+) WITHOUT ROWID;
+"""
+_TABLES = (
+    "quest_stats",
+    "quest_stats_histogram",
+    "quest_stats_daily",
+    "quest_stats_progress",
+)
+
+_ADD_TOTALS = (
+    "INSERT INTO quest_stats "
+    "(book, quest_id, attempts, correct_attempts, attempted_users, solved_users) "
+    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(book, quest_id) DO UPDATE SET "
+    "attempts = attempts + excluded.attempts, "
+    "correct_attempts = correct_attempts + excluded.correct_attempts, "
+    "attempted_users = attempted_users + excluded.attempted_users, "
+    "solved_users = solved_users + excluded.solved_users"
+)
+_ADD_HISTOGRAM = (
+    "INSERT INTO quest_stats_histogram (book, quest_id, kind, bucket, count) "
+    "VALUES (?, ?, ?, ?, 1) ON CONFLICT(book, quest_id, kind, bucket) DO UPDATE SET "
+    "count = count + 1"
+)
+_ADD_DAILY = (
+    "INSERT INTO quest_stats_daily "
+    "(book, quest_id, day, attempts, correct_attempts, solves) "
+    "VALUES (?, ?, ?, 1, ?, ?) "
+    "ON CONFLICT(book, quest_id, day) DO UPDATE SET "
+    "attempts = attempts + 1, "
+    "correct_attempts = correct_attempts + excluded.correct_attempts, "
+    "solves = solves + excluded.solves"
+)
+_INSERT_PROGRESS = (
+    "INSERT OR IGNORE INTO quest_stats_progress "
+    "(user_id, book, quest_id, first_attempt_at, solved) VALUES (?, ?, ?, ?, 0)"
+)
+_MARK_SOLVED = (
+    "UPDATE quest_stats_progress SET solved = 1 "
+    "WHERE user_id = ? AND book = ? AND quest_id = ? AND solved = 0"
+)
+_SELECT_FIRST_ATTEMPT_AT = (
+    "SELECT first_attempt_at FROM quest_stats_progress "
+    "WHERE user_id = ? AND book = ? AND quest_id = ?"
+)
+
+
+def _seconds_bucket(seconds: float) -> int:
+    """所要時間の区間 b ([2^b - 1, 2^(b+1) - 1) 秒)"""
+    return int(math.log2(max(seconds, 0.0) + 1.0))
+
+
+def _seconds_bucket_midpoint(bucket: int) -> float:
+    return (2**bucket - 1 + 2 ** (bucket + 1) - 1) / 2
+
+
+def _write_event(conn: sqlite3.Connection, event: AttemptEvent) -> None:
+    """
+    提出を DB の集計値に加える (書き込みスレッドで実行する)。
+
+    初めての挑戦・初めての正解かは DB の quest_stats_progress で判定する。
+    """
+    key = (event.user_id, event.book, event.quest_id)
+    first_attempt = conn.execute(_INSERT_PROGRESS, (*key, event.created_at)).rowcount
+    solved_now = event.is_correct and conn.execute(_MARK_SOLVED, key).rowcount
+    conn.execute(
+        _ADD_TOTALS,
+        (
+            event.book,
+            event.quest_id,
+            1,
+            int(event.is_correct),
+            first_attempt,
+            int(solved_now),
+        ),
+    )
+    if solved_now:
+        (first_attempt_at,) = conn.execute(_SELECT_FIRST_ATTEMPT_AT, key).fetchone()
+        conn.execute(
+            _ADD_HISTOGRAM,
+            (
+                event.book,
+                event.quest_id,
+                "attempts",
+                min(event.attempt_number, MAX_ATTEMPT_BUCKET),
+            ),
+        )
+        conn.execute(
+            _ADD_HISTOGRAM,
+            (
+                event.book,
+                event.quest_id,
+                "seconds",
+                _seconds_bucket(event.created_at - first_attempt_at),
+            ),
+        )
+    conn.execute(
+        _ADD_DAILY,
+        (
+            event.book,
+            event.quest_id,
+            int(event.created_at // SECONDS_PER_DAY),
+            int(event.is_correct),
+            int(solved_now),
+        ),
+    )
+
+
+def _histogram_median(histogram: Dict[int, int]) -> Optional[int]:
+    """ヒストグラムの中央値の区間 (下側の中央値)"""
+    total = sum(histogram.values())
+    if total == 0:
+        return None
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen * 2 >= total:
+            return bucket
+    return None
+
+
+@dataclass(frozen=True)
+class WindowStats:
+    """直近 days 日間の集計"""
+
+    days: int
+    attempts: int
+    correct_attempts: int
+    solves: int
+
+    @property
+    def success_rate(self) -> Optional[float]:
+        """提出のうち正解だった割合"""
+        return self.correct_attempts / self.attempts if self.attempts else None
+
+
+@dataclass(frozen=True)
+class QuestStats:
+    """1つのクエストの計算済みの統計"""
+
+    quest_id: int
+    attempts: int
+    correct_attempts: int
+    attempted_users: int
+    solved_users: int
+    median_attempts_to_solve: Optional[int]
+    median_seconds_to_solve: Optional[float]
+    windows: Tuple[WindowStats, ...]
+
+    @property
+    def pass_rate(self) -> Optional[float]:
+        """挑戦したユーザーのうち正解したユーザーの割合"""
+        if not self.attempted_users:
+            return None
+        return self.solved_users / self.attempted_users
+
+    def summary(self) -> str:
+        """クエストの説明に添える1行の要約"""
+        if not self.attempted_users:
+            return "📊 まだ挑戦した人はいません。"
+        parts = [
+            f"挑戦 {self.attempted_users} 人 / 正解 {self.solved_users} 人 "
+            f"(正解率 {self.pass_rate:.0%})"
+        ]
+        if self.median_attempts_to_solve is not None:
+            parts.append(f"正解までの提出 {self.median_attempts_to_solve} 回 (中央値)")
+        if self.median_seconds_to_solve is not None:
+            parts.append(
+                f"所要時間 約 {_format_duration(self.median_seconds_to_solve)} (中央値)"
+            )
+        for window in self.windows[:1]:
+            if window.attempts:
+                parts.append(
+                    f"直近{window.days}日の提出 {window.attempts} 件 "
+                    f"(正解 {window.success_rate:.0%})"
+                )
+        return "📊 " + "・".join(parts)
+
+
+def _format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f} 秒"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} 分"
+    return f"{seconds / 3600:.1f} 時間"
+
+
+class _QuestAggregate:
+    """1つのクエストの集計値 (更新用)"""
+
+    __slots__ = ("totals", "attempt_histogram", "seconds_histogram", "daily")
+
+    def __init__(self):
+        # attempts, correct_attempts, attempted_users, solved_users
+        self.totals = [0, 0, 0, 0]
+        self.attempt_histogram: Dict[int, int] = defaultdict(int)
+        self.seconds_histogram: Dict[int, int] = defaultdict(int)
+        # day -> [attempts, correct_attempts, solves]
+        self.daily: Dict[int, List[int]] = {}
+
+    def materialize(self, quest_id: int, today: int) -> QuestStats:
+        windows = []
+        for days in ROLLING_WINDOW_DAYS:
+            sums = [0, 0, 0]
+            for day, counts in self.daily.items():
+                if today - days < day <= today:
+                    for i in range(3):
+                        sums[i] += counts[i]
+            windows.append(WindowStats(days, *sums))
+        seconds_bucket = _histogram_median(self.seconds_histogram)
+        return QuestStats(
+            quest_id,
+            *self.totals,
+            median_attempts_to_solve=_histogram_median(self.attempt_histogram),
+            median_seconds_to_solve=(
+                None
+                if seconds_bucket is None
+                else _seconds_bucket_midpoint(seconds_bucket)
+            ),
+            windows=tuple(windows),
+        )
+
+    def prune(self, today: int) -> None:
+        oldest = today - max(ROLLING_WINDOW_DAYS)
+        for day in [day for day in self.daily if day <= oldest]:
+            del self.daily[day]
+
+
+class QuestStatsStore:
+    """クエストごとの統計を提出のたびに更新し、計算済みの値を返すリポジトリ"""
+
+    def __init__(self, attempt_store: AttemptStore):
+        self.attempt_store = attempt_store
+        # (book, quest_id) -> 集計値・計算済みの統計
+        self._aggregates: Dict[Tuple[str, int], _QuestAggregate] = {}
+        self._stats: Dict[Tuple[str, int], QuestStats] = {}
+        # (user_id, book, quest_id) -> [最初の提出の時刻, 正解済みか]
+        self._progress: Dict[Tuple[str, str, int], List] = {}
+        self._lock = threading.Lock()
+        self.refreshed_at = 0.0
+        self._conn = sqlite3.connect(attempt_store.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        create_schema(self._conn, _SCHEMA, _TABLES)
+        with self._lock:
+            for user_id, book, quest_id, first_attempt_at, solved in self._conn.execute(
+                "SELECT user_id, book, quest_id, first_attempt_at, solved "
+                "FROM quest_stats_progress"
+            ):
+                self._progress[(user_id, book, quest_id)] = [
+                    first_attempt_at,
+                    bool(solved),
+                ]
+        self.refresh()
+
+    def get(self, quest_id: int, book: str = DEFAULT_BOOK) -> Optional[QuestStats]:
+        """ブックのクエストの計算済みの統計 (提出が無いクエストは None)"""
+        return self._stats.get((book, quest_id))
+
+    def record(self, event: AttemptEvent) -> QuestStats:
+        """
+        提出を集計に加え、更新後の統計を返す。
+
+        返す統計はこのワーカーの暫定の値で、DB には書き込みスレッドで加える。
+        """
+        key = (event.user_id, event.book, event.quest_id)
+        quest_key = (event.book, event.quest_id)
+        day = int(event.created_at // SECONDS_PER_DAY)
+        with self._lock:
+            aggregate = self._aggregates.get(quest_key)
+            if aggregate is None:
+                aggregate = self._aggregates[quest_key] = _QuestAggregate()
+            delta = [1, int(event.is_correct), 0, 0]
+            progress = self._progress.get(key)
+            if progress is None:
+                progress = self._progress[key] = [event.created_at, False]
+                delta[2] = 1
+            solved_now = event.is_correct and not progress[1]
+            if solved_now:
+                progress[1] = True
+                delta[3] = 1
+                attempt_bucket = min(event.attempt_number, MAX_ATTEMPT_BUCKET)
+                seconds_bucket = _seconds_bucket(event.created_at - progress[0])
+                aggregate.attempt_histogram[attempt_bucket] += 1
+                aggregate.seconds_histogram[seconds_bucket] += 1
+            for i, value in enumerate(delta):
+                aggregate.totals[i] += value
+            counts = aggregate.daily.setdefault(day, [0, 0, 0])
+            counts[0] += 1
+            counts[1] += int(event.is_correct)
+            counts[2] += int(solved_now)
+            # 直近の期間は提出の日時ではなく現在の日付で区切る
+            today = int(time.time() // SECONDS_PER_DAY)
+            aggregate.prune(today)
+            stats = self._stats[quest_key] = aggregate.materialize(
+                event.quest_id, today
+            )
+        self.attempt_store.enqueue_call(_write_event, event)
+        return stats
+
+    def refresh(self) -> None:
+        """
+        DB の集計値を読み直して統計を計算し直す (他のワーカーの提出を反映する)。
+
+        読むのは集計済みのテーブルだけで、提出の記録は走査しない。
+        このプロセスの書き込み待ちの集計値は、先に書き込んでから読み直す。
+        """
+        self.attempt_store.flush()
+        today = int(time.time() // SECONDS_PER_DAY)
+        aggregates: Dict[Tuple[str, int], _QuestAggregate] = defaultdict(
+            _QuestAggregate
+        )
+        for book, quest_id, *totals in self._conn.execute(
+            "SELECT book, quest_id, attempts, correct_attempts, attempted_users, "
+            "solved_users FROM quest_stats"
+        ):
+            aggregates[(book, quest_id)].totals = totals
+        for book, quest_id, kind, bucket, count in self._conn.execute(
+            "SELECT book, quest_id, kind, bucket, count FROM quest_stats_histogram"
+        ):
+            aggregate = aggregates[(book, quest_id)]
+            histogram = (
+                aggregate.attempt_histogram
+                if kind == "attempts"
+                else aggregate.seconds_histogram
+            )
+            histogram[bucket] = count
+        for book, quest_id, day, *counts in self._conn.execute(
+            "SELECT book, quest_id, day, attempts, correct_attempts, solves "
+            "FROM quest_stats_daily WHERE day > ?",
+            (today - max(ROLLING_WINDOW_DAYS),),
+        ):
+            aggregates[(book, quest_id)].daily[day] = counts
+        stats = {
+            key: aggregate.materialize(key[1], today)
+            for key, aggregate in aggregates.items()
+        }
+        with self._lock:
+            self._aggregates = dict(aggregates)
+            self._stats = stats
+            self.refreshed_at = time.monotonic()
+
+    def is_stale(self, max_age_seconds: float = REFRESH_INTERVAL_SECONDS) -> bool:
+        """前回の読み直しから max_age_seconds 以上経っているか"""
+        return time.monotonic() - self.refreshed_at >= max_age_seconds
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+_stores: Dict[int, QuestStatsStore] = {}
+_stores_lock = threading.Lock()
+
+
+def find_quest_stats_store(attempt_store: AttemptStore) -> Optional[QuestStatsStore]:
+    """作成済みの QuestStatsStore を返す (未作成の場合は None、I/O なし)"""
+    return _stores.get(id(attempt_store))
+
+
+def get_quest_stats_store(attempt_store: AttemptStore) -> QuestStatsStore:
+    """
+    attempt_store に対応する QuestStatsStore を返す (初回呼び出し時に作成)。
+
+    作成時に集計値を読み込むため、イベントループからはスレッドプールで呼び出す。
+    """
+    store = _stores.get(id(attempt_store))
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(id(attempt_store))
+            if store is None:
+                store = QuestStatsStore(attempt_store)
+                _stores[id(attempt_store)] = store
+    return store
@@ -0,0 +1,282 @@
+# src/db/sqlite_quest_repository.py
+"""
+SQLite のカタログ (複数のブックのクエスト) を使う QuestRepository。
+
+JSON のブックはクエストをすべてメモリに読み込むため、ブックの数や
+クエストの数が多い場合はこちらを使う。クエストは (ブック, クエストID) と
+(ブック, 難易度) の索引で1件ずつ引くため、起動時に全件を読み込まない。
+
+カタログは JSON のブック (またはコンパイル済みブック) から作成する。
+ブック名はファイル名の拡張子を除いた部分で、同じブックを取り込み直すと
+そのブックのクエストだけが置き換わる。
+
+    python -m src.db.sqlite_quest_repository fixtures/books/part2.json
+
+アプリで使う場合は環境変数で指定する。
+    ES_QUEST_REPOSITORY_BACKEND=sqlite
+    ES_QUEST_CATALOG_PATH=data/catalog.db (デフォルト)
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import click
+
+from src.db.book_repository import BookRepository
+from src.db.connection_pool import ConnectionPool
+from src.models.quest import Quest
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog_books (
+    book TEXT PRIMARY KEY,
+    source_path TEXT NOT NULL,
+    quest_count INTEGER NOT NULL,
+    loadmap TEXT NOT NULL,
+    imported_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS catalog_quests (
+    book TEXT NOT NULL,
+    quest_id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    difficulty INTEGER NOT NULL,
+    query_type_hint TEXT,
+    correct_query TEXT,
+    evaluation_type TEXT NOT NULL,
+    evaluation_data TEXT NOT NULL,
+    hints TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (book, quest_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_catalog_quests_difficulty
+    ON catalog_quests (book, difficulty, quest_id);
+"""
+
+_COLUMNS = (
+    "quest_id, title, description, difficulty, query_type_hint, correct_query, "
+    "evaluation_type, evaluation_data, hints, created_at, updated_at"
+)
+# SQL 文は固定の文字列にして、接続ごとのプリペアドステートメントを再利用する
+_SELECT_BY_ID = f"SELECT {_COLUMNS} FROM catalog_quests WHERE book = ? AND quest_id = ?"
+_SELECT_BY_DIFFICULTY = (
+    f"SELECT {_COLUMNS} FROM catalog_quests WHERE book = ? AND difficulty = ? "
+    "ORDER BY quest_id"
+)
+_SELECT_ALL_BY_DIFFICULTY = (
+    f"SELECT {_COLUMNS} FROM catalog_quests WHERE book = ? "
+    "ORDER BY difficulty, quest_id"
+)
+_SELECT_ALL = f"SELECT {_COLUMNS} FROM catalog_quests WHERE book = ? ORDER BY quest_id"
+_INSERT = (
+    f"INSERT INTO catalog_quests (book, {_COLUMNS}) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def _row_to_quest(row: Tuple) -> Quest:
+    return Quest(
+        quest_id=row[0],
+        title=row[1],
+        description=row[2],
+        difficulty=row[3],
+        query_type_hint=row[4],
+        correct_query=row[5],
+        evaluation_type=row[6],
+        evaluation_data_raw=row[7],
+        hints_raw=row[8],
+        created_at=row[9],
+        updated_at=row[10],
+    )
+
+
+def book_name(path: Path) -> str:
+    """ブックのファイルパスからカタログ上のブック名を返す"""
+    return Path(path).stem
+
+
+def import_books(catalog_path: Path, book_paths: List[Path]) -> Dict[str, int]:
+    """
+    ブックのクエストをカタログに取り込み、ブックごとの件数を返す。
+
+    ブックごとに1トランザクションで置き換えるため、読み込み中のプロセスからは
+    取り込み前か後のどちらかのクエストだけが見える。
+    """
+    catalog_path = Path(catalog_path)
+    catalog_path.parent.mkdir(parents=True, exist_ok=True)
+    counts: Dict[str, int] = {}
+    conn = sqlite3.connect(catalog_path)
+    try:
+        conn.executescript(_SCHEMA)
+        for path in book_paths:
+            name = book_name(path)
+            # パースエラーはカタログを変更する前に発生させる
+            book_repo = BookRepository(Path(path))
+            quests = book_repo.load_quests()
+            loadmap = json.dumps(book_repo.load_loadmap(), ensure_ascii=False)
+            rows = [
+                (
+                    name,
+                    q.quest_id,
+                    q.title,
+                    q.description,
+                    q.difficulty,
+                    q.query_type_hint,
+                    q.correct_query,
+                    q.evaluation_type,
+                    q.evaluation_data_raw,
+                    q.hints_raw,
+                    q.created_at,
+                    q.updated_at,
+                )
+                for q in quests
+            ]
+            with conn:
+                conn.execute("DELETE FROM catalog_quests WHERE book = ?", (name,))
+                conn.executemany(_INSERT, rows)
+                conn.execute(
+                    "INSERT OR REPLACE INTO catalog_books "
+                    "(book, source_path, quest_count, loadmap, imported_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (name, str(path), len(rows), loadmap, time.time()),
+                )
+            counts[name] = len(rows)
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return counts
+
+
+class SqliteQuestRepository:
+    """カタログの1つのブックを QuestRepository と同じインターフェースで扱う"""
+
+    def __init__(self, pool: ConnectionPool, book: str):
+        self.pool = pool
+        self.book = book
+        with self.pool.connection() as conn:
+            if (
+                conn.execute(
+                    "SELECT 1 FROM catalog_books WHERE book = ?", (book,)
+                ).fetchone()
+                is None
+            ):
+                raise FileNotFoundError(
+                    f"カタログ {pool.path} にブック {book!r} がありません。"
+                    "先に取り込んでください。"
+                )
+
+    @property
+    def quests(self) -> List[Quest]:
+        """全クエストのリスト (呼び出しのたびにカタログから読み込む)"""
+        return self._fetch_all(_SELECT_ALL, (self.book,))
+
+    @property
+    def loadmap(self) -> List[Dict[str, Any]]:
+        """ブックの学習ロードマップ (章のリスト)"""
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT loadmap FROM catalog_books WHERE book = ?", (self.book,)
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else []
+
+    def _fetch_all(self, sql: str, params: Tuple) -> List[Quest]:
+        with self.pool.connection() as conn:
+            return [_row_to_quest(row) for row in conn.execute(sql, params)]
+
+    def get_quest_by_id(self, quest_id) -> Optional[Quest]:
+        """
+        指定されたIDのクエストを取得します (索引による1件の検索)。
+
+        Args:
+            quest_id: 取得するクエストのID (数値または文字列)。
+
+        Returns:
+            Questオブジェクト、または見つからない場合はNone。
+        """
+        try:
+            quest_id = int(quest_id)
+        except (TypeError, ValueError):
+            return None
+        with self.pool.connection() as conn:
+            row = conn.execute(_SELECT_BY_ID, (self.book, quest_id)).fetchone()
+        return _row_to_quest(row) if row is not None else None
+
+    def get_quests_by_difficulty(self, difficulty: int) -> List[Quest]:
+        """指定した難易度のクエストをID順に返す"""
+        return self._fetch_all(_SELECT_BY_DIFFICULTY, (self.book, difficulty))
+
+    def get_all_quests(self, order_by_difficulty: bool = True) -> List[Quest]:
+        """
+        すべてのクエストを取得します。
+
+        Args:
+            order_by_difficulty: Trueの場合、難易度順(昇順)でソートします。
+
+        Returns:
+            Questオブジェクトのリスト。
+        """
+        if order_by_difficulty:
+            return self._fetch_all(_SELECT_ALL_BY_DIFFICULTY, (self.book,))
+        return self.quests
+
+
+_pools: Dict[Path, ConnectionPool] = {}
+_repositories: Dict[Tuple[Path, str], SqliteQuestRepository] = {}
+_repositories_lock = threading.Lock()
+
+
+def get_sqlite_quest_repository(
+    catalog_path: Path, book: str, pool_size: int = 4
+) -> SqliteQuestRepository:
+    """
+    カタログのブックのリポジトリを返す (カタログごとにコネクションプールを共有)。
+
+    初回はカタログを開いてブックの有無を確認するため、イベントループからは
+    スレッドプールで呼び出す。
+    """
+    key = (Path(catalog_path).absolute(), book)
+    repository = _repositories.get(key)
+    if repository is None:
+        with _repositories_lock:
+            repository = _repositories.get(key)
+            if repository is None:
+                pool = _pools.get(key[0])
+                if pool is None:
+                    if not key[0].exists():
+                        raise FileNotFoundError(
+                            f"カタログ {key[0]} がありません。"
+                            "先にブックを取り込んでください。"
+                        )
+                    pool = _pools[key[0]] = ConnectionPool(key[0], size=pool_size)
+                repository = SqliteQuestRepository(pool, book)
+                _repositories[key] = repository
+    return repository
+
+
+@click.command()
+@click.argument(
+    "book_paths",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.option(
+    "--db",
+    "catalog_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=Path("data/catalog.db"),
+    show_default=True,
+    help="取り込み先のカタログ",
+)
+def main(book_paths: Tuple[Path, ...], catalog_path: Path):
+    """ブック (JSON またはコンパイル済みブック) をカタログに取り込む"""
+    for name, count in import_books(catalog_path, list(book_paths)).items():
+        click.echo(f"{catalog_path}: {name}: {count} quests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+# src/es/canonical.py
+"""
+クエリの正規化とフィンガープリント。
+
+キャッシュのキーや集計で「同じクエリ」を判定するため、クエリを1回だけ
+パースし、意味が同じ書き方を1つの形 (正規形) にそろえる。
+
+- キーの順序 (正規形の JSON はキーをソートして出力する)
+- 省略形: {"match": {"title": "x"}} は {"match": {"title": {"query": "x"}}}、
+  {"term": {"genre": "x"}} は {"term": {"genre": {"value": "x"}}} と同じ
+- デフォルト値: "operator": "or" や "boost": 1.0 などは省略した場合と同じ
+- bool の句が1つだけの場合のオブジェクトは、要素が1つのリストと同じ
+- トップレベルの "from": 0、"size": 10
+
+    canonical = canonicalize('{"query": {"match": {"title": "elastic"}}}')
+    canonical.fingerprint    # 128 ビットの16進文字列
+    canonical.fingerprint64  # 64 ビットの整数
+    canonical.normalized     # 正規形のクエリ (dict)
+
+提出されたクエリは ParsedQuery として入力を受け取ったところで1回だけ
+パースし、整形したテキストや正規形も必要になったときに1回だけ作成する。
+parse_query() は最近の CACHE_SIZE 件をキャッシュするため、同じテキストを
+何度渡してもパースは1回だけ行われる。返される body と normalized は共有
+されるので、呼び出し側で変更しないこと。
+
+orjson がインストールされていればパースと正規形の出力に使う。正規形の
+テキスト (とフィンガープリント) は、通常は標準の json と同じになる。
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+from typing import Any, Dict, Mapping, Union
+
+try:
+    import orjson
+except ImportError:  # orjson は gradio の依存として入る。無い場合は標準の json
+    orjson = None
+
+CACHE_SIZE = 1024
+
+
+def loads(text: str) -> Any:
+    """JSON をパースする (orjson があれば使う)"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def dumps_compact(value: Any) -> str:
+    """キーをソートした空白なしの JSON (orjson があれば使う)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_SORT_KEYS).decode("utf-8")
+        except TypeError:
+            # 64 ビットを超える整数など、orjson で出力できない値
+            pass
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+# 値を1つ取るクエリと、省略形の値を入れるキー
+_SHORTHAND_KEYS = {
+    "match": "query",
+    "match_phrase": "query",
+    "match_phrase_prefix": "query",
+    "match_bool_prefix": "query",
+    "term": "value",
+    "prefix": "value",
+    "wildcard": "value",
+    "regexp": "value",
+    "fuzzy": "value",
+}
+# 省略した場合と同じ意味になるパラメータの値 (クエリの種類ごと)
+_COMMON_DEFAULTS: Dict[str, Any] = {"boost": 1.0}
+_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "match": {
+        "operator": "or",
+        "zero_terms_query": "none",
+        "lenient": False,
+        "prefix_length": 0,
+        "max_expansions": 50,
+        "fuzzy_transpositions": True,
+        "auto_generate_synonyms_phrase_query": True,
+    },
+    "match_phrase": {"slop": 0, "zero_terms_query": "none"},
+    "match_phrase_prefix": {"slop": 0, "max_expansions": 50},
+    "term": {"case_insensitive": False},
+    "prefix": {"case_insensitive": False},
+    "wildcard": {"case_insensitive": False},
+    "fuzzy": {"max_expansions": 50, "prefix_length": 0, "transpositions": True},
+}
+_BOOL_CLAUSES = ("must", "filter", "should", "must_not")
+_TOP_LEVEL_DEFAULTS: Dict[str, Any] = {"from": 0, "size": 10}
+# 子のキーが集計の名前 (ユーザーが付けた名前) になるキー
+_NAMED_CHILDREN = {"aggs", "aggregations"}
+
+
+def _is_default(value: Any, default: Any) -> bool:
+    if isinstance(default, str):
+        return isinstance(value, str) and value.lower() == default
+    if isinstance(default, bool):
+        return value is default
+    # 1 と 1.0 は同じ値として扱う (True は数値とみなさない)
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and value == default
+    )
+
+
+def _normalize_leaf(kind: str, body: Any) -> Any:
+    """match や term など、フィールド名をキーに持つクエリ"""
+    if not isinstance(body, dict) or len(body) != 1:
+        return _normalize(body)
+    ((field_name, params),) = body.items()
+    if not isinstance(params, dict):
+        params = {_SHORTHAND_KEYS[kind]: params}
+    defaults = _DEFAULTS.get(kind, {})
+    normalized = {}
+    for key, value in params.items():
+        default = defaults.get(key, _COMMON_DEFAULTS.get(key))
+        if default is not None and _is_default(value, default):
+            continue
+        normalized[key] = _normalize(value)
+    return {field_name: normalized}
+
+
+def _normalize_bool(body: Any) -> Any:
+    if not isinstance(body, dict):
+        return _normalize(body)
+    normalized = {}
+    for key, value in body.items():
+        if key in _BOOL_CLAUSES:
+            clauses = value if isinstance(value, list) else [value]
+            if not clauses:
+                continue
+            normalized[key] = [_normalize(c) for c in clauses]
+        elif key in _COMMON_DEFAULTS and _is_default(value, _COMMON_DEFAULTS[key]):
+            continue
+        else:
+            normalized[key] = _normalize(value)
+    return normalized
+
+
+def _normalize(node: Any) -> Any:
+    if isinstance(node, list):
+        return [_normalize(v) for v in node]
+    if not isinstance(node, dict):
+        return node
+    normalized = {}
+    for key, value in node.items():
+        if key in _SHORTHAND_KEYS:
+            normalized[key] = _normalize_leaf(key, value)
+        elif key == "bool":
+            normalized[key] = _normalize_bool(value)
+        elif key in _NAMED_CHILDREN and isinstance(value, dict):
+            # 集計の名前が "match" などでもクエリとして扱わない
+            normalized[key] = {name: _normalize(agg) for name, agg in value.items()}
+        else:
+            normalized[key] = _normalize(value)
+    return normalized
+
+
+@dataclass(frozen=True)
+class CanonicalQuery:
+    """パース済みのクエリと正規形、フィンガープリント"""
+
+    body: Dict[str, Any]
+    normalized: Dict[str, Any]
+    canonical_json: str
+    digest: bytes = field(repr=False)
+
+    @property
+    def fingerprint(self) -> str:
+        """正規形の 128 ビットのハッシュ (16進文字列)"""
+        return self.digest.hex()
+
+    @property
+    def fingerprint64(self) -> int:
+        """正規形の 64 ビットのハッシュ (集計用の整数のキー)"""
+        return int.from_bytes(self.digest[:8], "big")
+
+
+def _canonical_from_body(body: Dict[str, Any]) -> CanonicalQuery:
+    normalized = _normalize(body)
+    for key, default in _TOP_LEVEL_DEFAULTS.items():
+        if key in normalized and _is_default(normalized[key], default):
+            del normalized[key]
+    canonical_json = dumps_compact(normalized)
+    digest = hashlib.blake2b(canonical_json.encode("utf-8"), digest_size=16).digest()
+    return CanonicalQuery(body, normalized, canonical_json, digest)
+
+
+@dataclass(frozen=True, eq=False)
+class ParsedQuery:
+    """
+    提出されたクエリ (入力のテキストとパース済みの dict)。
+
+    入力を受け取ったところで1回だけ作成し、QuestService や AgentService に
+    そのまま渡す。整形したテキストと正規形は初めて使うときに作成する。
+    """
+
+    text: str
+    body: Dict[str, Any] = field(repr=False)
+
+    @classmethod
+    def of(cls, query: Union["ParsedQuery", str]) -> "ParsedQuery":
+        """ParsedQuery はそのまま、文字列はパースして返す"""
+        return query if isinstance(query, ParsedQuery) else parse_query(query)
+
+    @cached_property
+    def pretty(self) -> str:
+        """表示用に整形したテキスト (インデント 4)"""
+        return json.dumps(self.body, indent=4, ensure_ascii=False)
+
+    @cached_property
+    def canonical(self) -> CanonicalQuery:
+        return _canonical_from_body(self.body)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_query(text: str) -> ParsedQuery:
+    """
+    クエリのテキストをパースする (同じテキストは2回目以降キャッシュを返す)。
+
+    Raises:
+        json.JSONDecodeError: JSON として不正な場合.
+        ValueError: JSON のオブジェクトではない場合.
+    """
+    body = loads(text)
+    if not isinstance(body, dict):
+        raise ValueError("Query must be a JSON object.")
+    return ParsedQuery(text, body)
+
+
+def canonicalize(query: Union[ParsedQuery, str, Mapping[str, Any]]) -> CanonicalQuery:
+    """
+    クエリ (ParsedQuery、JSON 文字列または dict) を正規化する。
+
+    Raises:
+        json.JSONDecodeError: 文字列が JSON として不正な場合.
+        ValueError: クエリが JSON のオブジェクトではない場合.
+    """
+    if isinstance(query, (ParsedQuery, str)):
+        return ParsedQuery.of(query).canonical
+    if not isinstance(query, Mapping):
+        raise ValueError("Query must be a JSON object.")
+    return _canonical_from_body(dict(query))
@@ -1,21 +1,46 @@
 # src/es/client.py (修正例)
+import logging
+from typing import Any, Dict
+
 from elasticsearch import Elasticsearch
 
 from ..config import AppConfig  # AppConfig をインポート
 
 # from ..exceptions import InitializationError # 必要なら
 
+logger = logging.getLogger(__name__)
+
+
+def transport_options(config: AppConfig) -> Dict[str, Any]:
+    """接続プール・圧縮・スニッフィング・再試行の設定"""
+    options: Dict[str, Any] = {
+        # 操作ごとのタイムアウトは src/es/resilience.py で設定する
+        "request_timeout": config.es_request_timeout,
+        "connections_per_node": config.es_connections_per_node,
+        "http_compress": config.es_http_compress,
+        "retry_on_timeout": config.es_retry_on_timeout,
+        "max_retries": config.es_max_retries,
+    }
+    if config.es_sniff:
+        if config.elastic_cloud_id:
+            # Elastic Cloud ではプロキシ経由のためスニッフィングできない
+            logger.warning("Elastic Cloud ではスニッフィングは使用できません。")
+        else:
+            options["sniff_on_start"] = True
+            options["sniff_on_node_failure"] = True
+    return options
+
 
 def get_es_client(config: AppConfig) -> Elasticsearch:
     """Elasticsearchクライアントを取得する (設定オブジェクトを使用)"""
-    common_args = {"request_timeout": 60}  # 共通設定
+    common_args = transport_options(config)  # 共通設定
 
     if config.elastic_cloud_id:
         # クラウドIDを使用
         if not config.elasticsearch_username or not config.elasticsearch_password:
             # 警告を出すかエラーにする
-            print(
-                "警告: Cloud IDを使用する場合、ELASTICSEARCH_USERNAME と "
+            logger.warning(
+                "Cloud IDを使用する場合、ELASTICSEARCH_USERNAME と "
                 "ELASTICSEARCH_PASSWORD の設定が必要です。"
             )
             # raise InitializationError("Cloud ID認証にはユーザー名
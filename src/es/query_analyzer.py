@@ -0,0 +1,559 @@
+# src/es/query_analyzer.py
+"""
+ユーザーのクエリを実行前に検査し、共有クラスタに負荷をかけるクエリを拒否する。
+
+クエリの構造 (AST) をたどって次の点を検査し、コストを見積もる。
+
+- size と from + size (深いページング) の上限 (数値の文字列や小数部が 0 の
+  小数は整数として扱い、整数でない値は拒否する)
+- 使用を禁止したクエリの種類 (QueryLimits.forbidden_query_types)
+- 先頭がワイルドカードの wildcard クエリ、query_string / simple_query_string
+  の語と、".*" で始まる regexp クエリ
+- 集計のバケット数 (入れ子の集計はバケット数の積) と text フィールドの集計
+- knn の num_candidates と rescore の window_size
+- 推定コストの合計 (スクリプト (runtime_mappings を含む) や knn などは
+  重く見積もる)
+
+フィールドの型はインデックスのマッピングから求める (get_field_types)。
+wildcard などを text フィールドに使う場合はコストを2倍に見積もる。
+
+検査を通ったクエリには timeout と terminate_after を付与する (指定された
+値が上限より大きい場合は上限に置き換える)。どちらかに達した場合、
+Elasticsearch はそこまでの結果を返す (timed_out / terminated_early)。
+
+    analysis = analyze_query(body, limits, field_types)
+    if analysis.rejected:
+        raise QueryRejectedError(analysis.message())
+    body = apply_limits(body, limits)
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional
+
+from .resilience import es_operation
+
+# クエリの種類ごとの推定コスト (種類の一覧にないものは DEFAULT_QUERY_COST)
+QUERY_COSTS: Dict[str, float] = {
+    "match_all": 1,
+    "match_none": 0,
+    "match": 1,
+    "match_phrase": 2,
+    "match_phrase_prefix": 5,
+    "match_bool_prefix": 5,
+    "multi_match": 2,
+    "combined_fields": 2,
+    "query_string": 10,
+    "simple_query_string": 5,
+    "term": 1,
+    "terms": 1,
+    "terms_set": 5,
+    "range": 2,
+    "exists": 1,
+    "ids": 1,
+    "prefix": 5,
+    "wildcard": 10,
+    "regexp": 20,
+    "fuzzy": 10,
+    "script": 50,
+    "more_like_this": 20,
+    "bool": 0,
+    "constant_score": 0,
+    "dis_max": 0,
+    "boosting": 1,
+    "function_score": 5,
+    "script_score": 50,
+    "nested": 5,
+    "has_child": 20,
+    "has_parent": 20,
+    "knn": 0,  # num_candidates から見積もる
+}
+DEFAULT_QUERY_COST = 5.0
+SCRIPT_COST = 50.0
+# 範囲が分からない histogram などのバケット数の見積もり
+UNBOUNDED_BUCKET_ESTIMATE = 100
+
+# 子のクエリを持つクエリと、子のクエリが入るキー
+_COMPOUND_QUERIES: Dict[str, tuple] = {
+    "bool": ("must", "filter", "should", "must_not"),
+    "constant_score": ("filter",),
+    "function_score": ("query",),
+    "script_score": ("query",),
+    "nested": ("query",),
+    "has_child": ("query",),
+    "has_parent": ("query",),
+    "boosting": ("positive", "negative"),
+    "dis_max": ("queries",),
+}
+# text フィールドに使うとコストが大きくなるクエリ
+_TERM_SCAN_QUERIES = {"prefix", "wildcard", "regexp", "fuzzy"}
+_SIZED_AGGREGATIONS = {
+    "terms",
+    "multi_terms",
+    "significant_terms",
+    "significant_text",
+    "composite",
+}
+_UNBOUNDED_AGGREGATIONS = {
+    "histogram",
+    "date_histogram",
+    "auto_date_histogram",
+    "variable_width_histogram",
+    "geohash_grid",
+    "geotile_grid",
+}
+# query_string の語の先頭のワイルドカード ("*" だけの語は全件の指定なので除く)
+_LEADING_WILDCARD_TERM = re.compile(r"(?:^|[\s(:+\-!])[*?](?=[^\s)])")
+_TEXT_QUERIES = {"query_string", "simple_query_string"}
+_TIME_VALUE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(nanos|micros|ms|s|m|h|d)\s*$")
+_TIME_UNITS = {
+    "nanos": 1e-9,
+    "micros": 1e-6,
+    "ms": 1e-3,
+    "s": 1.0,
+    "m": 60.0,
+    "h": 3600.0,
+    "d": 86400.0,
+}
+
+
+def parse_time_value(value: Any) -> Optional[float]:
+    """Elasticsearch の時間の指定 ("500ms"、"5s" など) を秒に変換する"""
+    if not isinstance(value, str):
+        return None
+    match = _TIME_VALUE.match(value)
+    if match is None:
+        return None
+    return float(match.group(1)) * _TIME_UNITS[match.group(2)]
+
+
+def _integer(value: Any) -> Optional[int]:
+    """
+    整数のパラメータを int に変換する (整数として解釈できない場合は None)。
+
+    Elasticsearch は "100" や 100.0 も整数として受け付けるため、上限の検査の
+    前にそろえる。
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+@dataclass(frozen=True)
+class QueryLimits:
+    """実行を許可するクエリの上限"""
+
+    max_size: int = 100
+    max_result_window: int = 1000
+    max_aggregation_buckets: int = 1000
+    max_knn_candidates: int = 1000
+    max_cost: float = 1000.0
+    forbidden_query_types: FrozenSet[str] = frozenset()
+    allow_leading_wildcard: bool = False
+    timeout: str = "5s"
+    terminate_after: int = 100000
+
+    @classmethod
+    def from_config(cls, config) -> Optional["QueryLimits"]:
+        """AppConfig の設定から作成する (検査を無効にしている場合は None)"""
+        if not config.query_limits_enabled:
+            return None
+        forbidden = {
+            t.strip() for t in config.query_forbidden_types.split(",") if t.strip()
+        }
+        return cls(
+            max_size=config.query_max_size,
+            max_result_window=config.query_max_result_window,
+            max_aggregation_buckets=config.query_max_aggregation_buckets,
+            max_knn_candidates=config.query_max_knn_candidates,
+            max_cost=config.query_max_cost,
+            forbidden_query_types=frozenset(forbidden),
+            timeout=config.query_timeout,
+            terminate_after=config.query_terminate_after,
+        )
+
+
+@dataclass
+class QueryAnalysis:
+    """検査の結果 (推定コストと違反の一覧)"""
+
+    cost: float = 0.0
+    aggregation_buckets: int = 0
+    violations: List[str] = field(default_factory=list)
+
+    @property
+    def rejected(self) -> bool:
+        return bool(self.violations)
+
+    def message(self) -> str:
+        lines = "\n".join(f"- {v}" for v in self.violations)
+        return f"クラスタへの負荷が大きいため、クエリは実行されませんでした。\n{lines}"
+
+
+def _field_params(body: Any):
+    """{"field": params} 形式のクエリのフィールド名とパラメータ"""
+    if isinstance(body, dict):
+        for name, params in body.items():
+            if name not in ("boost", "_name"):
+                return name, params
+    return None, None
+
+
+class _Analyzer:
+    def __init__(self, limits: QueryLimits, field_types: Mapping[str, str]):
+        self.limits = limits
+        self.field_types = field_types
+        self.result = QueryAnalysis()
+
+    def violation(self, message: str) -> None:
+        if message not in self.result.violations:
+            self.result.violations.append(message)
+
+    def integer(self, name: str, value: Any, default: int) -> int:
+        """整数のパラメータ (指定が無い場合は default、整数でない場合は違反)"""
+        if value is None:
+            return default
+        number = _integer(value)
+        if number is None:
+            self.violation(f"{name} ({value!r}) は整数で指定してください。")
+            return default
+        return number
+
+    def query(self, node: Any) -> float:
+        """クエリ (の配列) のコスト"""
+        if isinstance(node, list):
+            return sum(self.query(n) for n in node)
+        if not isinstance(node, dict):
+            return 0.0
+        return sum(self.clause(kind, body) for kind, body in node.items())
+
+    def clause(self, kind: str, body: Any) -> float:
+        if kind in self.limits.forbidden_query_types:
+            self.violation(f"{kind} クエリは使用できません。")
+        cost = float(QUERY_COSTS.get(kind, DEFAULT_QUERY_COST))
+        if kind in _COMPOUND_QUERIES and isinstance(body, dict):
+            for key in _COMPOUND_QUERIES[kind]:
+                cost += self.query(body.get(key))
+            if kind == "function_score":
+                for function in body.get("functions", []) or []:
+                    if isinstance(function, dict) and "script_score" in function:
+                        cost += SCRIPT_COST
+                    if isinstance(function, dict) and "filter" in function:
+                        cost += self.query(function["filter"])
+            if kind in ("nested", "has_child", "has_parent"):
+                self.inner_hits(body.get("inner_hits"))
+            return cost
+        if kind == "knn":
+            return self.knn(body)
+        name, params = _field_params(body)
+        if kind in ("wildcard", "regexp") and name is not None:
+            self.leading_pattern(kind, name, params)
+        if kind in _TEXT_QUERIES and isinstance(body, dict):
+            self.leading_wildcard_term(kind, body)
+        if kind == "intervals" and name is not None:
+            self.interval_rule(name, params)
+        if kind in _TERM_SCAN_QUERIES and self.field_types.get(name) == "text":
+            cost *= 2
+        if kind == "terms" and isinstance(params, list):
+            cost += len(params) / 100
+        return cost
+
+    def leading_pattern(self, kind: str, name: str, params: Any) -> None:
+        if self.limits.allow_leading_wildcard:
+            return
+        if isinstance(params, dict):
+            params = params.get("value", params.get(kind, params.get("wildcard")))
+        if not isinstance(params, str):
+            return
+        if kind == "wildcard" and params[:1] in ("*", "?"):
+            self.violation(
+                f"先頭がワイルドカードの wildcard クエリ ({name}: {params!r}) は"
+                "使用できません。"
+            )
+        elif kind == "regexp" and params.startswith((".*", ".+")):
+            self.violation(
+                f'".*" で始まる regexp クエリ ({name}: {params!r}) は使用できません。'
+            )
+
+    def leading_wildcard_term(self, kind: str, body: Dict[str, Any]) -> None:
+        """query_string などの検索文の語が "*" や "?" で始まっていないか"""
+        if self.limits.allow_leading_wildcard:
+            return
+        # 利用者が先頭のワイルドカードを無効にしている場合は通常の語として扱われる
+        if body.get("allow_leading_wildcard") is False:
+            return
+        text = body.get("query")
+        if isinstance(text, str) and _LEADING_WILDCARD_TERM.search(text):
+            self.violation(
+                f"先頭がワイルドカードの語を含む {kind} クエリ ({text!r}) は"
+                "使用できません。"
+            )
+
+    def interval_rule(self, name: str, rule: Any) -> None:
+        """intervals クエリの規則 (入れ子を含む) の wildcard / prefix を検査する"""
+        if not isinstance(rule, dict):
+            return
+        for kind, params in rule.items():
+            if not isinstance(params, dict):
+                continue
+            if kind in ("wildcard", "regexp"):
+                self.leading_pattern(kind, name, params.get("pattern"))
+            elif kind == "prefix" and not self.limits.allow_leading_wildcard:
+                # 空の prefix はすべての語に一致する
+                if params.get("prefix") == "":
+                    self.violation(
+                        f"空の prefix を持つ intervals クエリ ({name}) は"
+                        "使用できません。"
+                    )
+            elif kind in ("all_of", "any_of"):
+                for child in params.get("intervals", []) or []:
+                    self.interval_rule(name, child)
+            if "filter" in params and isinstance(params["filter"], dict):
+                for child in params["filter"].values():
+                    self.interval_rule(name, child)
+
+    def inner_hits(self, inner_hits: Any) -> None:
+        """inner_hits (の配列) の size を検査する"""
+        for item in inner_hits if isinstance(inner_hits, list) else [inner_hits]:
+            if not isinstance(item, dict):
+                continue
+            size = self.integer("inner_hits の size", item.get("size"), 3)
+            if size > self.limits.max_size:
+                self.violation(
+                    f"inner_hits の size ({size}) が上限 {self.limits.max_size} を"
+                    "超えています。"
+                )
+
+    def knn(self, body: Any) -> float:
+        if isinstance(body, list):
+            return sum(self.knn(b) for b in body)
+        if not isinstance(body, dict):
+            return 0.0
+        k = self.integer("knn の k", body.get("k"), 10)
+        candidates = self.integer(
+            "knn の num_candidates",
+            body.get("num_candidates"),
+            min(max(int(k * 1.5), k), 10000),
+        )
+        if candidates > self.limits.max_knn_candidates:
+            self.violation(
+                f"knn の num_candidates ({candidates}) が上限 "
+                f"{self.limits.max_knn_candidates} を超えています。"
+            )
+        if k > self.limits.max_size:
+            self.violation(
+                f"knn の k ({k}) が上限 {self.limits.max_size} を超えています。"
+            )
+        return max(candidates / 10, 1.0) + self.query(body.get("filter"))
+
+    def aggregations(self, aggs: Any, parent_buckets: int = 1) -> float:
+        if not isinstance(aggs, dict):
+            return 0.0
+        cost = 0.0
+        for agg in aggs.values():
+            if not isinstance(agg, dict):
+                continue
+            buckets = 1
+            for kind, body in agg.items():
+                if kind in ("aggs", "aggregations", "meta"):
+                    continue
+                if not isinstance(body, dict):
+                    continue
+                buckets = max(buckets, self.buckets(kind, body))
+                name = body.get("field")
+                if self.field_types.get(name) == "text":
+                    self.violation(
+                        f"text フィールド ({name}) の集計はできません。"
+                        "keyword のフィールドを指定してください。"
+                    )
+                if "script" in body:
+                    cost += SCRIPT_COST
+                if kind == "top_hits":
+                    size = self.integer("top_hits の size", body.get("size"), 3)
+                    if size > self.limits.max_size:
+                        self.violation(
+                            f"top_hits の size ({size}) が上限 "
+                            f"{self.limits.max_size} を超えています。"
+                        )
+                if kind == "filter":
+                    cost += self.query(body)
+                elif kind == "filters" and isinstance(body.get("filters"), dict):
+                    cost += self.query(list(body["filters"].values()))
+            total = parent_buckets * buckets
+            self.result.aggregation_buckets += total
+            cost += 2 + total / 10
+            cost += self.aggregations(
+                agg.get("aggs", agg.get("aggregations")), parent_buckets=total
+            )
+        return cost
+
+    @staticmethod
+    def buckets(kind: str, body: Dict[str, Any]) -> int:
+        if kind in _SIZED_AGGREGATIONS:
+            size = _integer(body.get("size", 10))
+            return size if size is not None and size > 0 else 10
+        if kind in ("range", "date_range", "ip_range"):
+            return max(len(body.get("ranges", []) or []), 1)
+        if kind == "filters":
+            filters = body.get("filters")
+            return max(len(filters), 1) if isinstance(filters, (dict, list)) else 1
+        if kind in _UNBOUNDED_AGGREGATIONS:
+            buckets = _integer(body.get("buckets"))
+            return buckets if buckets is not None else UNBOUNDED_BUCKET_ESTIMATE
+        return 1
+
+    def search(self, body: Dict[str, Any]) -> QueryAnalysis:
+        limits = self.limits
+        size = self.integer("size", body.get("size"), 10)
+        start = self.integer("from", body.get("from"), 0)
+        if size > limits.max_size:
+            self.violation(f"size ({size}) が上限 {limits.max_size} を超えています。")
+        if start + size > limits.max_result_window:
+            self.violation(
+                f"from + size ({start + size}) が上限 {limits.max_result_window} を"
+                "超えています。深いページングには search_after を使ってください。"
+            )
+        cost = self.query(body.get("query")) + self.query(body.get("post_filter"))
+        cost += self.knn(body.get("knn"))
+        rescores = body.get("rescore")
+        for rescore in rescores if isinstance(rescores, list) else [rescores]:
+            if not isinstance(rescore, dict):
+                continue
+            window = self.integer(
+                "rescore の window_size", rescore.get("window_size"), 10
+            )
+            if window > limits.max_result_window:
+                self.violation(
+                    f"rescore の window_size ({window}) が上限 "
+                    f"{limits.max_result_window} を超えています。"
+                )
+            query = rescore.get("query", {})
+            inner = query.get("rescore_query") if isinstance(query, dict) else None
+            cost += max(window / 10, 1.0) * self.query(inner)
+        cost += self.aggregations(body.get("aggs", body.get("aggregations")))
+        collapse = body.get("collapse")
+        if isinstance(collapse, dict):
+            self.inner_hits(collapse.get("inner_hits"))
+        sort = body.get("sort")
+        for item in sort if isinstance(sort, list) else [sort]:
+            if isinstance(item, dict) and "_script" in item:
+                cost += SCRIPT_COST
+        script_fields = body.get("script_fields")
+        if isinstance(script_fields, dict):
+            cost += SCRIPT_COST * len(script_fields)
+        # ランタイムフィールドのスクリプトはドキュメントごとに実行される
+        runtime_mappings = body.get("runtime_mappings")
+        if isinstance(runtime_mappings, dict):
+            cost += SCRIPT_COST * sum(
+                1
+                for definition in runtime_mappings.values()
+                if isinstance(definition, dict) and "script" in definition
+            )
+
+        if self.result.aggregation_buckets > limits.max_aggregation_buckets:
+            self.violation(
+                f"集計のバケット数 (推定 {self.result.aggregation_buckets}) が上限 "
+                f"{limits.max_aggregation_buckets} を超えています。"
+            )
+        self.result.cost = cost
+        if cost > limits.max_cost:
+            self.violation(
+                f"クエリの推定コスト ({cost:.0f}) が上限 {limits.max_cost:.0f} を"
+                "超えています。"
+            )
+        return self.result
+
+
+def analyze_query(
+    body: Mapping[str, Any],
+    limits: QueryLimits,
+    field_types: Optional[Mapping[str, str]] = None,
+) -> QueryAnalysis:
+    """
+    クエリを検査し、推定コストと制限への違反を返す。
+
+    Args:
+        body: 検索リクエストの本文.
+        limits: 制限.
+        field_types: フィールド名 (ドット区切り) -> 型。None の場合は
+            フィールドの型による見積もりをしない.
+    """
+    return _Analyzer(limits, field_types or {}).search(dict(body))
+
+
+def apply_limits(body: Mapping[str, Any], limits: QueryLimits) -> Dict[str, Any]:
+    """timeout と terminate_after を付与した本文を返す (body は変更しない)"""
+    limited = dict(body)
+    requested = parse_time_value(limited.get("timeout"))
+    maximum = parse_time_value(limits.timeout)
+    if maximum is not None and (requested is None or requested > maximum):
+        limited["timeout"] = limits.timeout
+    if limits.terminate_after > 0:
+        terminate_after = limited.get("terminate_after")
+        if (
+            not isinstance(terminate_after, int)
+            or isinstance(terminate_after, bool)
+            or not 0 < terminate_after <= limits.terminate_after
+        ):
+            limited["terminate_after"] = limits.terminate_after
+    return limited
+
+
+def mapping_field_types(mapping_response: Mapping[str, Any]) -> Dict[str, str]:
+    """get_mapping のレスポンスからフィールド名 (ドット区切り) -> 型を作成する"""
+    field_types: Dict[str, str] = {}
+
+    def walk(properties: Any, prefix: str) -> None:
+        if not isinstance(properties, dict):
+            return
+        for name, definition in properties.items():
+            if not isinstance(definition, dict):
+                continue
+            path = prefix + name
+            field_types[path] = definition.get("type", "object")
+            walk(definition.get("properties"), path + ".")
+            # マルチフィールド (title.keyword など)
+            walk(definition.get("fields"), path + ".")
+
+    for index_mapping in mapping_response.values():
+        if isinstance(index_mapping, dict):
+            walk(index_mapping.get("mappings", {}).get("properties"), "")
+    return field_types
+
+
+_field_types: Dict[str, Dict[str, str]] = {}
+
+
+def get_field_types(es_client, index_name: str) -> Dict[str, str]:
+    """
+    インデックスのフィールドの型を返す (インデックスごとに1回だけ取得する)。
+
+    マッピングを取得できない場合は空の辞書を返す (次回に取得し直す)。
+    """
+    field_types = _field_types.get(index_name)
+    if field_types is None:
+        try:
+            with es_operation(es_client, "mapping") as client:
+                response = client.indices.get_mapping(index=index_name)
+        except Exception:
+            return {}
+        field_types = mapping_field_types(getattr(response, "body", response))
+        _field_types[index_name] = field_types
+    return field_types
+
+
+def evict_field_types(index_name: Optional[str] = None) -> None:
+    """インデックスを作り直したときに、保持しているフィールドの型を破棄する"""
+    if index_name is None:
+        _field_types.clear()
+    else:
+        _field_types.pop(index_name, None)
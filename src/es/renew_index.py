@@ -1,10 +1,15 @@
 import json
+import logging
 import os
 
 from elasticsearch.helpers import bulk
 
 from src.config import load_config
+from src.db.book_repository import BookRepository
 from src.es.client import get_es_client
+from src.utils.log import configure_logging
+
+logger = logging.getLogger(__name__)
 
 
 def delete_index(es_client, index_name):
@@ -30,6 +35,7 @@ def create_index(es_client, index_name, book_file):
 
 
 def main():
+    configure_logging()
     # AppConfig から設定を読み込み Elasticsearch クライアントを初期化
     config = load_config()
     es = get_es_client(config)
@@ -37,20 +43,18 @@ def main():
     # インデックス名を取得
     index_name = os.environ.get("INDEX_NAME", config.index_name)
 
-    # 入力 JSON ファイルの取得 (fixters/tests/book.json)
-    with open(config.book_path, encoding="utf-8") as f:
-        data = json.load(f)
-
-    mapping = data["mappings"]
-    sample_data = data["sample_data"]
+    # 入力ブックの取得 (fixters/tests/book.json またはコンパイル済みブック)
+    book_repo = BookRepository(config.book_path)
+    mapping = book_repo.load_mappings()
+    sample_data = book_repo.iter_sample_data()
 
-    print(f"Deleting index: {index_name}")
+    logger.info("deleting index: %s", index_name)
     delete_index(es, index_name)
 
-    print(f"Creating index: {index_name}")
+    logger.info("creating index: %s", index_name)
     es.options(ignore_status=[400]).indices.create(index=index_name, body=mapping)
 
-    print("Appending documents from input file")
+    logger.info("appending documents from %s", config.book_path)
     actions = []
     for doc in sample_data:
         if "_index" not in doc:
@@ -59,7 +63,7 @@ def main():
     if actions:
         bulk(es, actions)
 
-    print("Setup ES index complete.")
+    logger.info("setup ES index complete", extra={"documents": len(actions)})
 
 
 if __name__ == "__main__":
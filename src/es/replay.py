@@ -0,0 +1,198 @@
+# src/es/replay.py
+"""
+記録済みの Elasticsearch レスポンスを再生するクライアント。
+
+ベンチマークや負荷試験をオフラインで実行するため、`search` などの
+呼び出しに対して記録ファイルのレスポンスを返す。RecordingEsClient で
+実際のクラスタへの呼び出しを記録し、記録ファイルを作成できる。
+
+記録ファイルの形式:
+    {
+      "mappings": {"<index>": {...get_mapping のレスポンス...}},
+      "searches": [{"index": "...", "body": {...}, "response": {...}}, ...]
+    }
+"""
+
+import copy
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.es.canonical import canonicalize
+
+# 同じクエリとみなすときに無視するリクエストのキー
+# (profile の有無は評価側の都合なので、記録時のレスポンスをそのまま使う。
+# timeout と terminate_after は実行時に付与する上限で、記録の結果は変わらない)
+_IGNORED_BODY_KEYS = {"profile", "timeout", "terminate_after"}
+
+
+def request_key(index: str, body: Dict[str, Any]) -> str:
+    """
+    インデックス名とクエリ本文から記録の検索キーを作成する。
+
+    クエリは正規形にするため、キーの順序や省略形の違いは同じキーになる。
+    """
+    body = {k: v for k, v in body.items() if k not in _IGNORED_BODY_KEYS}
+    return index + "\n" + canonicalize(body).canonical_json
+
+
+class RecordedResponseStore:
+    """記録済みレスポンスを保持するストア"""
+
+    def __init__(
+        self,
+        searches: Optional[Dict[str, Dict[str, Any]]] = None,
+        mappings: Optional[Dict[str, Dict[str, Any]]] = None,
+    ):
+        self.searches: Dict[str, Dict[str, Any]] = searches or {}
+        self.mappings: Dict[str, Dict[str, Any]] = mappings or {}
+
+    @classmethod
+    def load(cls, path: Path) -> "RecordedResponseStore":
+        """記録ファイルを読み込む"""
+        with Path(path).open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        searches = {
+            request_key(entry["index"], entry["body"]): entry["response"]
+            for entry in data.get("searches", [])
+        }
+        return cls(searches, data.get("mappings", {}))
+
+    def save(self, path: Path) -> None:
+        """記録ファイルに書き出す"""
+        entries: List[Dict[str, Any]] = []
+        for key, response in self.searches.items():
+            index, body = key.split("\n", 1)
+            entries.append(
+                {"index": index, "body": json.loads(body), "response": response}
+            )
+        data = {"mappings": self.mappings, "searches": entries}
+        Path(path).write_text(
+            json.dumps(data, indent=2, ensure_ascii=False) + "\n", encoding="utf-8"
+        )
+
+    def record_search(
+        self, index: str, body: Dict[str, Any], response: Dict[str, Any]
+    ) -> None:
+        self.searches[request_key(index, body)] = response
+
+    def find_search(self, index: str, body: Dict[str, Any]) -> Optional[Dict]:
+        return self.searches.get(request_key(index, body))
+
+
+class _ObjectApiResponse(dict):
+    """elasticsearch クライアントのレスポンスと同様に `.body` を持つ dict"""
+
+    @property
+    def body(self) -> Dict[str, Any]:
+        return dict(self)
+
+
+class _ReplayIndices:
+    def __init__(self, store: RecordedResponseStore):
+        self._store = store
+
+    def get_mapping(self, index: str, **kwargs: Any) -> _ObjectApiResponse:
+        if index not in self._store.mappings:
+            raise LookupError(f"記録済みのマッピングがありません: index={index}")
+        return _ObjectApiResponse(copy.deepcopy(self._store.mappings[index]))
+
+    def delete(self, index: str, **kwargs: Any) -> Dict[str, Any]:
+        return {"acknowledged": True}
+
+    def create(self, index: str, **kwargs: Any) -> Dict[str, Any]:
+        return {"acknowledged": True, "index": index}
+
+
+class ReplayEsClient:
+    """
+    記録済みレスポンスを返す Elasticsearch クライアントの代替。
+
+    strict が True の場合、記録にないクエリは LookupError になる。
+    False の場合は 0 件のレスポンスを返す。
+    """
+
+    def __init__(self, store: RecordedResponseStore, strict: bool = True):
+        self.store = store
+        self.strict = strict
+        self.indices = _ReplayIndices(store)
+        self.search_count = 0
+
+    def ping(self) -> bool:
+        return True
+
+    def options(self, **kwargs: Any) -> "ReplayEsClient":
+        return self
+
+    def search(
+        self, index: str, body: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> _ObjectApiResponse:
+        self.search_count += 1
+        body = body or {}
+        response = self.store.find_search(index, body)
+        if response is None:
+            if self.strict:
+                raise LookupError(
+                    f"記録済みのレスポンスがありません: index={index}, "
+                    f"body={json.dumps(body, ensure_ascii=False)}"
+                )
+            response = {
+                "took": 0,
+                "timed_out": False,
+                "hits": {"total": {"value": 0, "relation": "eq"}, "hits": []},
+            }
+        # 評価側でレスポンスを書き換えても記録に影響しないようコピーを返す
+        return _ObjectApiResponse(copy.deepcopy(response))
+
+
+class RecordingEsClient:
+    """実際のクライアントへの search / get_mapping の結果を記録するラッパー"""
+
+    def __init__(self, es_client: Any, store: RecordedResponseStore):
+        self._es_client = es_client
+        self.store = store
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._es_client, name)
+
+    def search(self, index: str, body: Dict[str, Any], **kwargs: Any):
+        response = self._es_client.search(index=index, body=body, **kwargs)
+        self.store.record_search(index, body, dict(response))
+        return response
+
+    def record_mapping(self, index: str) -> None:
+        response = self._es_client.indices.get_mapping(index=index)
+        self.store.mappings[index] = dict(response.body)
+
+
+def main():
+    """
+    設定中のクラスタでブックの正解例 (correct_query) を実行し、記録ファイルを作成する。
+
+    使い方:
+        python -m src.es.replay fixtures/tests/recorded_responses.json
+    """
+    import sys
+
+    from src.config import load_config
+    from src.db.book_repository import BookRepository
+    from src.es.client import get_es_client
+
+    output_path = Path(sys.argv[1]) if len(sys.argv) > 1 else None
+    if output_path is None:
+        raise SystemExit("usage: python -m src.es.replay <output.json>")
+
+    config = load_config()
+    store = RecordedResponseStore()
+    recorder = RecordingEsClient(get_es_client(config), store)
+    recorder.record_mapping(config.index_name)
+    for quest in BookRepository(config.book_path).load_quests():
+        if quest.correct_query:
+            recorder.search(
+                index=config.index_name, body=json.loads(quest.correct_query)
+            )
+    store.save(output_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# src/es/resilience.py
+"""
+Elasticsearch の呼び出しのタイムアウトとサーキットブレーカー。
+
+クラスタが不調になったときに、全員が request_timeout (60 秒) まで待たされ、
+待ちのリクエストがスレッドプールに積み上がるのを防ぐ。
+
+- 操作 (search / mapping / bulk) ごとにクライアント側のタイムアウトを設ける
+- 接続できない・タイムアウトした・過負荷 (429 / 502 / 503 / 504) の失敗が
+  続いたらブレーカーを開き、しばらくは送信せずに CircuitOpenError で失敗させる
+- 一定時間後に1件だけ試し (half_open)、成功すれば元に戻す
+- 呼び出し元がキャンセル済み (クライアントの切断など) なら送信しない
+
+    with es_operation(es_client, "search") as client:
+        response = client.search(index=index_name, body=body)
+
+クエリの構文エラーなど、クラスタが応答したエラーは失敗として数えない。
+設定は AppConfig (ES_QUEST_ES_*) から configure_resilience() で反映する。
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from elasticsearch import ApiError, ConnectionError, ConnectionTimeout
+
+from ..exceptions import CircuitOpenError
+from ..utils.executor import check_cancelled
+from ..utils.metrics import ES_CIRCUIT_STATE, ES_REJECTED, ES_UNAVAILABLE
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# クラスタが過負荷・停止中であることを示すステータスコード
+UNAVAILABLE_STATUSES = frozenset({429, 502, 503, 504})
+
+
+@dataclass(frozen=True)
+class OperationTimeouts:
+    """操作ごとのクライアント側のタイムアウト (秒)"""
+
+    search: float = 10.0
+    mapping: float = 10.0
+    bulk: float = 120.0
+
+    @classmethod
+    def from_config(cls, config) -> "OperationTimeouts":
+        return cls(
+            search=config.es_search_timeout,
+            mapping=config.es_mapping_timeout,
+            bulk=config.es_bulk_timeout,
+        )
+
+
+class CircuitBreaker:
+    """
+    連続した失敗の回数で開閉するサーキットブレーカー。
+
+    failure_threshold が 0 以下の場合は常に閉じたまま (無効)。
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            logger.warning(
+                "elasticsearch circuit breaker: %s -> %s (failures=%d)",
+                self._state,
+                state,
+                self._failures,
+            )
+            self._state = state
+        ES_CIRCUIT_STATE.set(_STATE_VALUES[state])
+
+    def _retry_in(self) -> float:
+        return max(0.0, self._opened_at + self.reset_timeout - self._clock())
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._retry_in() <= 0:
+                return HALF_OPEN
+            return self._state
+
+    def before_call(self, operation: str = "search") -> None:
+        """
+        送信してよいか確認する。
+
+        Raises:
+            CircuitOpenError: ブレーカーが開いている場合 (half_open で
+                試しのリクエストが実行中の場合も含む).
+        """
+        with self._lock:
+            if self._state == OPEN and self._retry_in() <= 0:
+                self._set_state(HALF_OPEN)
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            retry_in = self._retry_in()
+        ES_REJECTED.inc(operation=operation)
+        raise CircuitOpenError(
+            "Elasticsearch が応答しないため、リクエストを一時的に停止しています"
+            f" (あと {retry_in:.0f} 秒ほどで再試行します)。"
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            self._set_state(CLOSED)
+
+    def release_trial(self) -> None:
+        """結果が分からないまま終わった試しのリクエストの枠を空ける (状態は変えない)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.failure_threshold <= 0:
+                return
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+                self._set_state(OPEN)
+
+    def status(self) -> Dict[str, Any]:
+        """現在の状態 (/metrics やログに出す内容)"""
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "failures": self._failures,
+                "retry_in": round(self._retry_in(), 1) if state == OPEN else 0.0,
+            }
+
+
+def is_unavailable_error(error: BaseException) -> bool:
+    """クラスタに接続できない・過負荷であることを示すエラーか"""
+    if isinstance(error, (ConnectionError, ConnectionTimeout)):
+        return True
+    if isinstance(error, ApiError):
+        return getattr(error, "status_code", None) in UNAVAILABLE_STATUSES
+    return False
+
+
+_timeouts = OperationTimeouts()
+_breaker: Optional[CircuitBreaker] = None
+_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """プロセスで共有するブレーカー (接続先のクラスタは1つ)"""
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker()
+    return _breaker
+
+
+def configure_resilience(config) -> None:
+    """AppConfig の設定を反映する (ブレーカーの設定が変わった場合は作り直す)"""
+    global _timeouts, _breaker
+    _timeouts = OperationTimeouts.from_config(config)
+    breaker = get_circuit_breaker()
+    if (
+        breaker.failure_threshold != config.es_breaker_failures
+        or breaker.reset_timeout != config.es_breaker_reset_seconds
+    ):
+        with _breaker_lock:
+            _breaker = CircuitBreaker(
+                config.es_breaker_failures, config.es_breaker_reset_seconds
+            )
+
+
+def reset_circuit_breaker() -> None:
+    """ブレーカーを初期状態に戻す (テスト用)"""
+    global _breaker, _timeouts
+    with _breaker_lock:
+        _breaker = None
+        _timeouts = OperationTimeouts()
+
+
+def with_timeout(es_client, operation: str):
+    """操作のタイムアウトを設定したクライアントを返す"""
+    options = getattr(es_client, "options", None)
+    if options is None:
+        # options() を持たないテスト用のクライアントなど
+        return es_client
+    return options(request_timeout=getattr(_timeouts, operation))
+
+
+@contextmanager
+def es_operation(es_client, operation: str) -> Iterator[Any]:
+    """
+    タイムアウトを設定したクライアントを渡し、結果をブレーカーに記録する。
+
+    Raises:
+        CircuitOpenError: ブレーカーが開いている場合.
+        BlockingCallCancelled: 呼び出し元がキャンセル済みの場合.
+    """
+    check_cancelled()
+    breaker = get_circuit_breaker()
+    breaker.before_call(operation)
+    try:
+        yield with_timeout(es_client, operation)
+    except BaseException as e:
+        if is_unavailable_error(e):
+            ES_UNAVAILABLE.inc(operation=operation)
+            breaker.record_failure()
+        elif isinstance(e, ApiError):
+            # クラスタは応答している (クエリの誤りなど)
+            breaker.record_success()
+        else:
+            # キャンセルや呼び出し元のエラーではクラスタの状態は分からない
+            breaker.release_trial()
+        raise
+    breaker.record_success()
@@ -6,6 +6,11 @@ from typing import Any, Dict, List, Optional, Tuple
 class Evaluator(ABC):
     """評価ロジックの抽象基底クラス。"""
 
+    # True の場合、クエリを `"profile": true` 付きで実行したレスポンスを要求する
+    requires_profile: bool = False
+    # True の場合、正解例 (correct_query) の実行結果を reference_response として要求する
+    uses_reference: bool = False
+
     def __init__(self, expected_data: Any):
         """
         Args:
@@ -31,12 +36,48 @@ class Evaluator(ABC):
     @staticmethod
     def _get_hits_info(es_response: Dict[str, Any]) -> Tuple[int, List[Dict[str, Any]]]:
         """Elasticsearchレスポンスからヒット数とヒットリストを取得する。"""
-        hits_info = es_response.get("hits", {})
-        total_hits = hits_info.get("total", {}).get("value", 0)
-        actual_hits_list = hits_info.get("hits", [])
-        return total_hits, actual_hits_list
+        if isinstance(es_response, ResponseView):
+            return es_response.hits_info
+        return _extract_hits_info(es_response)
 
     @staticmethod
     def _get_aggregations(es_response: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Elasticsearchレスポンスから集計結果を取得する。"""
+        if isinstance(es_response, ResponseView):
+            return es_response.aggregations
         return es_response.get("aggregations")
+
+    @classmethod
+    def _get_hit_ids(cls, es_response: Dict[str, Any]) -> List[str]:
+        """ElasticsearchレスポンスからヒットしたドキュメントIDを順序通りに取得する。"""
+        if isinstance(es_response, ResponseView):
+            if es_response.hit_ids is None:
+                es_response.hit_ids = [hit["_id"] for hit in es_response.hits_info[1]]
+            return es_response.hit_ids
+        _, actual_hits_list = cls._get_hits_info(es_response)
+        return [hit["_id"] for hit in actual_hits_list]
+
+
+def _extract_hits_info(es_response: Dict[str, Any]) -> Tuple[int, List[Dict[str, Any]]]:
+    hits_info = es_response.get("hits", {})
+    total_hits = hits_info.get("total", {}).get("value", 0)
+    actual_hits_list = hits_info.get("hits", [])
+    return total_hits, actual_hits_list
+
+
+class ResponseView(dict):
+    """
+    ヒット情報と集計結果を一度だけ抽出して保持するレスポンスのビュー。
+
+    複数の Evaluator で同じレスポンスを評価する場合に共有する。
+    Evaluator のヘルパーメソッドはこのビューを受け取ると抽出済みの値を返す。
+    """
+
+    def __init__(self, es_response: Dict[str, Any]):
+        super().__init__(es_response)
+        self.hits_info: Tuple[int, List[Dict[str, Any]]] = _extract_hits_info(
+            es_response
+        )
+        self.aggregations: Optional[Dict[str, Any]] = es_response.get("aggregations")
+        # ドキュメントIDのリストは必要になった時点で一度だけ作成する
+        self.hit_ids: Optional[List[str]] = None
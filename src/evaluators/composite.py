@@ -0,0 +1,99 @@
+# src/evaluators/composite.py
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from .base import Evaluator, ResponseView
+
+
+class CompositeEvaluator(Evaluator):
+    """
+    複数の評価基準を1回のレスポンス解析でまとめて評価するクラス。
+
+    ヒット情報・集計結果は ResponseView で一度だけ抽出し、
+    すべてのサブ評価で共有する。
+    """
+
+    def __init__(self, expected_data: Any):
+        # expected_data は以下の形式を期待
+        # {"criteria": [{"evaluation_type": "...", "evaluation_data": ...}, ...],
+        #  "short_circuit": true}
+        if not isinstance(expected_data, dict):
+            raise TypeError(
+                f"[System Error] 評価データ型エラー (composite): "
+                f"期待する型=dict, 実際の型={type(expected_data).__name__}"
+            )
+        criteria = expected_data.get("criteria")
+        if not isinstance(criteria, list) or not criteria:
+            raise ValueError(
+                "[System Error] compositeの評価データには"
+                " 空でないリスト形式の 'criteria' キーが必要です。"
+            )
+        super().__init__(expected_data)
+        self.short_circuit: bool = bool(expected_data.get("short_circuit", False))
+        self.sub_evaluators: List[Evaluator] = [
+            self._create_sub_evaluator(index, criterion)
+            for index, criterion in enumerate(criteria)
+        ]
+        # いずれかのサブ評価が必要とする実行条件を引き継ぐ
+        self.requires_profile = any(e.requires_profile for e in self.sub_evaluators)
+        self.uses_reference = any(e.uses_reference for e in self.sub_evaluators)
+
+    @staticmethod
+    def _create_sub_evaluator(index: int, criterion: Any) -> Evaluator:
+        """評価基準の定義からサブ評価の Evaluator を生成する。"""
+        # factory が本モジュールをインポートするため、循環参照を避けてここでインポート
+        from .factory import get_evaluator
+
+        if not isinstance(criterion, dict) or "evaluation_type" not in criterion:
+            raise ValueError(
+                f"[System Error] compositeの評価基準 {index + 1} には"
+                " 'evaluation_type' キーが必要です。"
+            )
+        eval_data = criterion.get("evaluation_data")
+        # ブックと同様に JSON 文字列で書かれた評価データも受け付ける
+        if isinstance(eval_data, str):
+            try:
+                eval_data = json.loads(eval_data)
+            except json.JSONDecodeError:
+                raise ValueError(
+                    f"[System Error] compositeの評価基準 {index + 1} の"
+                    f" evaluation_data がJSONデコードできません: {eval_data}"
+                )
+        return get_evaluator(criterion["evaluation_type"], eval_data)
+
+    def evaluate(
+        self,
+        es_response: Dict[str, Any],
+        reference_response: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[bool, str]:
+        view = (
+            es_response
+            if isinstance(es_response, ResponseView)
+            else ResponseView(es_response)
+        )
+
+        is_correct = True
+        messages: List[str] = []
+        for sub_evaluator in self.sub_evaluators:
+            if sub_evaluator.uses_reference:
+                sub_correct, sub_message = sub_evaluator.evaluate(
+                    view, reference_response=reference_response
+                )
+            else:
+                sub_correct, sub_message = sub_evaluator.evaluate(view)
+            messages.append(f"- {sub_message}")
+            if not sub_correct:
+                is_correct = False
+                if self.short_circuit:
+                    break
+
+        num_criteria = len(self.sub_evaluators)
+        details = "\n".join(messages)
+        if is_correct:
+            return (
+                True,
+                f"正解！{num_criteria}件の評価基準をすべて満たしています。\n{details}",
+            )
+        if len(messages) < num_criteria:
+            details += f"\n(残り {num_criteria - len(messages)} 件の評価基準は省略)"
+        return False, f"不正解... 満たしていない評価基準があります。\n{details}"
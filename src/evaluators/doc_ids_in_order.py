@@ -19,14 +19,11 @@ class DocIdsInOrderEvaluator(Evaluator):
         super().__init__(expected_data)
 
     def evaluate(self, es_response: Dict[str, Any]) -> Tuple[bool, str]:
-        _, actual_hits_list = self._get_hits_info(es_response)
         expected_ids_ordered: List[str] = self.expected_data  # 型チェック済み
 
         num_expected = len(expected_ids_ordered)
         # 実際の結果から期待される件数分のIDを順序通りに取得
-        actual_ids_ordered: List[str] = [
-            hit["_id"] for hit in actual_hits_list[:num_expected]
-        ]
+        actual_ids_ordered: List[str] = self._get_hit_ids(es_response)[:num_expected]
 
         is_correct = actual_ids_ordered == expected_ids_ordered
         expected_ids_str = ", ".join(expected_ids_ordered)  # メッセージ表示用
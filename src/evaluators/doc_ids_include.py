@@ -19,11 +19,11 @@ class DocIdsIncludeEvaluator(Evaluator):
         super().__init__(expected_data)
 
     def evaluate(self, es_response: Dict[str, Any]) -> Tuple[bool, str]:
-        total_hits, actual_hits_list = self._get_hits_info(es_response)
+        total_hits, _ = self._get_hits_info(es_response)
         expected_ids: List[str] = self.expected_data  # 型チェック済み
         expected_ids_set: Set[str] = set(expected_ids)
 
-        actual_ids: Set[str] = {hit["_id"] for hit in actual_hits_list}
+        actual_ids: Set[str] = set(self._get_hit_ids(es_response))
         # 期待されるIDのうち、実際の結果に含まれていないものを抽出
         missing_ids: List[str] = sorted(list(expected_ids_set - actual_ids))
 
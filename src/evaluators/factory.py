@@ -3,8 +3,10 @@ from typing import Any, Dict, Type
 
 from .aggregation_result import AggregationResultEvaluator
 from .base import Evaluator
+from .composite import CompositeEvaluator
 from .doc_ids_in_order import DocIdsInOrderEvaluator
 from .doc_ids_include import DocIdsIncludeEvaluator
+from .query_performance import QueryPerformanceEvaluator
 from .result_count import ResultCountEvaluator
 
 # 他の評価クラスもインポート
@@ -16,6 +18,8 @@ EVALUATOR_MAP: Dict[str, Type[Evaluator]] = {
     "doc_ids_include": DocIdsIncludeEvaluator,
     "doc_ids_in_order": DocIdsInOrderEvaluator,
     "aggregation_result": AggregationResultEvaluator,
+    "query_performance": QueryPerformanceEvaluator,
+    "composite": CompositeEvaluator,
 }
 
 
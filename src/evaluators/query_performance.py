@@ -0,0 +1,236 @@
+# src/evaluators/query_performance.py
+from typing import Any, Dict, List, Optional, Tuple
+
+from .base import Evaluator
+
+# スコア計算が不要な (filter 句で十分な) Lucene クエリ型
+# プロファイルの "type" に現れる名前で判定する
+NON_SCORING_QUERY_TYPES = {
+    "PointRangeQuery",
+    "IndexOrDocValuesQuery",
+    "IndexSortSortedNumericDocValuesRangeQuery",
+    "TermInSetQuery",
+    "FieldExistsQuery",
+    "DocValuesFieldExistsQuery",
+    "NormsFieldExistsQuery",
+}
+
+# expected_data で指定できるしきい値キー
+THRESHOLD_KEYS = (
+    "max_took_ms",
+    "max_query_time_ms",
+    "max_scoring_filter_clauses",
+    "max_failed_shards",
+    "max_reference_ratio",
+)
+
+
+def _split_boolean_clauses(description: str) -> List[Tuple[str, str]]:
+    """
+    BooleanQuery の description をトップレベルの句の (記号, 句) に分ける。
+
+    句は空白で区切られ、記号は `+` (MUST)、`#` (FILTER)、`-` (MUST_NOT)、
+    なし (SHOULD) のいずれか。入れ子の BooleanQuery の句は括弧で囲まれ
+    (ブーストが付く場合は `(...)^2.0`)、範囲は `[... TO ...]` や `{...}`、
+    フレーズは引用符で囲まれるため、その中の空白では区切らない。
+    入れ子の句は子ノードの description と比較できるように括弧を外して返す。
+    """
+    clauses: List[Tuple[str, str]] = []
+    depth = 0
+    quoted = False
+    escaped = False
+    start = 0
+    for i, char in enumerate(description + " "):
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth = max(depth - 1, 0)
+        elif char == " " and depth == 0:
+            token = description[start:i]
+            start = i + 1
+            if not token:
+                continue
+            occur = token[0] if token[0] in "+#-" else ""
+            clause = token[len(occur) :]
+            if clause.startswith("("):
+                end = clause.rfind(")")
+                if end > 0 and (end == len(clause) - 1 or clause[end + 1] == "^"):
+                    clause = clause[1:end]
+            clauses.append((occur, clause))
+    return clauses
+
+
+class QueryPerformanceEvaluator(Evaluator):
+    """
+    クエリの実行コストで評価するクラス。
+
+    `"profile": true` 付きで実行したレスポンスの `took`、`_shards`、
+    プロファイルツリーのクエリ実行時間、クエリ/フィルタコンテキストを読み取り、
+    しきい値または正解例 (correct_query) のコストと比較して評価する。
+    """
+
+    requires_profile = True
+
+    def __init__(self, expected_data: Any):
+        # expected_data は {"max_took_ms": 50, "max_reference_ratio": 2.0, ...} 形式
+        if not isinstance(expected_data, dict):
+            raise TypeError(
+                f"[System Error] 評価データ型エラー (query_performance): "
+                f"期待する型=dict, 実際の型={type(expected_data).__name__}"
+            )
+        if not any(key in expected_data for key in THRESHOLD_KEYS):
+            raise ValueError(
+                "[System Error] query_performanceの評価データには"
+                f" {', '.join(THRESHOLD_KEYS)} のいずれかのキーが必要です。"
+            )
+        super().__init__(expected_data)
+        # 正解例との比較が指定されている場合のみ reference_response を要求する
+        self.uses_reference = "max_reference_ratio" in expected_data
+
+    def evaluate(
+        self,
+        es_response: Dict[str, Any],
+        reference_response: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[bool, str]:
+        profile = self._get_profile(es_response)
+        if profile is None:
+            return (
+                False,
+                "[System Error] レスポンスにプロファイル結果 (`profile`) が"
+                "含まれていません。",
+            )
+
+        expected: Dict[str, Any] = self.expected_data  # 型チェック済み
+        took = es_response.get("took", 0)
+        failed_shards = es_response.get("_shards", {}).get("failed", 0)
+        query_time_nanos = self._sum_query_time_nanos(profile)
+        scoring_filters = (
+            self._find_scoring_filter_clauses(
+                profile, set(expected.get("filter_fields", []))
+            )
+            if "max_scoring_filter_clauses" in expected
+            else []
+        )
+
+        problems: List[str] = []
+        if "max_took_ms" in expected and took > expected["max_took_ms"]:
+            problems.append(
+                f"took が {took}ms です (上限: {expected['max_took_ms']}ms)"
+            )
+        if "max_query_time_ms" in expected:
+            query_time_ms = query_time_nanos / 1_000_000
+            if query_time_ms > expected["max_query_time_ms"]:
+                problems.append(
+                    f"クエリ実行時間が {query_time_ms:.3f}ms です "
+                    f"(上限: {expected['max_query_time_ms']}ms)"
+                )
+        if (
+            "max_scoring_filter_clauses" in expected
+            and len(scoring_filters) > expected["max_scoring_filter_clauses"]
+        ):
+            problems.append(
+                "スコア計算が不要な条件がクエリコンテキストにあります。"
+                "`filter` 句に移すとキャッシュが効き高速になります: "
+                f"{', '.join(scoring_filters)}"
+            )
+        if failed_shards > expected.get("max_failed_shards", 0):
+            problems.append(f"{failed_shards} 個のシャードで検索が失敗しています")
+        if "max_reference_ratio" in expected:
+            reference_profile = (
+                self._get_profile(reference_response) if reference_response else None
+            )
+            if reference_profile is None:
+                return (
+                    False,
+                    "[System Error] 正解例のプロファイル結果が取得できないため"
+                    "コストを比較できません。",
+                )
+            reference_nanos = self._sum_query_time_nanos(reference_profile)
+            ratio = query_time_nanos / max(reference_nanos, 1)
+            if ratio > expected["max_reference_ratio"]:
+                problems.append(
+                    f"クエリ実行コストが正解例の {ratio:.1f} 倍です "
+                    f"(上限: {expected['max_reference_ratio']} 倍)"
+                )
+
+        summary = (
+            f"took: {took}ms, クエリ実行時間: {query_time_nanos / 1_000_000:.3f}ms"
+        )
+        if not problems:
+            return True, f"正解！効率的なクエリです。({summary})"
+        problem_lines = "\n".join(f"- {problem}" for problem in problems)
+        return False, (
+            f"不正解... クエリの実行コストに改善の余地があります。({summary})\n"
+            f"{problem_lines}"
+        )
+
+    @staticmethod
+    def _get_profile(es_response: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Elasticsearchレスポンスからプロファイル結果を取得する。"""
+        return es_response.get("profile")
+
+    @staticmethod
+    def _iter_top_level_queries(profile: Dict[str, Any]):
+        """全シャード・全検索のトップレベルのクエリノードを列挙する。"""
+        for shard in profile.get("shards", []):
+            for search in shard.get("searches", []):
+                yield from search.get("query", [])
+
+    def _sum_query_time_nanos(self, profile: Dict[str, Any]) -> int:
+        """トップレベルクエリの実行時間 (ナノ秒) を全シャード分合計する。"""
+        return sum(
+            node.get("time_in_nanos", 0)
+            for node in self._iter_top_level_queries(profile)
+        )
+
+    def _find_scoring_filter_clauses(
+        self, profile: Dict[str, Any], filter_fields: set
+    ) -> List[str]:
+        """
+        BooleanQuery の MUST 句 (`+`) のうち、filter 句で十分な条件を抽出する。
+
+        Lucene の BooleanQuery の description では MUST 句は `+`、
+        FILTER 句は `#` で表現される。プロファイルのツリーをたどり、
+        BooleanQuery の description をトップレベルの句に分けて、子ノードと
+        一致する句の記号でコンテキストを判定する (別の句の一部と一致した文字列を
+        親の句と取り違えない)。FILTER・MUST_NOT の句の中の BooleanQuery は
+        スコアを計算しないため、その MUST 句は対象にしない。
+        """
+        found: List[str] = []
+        # (ノード, スコアを計算するコンテキストか)
+        stack = [(node, True) for node in self._iter_top_level_queries(profile)]
+        while stack:
+            node, scoring = stack.pop()
+            children = node.get("children", [])
+            if node.get("type") != "BooleanQuery":
+                stack.extend((child, scoring) for child in children)
+                continue
+            occurs = {
+                clause: occur
+                for occur, clause in _split_boolean_clauses(node.get("description", ""))
+            }
+            for child in children:
+                description = child.get("description", "")
+                occur = occurs.get(description)
+                # FILTER・MUST_NOT の句の中はスコアを計算しない
+                child_scoring = scoring and occur not in ("#", "-")
+                stack.append((child, child_scoring))
+                if not child_scoring or occur != "+":
+                    continue
+                field = description.split(":", 1)[0].lstrip("(")
+                if (
+                    child.get("type") in NON_SCORING_QUERY_TYPES
+                    or field.endswith(".keyword")
+                    or field in filter_fields
+                ):
+                    if description not in found:
+                        found.append(description)
+        return found
@@ -35,7 +35,19 @@ class InvalidQueryError(QuestCliError):
     pass
 
 
+class QueryRejectedError(InvalidQueryError):
+    """クラスタへの負荷が大きいため実行を拒否したクエリのエラー"""
+
+    pass
+
+
 class AgentError(QuestCliError):
     """エージェント関連のエラー"""
 
     pass
+
+
+class CircuitOpenError(ElasticsearchError):
+    """Elasticsearch が不調なため、リクエストを送信せずに失敗させたエラー"""
+
+    pass
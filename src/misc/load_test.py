@@ -0,0 +1,390 @@
+# src/misc/load_test.py
+"""
+教室の受講者を模擬した UI バックエンドの負荷試験ドライバ。
+
+`src/ui_actions.py` のコールバック (load_quest / test_run_query / submit_answer) を
+Gradio を介さずに直接呼び出し、N 人の受講者を同時に動かす。各受講者はブックの
+クエストを順に進め、問題を読む・試し実行する・回答を提出するの間に思考時間を挟む。
+一定の確率で誤ったクエリを提出し、不正解の後に正解例で再提出する。
+
+LLMエージェントは固定応答のスタブに置き換える。--replay を指定すると
+Elasticsearch の代わりに記録済みレスポンス (src/es/replay.py) を使う。
+
+使い方:
+    python -m src.misc.load_test --students 30 --duration 120 \\
+        --replay fixtures/tests/recorded_responses.json
+"""
+
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+from unittest import mock
+
+import click
+
+from src.config import DEFAULT_BOOK_FILE
+from src.db.book_repository import BookRepository
+from src.models.quest import Quest
+from src.utils.benchmark import percentile
+
+CALLBACK_NAMES = ("load_quest", "test_run_query", "submit_answer")
+
+
+@dataclass
+class LoadTestConfig:
+    """負荷試験の設定"""
+
+    students: int = 10
+    duration_seconds: float = 60.0
+    book_path: Path = DEFAULT_BOOK_FILE
+    # 各操作の間の平均思考時間 (秒)。指数分布でばらつかせる
+    think_time_seconds: float = 3.0
+    # 最初の提出で誤ったクエリを出す確率
+    mistake_rate: float = 0.3
+    # スタブのエージェントの応答時間 (秒)
+    agent_latency_seconds: float = 1.0
+    replay_path: Optional[Path] = None
+    # イベントループ遅延の計測間隔 (秒)
+    lag_interval_seconds: float = 0.05
+    trace_malloc: bool = False
+    seed: Optional[int] = None
+
+
+@dataclass
+class CallbackStats:
+    """コールバックごとの計測結果"""
+
+    durations: List[float] = field(default_factory=list)
+    errors: int = 0
+
+    def record(self, seconds: float, failed: bool = False) -> None:
+        self.durations.append(seconds)
+        if failed:
+            self.errors += 1
+
+    def summary(self, elapsed_seconds: float) -> Dict[str, float]:
+        ordered = sorted(self.durations)
+        return {
+            "count": len(ordered),
+            "errors": self.errors,
+            "per_second": len(ordered) / elapsed_seconds if elapsed_seconds else 0.0,
+            "p50_ms": percentile(ordered, 0.50) * 1000,
+            "p95_ms": percentile(ordered, 0.95) * 1000,
+            "p99_ms": percentile(ordered, 0.99) * 1000,
+            "max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+        }
+
+
+class LoopLagSampler:
+    """
+    一定間隔で sleep し、予定より遅れて起きた時間をイベントループの遅延として記録する。
+    """
+
+    def __init__(self, interval_seconds: float = 0.05):
+        self.interval_seconds = interval_seconds
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            self.lags.append(max(loop.time() - scheduled, 0.0))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def summary(self) -> Dict[str, float]:
+        ordered = sorted(self.lags)
+        return {
+            "samples": len(ordered),
+            "p50_ms": percentile(ordered, 0.50) * 1000,
+            "p99_ms": percentile(ordered, 0.99) * 1000,
+            "max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+        }
+
+
+def make_wrong_query(quest: Quest) -> str:
+    """正解例を崩した誤答クエリを作る (結果が変わるよう検索条件を差し替える)"""
+    body = json.loads(quest.correct_query) if quest.correct_query else {}
+    body["query"] = {"match": {"name": f"wrong answer {quest.quest_id}"}}
+    body.pop("knn", None)
+    return json.dumps(body, ensure_ascii=False)
+
+
+async def _drain(generator) -> None:
+    async for _ in generator:
+        pass
+
+
+class SimulatedStudent:
+    """ブックのクエストを順に解いていく1人の受講者"""
+
+    def __init__(
+        self,
+        student_id: int,
+        quests: List[Quest],
+        config: LoadTestConfig,
+        stats: Dict[str, CallbackStats],
+        rng: random.Random,
+    ):
+        self.student_id = student_id
+        self.quests = quests
+        self.config = config
+        self.stats = stats
+        self.rng = rng
+
+    async def _think(self) -> None:
+        mean = self.config.think_time_seconds
+        if mean > 0:
+            # 長すぎる思考時間は平均の5倍で打ち切る
+            await asyncio.sleep(min(self.rng.expovariate(1 / mean), mean * 5))
+
+    async def _call(self, name: str, func: Callable[[], Awaitable]) -> None:
+        started = time.perf_counter()
+        failed = False
+        try:
+            await func()
+        except Exception:
+            failed = True
+        self.stats[name].record(time.perf_counter() - started, failed)
+
+    async def run(self, ui_actions, deadline: float) -> None:
+        book_path = str(self.config.book_path)
+        # 受講者ごとに開始位置をずらして、全員が同じクエストに集中しないようにする
+        offset = self.student_id % len(self.quests)
+        position = 0
+        while time.monotonic() < deadline:
+            quest = self.quests[(offset + position) % len(self.quests)]
+            position += 1
+            await self._call(
+                "load_quest",
+                lambda: ui_actions.load_quest(quest.quest_id, book_path),
+            )
+            await self._think()
+
+            answers = [quest.correct_query]
+            if self.rng.random() < self.config.mistake_rate:
+                answers.insert(0, make_wrong_query(quest))
+            for answer in answers:
+                if time.monotonic() >= deadline:
+                    return
+                await self._call(
+                    "test_run_query",
+                    lambda: _drain(ui_actions.test_run_query(answer, [])),
+                )
+                await self._think()
+                await self._call(
+                    "submit_answer",
+                    lambda: _drain(
+                        ui_actions.submit_answer(
+                            quest.quest_id,
+                            answer,
+                            [],
+                            book_path,
+                            user_id=f"load-test-{self.student_id}",
+                        )
+                    ),
+                )
+                await self._think()
+
+
+def _patch_backend(stack: ExitStack, config: LoadTestConfig) -> None:
+    """エージェントをスタブに、必要なら Elasticsearch を記録済みの応答に置き換える"""
+    from src import bootstrap
+    from src.services.agent_service import AgentService
+
+    latency = config.agent_latency_seconds
+
+    async def stub_agent(self, quest, user_query_str, rule_eval_message):
+        await asyncio.sleep(latency)
+        return "(負荷試験用のスタブ応答)"
+
+    stack.enter_context(
+        mock.patch.object(AgentService, "run_evaluation_agent", stub_agent)
+    )
+    # 提出の記録は一時ディレクトリの DB に書き込み、開発用の DB を汚さない
+    tmp_dir = stack.enter_context(tempfile.TemporaryDirectory())
+    stack.enter_context(
+        mock.patch.dict(os.environ, {"DB_PATH": str(Path(tmp_dir) / "attempts.db")})
+    )
+    if config.replay_path is not None:
+        from src.es.replay import RecordedResponseStore, ReplayEsClient
+
+        store = RecordedResponseStore.load(config.replay_path)
+        # 誤答クエリは記録に無いため、0件のレスポンスを返させる
+        stack.enter_context(
+            mock.patch.object(
+                bootstrap,
+                "get_es_client",
+                lambda app_config: ReplayEsClient(store, strict=False),
+            )
+        )
+
+
+def _rss_kib() -> int:
+    """プロセスの最大常駐メモリ (KiB)"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS はバイト単位、Linux は KiB 単位
+    return usage // 1024 if sys.platform == "darwin" else usage
+
+
+async def run_load_test(config: LoadTestConfig) -> Dict[str, object]:
+    """負荷試験を実行して結果のサマリーを返す"""
+    from src import ui_actions
+
+    quests = BookRepository(config.book_path).load_quests()
+    if not quests:
+        raise click.ClickException(f"クエストがありません: {config.book_path}")
+    rng = random.Random(config.seed)
+    stats = {name: CallbackStats() for name in CALLBACK_NAMES}
+    sampler = LoopLagSampler(config.lag_interval_seconds)
+
+    if config.trace_malloc:
+        tracemalloc.start()
+    traced_before = tracemalloc.get_traced_memory()[0] if config.trace_malloc else 0
+    rss_before = _rss_kib()
+
+    with ExitStack() as stack:
+        _patch_backend(stack, config)
+        sampler.start()
+        started = time.monotonic()
+        deadline = started + config.duration_seconds
+        students = [
+            SimulatedStudent(i, quests, config, stats, random.Random(rng.random()))
+            for i in range(config.students)
+        ]
+        await asyncio.gather(*(s.run(ui_actions, deadline) for s in students))
+        elapsed = time.monotonic() - started
+        await sampler.stop()
+
+    memory: Dict[str, float] = {
+        "rss_before_kib": rss_before,
+        "rss_after_kib": _rss_kib(),
+    }
+    if config.trace_malloc:
+        traced_after, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory["traced_growth_kib"] = (traced_after - traced_before) / 1024
+        memory["traced_peak_kib"] = traced_peak / 1024
+
+    return {
+        "students": config.students,
+        "elapsed_seconds": elapsed,
+        "callbacks": {name: s.summary(elapsed) for name, s in stats.items()},
+        "loop_lag": sampler.summary(),
+        "memory": memory,
+    }
+
+
+def format_report(report: Dict[str, object]) -> str:
+    """結果のサマリーを表形式の文字列にする"""
+    lines = [
+        f"students={report['students']} elapsed={report['elapsed_seconds']:.1f}s",
+        "",
+        f"{'callback':<16}{'count':>8}{'err':>6}{'req/s':>9}"
+        f"{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}{'maxms':>10}",
+    ]
+    for name, s in report["callbacks"].items():
+        lines.append(
+            f"{name:<16}{s['count']:>8}{s['errors']:>6}{s['per_second']:>9.2f}"
+            f"{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}"
+            f"{s['max_ms']:>10.1f}"
+        )
+    lag = report["loop_lag"]
+    lines += [
+        "",
+        f"event loop lag: p50={lag['p50_ms']:.1f}ms p99={lag['p99_ms']:.1f}ms "
+        f"max={lag['max_ms']:.1f}ms ({lag['samples']} samples)",
+    ]
+    memory = report["memory"]
+    memory_line = (
+        f"memory: max rss {memory['rss_before_kib'] / 1024:.1f}MiB -> "
+        f"{memory['rss_after_kib'] / 1024:.1f}MiB"
+    )
+    if "traced_growth_kib" in memory:
+        memory_line += (
+            f", traced growth={memory['traced_growth_kib']:.1f}KiB "
+            f"peak={memory['traced_peak_kib']:.1f}KiB"
+        )
+    lines.append(memory_line)
+    return "\n".join(lines)
+
+
+@click.command()
+@click.option("--students", type=int, default=10, help="同時に動かす受講者数")
+@click.option("--duration", type=float, default=60.0, help="実行時間 (秒)")
+@click.option(
+    "--book",
+    "book_path",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=DEFAULT_BOOK_FILE,
+    help="ブックファイル",
+)
+@click.option("--think-time", type=float, default=3.0, help="平均思考時間 (秒)")
+@click.option("--mistake-rate", type=float, default=0.3, help="誤答を提出する確率")
+@click.option(
+    "--agent-latency", type=float, default=1.0, help="スタブエージェントの応答時間"
+)
+@click.option(
+    "--replay",
+    "replay_path",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Elasticsearch の代わりに使う記録済みレスポンス",
+)
+@click.option("--trace-malloc", is_flag=True, help="tracemalloc で割り当てを計測")
+@click.option("--json-output", is_flag=True, help="結果を JSON で出力")
+@click.option("--seed", type=int, default=None, help="乱数シード")
+def main(
+    students,
+    duration,
+    book_path,
+    think_time,
+    mistake_rate,
+    agent_latency,
+    replay_path,
+    trace_malloc,
+    json_output,
+    seed,
+):
+    config = LoadTestConfig(
+        students=students,
+        duration_seconds=duration,
+        book_path=book_path,
+        think_time_seconds=think_time,
+        mistake_rate=mistake_rate,
+        agent_latency_seconds=agent_latency,
+        replay_path=replay_path,
+        trace_malloc=trace_malloc,
+        seed=seed,
+    )
+    report = asyncio.run(run_load_test(config))
+    if json_output:
+        click.echo(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        click.echo(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
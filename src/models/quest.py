@@ -16,7 +16,12 @@ class Quest:
     query_type_hint: Optional[str]
     correct_query: Optional[str]
     evaluation_type: Literal[
-        "result_count", "doc_ids_include", "doc_ids_in_order", "aggregation_result"
+        "result_count",
+        "doc_ids_include",
+        "doc_ids_in_order",
+        "aggregation_result",
+        "query_performance",
+        "composite",
     ]
     evaluation_data_raw: str  # DBから取得した生の評価データ(JSON文字列など)
     hints_raw: Optional[str]  # DBから取得した生のヒント(JSON文字列など)
@@ -39,6 +44,8 @@ class Quest:
             "doc_ids_include",
             "doc_ids_in_order",
             "aggregation_result",
+            "query_performance",
+            "composite",
         ]:
             try:
                 return json.loads(self.evaluation_data_raw)
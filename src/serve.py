@@ -0,0 +1,282 @@
+# src/serve.py (マルチプロセス構成のエントリーポイント)
+"""
+UI を複数のワーカープロセスで動かし、1つのポートで公開する。
+
+各ワーカーは `src.ui:create_app` を別々のポートで起動した uvicorn で、
+前段のプロキシがリクエストを振り分ける。Gradio のキューとストリーミング
+(チャットの逐次表示) はワーカーのプロセス内で完結するため、プロキシは
+Cookie でブラウザごとに同じワーカーへ振り分ける (スティッキーセッション)。
+ワーカーが応答しない場合は別のワーカーに振り分け直す。
+
+ワーカー間では次のものを共有する。
+- 正解例と提出されたクエリの実行結果、エージェントのフィードバックの
+  キャッシュ: SQLite (WAL モード) の共有キャッシュ (クエリは正規形のフィンガー
+  プリントをキーにするため、書き方だけが違うクエリも同じ結果を使う)
+- クエストのリポジトリ: コンパイル済みブック (.eqb) を使う場合、各ワーカーの
+  メモリマップは OS のページキャッシュを共有する。ブックの変更は各ワーカーの
+  BookWatcher がそれぞれ検出する。
+- Evaluator はクエストの定義から決まるため、各ワーカーで生成してキャッシュする
+
+メトリクス (/metrics) はワーカーごとに集計されるため、Prometheus からは
+各ワーカーのポートを直接収集すること。
+
+使い方:
+    python -m src.serve --workers 4 --port 7860
+"""
+
+import contextlib
+import itertools
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import click
+
+from src.config import DEFAULT_DATA_DIR, load_env
+from src.utils.log import configure_logging
+from src.utils.shared_cache import SHARED_CACHE_ENV_VAR
+
+logger = logging.getLogger(__name__)
+
+WORKER_COOKIE = "es_quest_worker"
+WORKER_ID_ENV_VAR = "ES_QUEST_WORKER_ID"
+DEFAULT_SHARED_CACHE_PATH = DEFAULT_DATA_DIR / "cache" / "shared_cache.sqlite3"
+
+# プロキシが転送しないホップバイホップのヘッダー
+_HOP_BY_HOP = frozenset(
+    (
+        "connection",
+        "keep-alive",
+        "proxy-authenticate",
+        "proxy-authorization",
+        "te",
+        "trailers",
+        "transfer-encoding",
+        "upgrade",
+    )
+)
+
+
+def _forward_headers(headers) -> List:
+    return [(k, v) for k, v in headers.items() if k.lower() not in _HOP_BY_HOP]
+
+
+class WorkerPool:
+    """ワーカーの URL とスティッキーセッションの振り分け"""
+
+    def __init__(self, worker_urls: List[str]):
+        if not worker_urls:
+            raise ValueError("ワーカーが1つも指定されていません。")
+        self.worker_urls = worker_urls
+        self._round_robin = itertools.cycle(range(len(worker_urls)))
+        self._down_until: Dict[int, float] = {}
+
+    def is_available(self, worker: int) -> bool:
+        return self._down_until.get(worker, 0.0) <= time.monotonic()
+
+    def mark_down(self, worker: int, seconds: float = 5.0) -> None:
+        """接続できなかったワーカーを一定時間、新しい振り分け先から外す"""
+        self._down_until[worker] = time.monotonic() + seconds
+
+    def choose(self, cookie: Optional[str], exclude=()) -> Optional[int]:
+        """Cookie のワーカーが使えればそれを、そうでなければ次のワーカーを返す"""
+        if cookie is not None and cookie.isdigit():
+            worker = int(cookie)
+            if (
+                worker < len(self.worker_urls)
+                and worker not in exclude
+                and self.is_available(worker)
+            ):
+                return worker
+        for _ in range(len(self.worker_urls)):
+            worker = next(self._round_robin)
+            if worker not in exclude and self.is_available(worker):
+                return worker
+        return None
+
+
+def create_proxy_app(worker_urls: List[str], client=None):
+    """
+    ワーカーにリクエストを中継する ASGI アプリを返す。
+
+    Args:
+        worker_urls: ワーカーのベース URL (例: http://127.0.0.1:7861)。
+        client: 中継に使う httpx.AsyncClient (テスト用。省略時は作成する)。
+    """
+    import httpx
+    from starlette.applications import Starlette
+    from starlette.background import BackgroundTask
+    from starlette.requests import Request
+    from starlette.responses import PlainTextResponse, StreamingResponse
+    from starlette.routing import Route
+
+    pool = WorkerPool(worker_urls)
+    if client is None:
+        # ストリーミングの応答は長時間続くため、読み込みのタイムアウトは設けない
+        client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=5.0))
+
+    async def proxy(request: Request):
+        body = await request.body()
+        cookie = request.cookies.get(WORKER_COOKIE)
+        tried = set()
+        while True:
+            worker = pool.choose(cookie, exclude=tried)
+            if worker is None:
+                return PlainTextResponse("利用できるワーカーがありません。", 502)
+            tried.add(worker)
+            upstream = client.build_request(
+                request.method,
+                worker_urls[worker] + request.url.path,
+                params=request.url.query,
+                headers=_forward_headers(request.headers),
+                content=body,
+            )
+            try:
+                response = await client.send(upstream, stream=True)
+            except httpx.TransportError as e:
+                logger.warning("worker %d is unavailable: %s", worker, e)
+                pool.mark_down(worker)
+                continue
+            headers = dict(_forward_headers(response.headers))
+            proxied = StreamingResponse(
+                response.aiter_raw(),
+                status_code=response.status_code,
+                headers=headers,
+                background=BackgroundTask(response.aclose),
+            )
+            if cookie != str(worker):
+                proxied.set_cookie(WORKER_COOKIE, str(worker), httponly=True)
+            return proxied
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        yield
+        await client.aclose()
+
+    methods = ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "HEAD"]
+    return Starlette(
+        routes=[Route("/{path:path}", proxy, methods=methods)], lifespan=lifespan
+    )
+
+
+class WorkerSupervisor:
+    """ワーカープロセスを起動し、終了したものを再起動する"""
+
+    def __init__(self, count: int, host: str, base_port: int, env: Dict[str, str]):
+        self.host = host
+        self.ports = [base_port + i for i in range(count)]
+        self.env = env
+        self.processes: List[Optional[subprocess.Popen]] = [None] * count
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def urls(self) -> List[str]:
+        return [f"http://{self.host}:{port}" for port in self.ports]
+
+    def _spawn(self, worker: int) -> subprocess.Popen:
+        env = dict(self.env, **{WORKER_ID_ENV_VAR: str(worker)})
+        command = [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "src.ui:create_app",
+            "--factory",
+            "--host",
+            self.host,
+            "--port",
+            str(self.ports[worker]),
+        ]
+        logger.info("starting worker %d on port %d", worker, self.ports[worker])
+        return subprocess.Popen(command, env=env)
+
+    def start(self) -> None:
+        for worker in range(len(self.ports)):
+            self.processes[worker] = self._spawn(worker)
+        self._thread = threading.Thread(
+            target=self._watch, name="worker-supervisor", daemon=True
+        )
+        self._thread.start()
+
+    def _watch(self) -> None:
+        while not self._stopping.wait(1.0):
+            with self._lock:
+                # 停止処理と同時に再起動しないよう、ロック内で停止中かを確認する
+                if self._stopping.is_set():
+                    return
+                for worker, process in enumerate(self.processes):
+                    if process is not None and process.poll() is not None:
+                        logger.warning(
+                            "worker %d exited with %s; restarting",
+                            worker,
+                            process.returncode,
+                        )
+                        self.processes[worker] = self._spawn(worker)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        with self._lock:
+            self._stopping.set()
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            if process is None:
+                continue
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+@click.command()
+@click.option("--workers", "-w", default=2, show_default=True, help="ワーカー数")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=7860, show_default=True, help="公開するポート")
+@click.option(
+    "--worker-base-port",
+    default=None,
+    type=int,
+    help="ワーカーのポートの開始番号 (デフォルト: 公開するポート + 1)",
+)
+@click.option(
+    "--shared-cache",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help=f"共有キャッシュのパス (デフォルト: {DEFAULT_SHARED_CACHE_PATH})",
+)
+def main(
+    workers: int,
+    host: str,
+    port: int,
+    worker_base_port: Optional[int],
+    shared_cache: Optional[Path],
+):
+    """UI を複数のワーカープロセスで起動し、スティッキーセッションで振り分ける"""
+    import uvicorn
+
+    load_env()
+    configure_logging()
+    env = dict(os.environ)
+    env[SHARED_CACHE_ENV_VAR] = str(
+        shared_cache
+        or os.environ.get(SHARED_CACHE_ENV_VAR)
+        or DEFAULT_SHARED_CACHE_PATH
+    )
+    supervisor = WorkerSupervisor(
+        workers, "127.0.0.1", worker_base_port or port + 1, env
+    )
+    supervisor.start()
+    try:
+        uvicorn.run(create_proxy_app(supervisor.urls), host=host, port=port)
+    finally:
+        supervisor.stop()
+
+
+if __name__ == "__main__":
+    main()
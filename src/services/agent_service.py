@@ -1,12 +1,47 @@
 # src/services/agent_service.py
-from agents import Agent, Runner, gen_trace_id, trace
-from agents.mcp import MCPServerStdio
+import hashlib
+import json
+import time
 
 from ..config import AppConfig
 from ..db.quest_repository import Quest  # Questモデル
+from ..es.canonical import ParsedQuery, canonicalize
 from ..exceptions import AgentError
+from ..utils.executor import run_blocking
+from ..utils.metrics import AGENT_SECONDS, AGENT_TOKENS, record_error
+from ..utils.shared_cache import get_shared_cache
+from ..utils.timing import span
 from ..view import QuestView
 
+# エージェントのフィードバックのキャッシュ (共有キャッシュが有効な場合のみ)
+# クエストと評価の結果が同じで、正規形が同じクエリのフィードバックを使い回す
+AGENT_FEEDBACK_CACHE_NAMESPACE = "agent_feedback"
+AGENT_FEEDBACK_CACHE_TTL_SECONDS = 3600
+
+
+def _feedback_cache_key(
+    quest: Quest, user_query: ParsedQuery | str, rule_eval_message: str
+) -> str | None:
+    """フィードバックのキャッシュのキー (クエリをパースできない場合は None)"""
+    try:
+        fingerprint = canonicalize(user_query).fingerprint
+    except ValueError:
+        return None
+    # プロンプトに含めるクエストの内容と評価の結果が変われば別のキーになる
+    context = json.dumps(
+        [
+            quest.title,
+            quest.difficulty,
+            quest.description,
+            quest.correct_query,
+            rule_eval_message,
+        ],
+        ensure_ascii=False,
+        default=str,
+    )
+    digest = hashlib.blake2b(context.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{quest.quest_id}:{digest}:{fingerprint}"
+
 
 class AgentService:
     """LLMエージェントの実行を担当するサービスクラス"""
@@ -35,6 +70,14 @@ class AgentService:
             else None,
             # Cloud ID はMCP Server側が対応しているか確認が必要
             "ELASTIC_CLOUD_ID": self.config.elastic_cloud_id,
+            # 接続プールと転送の設定 (MCP Server のクライアントも接続を使い回す)
+            "ELASTICSEARCH_POOL_MAXSIZE": str(self.config.es_connections_per_node),
+            "ELASTICSEARCH_KEEPALIVE_EXPIRY": str(self.config.es_keepalive_expiry),
+            "ELASTICSEARCH_HTTP_COMPRESS": str(self.config.es_http_compress).lower(),
+            "ELASTICSEARCH_RETRY_ON_TIMEOUT": str(
+                self.config.es_retry_on_timeout
+            ).lower(),
+            "ELASTICSEARCH_MAX_RETRIES": str(self.config.es_max_retries),
             # 必要に応じて他の環境変数も追加
             # "LOG_LEVEL": "DEBUG",
         }
@@ -53,14 +96,14 @@ class AgentService:
         }
 
     async def run_evaluation_agent(
-        self, quest: Quest, user_query_str: str, rule_eval_message: str
+        self, quest: Quest, user_query: ParsedQuery | str, rule_eval_message: str
     ) -> str:
         """
         LLMエージェントを実行し、ユーザーの回答に対する評価フィードバックを取得する。
 
         Args:
             quest: 対象のQuestオブジェクト.
-            user_query_str: ユーザーが入力したクエリ文字列.
+            user_query: ユーザーが入力したクエリ (パース済み、または文字列).
             rule_eval_message: ルールベース評価の結果メッセージ.
 
         Returns:
@@ -69,6 +112,37 @@ class AgentService:
         Raises:
             AgentError: エージェントの実行中にエラーが発生した場合.
         """
+        cache = get_shared_cache()
+        key = (
+            None
+            if cache is None
+            else _feedback_cache_key(quest, user_query, rule_eval_message)
+        )
+        if key is not None:
+            cached = await run_blocking(cache.get, AGENT_FEEDBACK_CACHE_NAMESPACE, key)
+            if cached is not None:
+                return cached
+        feedback = await self._run_evaluation_agent(
+            quest, user_query, rule_eval_message
+        )
+        if key is not None:
+            await run_blocking(
+                cache.set,
+                AGENT_FEEDBACK_CACHE_NAMESPACE,
+                key,
+                feedback,
+                ttl=AGENT_FEEDBACK_CACHE_TTL_SECONDS,
+            )
+        return feedback
+
+    async def _run_evaluation_agent(
+        self, quest: Quest, user_query: ParsedQuery | str, rule_eval_message: str
+    ) -> str:
+        """LLMエージェントを実行する (キャッシュを使わない)"""
+        # ユーザーが書いたままのテキストを渡す (パースし直さない)
+        user_query_str = (
+            user_query.text if isinstance(user_query, ParsedQuery) else user_query
+        )
         # エージェントへの指示プロンプト
         # TODO: このプロンプトは目的に合わせて調整・改善が必要
         agent_instructions = f"""
@@ -128,11 +202,20 @@ class AgentService:
           きます。
         ）
         """
+        # openai-agents SDK と MCP クライアントは読み込みに時間がかかるため、
+        # エージェントを実際に実行するときに読み込む (--skip_agent では読み込まない)
+        from agents import Agent, Runner, gen_trace_id, trace
+        from agents.mcp import MCPServerStdio
+
+        started = time.perf_counter()
         try:
             mcp_server_params = self._create_mcp_server_config()
+            # MCP Server プロセスの起動時間を計測 (async with の入口で終了する)
+            spawn_span = span("agent.mcp_spawn")
             async with MCPServerStdio(
                 name="MCP Elasticsearch Eval", params=mcp_server_params
             ) as server:
+                spawn_span.finish()
                 trace_id = gen_trace_id()
                 await self.view.display_trace_info(trace_id)  # トレースURLを表示
 
@@ -155,10 +238,12 @@ class AgentService:
                     agent_input = "上記の指示に従って、ユーザーの回答を評価し"
                     "フィードバックを生成してください。"
 
-                    result = await Runner.run(
-                        starting_agent=evaluation_agent, input=agent_input
-                    )
+                    with span("agent.runner_run"):
+                        result = await Runner.run(
+                            starting_agent=evaluation_agent, input=agent_input
+                        )
 
+                    self._record_token_usage(result)
                     if result.final_output is None:
                         raise AgentError(
                             "エージェントが最終的な評価フィードバックを生成できませんでした。"
@@ -167,12 +252,29 @@ class AgentService:
                     return result.final_output.strip()  # 前後の空白を除去
 
         except ConnectionRefusedError as e:
+            record_error("agent", e)
             raise AgentError(
                 "MCP Serverへの接続に失敗しました。プロセスが起動しているか"
                 f"確認してください。詳細: {e}"
             ) from e
         except Exception as e:
+            record_error("agent", e)
             # Agentライブラリ固有のエラーや予期せぬエラー
             raise AgentError(
                 f"エージェントの実行中に予期せぬエラーが発生しました: {e}"
             ) from e
+        finally:
+            AGENT_SECONDS.observe(time.perf_counter() - started)
+
+    @staticmethod
+    def _record_token_usage(result) -> None:
+        """Runner の実行結果からトークン使用量を集計してメトリクスに反映する"""
+        input_tokens = output_tokens = 0
+        for response in getattr(result, "raw_responses", None) or []:
+            usage = getattr(response, "usage", None)
+            if usage is None:
+                continue
+            input_tokens += getattr(usage, "input_tokens", 0) or 0
+            output_tokens += getattr(usage, "output_tokens", 0) or 0
+        AGENT_TOKENS.inc(input_tokens, kind="input")
+        AGENT_TOKENS.inc(output_tokens, kind="output")
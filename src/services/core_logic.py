@@ -1,53 +1,163 @@
 # src/services/core_logic.py
 import json
-from typing import Any, Dict, Optional, Tuple
+import logging
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
 
-from elasticsearch import Elasticsearch, TransportError
+from elasticsearch import ConnectionTimeout, Elasticsearch, TransportError
 
 # --- 依存関係 ---
 # (これらのモジュール/クラスが存在することを前提とします)
 from src.db.quest_repository import QuestRepository  # QuestRepositoryを想定
+from src.es.canonical import ParsedQuery
+from src.es.query_analyzer import (
+    QueryLimits,
+    analyze_query,
+    apply_limits,
+    get_field_types,
+)
+from src.es.resilience import es_operation
+from src.evaluators.base import Evaluator
 from src.evaluators.factory import get_evaluator  # 評価ファクトリをインポート
+from src.exceptions import CircuitOpenError, QueryRejectedError
 from src.models.quest import Quest  # Questモデルを想定
+from src.utils.executor import BlockingCallCancelled
+from src.utils.log import LazyJson
+from src.utils.metrics import CACHE_REQUESTS, ES_SEARCH_SECONDS, ES_TOOK_MILLISECONDS
+from src.utils.timing import span
+
+logger = logging.getLogger(__name__)
+
+# クエストごとの Evaluator キャッシュ
+# キーに評価タイプと生の評価データを含めるため、クエスト定義が変われば別エントリになる
+_evaluator_cache: Dict[Tuple[Any, str, str], Evaluator] = {}
+
+
+def get_quest_evaluator(quest: Quest) -> Evaluator:
+    """
+    クエストに対応する Evaluator を取得する (生成済みであればキャッシュを返す)。
+
+    Raises:
+        ValueError, TypeError: 評価タイプや評価データが不正な場合。
+    """
+    key = (quest.quest_id, quest.evaluation_type, str(quest.evaluation_data_raw))
+    evaluator = _evaluator_cache.get(key)
+    if evaluator is None:
+        CACHE_REQUESTS.inc(cache="evaluator", result="miss")
+        evaluator = get_evaluator(quest.evaluation_type, quest.evaluation_data)
+        _evaluator_cache[key] = evaluator
+    else:
+        CACHE_REQUESTS.inc(cache="evaluator", result="hit")
+    return evaluator
+
+
+def clear_evaluator_cache() -> None:
+    """Evaluator キャッシュを破棄する。"""
+    _evaluator_cache.clear()
+
+
+def evict_quest_evaluators(quest_ids: Iterable[Any]) -> int:
+    """指定したクエストの Evaluator だけをキャッシュから破棄し、破棄した数を返す。"""
+    targets = {str(quest_id) for quest_id in quest_ids}
+    stale = [key for key in list(_evaluator_cache) if str(key[0]) in targets]
+    for key in stale:
+        _evaluator_cache.pop(key, None)
+    return len(stale)
+
+
+def get_evaluation_requirements(quest: Quest) -> Tuple[bool, bool]:
+    """
+    クエストの評価に必要な実行条件を返す。
+
+    Returns:
+        Tuple[bool, bool]: (プロファイル付きで実行するか, 正解例の実行結果が必要か)
+        評価設定が不正な場合は (False, False) を返し、エラーは evaluate_result で扱う。
+    """
+    try:
+        evaluator = get_quest_evaluator(quest)
+    except (ValueError, TypeError, AttributeError):
+        return False, False
+    return evaluator.requires_profile, evaluator.uses_reference
 
 
 # execute_query 関数は元のままで良いでしょう
 def execute_query(
-    es_client: Elasticsearch, index_name: str, user_query_str: str
+    es_client: Elasticsearch,
+    index_name: str,
+    user_query: ParsedQuery | str,
+    profile: bool = False,
+    limits: QueryLimits | None = None,
 ) -> Dict[str, Any]:
     """
-    ユーザーが入力したJSON形式のクエリ文字列をElasticsearchで実行し、
-    結果(レスポンス全体)を返す。
-    (元のコードから変更なし)
+    ユーザーが入力したクエリ (パース済み、またはJSON形式の文字列) を
+    Elasticsearchで実行し、結果(レスポンス全体)を返す。
+    profile が True の場合は `"profile": true` を付与して実行する。
+    limits を指定した場合は実行前にクエリを検査し、制限を超える場合は
+    QueryRejectedError を送出する。検査を通ったクエリには timeout と
+    terminate_after を付与する。Elasticsearch が不調でサーキットブレーカーが
+    開いている場合は送信せずに CircuitOpenError を送出する。
     """
     try:
-        # ユーザー入力をJSONとしてパース
-        query_body = json.loads(user_query_str)
-        if not isinstance(query_body, dict):
-            raise ValueError("Query must be a JSON object.")
+        # 文字列の場合はJSONとしてパース (同じ文字列のパース結果は再利用される)
+        query_body = ParsedQuery.of(user_query).body
+        if limits is not None:
+            with span("analyze_query"):
+                analysis = analyze_query(
+                    query_body, limits, get_field_types(es_client, index_name)
+                )
+            if analysis.rejected:
+                raise QueryRejectedError(analysis.message())
+            query_body = apply_limits(query_body, limits)
+        if profile:
+            # パース結果は共有されるため、書き換えずにコピーして付与する
+            query_body = {**query_body, "profile": True}
 
-        print(f"\nExecuting query on index '{index_name}':")
-        print(json.dumps(query_body, indent=2, ensure_ascii=False))
+        # クエリ本文の整形はログが実際に出力される場合にだけ行う
+        logger.debug(
+            "executing query on index %s: %s", index_name, LazyJson(query_body)
+        )
 
-        # Elasticsearchにクエリを実行
-        response = es_client.search(index=index_name, body=query_body)
+        # Elasticsearchにクエリを実行 (タイムアウトとブレーカーは es_operation)
+        with span("es.search"), es_operation(es_client, "search") as client:
+            started = time.perf_counter()
+            # 遅い呼び出しやタイムアウトした呼び出しも記録する
+            outcome = "error"
+            try:
+                response = client.search(index=index_name, body=query_body)
+                outcome = "ok"
+            except ConnectionTimeout:
+                outcome = "timeout"
+                raise
+            finally:
+                ES_SEARCH_SECONDS.observe(
+                    time.perf_counter() - started, outcome=outcome
+                )
+        took = response.get("took")
+        if took is not None:
+            ES_TOOK_MILLISECONDS.observe(took)
         return response
 
     except json.JSONDecodeError as e:
         raise ValueError(f"Invalid JSON format in query: {e}") from e
+    except (QueryRejectedError, CircuitOpenError, BlockingCallCancelled):
+        # 想定どおりの拒否・中断なのでエラーとしては記録しない
+        raise
     except TransportError as e:
-        # Elasticsearch固有のエラー (クエリ構文エラーなどを含む可能性)
-        print(f"Elasticsearch query error details: {e.info}")  # エラー詳細を表示
-        # エラー情報を付加して再送出するとデバッグしやすい場合がある
-        raise TransportError(
-            f"Elasticsearch query failed: {e.error}", e.info, e.status_code
-        ) from e
+        # 接続できない・タイムアウトしたなど、通信の層のエラー
+        # (elastic_transport の TransportError は error / info を持たないため、
+        # そのまま再送出する)
+        logger.warning("elasticsearch transport error: %s", e)
+        raise
     except Exception as e:
-        print(f"An unexpected error occurred during query execution: {e}")
+        logger.error("unexpected error during query execution: %s", e)
         raise  # その他の予期せぬエラー
 
 
-def evaluate_result(quest: Quest, es_response: Dict[str, Any]) -> Tuple[bool, str]:
+def evaluate_result(
+    quest: Quest,
+    es_response: Dict[str, Any],
+    reference_response: Optional[Dict[str, Any]] = None,
+) -> Tuple[bool, str]:
     """
     クエストの評価基準に基づき、Elasticsearchの実行結果を評価する。（リファクタリング版）
     評価ロジックは Evaluator クラス群に委譲する。
@@ -56,22 +166,22 @@ def evaluate_result(quest: Quest, es_response: Dict[str, Any]) -> Tuple[bool, st
         quest: 評価対象のQuestオブジェクト。
                `evaluation_type` (str) と `evaluation_data` (Any) を持つ想定。
         es_response: Elasticsearchからのレスポンス (dict)。
+        reference_response: 正解例 (correct_query) の実行結果。
+               Evaluator が uses_reference の場合のみ利用される。
 
     Returns:
         Tuple[bool, str]: (正解かどうか, 評価メッセージ)
     """
     try:
-        # Quest オブジェクトから評価タイプと期待データを取得
-        eval_type = quest.evaluation_type
         # Questモデルが evaluation_data を適切な型で返すことを前提とします。
-        # もしDB等にJSON文字列で保存されている場合は、Questモデル側か、
-        # ここで json.loads() などでパースする必要があります。
-        expected_data = quest.evaluation_data
-
-        # ファクトリ関数を使って、評価タイプに対応する Evaluator インスタンスを取得
-        evaluator = get_evaluator(eval_type, expected_data)
+        # 評価タイプに対応する Evaluator インスタンスを取得 (キャッシュ利用)
+        evaluator = get_quest_evaluator(quest)
 
         # 取得した Evaluator オブジェクトの evaluate メソッドを呼び出して評価を実行
+        if evaluator.uses_reference:
+            return evaluator.evaluate(
+                es_response, reference_response=reference_response
+            )
         is_correct, message = evaluator.evaluate(es_response)
         return is_correct, message
 
@@ -80,21 +190,19 @@ def evaluate_result(quest: Quest, es_response: Dict[str, Any]) -> Tuple[bool, st
         # (例: 未定義のeval_type、不正なexpected_data形式、評価中のエラー)
         # エラーメッセージはファクトリや各Evaluatorクラスで生成されることを期待
         error_message = f"評価設定または実行時エラー: {e}"
-        print(error_message)  # ログ等にも出力推奨
+        logger.warning(error_message)
         return False, error_message  # ユーザーフレンドリーなメッセージに加工しても良い
     except AttributeError as e:
         # Quest オブジェクトに必要な属性 (evaluation_type, evaluation_data)
         # がない場合など
         error_message = f"[System Error] Questオブジェクトの形式が不正です: {e}"
-        print(error_message)
+        logger.error(error_message)
         return False, error_message
     except Exception as e:
         # その他の予期せぬエラー (Elasticsearchレスポンスの構造が想定外など)
         error_message = f"[System Error] 評価中に予期せぬエラーが発生しました: {e}"
-        # 本番環境では、エラーの詳細をログに記録することが重要
-        import traceback
-
-        print(f"{error_message}\n{traceback.format_exc()}")
+        # トレースバックの整形はログが出力される場合にだけ行われる
+        logger.exception(error_message)
         return False, error_message
 
 
@@ -132,7 +240,7 @@ def get_feedback(quest: Quest, is_correct: bool, attempt_count: int) -> str:
             )
         except Exception as e:
             # ヒント処理中の予期せぬエラー
-            print(f"Error processing hints: {e}")
+            logger.exception("error processing hints: %s", e)
             feedback += "[System Error] ヒントの処理中にエラーが発生しました。"
 
     # 正解時の追加メッセージが必要であればここに記述
@@ -164,14 +272,14 @@ def get_example_solution(quest_repo: QuestRepository, quest_id: int) -> Optional
         return None  # 解答例が見つからない場合は None を返す
     except AttributeError:
         # QuestRepository に指定のメソッドがない場合
-        print(
-            "Error: QuestRepository instance lacks 'get_solution_by_quest_id' method."
+        logger.error(
+            "QuestRepository instance lacks 'get_solution_by_quest_id' method."
         )
         # ユーザーにはシステムエラーとして伝えるのが適切か検討
         return "[System Error] 解答例取得機能が利用できません。"
     except Exception as e:
         # DB接続エラーなど、解答例取得中のその他のエラー
-        print(f"Error fetching example solution for quest_id {quest_id}: {e}")
+        logger.error("error fetching example solution for quest_id %s: %s", quest_id, e)
         return "[System Error] 解答例の取得中にエラーが発生しました。"
 
 
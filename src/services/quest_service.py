@@ -1,36 +1,111 @@
 # src/services/quest_service.py
+import dataclasses
+import hashlib
 import json
+from typing import TYPE_CHECKING
 
 from elasticsearch import ApiError, Elasticsearch, TransportError
 
 # 依存モジュール
+from ..db.achievements import AchievementEngine, AttemptEvent
+from ..db.attempt_store import DEFAULT_BOOK, DEFAULT_USER_ID, AttemptStore
+from ..db.points import PointsEngine
 from ..db.quest_repository import Quest, QuestRepository
+from ..db.quest_stats import QuestStatsStore
+from ..db.sqlite_quest_repository import SqliteQuestRepository
+from ..es.canonical import ParsedQuery, canonicalize
+from ..es.query_analyzer import QueryLimits
 from ..exceptions import (
+    CircuitOpenError,
+    QueryRejectedError,
     QuestCliError,
     QuestNotFoundError,
 )
+from ..utils.executor import run_blocking
+from ..utils.metrics import SUBMISSIONS, record_error
+from ..utils.shared_cache import get_shared_cache
+from ..utils.timing import span
 
 # core_logic を利用する場合
-from .core_logic import evaluate_result, execute_query, get_feedback
+from .core_logic import (
+    evaluate_result,
+    execute_query,
+    get_evaluation_requirements,
+    get_feedback,
+)
+
+if TYPE_CHECKING:
+    # numpy の読み込みに時間がかかるため、CLI の起動時には読み込まない
+    from .recommender import Recommender
 
 # または、評価ロジックなども Service 内に実装する
 
+# 正解例の実行結果のキャッシュ (共有キャッシュが有効な場合のみ)
+# インデックスの再構築時に破棄するが、念のため有効期限も設ける
+REFERENCE_CACHE_NAMESPACE = "reference_response"
+REFERENCE_CACHE_TTL_SECONDS = 600
+# 提出されたクエリの実行結果のキャッシュ (正規形が同じクエリで使い回す)
+USER_QUERY_CACHE_NAMESPACE = "user_query_response"
+USER_QUERY_CACHE_TTL_SECONDS = 600
+
+
+def _limits_key(limits: QueryLimits | None) -> str:
+    """キャッシュのキーに含める実行の上限 (プロセスによらず同じ文字列)"""
+    if limits is None:
+        return "-"
+    encoded = json.dumps(dataclasses.asdict(limits), sort_keys=True, default=sorted)
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=8).hexdigest()
+
 
 class QuestService:
     """クエストの取得、実行、評価を担当するサービスクラス"""
 
     def __init__(
-        self, quest_repo: QuestRepository, es_client: Elasticsearch, index_name: str
+        self,
+        quest_repo: QuestRepository,
+        es_client: Elasticsearch,
+        index_name: str,
+        attempt_store: AttemptStore | None = None,
+        user_id: str = DEFAULT_USER_ID,
+        points_engine: PointsEngine | None = None,
+        achievement_engine: AchievementEngine | None = None,
+        quest_stats: QuestStatsStore | None = None,
+        recommender: "Recommender | None" = None,
+        query_limits: QueryLimits | None = None,
+        book: str = DEFAULT_BOOK,
     ):
         """
         Args:
             quest_repo: QuestRepositoryインスタンス.
             es_client: Elasticsearchクライアントインスタンス.
             index_name: 操作対象のElasticsearchインデックス名.
+            attempt_store: 提出を記録するストア (None の場合は記録せず、
+                試行回数は常に 1 とみなす).
+            user_id: 提出するユーザーの ID.
+            points_engine: 正解時にポイントを付与するエンジン
+                (None の場合は付与しない。attempt_store と併せて使う).
+            achievement_engine: 提出ごとにアチーブメントを判定するエンジン
+                (None の場合は判定しない。attempt_store と併せて使う).
+            quest_stats: 提出ごとにクエストの統計を更新するストア
+                (None の場合は更新しない。attempt_store と併せて使う).
+            recommender: 提出を習熟度に反映し、正解時に次のクエストを薦める
+                (None の場合は薦めない。attempt_store と併せて使う).
+            query_limits: ユーザーのクエリを実行前に検査する制限
+                (None の場合は検査しない。正解例のクエリは検査しない).
+            book: quest_repo のブックの名前 (提出の記録や統計はブックと
+                クエストIDの組で区別する).
         """
         self.quest_repo = quest_repo
         self.es_client = es_client
         self.index_name = index_name
+        self.attempt_store = attempt_store
+        self.user_id = user_id
+        self.points_engine = points_engine
+        self.achievement_engine = achievement_engine
+        self.quest_stats = quest_stats
+        self.recommender = recommender
+        self.query_limits = query_limits
+        self.book = book
 
     def get_quest(self, quest_id: int) -> Quest:
         """
@@ -50,15 +125,113 @@ class QuestService:
             raise QuestNotFoundError(f"クエストID {quest_id} が見つかりません。")
         return quest
 
+    async def fetch_quest(self, quest_id: int) -> Quest:
+        """
+        get_quest のイベントループ用。
+
+        SQLite のカタログはクエストを1件ずつ読み込むため、ループを止めないように
+        スレッドプールで取得する (JSON のブックはメモリ上にあるためそのまま返す)。
+        """
+        if isinstance(self.quest_repo, SqliteQuestRepository):
+            return await run_blocking(self.get_quest, quest_id)
+        return self.get_quest(quest_id)
+
+    def _reference_cache_key(self, quest: Quest) -> str:
+        # 正解例の書き方 (キーの順序など) だけが変わった場合は同じキーになる
+        fingerprint = canonicalize(quest.correct_query).fingerprint
+        return f"{self.index_name}:{quest.quest_id}:{fingerprint}"
+
+    async def _execute_reference_query(self, quest: Quest) -> dict:
+        """
+        正解例のクエリを実行する。
+
+        結果はユーザーによらず同じなので、共有キャッシュが有効な場合は
+        全ワーカーで使い回す。
+        """
+        cache = get_shared_cache()
+        key = self._reference_cache_key(quest)
+        if cache is not None:
+            cached = await run_blocking(cache.get, REFERENCE_CACHE_NAMESPACE, key)
+            if cached is not None:
+                return cached
+        with span("execute_query.reference"):
+            response = await run_blocking(
+                execute_query,
+                self.es_client,
+                self.index_name,
+                quest.correct_query,
+                profile=True,
+            )
+        if cache is not None:
+            await run_blocking(
+                cache.set,
+                REFERENCE_CACHE_NAMESPACE,
+                key,
+                # クライアントのレスポンスオブジェクトは JSON にできないため本体を保存
+                getattr(response, "body", response),
+                ttl=REFERENCE_CACHE_TTL_SECONDS,
+            )
+        return response
+
+    def _user_query_cache_key(
+        self, user_query: ParsedQuery | str, profile: bool
+    ) -> str | None:
+        """提出されたクエリのキャッシュのキー (パースできない場合は None)"""
+        try:
+            fingerprint = canonicalize(user_query).fingerprint
+        except ValueError:
+            return None
+        limits = _limits_key(self.query_limits)
+        return f"{self.index_name}:{int(profile)}:{limits}:{fingerprint}"
+
+    async def _execute_user_query(
+        self, user_query: ParsedQuery | str, profile: bool
+    ) -> dict:
+        """
+        提出されたクエリを実行する。
+
+        書き方 (キーの順序や省略形) だけが違うクエリの結果は同じなので、
+        共有キャッシュが有効な場合は正規形のフィンガープリントをキーにして
+        全ワーカーで使い回す。キャッシュするのは検査を通って最後まで実行された
+        結果だけなので、キャッシュから返す場合も検査の結果は変わらない。
+        """
+        cache = get_shared_cache()
+        key = None if cache is None else self._user_query_cache_key(user_query, profile)
+        if key is not None:
+            cached = await run_blocking(cache.get, USER_QUERY_CACHE_NAMESPACE, key)
+            if cached is not None:
+                return cached
+        with span("execute_query"):
+            response = await run_blocking(
+                execute_query,
+                self.es_client,
+                self.index_name,
+                user_query,
+                profile=profile,
+                limits=self.query_limits,
+            )
+        if key is not None and not (
+            response.get("timed_out") or response.get("terminated_early")
+        ):
+            await run_blocking(
+                cache.set,
+                USER_QUERY_CACHE_NAMESPACE,
+                key,
+                getattr(response, "body", response),
+                ttl=USER_QUERY_CACHE_TTL_SECONDS,
+            )
+        return response
+
     async def execute_and_evaluate(
-        self, quest: Quest, user_query_str: str
+        self, quest: Quest, user_query: ParsedQuery | str
     ) -> tuple[bool, str, str | None, dict | None]:
         """
         ユーザーが提供したクエリを実行し、結果をルールベースで評価してフィードバックを生成する。
 
         Args:
             quest: 対象のQuestオブジェクト.
-            user_query_str: ユーザーが入力したJSON形式のクエリ文字列.
+            user_query: ユーザーが入力したクエリ (load_query_from_source で
+                パース済みのもの、またはJSON形式の文字列).
 
         Returns:
             tuple: (正解かどうか, 評価メッセージ, ルールベースフィードバック,
@@ -66,12 +239,18 @@ class QuestService:
 
         Raises:
             ElasticsearchError: クエリ実行中にElasticsearch関連のエラー
-            が発生した場合.
+            が発生した場合 (Elasticsearch が不調で送信しなかった場合の
+            CircuitOpenError を含む).
             InvalidQueryError: クエリ文字列のパースに失敗した場合
             (通常は呼び出し元でチェック済み).
             QuestCliError: その他の予期せぬエラー.
         """
-        attempt_count = 1  # 将来的に試行回数を記録・利用する場合は変更
+        # 今回の提出が何回目か (ヒントの出し分けに使う)
+        attempt_count = 1
+        if self.attempt_store is not None:
+            attempt_count += self.attempt_store.attempt_count(
+                self.user_id, quest.quest_id, self.book
+            )
 
         es_response: dict | None = None
         is_correct: bool = False
@@ -82,13 +261,43 @@ class QuestService:
             # execute_query は core_logic にある想定
             # TransportError, ValueError (JSONDecodeError含む),
             # ElasticsearchException を捕捉
-            es_response = execute_query(self.es_client, self.index_name, user_query_str)
+            # 評価タイプによってはプロファイル付きの実行や正解例の実行が必要
+            profile, needs_reference = get_evaluation_requirements(quest)
+            # 同期版クライアントの呼び出しはイベントループの外で行う
+            es_response = await self._execute_user_query(user_query, profile)
+            reference_response = None
+            if needs_reference and quest.correct_query:
+                reference_response = await self._execute_reference_query(quest)
 
             # 実行成功後、ルールベース評価
-            is_correct, eval_message = evaluate_result(quest, es_response)
-            feedback = get_feedback(quest, is_correct, attempt_count)
+            with span("evaluate_result"):
+                is_correct, eval_message = evaluate_result(
+                    quest, es_response, reference_response
+                )
+            if es_response.get("timed_out") or es_response.get("terminated_early"):
+                # timeout / terminate_after に達したため、結果は途中までのもの
+                eval_message += (
+                    "\n(検索が実行時間またはドキュメント数の上限に達したため、"
+                    "途中までの結果で評価しました)"
+                )
+            with span("get_feedback"):
+                feedback = get_feedback(quest, is_correct, attempt_count)
+
+        except QueryRejectedError as e:
+            # 実行前の検査で拒否したクエリ (クラスタには送信していない)
+            is_correct = False
+            eval_message = f"不正解... {e}"
+            feedback = get_feedback(
+                quest, is_correct=False, attempt_count=attempt_count
+            )
+            es_response = None
+
+        except CircuitOpenError:
+            # Elasticsearch が不調なため送信していない (提出としては記録しない)
+            raise
 
         except json.JSONDecodeError as e:
+            record_error("quest_service", e)
             # execute_query 内でパースする場合 or ここで再度パースする場合
             # 通常は load_query_from_source でチェック済みのはず
             is_correct = False
@@ -102,6 +311,7 @@ class QuestService:
             # raise InvalidQueryError(f"クエリのJSON形式が無効です: {e}") from e
 
         except TransportError as e:
+            record_error("quest_service", e)
             # Elasticsearchへの接続エラー、クエリ構文エラーなど
             is_correct = False
             error_info = (
@@ -118,6 +328,7 @@ class QuestService:
             # raise ElasticsearchError(f"クエリ実行エラー: {error_info}") from e
 
         except ApiError as e:
+            record_error("quest_service", e)
             # TransportError 以外の Elasticsearch クライアントエラー
             is_correct = False
             eval_message = f"不正解... Elasticsearch関連エラー: {e}"
@@ -128,10 +339,50 @@ class QuestService:
             # raise ElasticsearchError(f"Elasticsearch関連エラー: {e}") from e
 
         except Exception as e:
+            record_error("quest_service", e)
             # core_logic内の予期せぬエラーなど
             # 予期せぬエラーは上位に伝播させる
             raise QuestCliError(
                 f"クエリ実行または評価中に予期せぬエラーが発生しました: {e}"
             ) from e
 
+        if self.attempt_store is not None:
+            # 書き込みはバックグラウンドで行われるため、応答を遅らせない
+            attempt_number = self.attempt_store.record(
+                self.user_id,
+                quest.quest_id,
+                is_correct,
+                user_query.text if isinstance(user_query, ParsedQuery) else user_query,
+                book=self.book,
+            )
+            notices = []
+            if is_correct and self.points_engine is not None:
+                # 初めて正解したクエストのみ付与される
+                award = self.points_engine.award(
+                    self.user_id, quest, attempt_number, self.book
+                )
+                if award is not None:
+                    notices.append(award.message())
+            event = AttemptEvent.from_result(
+                self.user_id, quest, attempt_number, is_correct, book=self.book
+            )
+            if self.quest_stats is not None:
+                self.quest_stats.record(event)
+            if self.achievement_engine is not None:
+                notices.extend(
+                    u.message() for u in self.achievement_engine.process(event)
+                )
+            if self.recommender is not None:
+                self.recommender.observe(event)
+                if is_correct:
+                    # 初回はユーザーの提出の記録を読み込むため、スレッドプールで実行
+                    recommendations = await run_blocking(
+                        self.recommender.recommend, self.user_id, 1
+                    )
+                    notices.extend(r.message() for r in recommendations)
+            if notices:
+                feedback = "\n\n".join(([feedback] if feedback else []) + notices)
+        SUBMISSIONS.inc(
+            quest_id=quest.quest_id, result="correct" if is_correct else "incorrect"
+        )
         return is_correct, eval_message, feedback, es_response
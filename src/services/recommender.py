@@ -0,0 +1,379 @@
+# src/services/recommender.py
+"""
+ユーザーごとの「次に解くクエスト」のおすすめ。
+
+クエストの関係 (スキルグラフ) はクエストの読み込み時に1回だけ計算しておく。
+
+- スキル: query_type_hint の各要素 ("bool, term" なら bool と term)
+- 章: ブックの学習ロードマップ (loadmap) の learning_points にスキル名が
+  最初に現れる章。クエストの章はそのスキルの章のうち最も後ろの章とする
+  (どのスキルも現れない場合は 0 = 不明)
+- 前提クエスト: 1つ下の難易度で、同じか前の章にあり、スキルが重なるクエスト
+  (重なりが大きい順に MAX_PREREQUISITES 件まで)
+
+ユーザーごとには、スキルごとの習熟度 (スキル数の float32 のベクトル) と
+適正な難易度 (level)、正解済みのクエストと正解済みの前提クエストの数
+(正解したクエストを前提とするクエストの分だけ) を保持し、提出のたびに更新する。
+おすすめの計算はクエスト数の長さのベクトル演算だけで行う。
+
+    score = 0.5 * 難易度の適合 + 0.3 * 苦手なスキルの割合 + 0.2 * 前提の達成率
+
+ユーザーの状態は初回の recommend() で提出の記録 (attempts) から作成する。
+"""
+
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from src.db.achievements import AttemptEvent
+from src.db.attempt_store import DEFAULT_BOOK, AttemptStore
+from src.models.quest import Quest
+
+# 前提クエストの最大数 (クエストごと)
+MAX_PREREQUISITES = 8
+# 状態をメモリに保持するユーザー数の上限 (超えた分は使われていない順に破棄)
+MAX_CACHED_USERS = 10000
+# 正解・不正解のときに習熟度を 1・0 に近づける割合
+CORRECT_LEARNING_RATE = 0.5
+INCORRECT_LEARNING_RATE = 0.15
+# 提出のたびに level を (難易度 ± 0.5) に近づける割合
+LEVEL_STEP = 0.5
+SCORE_WEIGHTS = (0.5, 0.3, 0.2)
+# 前提クエストを求めるときに一度に掛け合わせる行数 (メモリ使用量の上限)
+_BLOCK_ROWS = 1024
+
+
+def _skills(query_type_hint: Optional[str]) -> List[str]:
+    if not query_type_hint:
+        return []
+    return [s.strip() for s in query_type_hint.split(",") if s.strip()]
+
+
+def _skill_chapters(skills: Sequence[str], loadmap: List[Dict[str, Any]]) -> List[int]:
+    """スキルが最初に現れる章の ID (現れない場合は 0)"""
+    chapters = sorted(loadmap, key=lambda c: c.get("chapter_id", 0))
+    texts = [
+        (int(c.get("chapter_id", 0)), " ".join(c.get("learning_points", [])))
+        for c in chapters
+    ]
+    result = []
+    for skill in skills:
+        # "match" が "match_phrase" に一致しないように単語の境界で区切る
+        pattern = re.compile(rf"(?<![A-Za-z0-9_]){re.escape(skill)}(?![A-Za-z0-9_])")
+        result.append(next((cid for cid, text in texts if pattern.search(text)), 0))
+    return result
+
+
+class SkillGraph:
+    """クエストのスキル、難易度、章と前提クエストの関係 (読み込み後は変更しない)"""
+
+    def __init__(self, quests: Sequence[Quest], loadmap: List[Dict[str, Any]]):
+        self.quests = list(quests)
+        self.index: Dict[int, int] = {q.quest_id: i for i, q in enumerate(self.quests)}
+        quest_skills = [_skills(q.query_type_hint) for q in self.quests]
+        self.skills: List[str] = sorted({s for skills in quest_skills for s in skills})
+        skill_index = {s: i for i, s in enumerate(self.skills)}
+        n, m = len(self.quests), len(self.skills)
+
+        # クエスト x スキルの行列 (行ごとに合計 1 に正規化)
+        incidence = np.zeros((n, m), dtype=np.float32)
+        for i, skills in enumerate(quest_skills):
+            for s in skills:
+                incidence[i, skill_index[s]] = 1.0
+        counts = incidence.sum(axis=1, keepdims=True)
+        self.weights = np.divide(
+            incidence, counts, out=np.zeros_like(incidence), where=counts > 0
+        )
+        self.difficulty = np.array(
+            [q.difficulty for q in self.quests], dtype=np.float32
+        )
+        skill_chapter = np.array(_skill_chapters(self.skills, loadmap), dtype=np.int32)
+        self.chapter = (
+            (incidence * skill_chapter).max(axis=1).astype(np.int32)
+            if m
+            else np.zeros(n, dtype=np.int32)
+        )
+        self._build_prerequisites(incidence)
+
+    def _build_prerequisites(self, incidence: np.ndarray) -> None:
+        """前提クエストを CSR 形式 (indptr, indices) で求める"""
+        n = len(self.quests)
+        prerequisites: List[np.ndarray] = [np.empty(0, dtype=np.int32)] * n
+        for level in np.unique(self.difficulty):
+            targets = np.flatnonzero(self.difficulty == level)
+            sources = np.flatnonzero(self.difficulty == level - 1)
+            if len(sources) == 0:
+                continue
+            for start in range(0, len(targets), _BLOCK_ROWS):
+                block = targets[start : start + _BLOCK_ROWS]
+                overlap = incidence[block] @ incidence[sources].T
+                # 後ろの章のクエストは前提にしない (章が不明の場合は区別しない)
+                later = (self.chapter[block, None] > 0) & (
+                    self.chapter[None, sources] > self.chapter[block, None]
+                )
+                overlap[later] = 0.0
+                k = min(MAX_PREREQUISITES, len(sources))
+                top = np.argpartition(-overlap, k - 1, axis=1)[:, :k]
+                for row, i in enumerate(block):
+                    candidates = top[row][overlap[row, top[row]] > 0]
+                    prerequisites[i] = np.sort(sources[candidates]).astype(np.int32)
+        lengths = np.array([len(p) for p in prerequisites], dtype=np.int64)
+        self.indptr = np.concatenate(([0], np.cumsum(lengths)))
+        self.indices = (
+            np.concatenate(prerequisites).astype(np.int32)
+            if n
+            else np.empty(0, dtype=np.int32)
+        )
+        # 逆向きの辺 (そのクエストを前提とするクエスト)。正解したときに
+        # 影響を受けるクエストだけの達成数を更新するために使う
+        rows = np.repeat(np.arange(n, dtype=np.int32), lengths)
+        order = np.argsort(self.indices, kind="stable")
+        self.dependents = rows[order]
+        self.dependents_indptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(self.indices, minlength=n)))
+        )
+        counts = lengths.astype(np.float32)
+        self._inverse_counts = np.divide(
+            1.0, counts, out=np.zeros_like(counts), where=counts > 0
+        )
+        self._base_readiness = (counts == 0).astype(np.float32)
+
+    def prerequisites(self, quest_id: int) -> List[int]:
+        """クエストの前提クエストの ID"""
+        i = self.index[quest_id]
+        return [
+            self.quests[j].quest_id
+            for j in self.indices[self.indptr[i] : self.indptr[i + 1]]
+        ]
+
+    def dependents_of(self, i: int) -> np.ndarray:
+        """i 番目のクエストを前提とするクエストの番号"""
+        return self.dependents[
+            self.dependents_indptr[i] : self.dependents_indptr[i + 1]
+        ]
+
+    def readiness(self, done: Dict[int, int]) -> np.ndarray:
+        """
+        クエストごとの前提クエストの正解率 (前提が無い場合は 1)。
+
+        done はクエストの番号 -> 正解済みの前提クエストの数 (0 のものは省略)。
+        """
+        readiness = self._base_readiness.copy()
+        if done:
+            keys = np.fromiter(done.keys(), dtype=np.int64, count=len(done))
+            values = np.fromiter(done.values(), dtype=np.float32, count=len(done))
+            readiness[keys] = values * self._inverse_counts[keys]
+        return readiness
+
+
+class _UserState:
+    """ユーザーのスキルごとの習熟度、適正な難易度と正解済みのクエスト"""
+
+    __slots__ = ("mastery", "level", "solved", "done")
+
+    def __init__(self, graph: SkillGraph):
+        self.mastery = np.zeros(len(graph.skills), dtype=np.float32)
+        self.level = float(graph.difficulty.min()) if len(graph.quests) else 1.0
+        self.solved: Set[int] = set()
+        # クエストの番号 -> 正解済みの前提クエストの数
+        self.done: Dict[int, int] = {}
+
+    def update(self, graph: SkillGraph, i: int, is_correct: bool) -> None:
+        w = graph.weights[i]
+        d = float(graph.difficulty[i])
+        if is_correct:
+            self.mastery += CORRECT_LEARNING_RATE * w * (1.0 - self.mastery)
+            if i not in self.solved:
+                self.solved.add(i)
+                for j in graph.dependents_of(i).tolist():
+                    self.done[j] = self.done.get(j, 0) + 1
+            if d + 0.5 > self.level:
+                self.level += LEVEL_STEP * (d + 0.5 - self.level)
+        else:
+            self.mastery -= INCORRECT_LEARNING_RATE * w * self.mastery
+            if self.level > d - 0.5:
+                self.level -= LEVEL_STEP * (self.level - (d - 0.5))
+        self.level = min(
+            max(self.level, float(graph.difficulty.min())),
+            float(graph.difficulty.max()),
+        )
+
+
+@dataclass(frozen=True)
+class Recommendation:
+    quest: Quest
+    score: float
+
+    def message(self) -> str:
+        return (
+            f"次のおすすめ: クエスト {self.quest.quest_id} {self.quest.title}"
+            f" (難易度 {self.quest.difficulty})"
+        )
+
+
+class Recommender:
+    """スキルグラフとユーザーの習熟度から次に解くクエストを選ぶ"""
+
+    def __init__(
+        self, attempt_store: AttemptStore, quest_repo, book: str = DEFAULT_BOOK
+    ):
+        self.attempt_store = attempt_store
+        self.book = book
+        self._users: "OrderedDict[str, _UserState]" = OrderedDict()
+        # 状態を読み込み中のユーザー -> 読み込み中に届いた提出の数
+        self._loading: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # 記録の読み込みは self._lock の外で行うため、接続は別のロックで守る
+        self._conn_lock = threading.Lock()
+        self._conn = sqlite3.connect(attempt_store.db_path, check_same_thread=False)
+        self.use_repository(quest_repo)
+
+    def use_repository(self, quest_repo) -> None:
+        """
+        クエストのリポジトリを設定する (変わった場合はグラフを作り直す)。
+
+        同じブックの読み込み直し (BookWatcher による差し替え) に使う。
+        別のブックには get_recommender でブックごとの Recommender を使う。
+        """
+        if getattr(self, "quest_repo", None) is quest_repo:
+            return
+        graph = SkillGraph(quest_repo.get_all_quests(), quest_repo.loadmap)
+        with self._lock:
+            self.quest_repo = quest_repo
+            self.graph = graph
+            # ユーザーの状態はクエストの並びに依存するため作り直す
+            self._users.clear()
+
+    def _load_user(self, graph: SkillGraph, user_id: str) -> _UserState:
+        """このブックの提出の記録からユーザーの状態を作成する (ロックの外で呼び出す)"""
+        self.attempt_store.flush()
+        state = _UserState(graph)
+        with self._conn_lock:
+            rows = self._conn.execute(
+                "SELECT quest_id, is_correct FROM attempts "
+                "WHERE user_id = ? AND book = ? ORDER BY attempt_id",
+                (user_id, self.book),
+            ).fetchall()
+        for quest_id, is_correct in rows:
+            i = graph.index.get(quest_id)
+            if i is not None:
+                state.update(graph, i, bool(is_correct))
+        return state
+
+    def _ensure_loaded(self, user_id: str) -> None:
+        """
+        ユーザーの状態を読み込む (読み込み済みの場合は何もしない)。
+
+        記録の読み込みの間はロックを解放し、他のユーザーの提出を止めない。
+        読み込み中にそのユーザーの提出が届いた場合やグラフが差し替わった場合は、
+        読み込んだ状態を捨てて読み込み直す。
+        """
+        while True:
+            with self._lock:
+                if user_id in self._users:
+                    self._users.move_to_end(user_id)
+                    return
+                graph = self.graph
+                observed = self._loading.setdefault(user_id, 0)
+            state = self._load_user(graph, user_id)
+            with self._lock:
+                if self._loading.get(user_id) == observed and self.graph is graph:
+                    del self._loading[user_id]
+                    self._users[user_id] = state
+                    if len(self._users) > MAX_CACHED_USERS:
+                        self._users.popitem(last=False)
+                    return
+
+    def observe(self, event: AttemptEvent) -> None:
+        """提出を習熟度に反映する (状態を読み込んでいないユーザーは次回に読み込む)"""
+        if event.book != self.book:
+            return
+        with self._lock:
+            state = self._users.get(event.user_id)
+            if state is None:
+                if event.user_id in self._loading:
+                    self._loading[event.user_id] += 1
+                return
+            i = self.graph.index.get(event.quest_id)
+            if i is not None:
+                state.update(self.graph, i, event.is_correct)
+
+    def recommend(self, user_id: str, k: int = 3) -> List[Recommendation]:
+        """
+        スコアの高い順に未正解のクエストを最大 k 件返す。
+
+        初回はユーザーの提出の記録を読み込むため、イベントループからは
+        スレッドプールで呼び出す。
+        """
+        if k <= 0:
+            return []
+        while True:
+            self._ensure_loaded(user_id)
+            # グラフとユーザーの状態は同じロックの中で読む (use_repository で
+            # グラフが差し替わると、状態の番号は新しいグラフのものになる)
+            with self._lock:
+                graph = self.graph
+                state = self._users.get(user_id)
+                if state is None:
+                    # 読み込んだ直後に破棄された場合は読み込み直す
+                    continue
+                n = len(graph.quests)
+                if n == 0:
+                    return []
+                mastery = state.mastery.copy()
+                level = state.level
+                solved = np.fromiter(
+                    state.solved, dtype=np.int64, count=len(state.solved)
+                )
+                readiness = graph.readiness(state.done)
+            break
+        w_fit, w_weak, w_ready = SCORE_WEIGHTS
+        fit = np.exp(-0.5 * (graph.difficulty - level) ** 2)
+        weak = 1.0 - graph.weights @ mastery
+        score = w_fit * fit + w_weak * weak + w_ready * readiness
+        score[solved] = -np.inf
+        k = min(k, n - len(solved))
+        if k <= 0:
+            return []
+        top = np.argpartition(-score, k - 1)[:k]
+        # 同点の場合は ID の小さい (並びが前の) クエストを優先する
+        top = top[np.lexsort((top, -score[top]))]
+        return [Recommendation(graph.quests[i], float(score[i])) for i in top]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+_recommenders: Dict[Tuple[int, str], Recommender] = {}
+_recommenders_lock = threading.Lock()
+
+
+def find_recommender(attempt_store: AttemptStore, book: str) -> Optional[Recommender]:
+    """作成済みの Recommender を返す (未作成の場合は None、I/O なし)"""
+    return _recommenders.get((id(attempt_store), book))
+
+
+def get_recommender(attempt_store: AttemptStore, book: str, quest_repo) -> Recommender:
+    """
+    attempt_store とブックの組に対応する Recommender を返す (初回呼び出し時に作成)。
+
+    スキルグラフとユーザーの状態はブックごとに持つため、複数のブックを
+    交互に使っても作り直さない (同じブックが読み込み直された場合だけ作り直す)。
+    作成時にクエストを読み込んでスキルグラフを計算するため、
+    イベントループからはスレッドプールで呼び出す。
+    """
+    key = (id(attempt_store), book)
+    recommender = _recommenders.get(key)
+    if recommender is None:
+        with _recommenders_lock:
+            recommender = _recommenders.get(key)
+            if recommender is None:
+                recommender = Recommender(attempt_store, quest_repo, book)
+                _recommenders[key] = recommender
+    recommender.use_repository(quest_repo)
+    return recommender
@@ -1,14 +1,18 @@
 # src/ui.py (エントリーポイント)
 
+import uuid
+
 # レイアウトモジュールの gr.Blocks() をインポート
 import gradio as gr
 
+from src.config import load_env
 from src.ui_actions import (
     check_query_format,
     format_query,
     get_mapping,
     init_elasticsearch_index,
     load_quest,
+    show_leaderboard,
     submit_answer,
     test_run_query,
 )
@@ -16,17 +20,31 @@ from src.ui_asset import (
     APP_TITLE,
     FORMAT_QUERY_BUTTON_TEXT,
     JSON_CHECK_OK,
+    LEADERBOARD_BUTTON_TEXT,
     MAPPING_BUTTON_TEXT,
     RENEW_INDEX_BUTTON_TEXT,
     SUBMIT_BUTTON_TEXT,
     TEST_RUN_BUTTON_TEXT,
 )
+from src.utils.log import configure_logging
+from src.utils.metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY, observe_span
+from src.utils.timing import add_span_listener
+
+# 共有サービスとして運用する場合のメトリクスエンドポイント
+METRICS_PATH = "/metrics"
+
+# 提出の記録に使う匿名のユーザーID (ブラウザの localStorage に保存)
+USER_ID_STORAGE_KEY = "es_quest_user_id"
+
+load_env()
+configure_logging()
 
 css = """
 .large_font textarea {font-size: 1.5em; !important}
 """
 with gr.Blocks(fill_width=True, fill_height=True, css=css) as demo:
     gr.Markdown(f"# {APP_TITLE}", max_height=30)
+    ui_user_id = gr.BrowserState("", storage_key=USER_ID_STORAGE_KEY)
     with gr.Row(equal_height=True, scale=1):
         with gr.Column(scale=2):
             ui_chat = gr.Chatbot(type="messages", show_label=False)
@@ -48,6 +66,7 @@ with gr.Blocks(fill_width=True, fill_height=True, css=css) as demo:
                 )
                 ui_submit_button = gr.Button(SUBMIT_BUTTON_TEXT, variant="primary")
                 ui_mapping_button = gr.Button(MAPPING_BUTTON_TEXT)
+                ui_leaderboard_button = gr.Button(LEADERBOARD_BUTTON_TEXT)
                 ui_book_select = gr.Dropdown(
                     [
                         ("default", "fixtures/books/default.json"),
@@ -67,6 +86,13 @@ with gr.Blocks(fill_width=True, fill_height=True, css=css) as demo:
         ui_renew_index_button,
     ]
 
+    # 初回アクセス時にユーザーIDを発行する (以降は同じブラウザで同じID)
+    demo.load(
+        lambda user_id: user_id or uuid.uuid4().hex,
+        inputs=[ui_user_id],
+        outputs=[ui_user_id],
+    )
+
     # load quest
     gr.on(
         [demo.load, ui_quest_id.change, ui_book_select.change],
@@ -87,7 +113,7 @@ with gr.Blocks(fill_width=True, fill_height=True, css=css) as demo:
     gr.on(
         [ui_submit_button.click],
         fn=submit_answer,
-        inputs=[ui_quest_id, ui_user_query, ui_chat, ui_book_select],
+        inputs=[ui_quest_id, ui_user_query, ui_chat, ui_book_select, ui_user_id],
         outputs=[ui_chat] + ui_buttons,
     )
 
@@ -115,6 +141,14 @@ with gr.Blocks(fill_width=True, fill_height=True, css=css) as demo:
         outputs=[ui_chat] + ui_buttons,
     )
 
+    # show leaderboard (読み込みのみなので他のボタンは無効にしない)
+    gr.on(
+        [ui_leaderboard_button.click],
+        fn=show_leaderboard,
+        inputs=[ui_chat, ui_user_id],
+        outputs=[ui_chat],
+    )
+
     # reset elasticsearch index - using async action:
     # init_elasticsearch_index from src/ui_async_actions
     gr.on(
@@ -124,5 +158,27 @@ with gr.Blocks(fill_width=True, fill_height=True, css=css) as demo:
         outputs=[ui_chat] + ui_buttons,
     )
 
+
+def create_app():
+    """
+    Gradio アプリと Prometheus 形式のメトリクスエンドポイントを
+    同じ FastAPI アプリにマウントして返す。
+    """
+    from fastapi import FastAPI
+    from fastapi.responses import Response
+
+    # スパンの計測結果もメトリクスとして公開する
+    add_span_listener(observe_span)
+
+    app = FastAPI()
+
+    @app.get(METRICS_PATH)
+    def metrics():
+        return Response(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    return gr.mount_gradio_app(app, demo, path="/")
+
+
 if __name__ == "__main__":
+    # /metrics も公開する場合は create_app を uvicorn で起動する (make serve)
     demo.launch(share=False, debug=True)
@@ -4,15 +4,25 @@ from pathlib import Path
 from textwrap import dedent
 from typing import Any, Dict, Tuple
 
-import gradio as gr
 from elasticsearch.helpers import bulk
 
-from src.bootstrap import AppContainer
+from src.bootstrap import AppContainer, get_repository_registry
 from src.config import load_config
-from src.exceptions import QuestCliError
-from src.services.agent_service import AgentService
+from src.db.attempt_store import DEFAULT_USER_ID
+from src.db.book_repository import BookRepository
+from src.db.book_watcher import ensure_book_watcher
+from src.db.points import PointsEngine
+from src.es.canonical import ParsedQuery, parse_query
+from src.es.query_analyzer import QueryLimits, evict_field_types
+from src.es.resilience import es_operation
+from src.exceptions import QuestCliError, QuestNotFoundError
+from src.services.agent_service import AGENT_FEEDBACK_CACHE_NAMESPACE, AgentService
 from src.services.core_logic import execute_query
-from src.services.quest_service import QuestService
+from src.services.quest_service import (
+    REFERENCE_CACHE_NAMESPACE,
+    USER_QUERY_CACHE_NAMESPACE,
+    QuestService,
+)
 from src.ui_asset import (
     FORMAT_QUERY_BUTTON_TEXT,
     JSON_CHECK_NG,
@@ -24,7 +34,13 @@ from src.ui_asset import (
 )
 
 # リファクタリングで分割・作成したモジュールをインポート
+from src.utils.executor import run_blocking
+from src.utils.log import correlation_scope
+from src.utils.loop_monitor import ensure_loop_monitor
+from src.utils.metrics import QUEUE_DEPTH, record_error, track_callback
 from src.utils.query_loader import load_query_from_source
+from src.utils.shared_cache import get_shared_cache
+from src.utils.timing import current_recorder, recording, span
 from src.view import EndOfMessage, QuestView
 
 
@@ -35,28 +51,45 @@ class QueuedQuestView(QuestView):
         super().__init__()
         self.message_queue = asyncio.Queue()  # 非同期メッセージキューを追加
         self.custom_echo = self.send_message
+        # 受信側が終了した後のメッセージは捨てる
+        self._closed = False
 
     async def send_message(self, message: str | EndOfMessage, **kwargs: Dict[str, Any]):
         """非同期にメッセージをキューに送信する"""
+        if self._closed:
+            return
         await self.message_queue.put(message)
+        QUEUE_DEPTH.inc()
 
     async def receive_messages(self):
         """キューからメッセージを取り出して処理する非同期メソッド"""
-        while True:
-            message = await self.message_queue.get()
-            self.message_queue.task_done()
-            if isinstance(message, EndOfMessage):
-                break
-            elif isinstance(message, str):
-                yield message
-            else:
-                raise ValueError(
-                    f"receive_messages で予期しない型を受け取りました: {type(message)}"
-                )
+        try:
+            while True:
+                message = await self.message_queue.get()
+                self.message_queue.task_done()
+                QUEUE_DEPTH.dec()
+                if isinstance(message, EndOfMessage):
+                    break
+                elif isinstance(message, str):
+                    yield message
+                else:
+                    raise ValueError(
+                        "receive_messages で予期しない型を受け取りました: "
+                        f"{type(message)}"
+                    )
+        finally:
+            # セッションが破棄されて途中で打ち切られた場合も、残りのメッセージを
+            # 捨ててキューの深さを戻す
+            self._closed = True
+            while not self.message_queue.empty():
+                self.message_queue.get_nowait()
+                self.message_queue.task_done()
+                QUEUE_DEPTH.dec()
 
 
 async def handle_exception(view: QuestView, e: Exception):
     """集約的な例外ハンドリング"""
+    record_error("ui", e)
     if isinstance(e, (QuestCliError, FileNotFoundError)):
         msg = (
             str(e)
@@ -75,21 +108,41 @@ async def get_services(
     db_path_override: Path | None = None,
     index_name_override: str | None = None,
     book_path_override: Path | None = None,
+    user_id: str | None = None,
 ) -> Tuple[Any, Any, Any, QuestService, AgentService]:
     """
     サービス初期化を行い、関連インスタンスを返すヘルパー関数。
+
+    user_id は提出の記録 (試行回数によるヒントの出し分け) に使う。
     """
+    ensure_loop_monitor()
+    ensure_book_watcher(get_repository_registry())
     if view is None:
         view = QueuedQuestView()
-    config = load_config(
-        db_path_override=db_path_override,
-        index_name_override=index_name_override,
-        book_path_override=book_path_override,
-    )
+    with span("config.load"):
+        config = await run_blocking(
+            load_config,
+            db_path_override=db_path_override,
+            index_name_override=index_name_override,
+            book_path_override=book_path_override,
+        )
     container = AppContainer(config)
     quest_repo = await container.quest_repository
     es_client = await container.es_client
-    quest_service = QuestService(quest_repo, es_client, config.index_name)
+    attempt_store = await container.attempt_store
+    quest_service = QuestService(
+        quest_repo,
+        es_client,
+        config.index_name,
+        attempt_store=attempt_store,
+        user_id=user_id or DEFAULT_USER_ID,
+        points_engine=await container.points_engine,
+        achievement_engine=await container.achievement_engine,
+        quest_stats=await container.quest_stats,
+        recommender=await container.recommender,
+        query_limits=QueryLimits.from_config(config),
+        book=container.book,
+    )
     agent_service = AgentService(config, view)
     return config, quest_repo, es_client, quest_service, agent_service
 
@@ -97,12 +150,38 @@ async def get_services(
 async def cli(
     quest_id: int,
     view: QueuedQuestView | None = None,
-    query: str | None = None,
+    query: str | ParsedQuery | None = None,
     query_file: Path | None = None,
     db_path: Path | None = None,
     index_name: str | None = None,
     skip_agent: bool = False,
     book_path: Path | None = None,
+    user_id: str | None = None,
+):
+    with correlation_scope(), recording("submit_answer"):
+        await _cli(
+            quest_id,
+            view,
+            query,
+            query_file,
+            db_path,
+            index_name,
+            skip_agent,
+            book_path,
+            user_id,
+        )
+
+
+async def _cli(
+    quest_id: int,
+    view: QueuedQuestView | None,
+    query: str | ParsedQuery | None,
+    query_file: Path | None,
+    db_path: Path | None,
+    index_name: str | None,
+    skip_agent: bool,
+    book_path: Path | None,
+    user_id: str | None,
 ):
     try:
         (
@@ -116,6 +195,7 @@ async def cli(
             db_path_override=db_path,
             index_name_override=index_name,
             book_path_override=book_path,
+            user_id=user_id,
         )
         await run_quest_flow(
             view=view,
@@ -139,24 +219,25 @@ async def run_quest_flow(
     quest_service: QuestService,
     agent_service: AgentService,
     quest_id: int,
-    query_str_arg: str | None,
+    query_str_arg: str | ParsedQuery | None,
     query_file_arg: Path | None,
     skip_agent: bool,
 ):
-    quest = quest_service.get_quest(quest_id)
+    with span("get_quest"):
+        quest = await quest_service.fetch_quest(quest_id)
     await view.display_quest_details(quest)
-    user_query_str = load_query_from_source(
+    user_query = load_query_from_source(
         query_str=query_str_arg,
         query_file=query_file_arg,
     )
     await view.display_info("## 提出されたクエリ")
-    await view.display_info(f"```json\n{user_query_str}\n```")
+    await view.display_info(f"```json\n{user_query.pretty}\n```")
     (
         is_correct,
         rule_eval_message,
         rule_feedback,
         es_response,
-    ) = await quest_service.execute_and_evaluate(quest, user_query_str)
+    ) = await quest_service.execute_and_evaluate(quest, user_query)
     await view.display_elasticsearch_response(es_response)
     await view.display_evaluation(rule_eval_message, is_correct)
     await view.display_feedback("ルールベース評価フィードバック", rule_feedback)
@@ -165,7 +246,7 @@ async def run_quest_flow(
         await view.display_info("\n🤖 LLMエージェントによる評価を実行中...")
         try:
             agent_feedback = await agent_service.run_evaluation_agent(
-                quest, user_query_str, rule_eval_message
+                quest, user_query, rule_eval_message
             )
             await view.display_feedback("🤖 AI評価フィードバック", agent_feedback)
         except QuestCliError as e:
@@ -176,6 +257,9 @@ async def run_quest_flow(
         await view.display_clear_message()
     else:
         await view.display_retry_message()
+    recorder = current_recorder()
+    if recorder is not None:
+        await view.display_timings(recorder)
     await view.close()
 
 
@@ -188,6 +272,9 @@ def append_message(history, role, content):
 
 
 def make_ui_buttons(enable_flag: bool = True):
+    # Gradio は UI から呼び出されたときだけ読み込む (負荷試験などで直接呼ぶ場合も同様)
+    import gradio as gr
+
     return (
         gr.Button(FORMAT_QUERY_BUTTON_TEXT, interactive=enable_flag),
         gr.Button(TEST_RUN_BUTTON_TEXT, variant="secondary", interactive=enable_flag),
@@ -200,6 +287,7 @@ def make_ui_buttons(enable_flag: bool = True):
 # callbacks
 
 
+@track_callback("load_quest")
 async def load_quest(quest_id, book_path):
     if book_path is None:
         return
@@ -210,19 +298,38 @@ async def load_quest(quest_id, book_path):
         quest_service,
         agent_service,
     ) = await get_services(book_path_override=Path(book_path))
-    quest = quest_repo.get_quest_by_id(quest_id)
-    if quest is None:
+    try:
+        quest = await quest_service.fetch_quest(quest_id)
+    except QuestNotFoundError:
         return [
             {"role": "assistant", "content": f"クエストが読み込めません: {quest_id=}"}
         ]
+    summary = await _quest_stats_summary(config, quest.quest_id)
     question = f"""
         ## Quest {quest_id}: {quest.title}
         {quest.description}
+
+        {summary}
         """
     return [{"role": "assistant", "content": question}]
 
 
-async def submit_answer(quest_id, query, history, book_path):
+async def _quest_stats_summary(config, quest_id: int) -> str:
+    """クエストの計算済みの統計の要約 (他のワーカーの分は一定間隔で読み直す)"""
+    container = AppContainer(config)
+    stats_store = await container.quest_stats
+    if stats_store.is_stale():
+        await run_blocking(stats_store.refresh)
+    stats = stats_store.get(quest_id, container.book)
+    if stats is None:
+        return "📊 まだ挑戦した人はいません。"
+    return stats.summary()
+
+
+@track_callback("submit_answer")
+async def submit_answer(quest_id, query, history, book_path, user_id=None):
+    # クエリはここで1回だけパースし、パース結果を評価まで渡す
+    parsed_query = _parse_query(query)
     formatted_query = _format_query(query)
     yield (
         append_message(
@@ -236,16 +343,24 @@ async def submit_answer(quest_id, query, history, book_path):
         cli(
             quest_id=quest_id,
             view=view,
-            query=formatted_query,
+            query=parsed_query or formatted_query,
             book_path=Path(book_path),
+            user_id=user_id,
         )
     )
-    async for message in view.receive_messages():
-        yield (append_message(history, "assistant", message),) + make_ui_buttons(False)
+    messages = view.receive_messages()
+    try:
+        async for message in messages:
+            chat = append_message(history, "assistant", message)
+            yield (chat,) + make_ui_buttons(False)
+    finally:
+        # 中断された場合もここで受信を終了する (GC による終了を待たない)
+        await messages.aclose()
     await quest_task
     yield (history,) + make_ui_buttons(True)
 
 
+@track_callback("get_mapping")
 async def get_mapping(history):
     (
         config,
@@ -257,7 +372,7 @@ async def get_mapping(history):
     yield (
         append_message(history, "user", "マッピングを取得して。"),
     ) + make_ui_buttons(False)
-    result = es_client.indices.get_mapping(index=config.index_name)
+    result = await run_blocking(_fetch_mapping, es_client, config.index_name)
     formatted_mapping = json.dumps(result.body, indent=4, ensure_ascii=False)
     yield (
         append_message(
@@ -268,6 +383,37 @@ async def get_mapping(history):
     ) + make_ui_buttons(True)
 
 
+LEADERBOARD_SIZE = 10
+
+
+def _format_leaderboard(engine: PointsEngine, user_id: str | None) -> str:
+    entries = engine.leaderboard.top(LEADERBOARD_SIZE)
+    if not entries:
+        return "まだポイントを獲得したユーザーはいません。"
+    lines = ["| 順位 | ユーザー | ポイント |", "| ---: | --- | ---: |"]
+    for entry in entries:
+        # ユーザーIDは匿名のIDなので先頭だけ表示する (自分の行には印を付ける)
+        name = entry.user_id[:8] + (" (あなた)" if entry.user_id == user_id else "")
+        lines.append(f"| {entry.rank} | {name} | {entry.points} |")
+    rank = engine.leaderboard.rank(user_id) if user_id else None
+    if rank is not None:
+        points = engine.leaderboard.score(user_id)
+        lines.append(f"\nあなたは {rank} 位 ({points} ポイント) です。")
+    return "\n".join(lines)
+
+
+@track_callback("show_leaderboard")
+async def show_leaderboard(history, user_id=None):
+    """ランキングの上位と自分の順位を表示する (全件の集計はしない)"""
+    config = await run_blocking(load_config)
+    engine = await AppContainer(config).points_engine
+    # 他のワーカーで更新された累計を取り込む (前回以降に更新された分のみ)
+    await run_blocking(engine.sync)
+    append_message(history, "user", "ランキングを見せて。")
+    return append_message(history, "assistant", _format_leaderboard(engine, user_id))
+
+
+@track_callback("test_run_query")
 async def test_run_query(query, history):
     (
         config,
@@ -300,7 +446,13 @@ async def test_run_query(query, history):
         ),
     ) + make_ui_buttons(False)
     try:
-        result = execute_query(es_client, config.index_name, query)
+        result = await run_blocking(
+            execute_query,
+            es_client,
+            config.index_name,
+            _parse_query(query),
+            limits=quest_service.query_limits,
+        )
     except Exception as e:
         yield (
             append_message(
@@ -320,6 +472,7 @@ async def test_run_query(query, history):
     ) + make_ui_buttons(True)
 
 
+@track_callback("init_elasticsearch_index")
 async def init_elasticsearch_index(history, book_path):
     (
         config,
@@ -335,52 +488,116 @@ async def init_elasticsearch_index(history, book_path):
     yield (
         append_message(history, "assistant", f"load: {config.book_path}"),
     ) + make_ui_buttons(False)
-    with open(config.book_path, encoding="utf-8") as f:
-        data = json.load(f)
-    mappings = data["mappings"]
-    sample_data = data["sample_data"]
+    book_repo = BookRepository(config.book_path)
+    mappings = await run_blocking(book_repo.load_mappings)
     yield (
         append_message(history, "assistant", "### Elasticsearch の更新"),
     ) + make_ui_buttons(False)
     yield (
         append_message(history, "assistant", "  - インデックスを削除します"),
     ) + make_ui_buttons(False)
-    es_client.options(ignore_status=[400, 404]).indices.delete(index=index_name)
+    await run_blocking(
+        es_client.options(ignore_status=[400, 404]).indices.delete, index=index_name
+    )
     yield (
         append_message(history, "assistant", "  - インデックスとマッピングを作成"),
     ) + make_ui_buttons(False)
-    es_client.options(ignore_status=[400]).indices.create(
-        index=index_name, body={"mappings": mappings}
+    await run_blocking(
+        es_client.options(ignore_status=[400]).indices.create,
+        index=index_name,
+        body={"mappings": mappings},
     )
     yield (
         append_message(history, "assistant", "  - インデックスにデータを追加"),
     ) + make_ui_buttons(False)
-    actions = []
-    for doc_index, doc in enumerate(sample_data):
-        if "_index" not in doc:
-            doc["_index"] = index_name
-            doc["_id"] = doc_index + 1
-        actions.append(doc)
-    if actions:
-        bulk(es_client, actions)
+    # sample_data はブックから逐次読み出し、チャンクごとに登録する
+    indexed_count = await run_blocking(
+        _bulk_in_chunks, es_client, _iter_book_actions(book_repo, index_name)
+    )
+    # インデックスの内容が変わったので、クエリの実行結果とフィードバックの
+    # キャッシュと、クエリの検査に使うフィールドの型を破棄する
+    evict_field_types(index_name)
+    shared_cache = get_shared_cache()
+    if shared_cache is not None:
+        for namespace in (
+            REFERENCE_CACHE_NAMESPACE,
+            USER_QUERY_CACHE_NAMESPACE,
+            AGENT_FEEDBACK_CACHE_NAMESPACE,
+        ):
+            await run_blocking(shared_cache.clear, namespace)
     yield (
         append_message(
             history,
             "assistant",
-            f"  - {len(actions)} 件追加\n  - インデックスを再構築しました",
+            f"  - {indexed_count} 件追加\n  - インデックスを再構築しました",
         ),
     ) + make_ui_buttons(True)
 
 
-def _format_query(query):
+# 一度に bulk 登録するドキュメント数 (チャンクの区切りでキャンセルを確認する)
+BULK_CHUNK_SIZE = 500
+
+
+def _iter_book_actions(book_repo: BookRepository, index_name: str):
+    """ブックの sample_data から bulk 登録用のアクションを逐次生成する"""
+    for doc_index, doc in enumerate(book_repo.iter_sample_data()):
+        if "_index" not in doc:
+            doc["_index"] = index_name
+            doc["_id"] = doc_index + 1
+        yield doc
+
+
+def _bulk_in_chunks(es_client, actions, chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """
+    チャンクごとに bulk 登録し、登録した件数を返す。
+
+    actions はイテレータでもよく、一度にメモリに載るのは1チャンク分だけ。
+    呼び出し元が切断されたらチャンクの区切りで中断する。
+    """
+    count = 0
+    chunk = []
+    for action in actions:
+        chunk.append(action)
+        if len(chunk) >= chunk_size:
+            _bulk_chunk(es_client, chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        _bulk_chunk(es_client, chunk)
+        count += len(chunk)
+    return count
+
+
+def _bulk_chunk(es_client, chunk) -> None:
+    # es_operation は送信前にキャンセルを確認し、bulk 用のタイムアウトを設定する
+    with es_operation(es_client, "bulk") as client:
+        bulk(client, chunk)
+
+
+def _fetch_mapping(es_client, index_name: str):
+    with es_operation(es_client, "mapping") as client:
+        return client.indices.get_mapping(index=index_name)
+
+
+def _parse_query(query) -> ParsedQuery | None:
+    """クエリをパースする (JSON のオブジェクトではない場合は None)"""
     try:
-        query_dict = json.loads(query)
-        return json.dumps(query_dict, indent=4, ensure_ascii=False)
-    except json.JSONDecodeError:
+        return parse_query(query)
+    except ValueError:
+        return None
+
+
+def _format_query(query):
+    parsed = _parse_query(query)
+    if parsed is None:
+        import gradio as gr
+
         gr.Error("クエリを整形できません。正しいJSON形式で書いてください。")
         return query
+    return parsed.pretty
 
 
+@track_callback("format_query")
 async def format_query(query):
     """
     クエリを整形する
@@ -389,16 +606,10 @@ async def format_query(query):
 
 
 def _check_query_format(query):
-    valid_flag = False
-    try:
-        _ = json.loads(query)
-        valid_flag = True
-    except json.JSONDecodeError:
-        pass
-
-    return valid_flag
+    return _parse_query(query) is not None
 
 
+@track_callback("check_query_format")
 async def check_query_format(query):
     valid_flag = _check_query_format(query)
     if valid_flag:
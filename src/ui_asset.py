@@ -7,3 +7,4 @@ TEST_RUN_BUTTON_TEXT = "▶️  テスト実行 ▶️"
 FORMAT_QUERY_BUTTON_TEXT = "✨ 自動整形 ✨"
 MAPPING_BUTTON_TEXT = "(マッピング取得)"
 RENEW_INDEX_BUTTON_TEXT = "(インデックス再構築)"
+LEADERBOARD_BUTTON_TEXT = "🏆 ランキング 🏆"
@@ -0,0 +1,234 @@
+# src/utils/benchmark.py
+"""
+ベンチマーク計測用のハーネス。
+
+処理を繰り返し実行してスループットとレイテンシのパーセンタイル (p50/p95/p99) を
+計測し、tracemalloc でメモリ割り当て量を計測する。保存済みのベースラインと
+比較して性能劣化を検出できる。
+"""
+
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+
+@dataclass
+class BenchmarkResult:
+    """1つのベンチマークの計測結果"""
+
+    name: str
+    iterations: int
+    total_seconds: float
+    ops_per_second: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    # 計測区間中のメモリ割り当てのピーク (KiB)
+    peak_alloc_kib: float
+    # 1回あたりの平均割り当て量 (KiB)。計測終了時点で解放されていない分を含む
+    alloc_kib_per_op: float
+
+    def format(self) -> str:
+        return (
+            f"{self.name}: {self.ops_per_second:,.0f} ops/s, "
+            f"p50={self.p50_ms:.3f}ms p95={self.p95_ms:.3f}ms "
+            f"p99={self.p99_ms:.3f}ms, peak={self.peak_alloc_kib:.1f}KiB "
+            f"({self.alloc_kib_per_op:.2f}KiB/op)"
+        )
+
+
+def percentile(sorted_values: Sequence[float], ratio: float) -> float:
+    """ソート済みの値から線形補間でパーセンタイルを求める"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * ratio
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = position - lower
+    return sorted_values[lower] * (1 - fraction) + sorted_values[upper] * fraction
+
+
+def summarize(
+    name: str,
+    durations: List[float],
+    total_seconds: float,
+    peak_bytes: int = 0,
+    allocated_bytes: int = 0,
+) -> BenchmarkResult:
+    """1回ごとの処理時間 (秒) のリストから計測結果を作成する"""
+    ordered = sorted(durations)
+    iterations = len(durations)
+    return BenchmarkResult(
+        name=name,
+        iterations=iterations,
+        total_seconds=total_seconds,
+        ops_per_second=iterations / total_seconds if total_seconds else 0.0,
+        p50_ms=percentile(ordered, 0.50) * 1000,
+        p95_ms=percentile(ordered, 0.95) * 1000,
+        p99_ms=percentile(ordered, 0.99) * 1000,
+        peak_alloc_kib=peak_bytes / 1024,
+        alloc_kib_per_op=allocated_bytes / 1024 / max(iterations, 1),
+    )
+
+
+def _measure_allocations(run_batch: Callable[[], None]) -> tuple[int, int]:
+    """tracemalloc でバッチ実行中のピークと残存割り当て量を計測する"""
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        run_batch()
+        # 循環参照で残っているだけのオブジェクトは残存量に含めない
+        gc.collect()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
+    return max(peak - before, 0), max(after - before, 0)
+
+
+def run_benchmark(
+    name: str,
+    func: Callable[[], Any],
+    iterations: int = 200,
+    warmup: int = 10,
+    alloc_iterations: int = 20,
+    settle: Optional[Callable[[], Any]] = None,
+) -> BenchmarkResult:
+    """
+    同期関数のベンチマークを実行する。
+
+    時間計測とメモリ計測は別々のパスで行う (tracemalloc は処理を遅くするため)。
+    settle はメモリ計測パスの最後に呼び出す (バックグラウンドで書き込む記録を
+    flush するなど、計測対象が後で解放するメモリを残存量に含めないため)。
+    """
+    for _ in range(warmup):
+        func()
+
+    durations: List[float] = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        op_started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - op_started)
+    total_seconds = time.perf_counter() - started
+
+    def run_batch():
+        for _ in range(alloc_iterations):
+            func()
+        if settle is not None:
+            settle()
+
+    peak, allocated = _measure_allocations(run_batch)
+    result = summarize(name, durations, total_seconds, peak, allocated)
+    # 1回あたりの割り当て量はメモリ計測パスの回数で割る
+    result.alloc_kib_per_op = allocated / 1024 / max(alloc_iterations, 1)
+    return result
+
+
+def run_async_benchmark(
+    name: str,
+    func: Callable[[], Awaitable[Any]],
+    iterations: int = 200,
+    warmup: int = 10,
+    alloc_iterations: int = 20,
+    settle: Optional[Callable[[], Any]] = None,
+) -> BenchmarkResult:
+    """コルーチン関数のベンチマークを1つのイベントループ上で実行する"""
+    loop = asyncio.new_event_loop()
+    try:
+        return run_benchmark(
+            name,
+            lambda: loop.run_until_complete(func()),
+            iterations=iterations,
+            warmup=warmup,
+            alloc_iterations=alloc_iterations,
+            settle=settle,
+        )
+    finally:
+        # 計測対象が起動した常駐タスク (ブックの監視など) を終了させてから閉じる
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+
+
+# --- ベースラインとの比較 ---
+
+# 倍率による比較に加えて、ベースラインとの差がこれ以下なら劣化とみなさない
+P95_FLOOR_MS = 1.0
+ALLOC_FLOOR_KIB = 4.0
+
+
+def load_baseline(path: Path) -> Dict[str, Dict[str, float]]:
+    """保存済みのベースラインを読み込む (ファイルがなければ空)"""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_baseline(path: Path, results: Sequence[BenchmarkResult]) -> None:
+    """計測結果をベースラインとして保存する"""
+    data = {
+        result.name: {
+            "ops_per_second": round(result.ops_per_second, 1),
+            "p95_ms": round(result.p95_ms, 4),
+            "alloc_kib_per_op": round(result.alloc_kib_per_op, 2),
+        }
+        for result in results
+    }
+    Path(path).write_text(
+        json.dumps(data, indent=2, ensure_ascii=False, sort_keys=True) + "\n",
+        encoding="utf-8",
+    )
+
+
+def find_regressions(
+    results: Sequence[BenchmarkResult],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float = 2.0,
+    p95_floor_ms: float = P95_FLOOR_MS,
+    alloc_floor_kib: float = ALLOC_FLOOR_KIB,
+) -> List[str]:
+    """
+    ベースラインより tolerance 倍以上遅い (または多く割り当てる) 結果を列挙する。
+
+    計測環境の差を吸収するため、tolerance はある程度大きめにしておく。
+    1ms 未満の処理では倍率だけだと揺らぎで失敗するため、ベースラインとの差が
+    p95_floor_ms (割り当て量は alloc_floor_kib) 以下の場合も劣化とみなさない。
+    ベースラインに無いベンチマークは比較しない。
+    """
+    regressions: List[str] = []
+    for result in results:
+        expected = baseline.get(result.name)
+        if not expected:
+            continue
+        p95 = expected.get("p95_ms")
+        if p95 and result.p95_ms > max(p95 * tolerance, p95 + p95_floor_ms):
+            regressions.append(
+                f"{result.name}: p95 {result.p95_ms:.3f}ms > "
+                f"baseline {p95:.3f}ms x {tolerance}"
+            )
+        alloc = expected.get("alloc_kib_per_op")
+        # 割り当て量が極小の場合は誤差が大きいため 1KiB 未満は比較しない
+        if (
+            alloc
+            and alloc >= 1
+            and result.alloc_kib_per_op
+            > max(alloc * tolerance, alloc + alloc_floor_kib)
+        ):
+            regressions.append(
+                f"{result.name}: alloc {result.alloc_kib_per_op:.2f}KiB/op > "
+                f"baseline {alloc:.2f}KiB/op x {tolerance}"
+            )
+    return regressions
@@ -0,0 +1,125 @@
+# src/utils/executor.py
+"""
+ブロッキング処理 (同期版 Elasticsearch クライアントやファイル I/O) を
+イベントループの外で実行するためのスレッドプール。
+
+- スレッド数の上限を設け、スレッドには名前を付ける (スタックやログで判別できる)
+- 呼び出し元の contextvars (相関ID、計測中のスパンなど) をワーカーに引き継ぐ
+- 呼び出し元のタスクがキャンセルされた場合 (クライアントの切断など)、
+  未実行の処理は実行せず、実行中の処理にはキャンセルを通知する。
+  長い処理は check_cancelled() を区切りごとに呼び出して中断できる。
+
+設定は環境変数で変更できる。
+    ES_QUEST_IO_WORKERS: スレッド数の上限 (デフォルト: 8)
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Callable, Optional, TypeVar
+
+from .metrics import EXECUTOR_INFLIGHT, EXECUTOR_WAIT_SECONDS
+
+T = TypeVar("T")
+
+IO_WORKERS_ENV_VAR = "ES_QUEST_IO_WORKERS"
+DEFAULT_IO_WORKERS = 8
+THREAD_NAME_PREFIX = "es-quest-io"
+
+_cancel_event: ContextVar[Optional[threading.Event]] = ContextVar(
+    "blocking_cancel_event", default=None
+)
+
+_default_executor: Optional["BlockingExecutor"] = None
+_default_lock = threading.Lock()
+
+
+class BlockingCallCancelled(Exception):
+    """呼び出し元がキャンセルされたため、ワーカー側の処理を中断した"""
+
+
+def check_cancelled() -> None:
+    """
+    ワーカーで実行中の処理から呼び出し、呼び出し元がキャンセル済みなら中断する。
+
+    イベントループ上 (executor 外) で呼び出した場合は何もしない。
+    """
+    event = _cancel_event.get()
+    if event is not None and event.is_set():
+        raise BlockingCallCancelled("呼び出し元がキャンセルされました。")
+
+
+class BlockingExecutor:
+    """上限付き・名前付きのスレッドプール"""
+
+    def __init__(
+        self, max_workers: int = DEFAULT_IO_WORKERS, name: str = THREAD_NAME_PREFIX
+    ):
+        self.max_workers = max_workers
+        self.name = name
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        func(*args, **kwargs) をワーカースレッドで実行し、結果を待つ。
+
+        待機中にキャンセルされた場合は、キャンセルを通知してから
+        CancelledError を送出する (実行中の処理の完了は待たない)。
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        event = threading.Event()
+        call_name = getattr(func, "__qualname__", type(func).__name__)
+        submitted_at = time.perf_counter()
+
+        def call() -> T:
+            EXECUTOR_WAIT_SECONDS.observe(time.perf_counter() - submitted_at)
+            # キャンセル済みなら開始しない (順番待ちの間に切断された場合)
+            if event.is_set():
+                raise BlockingCallCancelled("呼び出し元がキャンセルされました。")
+            token = _cancel_event.set(event)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _cancel_event.reset(token)
+
+        EXECUTOR_INFLIGHT.inc(call=call_name)
+        future = loop.run_in_executor(
+            self._executor, functools.partial(context.run, call)
+        )
+        try:
+            return await future
+        except asyncio.CancelledError:
+            event.set()
+            future.cancel()
+            raise
+        finally:
+            EXECUTOR_INFLIGHT.dec(call=call_name)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def get_executor() -> BlockingExecutor:
+    """アプリ共通の BlockingExecutor を返す (初回呼び出し時に作成)"""
+    global _default_executor
+    if _default_executor is None:
+        with _default_lock:
+            if _default_executor is None:
+                max_workers = int(
+                    os.environ.get(IO_WORKERS_ENV_VAR, DEFAULT_IO_WORKERS)
+                )
+                _default_executor = BlockingExecutor(max_workers)
+    return _default_executor
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """アプリ共通のスレッドプールでブロッキング処理を実行する"""
+    return await get_executor().run(func, *args, **kwargs)
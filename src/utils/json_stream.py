@@ -0,0 +1,228 @@
+# src/utils/json_stream.py
+"""
+トップレベルが JSON オブジェクトのファイルを、必要なキーだけ読み出すパーサー。
+
+ファイルを少しずつ読み込み、不要なキーの値はデコードせずに読み飛ばす。
+配列の値は要素を1つずつ返すため、メモリ使用量は読み出す要素の大きさに比例し、
+ファイル全体の大きさには依存しない。
+
+    for quest in iter_array_items(path, "quests"):
+        ...
+    mappings = load_keys(path, ["mappings"])["mappings"]
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, TextIO
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",:]}"
+# 文字列の外で意味を持つ文字 / 文字列の中で意味を持つ文字
+_STRUCTURAL = re.compile(r'["\[\]{}]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+class _Reader:
+    """チャンク単位で読み込むバッファ付きのリーダー"""
+
+    def __init__(self, fp: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """次のチャンクを読み込む。読み込めた場合は True"""
+        if self.eof:
+            return False
+        chunk = self._fp.read(self._chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # 読み終えた部分は捨てて、バッファが際限なく大きくならないようにする
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def error(self, message: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self.buf, self.pos)
+
+    def peek(self) -> str:
+        """空白を読み飛ばして次の文字を返す (読み進めない)。終端では空文字。"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise self.error(f"'{char}' が必要です")
+        self.pos += 1
+
+    def decode(self) -> Any:
+        """現在位置の値を1つデコードする"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # 数値はチャンクの境界で途切れていても ("-12." の "-12" など)
+            # デコードに成功してしまうため、値の直後が区切り文字かを確認する
+            if (end == len(self.buf) or self.buf[end] not in _DELIMITERS) and (
+                self.fill()
+            ):
+                continue
+            self.pos = end
+            return value
+
+    def skip(self) -> None:
+        """現在位置の値を保持せずに読み飛ばす"""
+        first = self.peek()
+        if first == "[":
+            # 配列は要素ごとにデコードして捨てる。C 実装のデコーダーを使う方が
+            # 文字単位の走査より速く、メモリ使用量も要素1つ分で済む。
+            for _ in _iter_array(self):
+                pass
+            return
+        if first != "{":
+            # スカラー値は小さいのでデコードして捨てる
+            self.decode()
+            return
+        self.scan()
+
+    def scan(self) -> None:
+        """現在位置のオブジェクトを、デコードせずに構造だけ追って読み飛ばす"""
+        self.peek()
+        depth = 0
+        in_string = False
+        while True:
+            pattern = _STRING_SPECIAL if in_string else _STRUCTURAL
+            match = pattern.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+                if not self.fill():
+                    raise self.error("JSON が途中で終わっています")
+                continue
+            char = match.group()
+            self.pos = match.end()
+            if in_string:
+                if char == '"':
+                    in_string = False
+                    continue
+                # エスケープ: 次の1文字を読み飛ばす
+                if self.pos >= len(self.buf) and not self.fill():
+                    raise self.error("JSON が途中で終わっています")
+                self.pos += 1
+            elif char == '"':
+                in_string = True
+            elif char in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+
+def _iter_top_level_keys(reader: _Reader) -> Iterator[str]:
+    """
+    トップレベルのオブジェクトのキーを順に返す。
+
+    キーを受け取った側は、次のキーを要求するまでに値を消費 (decode / skip /
+    配列の走査) しておく必要がある。
+    """
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.pos += 1
+        return
+    while True:
+        key = reader.decode()
+        if not isinstance(key, str):
+            raise reader.error("オブジェクトのキーが文字列ではありません")
+        reader.expect(":")
+        yield key
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == "}":
+            return
+        if separator != ",":
+            raise reader.error("',' または '}' が必要です")
+
+
+def _iter_array(reader: _Reader) -> Iterator[Any]:
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.pos += 1
+        return
+    while True:
+        yield reader.decode()
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise reader.error("',' または ']' が必要です")
+
+
+def iter_array_items_from(
+    fp: TextIO, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[Any]:
+    """
+    トップレベルのキー key の配列の要素を1つずつ返す (ファイルオブジェクト版)。
+
+    他のキーの値は読み飛ばす。キーが無い場合は何も返さない。
+    """
+    reader = _Reader(fp, chunk_size)
+    for current in _iter_top_level_keys(reader):
+        if current != key:
+            reader.skip()
+            continue
+        if reader.peek() != "[":
+            raise reader.error(f"'{key}' の値が配列ではありません")
+        yield from _iter_array(reader)
+        return
+
+
+def iter_array_items(
+    path: Path, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[Any]:
+    """ファイル path のトップレベルのキー key の配列の要素を1つずつ返す"""
+    with Path(path).open("r", encoding="utf-8") as f:
+        yield from iter_array_items_from(f, key, chunk_size)
+
+
+def load_keys(
+    path: Path,
+    keys: Iterable[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    default: Optional[Any] = None,
+) -> Dict[str, Any]:
+    """
+    ファイル path のトップレベルのうち、keys の値だけをデコードして返す。
+
+    すべてのキーが見つかった時点で読み込みを終える。見つからないキーの値は default。
+    """
+    wanted = set(keys)
+    result: Dict[str, Any] = {key: default for key in wanted}
+    remaining = set(wanted)
+    with Path(path).open("r", encoding="utf-8") as f:
+        reader = _Reader(f, chunk_size)
+        for current in _iter_top_level_keys(reader):
+            if current in remaining:
+                result[current] = reader.decode()
+                remaining.discard(current)
+                if not remaining:
+                    break
+            else:
+                reader.skip()
+    return result
@@ -0,0 +1,229 @@
+# src/utils/log.py
+"""
+JSON Lines 形式の構造化ロギング。
+
+- リクエストごとの相関ID (correlation id) を contextvars で引き回し、全ログに付与する
+- WARNING 未満のログはサンプリングレートに従って間引ける
+- LazyJson を使うと、ログが実際に出力される場合にだけ JSON 整形を行う
+- 出力 (ストリームへの書き込み) はバックグラウンドスレッドで行う
+
+設定は環境変数で変更できる。
+    ES_QUEST_LOG_LEVEL: ログレベル (デフォルト: INFO)
+    ES_QUEST_LOG_FORMAT: "json" または "text" (デフォルト: json)
+    ES_QUEST_LOG_SAMPLE_RATE: WARNING 未満のログの出力率 0.0-1.0 (デフォルト: 1.0)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import numbers
+import os
+import queue
+import random
+import sys
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Iterator, Mapping, Optional
+
+LOG_LEVEL_ENV_VAR = "ES_QUEST_LOG_LEVEL"
+LOG_FORMAT_ENV_VAR = "ES_QUEST_LOG_FORMAT"
+LOG_SAMPLE_RATE_ENV_VAR = "ES_QUEST_LOG_SAMPLE_RATE"
+
+# ロガーの階層のルート (src 配下のモジュールはすべてこの配下になる)
+APP_LOGGER_NAME = "src"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+_correlation_id: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+
+# LogRecord が標準で持つ属性 (これ以外は extra として JSON に含める)
+_RESERVED_ATTRS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__.keys()) | {
+    "message",
+    "asctime",
+    "correlation_id",
+}
+
+
+class LazyJson:
+    """ログ出力時にだけ JSON 文字列に変換するラッパー"""
+
+    __slots__ = ("value", "indent")
+
+    def __init__(self, value: Any, indent: Optional[int] = None):
+        self.value = value
+        self.indent = indent
+
+    def __str__(self) -> str:
+        try:
+            return json.dumps(self.value, indent=self.indent, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return str(self.value)
+
+
+def get_correlation_id() -> Optional[str]:
+    """現在のコンテキストの相関IDを返す"""
+    return _correlation_id.get()
+
+
+@contextmanager
+def correlation_scope(correlation_id: Optional[str] = None) -> Iterator[str]:
+    """
+    現在のコンテキスト (非同期タスク) に相関IDを設定する。
+
+    correlation_id を省略した場合は新しく採番する。
+    """
+    value = correlation_id or uuid.uuid4().hex[:16]
+    token = _correlation_id.set(value)
+    try:
+        yield value
+    finally:
+        _correlation_id.reset(token)
+
+
+class CorrelationIdFilter(logging.Filter):
+    """LogRecord に相関IDを付与するフィルタ"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = _correlation_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """しきい値未満のレベルのログを指定した割合で間引くフィルタ"""
+
+    def __init__(self, sample_rate: float, always_level: int = logging.WARNING):
+        super().__init__()
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.always_level = always_level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.always_level or self.sample_rate >= 1.0:
+            return True
+        return random.random() < self.sample_rate
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """1レコード1行の JSON に整形するフォーマッタ"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        correlation_id = getattr(record, "correlation_id", None)
+        if correlation_id:
+            entry["correlation_id"] = correlation_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _Snapshot:
+    """ログに渡した時点の引数の文字列表現 (%s と %r で使う)"""
+
+    __slots__ = ("_str", "_repr")
+
+    def __init__(self, value: Any):
+        self._str = str(value)
+        self._repr = repr(value)
+
+    def __str__(self) -> str:
+        return self._str
+
+    def __repr__(self) -> str:
+        return self._repr
+
+
+def _snapshot(value: Any) -> Any:
+    """変更されうる引数をログに渡した時点の文字列表現に置き換える"""
+    if value is None or isinstance(value, (str, bytes, numbers.Number, LazyJson)):
+        return value
+    return _Snapshot(value)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    整形せずにレコードをキューに積む QueueHandler。
+
+    標準の prepare() は呼び出し元スレッドで format() を実行し、exc_info を
+    消してしまう。ここでは相関ID (フィルタで付与済み) を含むレコードを
+    そのまま渡し、メッセージの組み立て・LazyJson の整形・トレースバックの
+    整形はバックグラウンドスレッドのフォーマッタで行う。
+    ただし、ログ出力後に呼び出し元が変更しうる引数 (dict やリストなど) は、
+    ここで文字列表現を取っておく。LazyJson は出力するときに整形するため、
+    包んだ値はログ出力後に変更しないこと。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if isinstance(args, Mapping):
+            record.args = {key: _snapshot(value) for key, value in args.items()}
+        elif args:
+            record.args = tuple(_snapshot(arg) for arg in args)
+        return record
+
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(correlation_id)s] %(message)s"
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    log_format: Optional[str] = None,
+    sample_rate: Optional[float] = None,
+    stream=None,
+    background: bool = True,
+) -> logging.Logger:
+    """
+    アプリケーションのロガーを設定する。複数回呼び出しても設定は1つだけ。
+
+    引数を省略した場合は環境変数の値 (なければデフォルト値) を使う。
+    background が True の場合、呼び出し元スレッドではレコードをキューに
+    積むだけにして、整形済みの書き込みはバックグラウンドスレッドで行う。
+    """
+    global _listener
+    level = level or os.environ.get(LOG_LEVEL_ENV_VAR, "INFO")
+    log_format = log_format or os.environ.get(LOG_FORMAT_ENV_VAR, "json")
+    if sample_rate is None:
+        sample_rate = float(os.environ.get(LOG_SAMPLE_RATE_ENV_VAR, "1.0"))
+
+    stream_handler = logging.StreamHandler(stream or sys.stderr)
+    if log_format == "json":
+        stream_handler.setFormatter(JsonLinesFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if background:
+        handler = _DeferredQueueHandler(queue.SimpleQueue())
+        _listener = logging.handlers.QueueListener(handler.queue, stream_handler)
+        _listener.start()
+    else:
+        handler = stream_handler
+    # 相関IDは contextvars にあるため、呼び出し元のスレッドで付与する
+    handler.addFilter(CorrelationIdFilter())
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    logger = logging.getLogger(APP_LOGGER_NAME)
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
+    logger.addHandler(handler)
+    logger.setLevel(level.upper())
+    logger.propagate = False
+    return logger
+
+
+@atexit.register
+def _stop_listener() -> None:
+    """終了時にキューに残ったログを書き出す"""
+    if _listener is not None:
+        _listener.stop()
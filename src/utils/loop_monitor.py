@@ -0,0 +1,186 @@
+# src/utils/loop_monitor.py
+"""
+イベントループの遅延 (lag) の計測と、ループをブロックする処理の検出。
+
+ハートビート用のタスクが一定間隔で sleep し、予定より遅れて起きた時間を
+遅延としてヒストグラムに記録する。デバッグモードでは別スレッドの監視役が
+ハートビートの途絶を検出し、その時点のループスレッドのスタックを取得して、
+どの処理がループをブロックしているかをログに出力する。あわせて asyncio の
+デバッグモードを有効にし、遅いコールバックも asyncio 自身に報告させる。
+
+設定は環境変数で変更できる。
+    ES_QUEST_LOOP_MONITOR: "off" (デフォルト) / "on" (遅延のヒストグラムのみ) /
+        "debug" (ブロッキング検出とスタック取得も行う)
+    ES_QUEST_LOOP_BLOCK_THRESHOLD_MS: ブロッキングとみなす遅延 (デフォルト: 100)
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from .metrics import LOOP_BLOCKED, LOOP_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_ENV_VAR = "ES_QUEST_LOOP_MONITOR"
+BLOCK_THRESHOLD_ENV_VAR = "ES_QUEST_LOOP_BLOCK_THRESHOLD_MS"
+
+# ブロッキング箇所の特定に使うプロジェクトのルート
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+_THIS_FILE = Path(__file__).resolve()
+
+_monitor: Optional["LoopMonitor"] = None
+
+
+def loop_monitor_mode() -> str:
+    """環境変数から監視モード ("off" / "on" / "debug") を返す"""
+    value = os.environ.get(LOOP_MONITOR_ENV_VAR, "").lower()
+    if value == "debug":
+        return "debug"
+    if value in ("1", "true", "yes", "on"):
+        return "on"
+    return "off"
+
+
+@dataclass
+class BlockingReport:
+    """ループのブロッキングを1回検出した結果"""
+
+    site: str
+    blocked_seconds: float
+    stack: List[traceback.FrameSummary]
+
+    def format_stack(self) -> str:
+        return "".join(traceback.format_list(self.stack))
+
+
+def attribute_site(stack: List[traceback.FrameSummary]) -> str:
+    """
+    スタックからブロッキングの原因とみなす箇所を `相対パス:関数名` で返す。
+
+    標準ライブラリや依存パッケージの内部ではなく、それを呼び出した
+    プロジェクト内の最も内側のフレームを原因とする。
+    """
+    for frame in reversed(stack):
+        # <frozen ...> などの組み込みモジュールは対象外
+        if frame.filename.startswith("<"):
+            continue
+        path = Path(frame.filename).resolve()
+        if path == _THIS_FILE or "site-packages" in path.parts:
+            continue
+        if path.is_relative_to(_PROJECT_ROOT):
+            return f"{path.relative_to(_PROJECT_ROOT)}:{frame.name}"
+    if stack:
+        return f"{Path(stack[-1].filename).name}:{stack[-1].name}"
+    return "unknown"
+
+
+class LoopMonitor:
+    """1つのイベントループを監視するモニター"""
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        debug: bool = False,
+        threshold_seconds: float = 0.1,
+        interval_seconds: float = 0.05,
+    ):
+        self.loop = loop
+        self.debug = debug
+        self.threshold_seconds = threshold_seconds
+        self.interval_seconds = interval_seconds
+        self.reports: List[BlockingReport] = []
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """監視を開始する。イベントループのスレッドから呼び出すこと。"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = self.loop.create_task(self._heartbeat())
+        if self.debug:
+            self.loop.set_debug(True)
+            self.loop.slow_callback_duration = self.threshold_seconds
+            self._watchdog = threading.Thread(
+                target=self._watch, name="loop-monitor", daemon=True
+            )
+            self._watchdog.start()
+
+    def stop(self) -> None:
+        """監視を終了する"""
+        self._stopped.set()
+        if self._task is not None and not self.loop.is_closed():
+            self._task.cancel()
+        self._task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._last_beat = time.monotonic()
+            scheduled = self.loop.time() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            LOOP_LAG_SECONDS.observe(max(self.loop.time() - scheduled, 0.0))
+
+    def _watch(self) -> None:
+        """監視スレッド: ハートビートが途絶えている間のスタックを取得する"""
+        reported_beat = None
+        check_interval = min(self.interval_seconds, self.threshold_seconds / 2)
+        while not self._stopped.wait(check_interval):
+            if self.loop.is_closed():
+                return
+            beat = self._last_beat
+            # ハートビートは interval 後に起きる予定なので、その分を差し引く
+            overdue = time.monotonic() - beat - self.interval_seconds
+            if overdue >= self.threshold_seconds and beat != reported_beat:
+                # 同じブロッキングを重複して報告しない
+                reported_beat = beat
+                self._report_blocking(overdue)
+
+    def _report_blocking(self, blocked_seconds: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        report = BlockingReport(attribute_site(stack), blocked_seconds, stack)
+        self.reports.append(report)
+        LOOP_BLOCKED.inc(site=report.site)
+        logger.warning(
+            "event loop blocked for %.0fms at %s\n%s",
+            blocked_seconds * 1000,
+            report.site,
+            report.format_stack(),
+            extra={"blocked_ms": blocked_seconds * 1000, "site": report.site},
+        )
+
+
+def ensure_loop_monitor() -> Optional[LoopMonitor]:
+    """
+    実行中のイベントループの監視を開始する (環境変数で無効な場合は何もしない)。
+
+    同じループに対して何度呼び出しても監視は1つだけ。別のループで呼び出された
+    場合 (CLI で asyncio.run を繰り返した場合など) は前の監視を終了して付け替える。
+    """
+    global _monitor
+    mode = loop_monitor_mode()
+    if mode == "off":
+        return None
+    loop = asyncio.get_running_loop()
+    if _monitor is not None and _monitor.loop is loop:
+        return _monitor
+    if _monitor is not None:
+        _monitor.stop()
+    threshold_ms = float(os.environ.get(BLOCK_THRESHOLD_ENV_VAR, "100"))
+    _monitor = LoopMonitor(
+        loop, debug=(mode == "debug"), threshold_seconds=threshold_ms / 1000
+    )
+    _monitor.start()
+    return _monitor
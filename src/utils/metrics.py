@@ -0,0 +1,389 @@
+# src/utils/metrics.py
+"""
+Prometheus テキスト形式で出力できる軽量なメトリクスレジストリ。
+
+外部ライブラリには依存せず、Counter / Gauge / Histogram のみを提供する。
+アプリ全体で共有するメトリクスは本モジュールの末尾で定義する。
+"""
+
+import functools
+import inspect
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# レイテンシ用のデフォルトバケット (秒)
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """メトリクスの共通処理 (ラベルの解決とロック)"""
+
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"メトリクス {self.name} のラベルが不正です: "
+                f"期待={self.labelnames}, 実際={tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """単調増加するカウンター"""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: object) -> float:
+        return self._values.get(self._label_values(labels), 0.0)
+
+    def _render_samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, value in items:
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}{labels} {_format_number(value)}"
+
+
+class Gauge(_Metric):
+    """増減する現在値"""
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: object) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def get(self, **labels: object) -> float:
+        return self._values.get(self._label_values(labels), 0.0)
+
+    def _render_samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, value in items:
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}{labels} {_format_number(value)}"
+
+
+class Histogram(_Metric):
+    """累積バケットで分布を記録するヒストグラム"""
+
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # ラベル値ごとに (バケットごとの件数, 合計, 件数)
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            counts, total, count = self._values.get(
+                key, ([0] * len(self.buckets), 0.0, 0)
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    def get_count(self, **labels: object) -> int:
+        entry = self._values.get(self._label_values(labels))
+        return entry[2] if entry else 0
+
+    def _render_samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(
+                (values, (list(counts), total, count))
+                for values, (counts, total, count) in self._values.items()
+            )
+        for values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_number(bound)}"'
+                labels = _format_labels(self.labelnames, values, le)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_number(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class MetricsRegistry:
+    """メトリクスを登録し、まとめて出力するレジストリ"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"メトリクス {metric.name} は登録済みです。")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus テキスト形式 (version 0.0.4) で出力する"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- アプリ共通のメトリクス ---
+REGISTRY = MetricsRegistry()
+
+SUBMISSIONS = REGISTRY.counter(
+    "es_quest_submissions_total",
+    "クエストへの回答提出数",
+    ["quest_id", "result"],
+)
+ES_SEARCH_SECONDS = REGISTRY.histogram(
+    "es_quest_es_search_seconds",
+    "Elasticsearch の search 呼び出しのレイテンシ (秒)。"
+    "失敗した呼び出しも含む (outcome: ok / timeout / error)",
+    ["outcome"],
+)
+ES_TOOK_MILLISECONDS = REGISTRY.histogram(
+    "es_quest_es_took_milliseconds",
+    "Elasticsearch レスポンスの took (ミリ秒)",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+AGENT_SECONDS = REGISTRY.histogram(
+    "es_quest_agent_seconds",
+    "LLMエージェントによる評価のレイテンシ (秒)",
+)
+AGENT_TOKENS = REGISTRY.counter(
+    "es_quest_agent_tokens_total",
+    "LLMエージェントが消費したトークン数",
+    ["kind"],
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "es_quest_cache_requests_total",
+    "キャッシュの参照回数",
+    ["cache", "result"],
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "es_quest_view_queue_depth",
+    "UI への送信待ちメッセージ数 (全セッション合計)",
+)
+INFLIGHT = REGISTRY.gauge(
+    "es_quest_inflight_callbacks",
+    "実行中の UI コールバック数",
+    ["callback"],
+)
+CALLBACK_SECONDS = REGISTRY.histogram(
+    "es_quest_callback_seconds",
+    "UI コールバックの処理時間 (秒)",
+    ["callback"],
+)
+ERRORS = REGISTRY.counter(
+    "es_quest_errors_total",
+    "発生したエラー数 (例外クラス別)",
+    ["source", "error_class"],
+)
+SPAN_SECONDS = REGISTRY.histogram(
+    "es_quest_span_seconds",
+    "timing モジュールで計測したスパンの処理時間 (秒)",
+    ["span"],
+)
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "es_quest_event_loop_lag_seconds",
+    "イベントループの遅延 (予定より遅れてタスクが再開した秒数)",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_BLOCKED = REGISTRY.counter(
+    "es_quest_event_loop_blocked_total",
+    "イベントループのブロッキングの検出数 (原因箇所別、デバッグモードのみ)",
+    ["site"],
+)
+EXECUTOR_INFLIGHT = REGISTRY.gauge(
+    "es_quest_executor_inflight",
+    "スレッドプールで実行中・待機中のブロッキング処理数",
+    ["call"],
+)
+EXECUTOR_WAIT_SECONDS = REGISTRY.histogram(
+    "es_quest_executor_wait_seconds",
+    "ブロッキング処理がスレッドプールで実行開始されるまでの待ち時間 (秒)",
+)
+ATTEMPTS_PENDING = REGISTRY.gauge(
+    "es_quest_attempts_pending",
+    "書き込み待ちの記録数 (提出・ポイントなど)",
+)
+BOOK_RELOADS = REGISTRY.counter(
+    "es_quest_book_reloads_total",
+    "ブックの変更を検出して再読み込みした回数 (result: ok / error)",
+    ["result"],
+)
+
+
+def observe_span(name: str, seconds: float) -> None:
+    """timing モジュールのスパンリスナー。スパンをメトリクスに反映する。"""
+    SPAN_SECONDS.observe(seconds, span=name)
+
+
+def record_error(source: str, error: BaseException) -> None:
+    """エラーを例外クラス別にカウントする"""
+    ERRORS.inc(source=source, error_class=type(error).__name__)
+
+
+def track_callback(name: str):
+    """
+    UI コールバックの実行数・処理時間・エラーを記録するデコレータ。
+
+    Gradio は関数の種類 (async generator かどうか) でストリーミングを判定するため、
+    元の関数と同じ種類のラッパーを返す。
+    """
+
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+
+            @functools.wraps(func)
+            async def asyncgen_wrapper(*args, **kwargs):
+                INFLIGHT.inc(callback=name)
+                started = time.perf_counter()
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                except Exception as e:
+                    record_error(name, e)
+                    raise
+                finally:
+                    INFLIGHT.dec(callback=name)
+                    CALLBACK_SECONDS.observe(
+                        time.perf_counter() - started, callback=name
+                    )
+
+            return asyncgen_wrapper
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            INFLIGHT.inc(callback=name)
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                record_error(name, e)
+                raise
+            finally:
+                INFLIGHT.dec(callback=name)
+                CALLBACK_SECONDS.observe(time.perf_counter() - started, callback=name)
+
+        return async_wrapper
+
+    return decorator
+
+
+ES_CIRCUIT_STATE = REGISTRY.gauge(
+    "es_quest_es_circuit_state",
+    "Elasticsearch のサーキットブレーカーの状態 (0: closed, 1: half_open, 2: open)",
+)
+ES_UNAVAILABLE = REGISTRY.counter(
+    "es_quest_es_unavailable_total",
+    "Elasticsearch に接続できなかった (タイムアウトを含む) 回数",
+    ["operation"],
+)
+ES_REJECTED = REGISTRY.counter(
+    "es_quest_es_rejected_total",
+    "サーキットブレーカーが開いているため送信せずに失敗させた回数",
+    ["operation"],
+)
@@ -1,28 +1,32 @@
 # src/utils/query_loader.py
-import json
 from pathlib import Path
 
+from ..es.canonical import ParsedQuery, parse_query
 from ..exceptions import InvalidQueryError
 
 
 def load_query_from_source(
-    query_str: str | None,
+    query_str: str | ParsedQuery | None,
     query_file: Path | None,
-) -> str:
+) -> ParsedQuery:
     """
     ファイル、文字列、または対話入力からクエリ文字列を取得し、JSON形式か検証する。
 
     Args:
-        query_str: クエリ文字列 (CLI引数).
+        query_str: クエリ文字列 (CLI引数)。UI などでパース済みの場合は
+            ParsedQuery をそのまま返す.
         query_file: クエリファイルパス (CLI引数).
 
     Returns:
-        有効なJSON形式のクエリ文字列.
+        パース済みのクエリ (以降の処理ではパースし直さずに使う).
 
     Raises:
         InvalidQueryError: クエリの取得や検証に失敗した場合.
         FileNotFoundError: クエリファイルが見つからない or 読み込めない場合.
     """
+    if isinstance(query_str, ParsedQuery):
+        return query_str
+
     user_query_str = None
     source = "不明"
 
@@ -52,12 +56,10 @@ def load_query_from_source(
     if not user_query_str or not user_query_str.strip():
         raise InvalidQueryError(f"{source} から取得されたクエリが空です。")
 
-    # 簡単なJSON形式チェック
     try:
-        json.loads(user_query_str)
-    except json.JSONDecodeError as e:
+        return parse_query(user_query_str)
+    except ValueError as e:
+        # json.JSONDecodeError、または JSON のオブジェクトではない場合
         raise InvalidQueryError(
             f"{source} から取得されたクエリが有効なJSON形式ではありません: {e}"
         ) from e
-
-    return user_query_str
@@ -0,0 +1,130 @@
+# src/utils/shared_cache.py
+"""
+複数のワーカープロセスで共有するキャッシュ (SQLite の WAL モード)。
+
+WAL モードでは読み込みが書き込みを待たないため、各ワーカーが同じファイルを
+開いて並行に読み書きできる。値は JSON にシリアライズして保存し、
+名前空間ごとにまとめて破棄できる (インデックスの再構築時など)。
+
+接続はスレッドごとに作成する (sqlite3 の接続はスレッド間で共有できない)。
+
+設定は環境変数で変更できる。
+    ES_QUEST_SHARED_CACHE: キャッシュファイルのパス (未設定の場合は使わない)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from .metrics import CACHE_REQUESTS
+
+SHARED_CACHE_ENV_VAR = "ES_QUEST_SHARED_CACHE"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+)
+"""
+
+_default_cache: Optional["SharedCache"] = None
+_default_lock = threading.Lock()
+
+
+class SharedCache:
+    """プロセス間で共有する JSON 値のキャッシュ"""
+
+    def __init__(self, path: Path, timeout_seconds: float = 5.0):
+        self.path = Path(path)
+        self.timeout_seconds = timeout_seconds
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connection()
+        with conn:
+            conn.execute(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout_seconds)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL では NORMAL でも破損はしない (電源断時に直近の書き込みを失うだけ)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """値を返す。無い場合や期限切れの場合は None。"""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            )
+            .fetchone()
+        )
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            CACHE_REQUESTS.inc(cache=namespace, result="miss")
+            return None
+        CACHE_REQUESTS.inc(cache=namespace, result="hit")
+        return json.loads(row[0])
+
+    def set(
+        self, namespace: str, key: str, value: Any, ttl: Optional[float] = None
+    ) -> None:
+        """値を保存する。ttl (秒) を指定した場合はその時間が過ぎると無効になる。"""
+        expires_at = time.time() + ttl if ttl is not None else None
+        encoded = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (namespace, key, encoded, expires_at),
+            )
+
+    def delete(self, namespace: str, key: str) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+            )
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """名前空間の値をすべて破棄する (None の場合はすべての値)"""
+        conn = self._connection()
+        with conn:
+            if namespace is None:
+                conn.execute("DELETE FROM cache")
+            else:
+                conn.execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+
+    def purge_expired(self) -> int:
+        """期限切れの値を削除し、削除した件数を返す"""
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?",
+                (time.time(),),
+            )
+        return cursor.rowcount
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """環境変数で指定された共有キャッシュを返す (未設定の場合は None)"""
+    global _default_cache
+    path = os.environ.get(SHARED_CACHE_ENV_VAR)
+    if not path:
+        return None
+    if _default_cache is None or _default_cache.path != Path(path):
+        with _default_lock:
+            if _default_cache is None or _default_cache.path != Path(path):
+                _default_cache = SharedCache(Path(path))
+    return _default_cache
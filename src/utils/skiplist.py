@@ -0,0 +1,125 @@
+# src/utils/skiplist.py
+"""
+位置 (順位) で引けるスキップリスト。
+
+各リンクに「何要素先に進むか」(幅) を持たせることで、挿入・削除・
+値の順位 (bisect_left)・位置による参照をいずれも平均 O(log n) で行う。
+ランキングのように、値の更新と順位の参照が頻繁に混ざる用途向け。
+
+    ranking = IndexableSkiplist()
+    ranking.insert((-120, "alice"))
+    ranking.bisect_left((-120, ""))  # alice より上位の人数
+"""
+
+import random
+from typing import Any, Iterator, List, Optional
+
+MAX_LEVEL = 32
+
+
+class _Node:
+    __slots__ = ("value", "next", "width")
+
+    def __init__(self, value: Any, level: int):
+        self.value = value
+        self.next: List[Optional["_Node"]] = [None] * level
+        # next[i] までに進む要素数 (末尾の次を番兵とみなした距離)
+        self.width: List[int] = [1] * level
+
+
+class IndexableSkiplist:
+    """比較可能な値を昇順に保持するスキップリスト (重複した値も保持できる)"""
+
+    def __init__(self, seed: Optional[int] = None):
+        self._head = _Node(None, MAX_LEVEL)
+        self._level = 1
+        self._size = 0
+        self._random = random.Random(seed)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < MAX_LEVEL and self._random.random() < 0.5:
+            level += 1
+        return level
+
+    def _find(self, value: Any):
+        """各レベルで value より小さい最後のノードと、その位置を返す"""
+        chain: List[_Node] = [self._head] * MAX_LEVEL
+        positions = [0] * MAX_LEVEL
+        node = self._head
+        position = 0
+        for level in reversed(range(self._level)):
+            while node.next[level] is not None and node.next[level].value < value:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            positions[level] = position
+        return chain, positions, position
+
+    def insert(self, value: Any) -> None:
+        chain, positions, position = self._find(value)
+        level = self._random_level()
+        if level > self._level:
+            # 新たに使うレベルでは、先頭から番兵までの距離で初期化する
+            for new_level in range(self._level, level):
+                self._head.width[new_level] = self._size + 1
+            self._level = level
+        node = _Node(value, level)
+        for i in range(level):
+            prev = chain[i]
+            node.next[i] = prev.next[i]
+            prev.next[i] = node
+            node.width[i] = prev.width[i] - (position - positions[i])
+            prev.width[i] = position - positions[i] + 1
+        for i in range(level, self._level):
+            chain[i].width[i] += 1
+        self._size += 1
+
+    def remove(self, value: Any) -> None:
+        """value と等しい要素を1つ削除する。無い場合は ValueError。"""
+        chain, _, _ = self._find(value)
+        target = chain[0].next[0]
+        if target is None or target.value != value:
+            raise ValueError(f"{value!r} is not in the skiplist")
+        for i in range(len(target.next)):
+            prev = chain[i]
+            prev.width[i] += target.width[i] - 1
+            prev.next[i] = target.next[i]
+        for i in range(len(target.next), self._level):
+            chain[i].width[i] -= 1
+        self._size -= 1
+
+    def bisect_left(self, value: Any) -> int:
+        """value より小さい要素の数 (value を挿入する位置)"""
+        return self._find(value)[2]
+
+    def __getitem__(self, index: int) -> Any:
+        return self._node_at(index).value
+
+    def _node_at(self, index: int) -> _Node:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("skiplist index out of range")
+        node = self._head
+        remaining = index + 1
+        for level in reversed(range(self._level)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node
+
+    def iter_from(self, index: int = 0) -> Iterator[Any]:
+        """位置 index 以降の値を昇順に返す"""
+        if index >= self._size:
+            return
+        node: Optional[_Node] = self._node_at(max(index, 0))
+        while node is not None:
+            yield node.value
+            node = node.next[0]
+
+    def __iter__(self) -> Iterator[Any]:
+        return self.iter_from(0)
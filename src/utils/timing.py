@@ -0,0 +1,187 @@
+# src/utils/timing.py
+"""
+処理時間を計測する軽量なスパン/タイマー機能。
+
+記録中のリクエストは contextvars で管理するため、非同期タスクごとに独立して
+計測できる。記録もリスナーも無い場合、span() は共有の何もしない
+コンテキストマネージャを返すだけなので、無効時のコストはほぼゼロ。
+"""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# この環境変数が真値 (1, true, yes, on) の場合にリクエストごとの計測を有効にする
+TIMING_ENV_VAR = "ES_QUEST_TIMING"
+
+# スパン終了時に (スパン名, 経過秒) で呼び出されるリスナー (メトリクス連携用)
+SpanListener = Callable[[str, float], None]
+_listeners: List[SpanListener] = []
+
+_current_recorder: ContextVar[Optional["TimingRecorder"]] = ContextVar(
+    "timing_recorder", default=None
+)
+
+
+def _notify_listeners(name: str, seconds: float) -> None:
+    for listener in _listeners:
+        try:
+            listener(name, seconds)
+        except Exception:
+            logger.exception("span listener failed: %s", name)
+
+
+class TimingRecorder:
+    """1リクエスト分のスパンの計測結果を保持するクラス"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+
+    def record(self, span_name: str, seconds: float) -> None:
+        """スパンの計測結果を追加する"""
+        self.spans.append((span_name, seconds))
+
+    @property
+    def total_seconds(self) -> float:
+        """記録開始からの経過秒"""
+        return time.perf_counter() - self.started_at
+
+    def breakdown(self) -> List[Tuple[str, float]]:
+        """(スパン名, 経過ミリ秒) のリストを終了順で返す"""
+        return [(name, seconds * 1000) for name, seconds in self.spans]
+
+    def format(self) -> str:
+        """ログ出力用の1行サマリーを返す"""
+        parts = ", ".join(f"{name}={ms:.1f}ms" for name, ms in self.breakdown())
+        return f"{self.name} total={self.total_seconds * 1000:.1f}ms ({parts})"
+
+
+class _Span:
+    """計測中のスパン。with 文または finish() で終了する。"""
+
+    __slots__ = ("name", "recorder", "started_at", "finished")
+
+    def __init__(self, name: str, recorder: Optional[TimingRecorder]):
+        self.name = name
+        self.recorder = recorder
+        self.started_at = time.perf_counter()
+        self.finished = False
+
+    def finish(self) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        seconds = time.perf_counter() - self.started_at
+        if self.recorder is not None:
+            self.recorder.record(self.name, seconds)
+        _notify_listeners(self.name, seconds)
+
+    def __enter__(self) -> "_Span":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.finish()
+
+
+class _NullSpan:
+    """計測が無効な場合に返す何もしないスパン"""
+
+    __slots__ = ()
+
+    def finish(self) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str) -> _Span | _NullSpan:
+    """
+    処理時間を計測するスパンを開始する。
+
+    使い方:
+        with span("execute_query"):
+            ...
+
+    with 文を使えない区間 (async with の入口など) は戻り値の finish() を
+    明示的に呼び出す。
+    """
+    recorder = _current_recorder.get()
+    if recorder is None and not _listeners:
+        return _NULL_SPAN
+    return _Span(name, recorder)
+
+
+def record_span(name: str, seconds: float) -> None:
+    """計測済みの経過時間をスパンとして記録する (記録開始前の処理向け)"""
+    recorder = _current_recorder.get()
+    if recorder is not None:
+        recorder.record(name, seconds)
+    _notify_listeners(name, seconds)
+
+
+def timing_enabled() -> bool:
+    """環境変数で計測が有効化されているかを返す"""
+    return os.environ.get(TIMING_ENV_VAR, "").lower() in ("1", "true", "yes", "on")
+
+
+@contextmanager
+def recording(
+    name: str, enabled: Optional[bool] = None
+) -> Iterator[Optional[TimingRecorder]]:
+    """
+    現在のコンテキスト (非同期タスク) でスパンの記録を開始する。
+
+    終了時に内訳をログへ出力する。enabled が False の場合は None を返し、
+    何も記録しない。None の場合は環境変数 ES_QUEST_TIMING に従う。
+    """
+    if enabled is None:
+        enabled = timing_enabled()
+    if not enabled:
+        yield None
+        return
+    recorder = TimingRecorder(name)
+    token = _current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_recorder.reset(token)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "timing: %s",
+                recorder.format(),
+                extra={
+                    "timings_ms": recorder.breakdown(),
+                    "total_ms": recorder.total_seconds * 1000,
+                },
+            )
+
+
+def current_recorder() -> Optional[TimingRecorder]:
+    """現在のコンテキストで記録中の TimingRecorder を返す"""
+    return _current_recorder.get()
+
+
+def add_span_listener(listener: SpanListener) -> None:
+    """すべてのスパン終了時に呼び出されるリスナーを登録する"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_span_listener(listener: SpanListener) -> None:
+    """登録済みのリスナーを解除する"""
+    if listener in _listeners:
+        _listeners.remove(listener)
@@ -107,6 +107,13 @@ class QuestView:
         url = f"https://platform.openai.com/traces/trace?trace_id={trace_id}"
         await self.display_info(f"Trace URL: {url}")
 
+    async def display_timings(self, recorder):
+        """処理時間の内訳を表示する (recorder は TimingRecorder)"""
+        await self.custom_echo("## 処理時間")
+        lines = [f"- {name}: {ms:.1f} ms" for name, ms in recorder.breakdown()]
+        lines.append(f"- 合計: {recorder.total_seconds * 1000:.1f} ms")
+        await self.custom_echo("\n".join(lines))
+
     async def display_clear_message(self):
         """クエストクリアメッセージを表示する"""
         await self.custom_echo("🎉 クエストクリア！おめでとうございます！ 🎉")
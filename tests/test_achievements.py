@@ -0,0 +1,228 @@
+# tests/test_achievements.py
+import asyncio
+import sqlite3
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from src.db.achievements import (
+    AchievementEngine,
+    AchievementRule,
+    AttemptEvent,
+    QuestClearCountRule,
+    StreakRule,
+    default_rules,
+    get_achievement_engine,
+    main,
+    quest_group_rules,
+    rebuild_achievements,
+)
+from src.db.attempt_store import DEFAULT_BOOK, AttemptStore
+from src.db.quest_repository import QuestRepository
+from src.services.quest_service import QuestService
+
+
+def _event(quest, is_correct, attempt_number=1, user_id="alice", book=DEFAULT_BOOK):
+    return AttemptEvent.from_result(
+        user_id, quest, attempt_number, is_correct, book=book
+    )
+
+
+class _CountingRule(AchievementRule):
+    """update が呼ばれた回数を数えるルール"""
+
+    def __init__(self, achievement_id, conditions):
+        self.achievement_id = achievement_id
+        self.title = achievement_id
+        self.description = achievement_id
+        self.conditions = conditions
+        self.calls = 0
+
+    def update(self, state, event):
+        self.calls += 1
+        return state + 1
+
+    def is_achieved(self, state):
+        return False
+
+
+def test_only_rules_affected_by_the_event_are_evaluated(quest_repository):
+    quest = quest_repository.get_quest_by_id(1)
+    on_quest_1 = _CountingRule(
+        "q1", {"quest_id": frozenset([1]), "is_correct": frozenset([True])}
+    )
+    on_quest_2 = _CountingRule("q2", {"quest_id": frozenset([2])})
+    on_failure = _CountingRule("ng", {"is_correct": frozenset([False])})
+    engine = AchievementEngine([on_quest_1, on_quest_2, on_failure])
+
+    engine.process(_event(quest, True))
+    engine.process(_event(quest, False))
+    assert (on_quest_1.calls, on_quest_2.calls, on_failure.calls) == (1, 0, 1)
+    assert on_quest_1 in engine._candidates(_event(quest, False))
+    assert on_quest_2 not in engine._candidates(_event(quest, True))
+
+
+def test_unlocks_are_reported_once(quest_repository):
+    quests = [quest_repository.get_quest_by_id(i) for i in (1, 2, 9, 14)]
+    engine = AchievementEngine(
+        [QuestClearCountRule("clear_2", "2個", 2), StreakRule("streak_3", "3連続", 3)]
+        + quest_group_rules(quests)
+    )
+    unlocked = [
+        [u.achievement_id for u in engine.process(_event(quest, is_correct))]
+        for quest, is_correct in [
+            (quests[0], True),
+            (quests[0], True),
+            (quests[1], False),
+            (quests[1], True),
+            (quests[2], True),
+            (quests[3], True),
+        ]
+    ]
+    group_id = quest_group_rules(quests)[0].achievement_id
+    assert unlocked == [[], [], [], ["clear_2"], [], ["streak_3", group_id]]
+    assert engine.unlocked("alice") == sorted(["clear_2", "streak_3", group_id])
+    assert engine.state("alice", "clear_2") == [["default", 1], ["default", 2]]
+
+
+def test_streak_counts_only_first_time_correct_answers(quest_repository):
+    quests = [quest_repository.get_quest_by_id(i) for i in (1, 2)]
+    engine = AchievementEngine([StreakRule("streak_3", "3連続", 3)])
+    # 正解済みのクエストに同じ答えを貼り付けても連続にはならない
+    for attempt_number in range(1, 6):
+        assert engine.process(_event(quests[0], True, attempt_number)) == []
+    assert engine.state("alice", "streak_3") == {
+        "streak": 1,
+        "solved": [["default", 1]],
+    }
+
+    # 不正解で途切れ、正解済みのクエストは数え直さない
+    engine.process(_event(quests[1], False))
+    engine.process(_event(quests[0], True, 6))
+    engine.process(_event(quests[1], True, 2))
+    assert engine.state("alice", "streak_3") == {
+        "streak": 1,
+        "solved": [["default", 1], ["default", 2]],
+    }
+
+
+def test_same_quest_id_in_other_books_is_another_quest(quest_repository):
+    quest = quest_repository.get_quest_by_id(1)
+    rules = [
+        QuestClearCountRule("clear_2", "2個", 2),
+        StreakRule("streak_2", "2連続", 2),
+    ]
+    engine = AchievementEngine(rules + quest_group_rules([quest]))
+    assert engine.process(_event(quest, True, book="part2")) == []
+    unlocked = sorted(u.achievement_id for u in engine.process(_event(quest, True)))
+    # クエスト群のルールは既定のブックの正解だけで獲得する
+    group_id = quest_group_rules([quest])[0].achievement_id
+    assert unlocked == sorted(["clear_2", "streak_2", group_id])
+    assert quest_group_rules([quest], "part2")[0].achievement_id not in unlocked
+
+
+def test_states_saved_with_quest_ids_only_are_read_as_default_book(quest_repository):
+    quests = [quest_repository.get_quest_by_id(i) for i in (1, 2)]
+    engine = AchievementEngine([StreakRule("streak_3", "3連続", 3)])
+    engine._states[("alice", "streak_3")] = {"streak": 1, "solved": [1]}
+    engine.process(_event(quests[0], True, 2))
+    assert engine.state("alice", "streak_3")["streak"] == 1
+    engine.process(_event(quests[1], True))
+    assert engine.state("alice", "streak_3") == {
+        "streak": 2,
+        "solved": [["default", 1], ["default", 2]],
+    }
+
+
+def test_state_is_persisted_and_rebuilt_from_attempts(tmp_path, quest_repository):
+    db_path = tmp_path / "attempts.db"
+    quest = quest_repository.get_quest_by_id(17)
+    store = AttemptStore(db_path)
+    engine = get_achievement_engine(store, quest_repository)
+    for is_correct in (False, True):
+        store.record("alice", quest.quest_id, is_correct, "q")
+        engine.process(
+            _event(quest, is_correct, store.attempt_count("alice", quest.quest_id))
+        )
+    store.close()
+
+    reloaded = AchievementEngine(default_rules())
+    with sqlite3.connect(db_path) as conn:
+        reloaded.load(conn)
+    assert reloaded.unlocked("alice") == ["first_clear", "ranking_master"]
+    assert reloaded.state("alice", "streak_5") == {
+        "streak": 1,
+        "solved": [["default", 17]],
+    }
+
+    # 記録から再構築しても同じ状態になる
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DELETE FROM user_achievements")
+    stats = rebuild_achievements(db_path, {"default": quest_repository})
+    assert stats == {"replayed": 2, "skipped": 0, "unlocked": 2}
+    rebuilt = AchievementEngine(default_rules())
+    with sqlite3.connect(db_path) as conn:
+        rebuilt.load(conn)
+    assert rebuilt.unlocked("alice") == ["first_clear", "ranking_master"]
+
+
+def test_rebuild_command(tmp_path, quest_repository):
+    db_path = tmp_path / "attempts.db"
+    store = AttemptStore(db_path)
+    store.record("alice", 1, True, "q")
+    store.record("alice", 999, True, "q")
+    store.close()
+    result = CliRunner().invoke(
+        main, ["--db", str(db_path), "--book", "fixtures/books/default.json"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "replayed 1 attempts (skipped 1), 1 achievements unlocked" in result.output
+
+
+def test_rebuild_replays_every_book_and_keeps_other_rules(tmp_path, quest_repository):
+    db_path = tmp_path / "attempts.db"
+    store = AttemptStore(db_path)
+    store.record("alice", 1, True, "q")
+    store.record("alice", 1, True, "q", book="part2")
+    store.record("alice", 1, True, "q", book="unknown")
+    store.close()
+    with sqlite3.connect(db_path) as conn:
+        AchievementEngine().dump(conn)
+        conn.execute(
+            "INSERT INTO user_achievements VALUES ('alice', 'retired_badge', 0)"
+        )
+    part2 = QuestRepository(Path(__file__).parent.parent / "fixtures/books/part2.json")
+    stats = rebuild_achievements(db_path, {"default": quest_repository, "part2": part2})
+    assert (stats["replayed"], stats["skipped"]) == (2, 1)
+    engine = AchievementEngine(default_rules())
+    with sqlite3.connect(db_path) as conn:
+        engine.load(conn)
+    # 再構築するルールの記録だけを置き換える
+    assert "retired_badge" in engine.unlocked("alice")
+    assert engine.state("alice", "clear_10") == [["default", 1], ["part2", 1]]
+
+
+class _ThreeHitsEsClient:
+    def search(self, index, body):
+        hits = [{"_id": str(i), "_source": {}} for i in range(3)]
+        return {"took": 1, "hits": {"total": {"value": 3}, "hits": hits}}
+
+
+def test_quest_service_reports_unlocked_achievements(tmp_path, quest_repository):
+    store = AttemptStore(tmp_path / "attempts.db")
+    service = QuestService(
+        quest_repository,
+        _ThreeHitsEsClient(),
+        "books",
+        attempt_store=store,
+        user_id="alice",
+        achievement_engine=AchievementEngine(default_rules()),
+    )
+    quest = quest_repository.get_quest_by_id(1)
+    try:
+        _, _, feedback, _ = asyncio.run(
+            service.execute_and_evaluate(quest, '{"query": {"match_all": {}}}')
+        )
+    finally:
+        store.close()
+    assert "アチーブメント獲得: はじめの一歩" in feedback
@@ -0,0 +1,155 @@
+# tests/test_attempt_store.py
+import asyncio
+import sqlite3
+
+from src.db.attempt_store import AttemptStore
+from src.services.quest_service import QuestService
+
+
+def _rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(
+            "SELECT user_id, quest_id, attempt_number, is_correct, query "
+            "FROM attempts ORDER BY attempt_id"
+        ).fetchall()
+
+
+def test_record_counts_per_user_and_quest(tmp_path):
+    store = AttemptStore(tmp_path / "attempts.db")
+    try:
+        assert store.record("alice", 1, False, "q1") == 1
+        assert store.record("alice", 1, True, "q2") == 2
+        assert store.record("alice", 2, False, "q3") == 1
+        assert store.record("bob", 1, False, "q4") == 1
+        assert store.attempt_count("alice", 1) == 2
+        assert store.attempt_count("carol", 1) == 0
+        store.flush()
+        assert _rows(tmp_path / "attempts.db") == [
+            ("alice", 1, 1, 0, "q1"),
+            ("alice", 1, 2, 1, "q2"),
+            ("alice", 2, 1, 0, "q3"),
+            ("bob", 1, 1, 0, "q4"),
+        ]
+    finally:
+        store.close()
+
+
+def test_batches_are_written_and_counts_survive_restart(tmp_path):
+    """バッチサイズを超える記録も書き込まれ、再起動後も試行回数が引き継がれる"""
+    db_path = tmp_path / "attempts.db"
+    store = AttemptStore(db_path, batch_size=7, flush_interval_seconds=60)
+    for i in range(50):
+        store.record("alice", 1 + i % 2, False, f"q{i}")
+    # close は残りを書き込んでから終了する (flush_interval を待たない)
+    store.close()
+    assert len(_rows(db_path)) == 50
+
+    reopened = AttemptStore(db_path)
+    try:
+        assert reopened.attempt_count("alice", 1) == 25
+        assert reopened.record("alice", 2, True, "q") == 26
+    finally:
+        reopened.close()
+
+
+def test_attempts_are_counted_per_book(tmp_path):
+    """ブックごとにクエストIDが重なるため、別のブックの提出は数えない"""
+    db_path = tmp_path / "attempts.db"
+    store = AttemptStore(db_path)
+    try:
+        assert store.record("alice", 1, False, "q1", book="part2") == 1
+        assert store.attempt_count("alice", 1) == 0
+        assert store.record("alice", 1, False, "q2") == 1
+        assert store.attempt_count("alice", 1, "part2") == 1
+    finally:
+        store.close()
+    reopened = AttemptStore(db_path)
+    try:
+        assert reopened.attempt_count("alice", 1, "part2") == 1
+        assert reopened.attempt_count("alice", 1, "default") == 1
+    finally:
+        reopened.close()
+
+
+def test_attempts_without_book_are_migrated_to_default_book(tmp_path):
+    db_path = tmp_path / "attempts.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(
+            """
+            CREATE TABLE attempts (
+                attempt_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                quest_id INTEGER NOT NULL,
+                attempt_number INTEGER NOT NULL,
+                is_correct INTEGER NOT NULL,
+                query TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            INSERT INTO attempts
+                (user_id, quest_id, attempt_number, is_correct, query, created_at)
+                VALUES ('alice', 1, 1, 0, 'q', 0);
+            """
+        )
+    conn.close()
+    store = AttemptStore(db_path)
+    try:
+        assert store.attempt_count("alice", 1) == 1
+        assert store.attempt_count("alice", 1, "part2") == 0
+        assert store.record("alice", 1, True, "q2") == 2
+        store.flush()
+        with sqlite3.connect(db_path) as conn:
+            assert conn.execute(
+                "SELECT attempt_id, book FROM attempts ORDER BY attempt_id"
+            ).fetchall() == [(1, "default"), (2, "default")]
+        conn.close()
+    finally:
+        store.close()
+
+
+def test_record_after_close_is_counted_but_not_persisted(tmp_path):
+    store = AttemptStore(tmp_path / "attempts.db")
+    store.close()
+    assert store.record("alice", 1, False, "q") == 1
+    assert _rows(tmp_path / "attempts.db") == []
+
+
+class _NoHitsEsClient:
+    def search(self, index, body):
+        return {"took": 1, "hits": {"total": {"value": 0}, "hits": []}}
+
+
+def test_hints_progress_with_attempts(tmp_path, quest_repository):
+    """不正解を繰り返すとヒントが進み、ユーザーごとに独立して数えられる"""
+    store = AttemptStore(tmp_path / "attempts.db")
+    quest = quest_repository.get_quest_by_id(1)
+    query = '{"query": {"match_all": {}}}'
+
+    async def submit(user_id):
+        service = QuestService(
+            quest_repository,
+            _NoHitsEsClient(),
+            "books",
+            attempt_store=store,
+            user_id=user_id,
+        )
+        _, _, feedback, _ = await service.execute_and_evaluate(quest, query)
+        return feedback
+
+    async def scenario():
+        return [
+            await submit("alice"),
+            await submit("alice"),
+            await submit("alice"),
+            await submit("bob"),
+        ]
+
+    try:
+        feedbacks = asyncio.run(scenario())
+        store.flush()
+    finally:
+        store.close()
+    assert "ヒント 1" in feedbacks[0]
+    assert "ヒント 2" in feedbacks[1]
+    assert "これが最後のヒントです" in feedbacks[2]
+    assert "ヒント 1" in feedbacks[3]
+    assert len(_rows(tmp_path / "attempts.db")) == 4
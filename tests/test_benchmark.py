@@ -0,0 +1,548 @@
+# tests/test_benchmark.py
+"""
+採点パイプラインのベンチマーク。
+
+Elasticsearch には接続せず、記録済みレスポンス (fixtures/tests/recorded_responses.json)
+を ReplayEsClient で再生して計測する。ベンチマーク本体は benchmark マーカー付きで、
+通常のテストでは実行されない (`make bench` で実行する)。
+
+    ES_QUEST_BENCHMARK_UPDATE=1: 計測結果でベースラインを更新する
+    ES_QUEST_BENCHMARK_TOLERANCE: 劣化とみなす倍率 (デフォルト: 2.0)
+"""
+
+import asyncio
+import importlib.util
+import json
+import os
+import shutil
+import ssl
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+from src.db.attempt_store import AttemptStore, find_attempt_store
+from src.db.book_repository import BookRepository
+from src.db.quest_repository import QuestRepository
+from src.es.replay import RecordedResponseStore, ReplayEsClient, request_key
+from src.evaluators.factory import get_evaluator
+from src.models.quest import Quest
+from src.services.core_logic import evaluate_result
+from src.services.quest_service import QuestService
+from src.services.recommender import Recommender
+from src.utils.benchmark import (
+    BenchmarkResult,
+    find_regressions,
+    load_baseline,
+    percentile,
+    run_async_benchmark,
+    run_benchmark,
+    save_baseline,
+)
+
+PROJECT_ROOT = Path(__file__).parent.parent
+BOOK_FILE = PROJECT_ROOT / "fixtures" / "books" / "default.json"
+RECORDED_FILE = PROJECT_ROOT / "fixtures" / "tests" / "recorded_responses.json"
+BASELINE_FILE = PROJECT_ROOT / "fixtures" / "tests" / "benchmark_baseline.json"
+MCP_SERVER_DIR = PROJECT_ROOT / "mcp" / "elasticsearch-mcp-server"
+INDEX_NAME = "sample_books"
+
+
+@pytest.fixture(scope="module")
+def recorded_store() -> RecordedResponseStore:
+    return RecordedResponseStore.load(RECORDED_FILE)
+
+
+@pytest.fixture(scope="module")
+def book_quests():
+    return {quest.quest_id: quest for quest in BookRepository(BOOK_FILE).load_quests()}
+
+
+# --- ハーネスと再生クライアントの単体テスト (常に実行) ---
+
+
+def test_percentile_interpolates():
+    """パーセンタイルは線形補間で求める"""
+    values = [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert percentile(values, 0.5) == 3.0
+    assert percentile(values, 0.95) == pytest.approx(4.8)
+    assert percentile([], 0.5) == 0.0
+
+
+def test_run_benchmark_reports_iterations():
+    """指定回数だけ計測し、パーセンタイルは単調になる"""
+    result = run_benchmark("noop", lambda: None, iterations=50, warmup=1)
+    assert result.iterations == 50
+    assert result.p50_ms <= result.p95_ms <= result.p99_ms
+    assert "noop" in result.format()
+
+
+def _result(name: str, p95_ms: float, alloc_kib_per_op: float) -> BenchmarkResult:
+    return BenchmarkResult(
+        name=name,
+        iterations=1,
+        total_seconds=1.0,
+        ops_per_second=1.0,
+        p50_ms=p95_ms,
+        p95_ms=p95_ms,
+        p99_ms=p95_ms,
+        peak_alloc_kib=alloc_kib_per_op,
+        alloc_kib_per_op=alloc_kib_per_op,
+    )
+
+
+def test_find_regressions():
+    """ベースラインより tolerance 倍以上悪化した結果だけを報告する"""
+    baseline = {
+        "fast": {"p95_ms": 1.0, "alloc_kib_per_op": 10.0},
+        "tiny_alloc": {"p95_ms": 1.0, "alloc_kib_per_op": 0.1},
+    }
+    results = [
+        _result("fast", p95_ms=3.0, alloc_kib_per_op=30.0),
+        _result("tiny_alloc", p95_ms=1.5, alloc_kib_per_op=5.0),
+        _result("new", p95_ms=100.0, alloc_kib_per_op=100.0),
+    ]
+    regressions = find_regressions(results, baseline, tolerance=2.0)
+    assert len(regressions) == 2
+    assert all(r.startswith("fast:") for r in regressions)
+
+
+def test_find_regressions_ignores_sub_millisecond_jitter():
+    """倍率を超えても、ベースラインとの差が下限以下なら劣化とみなさない"""
+    baseline = {"tiny": {"p95_ms": 0.177, "alloc_kib_per_op": 1.5}}
+    jitter = [_result("tiny", p95_ms=0.38, alloc_kib_per_op=4.0)]
+    assert find_regressions(jitter, baseline, tolerance=2.0) == []
+    slow = [_result("tiny", p95_ms=1.3, alloc_kib_per_op=6.0)]
+    assert len(find_regressions(slow, baseline, tolerance=2.0)) == 2
+
+
+def test_replay_client_returns_recorded_response(recorded_store, book_quests):
+    """正解例のクエリは記録済みレスポンスで再生され、profile の有無は無視する"""
+    client = ReplayEsClient(recorded_store)
+    body = json.loads(book_quests[17].correct_query)
+    response = client.search(index=INDEX_NAME, body=body)
+    assert [hit["_id"] for hit in response["hits"]["hits"]] == ["10", "11", "18"]
+
+    # 評価側での書き換えは記録に影響しない
+    response["hits"]["hits"].clear()
+    profiled = client.search(index=INDEX_NAME, body={**body, "profile": True})
+    assert len(profiled["hits"]["hits"]) == 3
+    assert client.search_count == 2
+
+
+def test_replay_client_strict_mode(recorded_store):
+    """strict モードでは未記録のクエリは LookupError、非 strict では 0 件"""
+    body = {"query": {"term": {"author": "not-recorded"}}}
+    with pytest.raises(LookupError):
+        ReplayEsClient(recorded_store).search(index=INDEX_NAME, body=body)
+    response = ReplayEsClient(recorded_store, strict=False).search(
+        index=INDEX_NAME, body=body
+    )
+    assert response["hits"]["total"]["value"] == 0
+
+
+def test_recorded_responses_cover_book(recorded_store, book_quests):
+    """記録ファイルはブックの全正解例を網羅し、正解として評価される"""
+    for quest in book_quests.values():
+        body = json.loads(quest.correct_query)
+        assert request_key(INDEX_NAME, body) in recorded_store.searches
+        response = ReplayEsClient(recorded_store).search(index=INDEX_NAME, body=body)
+        is_correct, message = evaluate_result(quest, response)
+        assert is_correct, f"quest {quest.quest_id}: {message}"
+
+
+# --- ベンチマーク (make bench で実行) ---
+
+_collected: List[BenchmarkResult] = []
+
+
+@pytest.fixture(scope="module")
+def check_baseline():
+    """
+    計測結果をベースラインと比較する関数を返す。
+
+    ES_QUEST_BENCHMARK_UPDATE が真値の場合は比較せず、モジュール終了時に
+    ベースラインを更新する。
+    """
+    update = os.environ.get("ES_QUEST_BENCHMARK_UPDATE", "") in ("1", "true", "yes")
+    tolerance = float(os.environ.get("ES_QUEST_BENCHMARK_TOLERANCE", "2.0"))
+    baseline = load_baseline(BASELINE_FILE)
+
+    def check(result: BenchmarkResult) -> None:
+        print(f"\n{result.format()}")
+        _collected.append(result)
+        if update:
+            return
+        regressions = find_regressions([result], baseline, tolerance)
+        assert not regressions, "\n".join(regressions)
+
+    yield check
+
+    if update and _collected:
+        merged: Dict[str, BenchmarkResult] = {r.name: r for r in _collected}
+        save_baseline(BASELINE_FILE, sorted(merged.values(), key=lambda r: r.name))
+
+
+@pytest.mark.benchmark
+def test_bench_book_load(check_baseline):
+    """ブックファイルの読み込みとクエストのパース"""
+    repo = BookRepository(BOOK_FILE)
+    check_baseline(run_benchmark("book.load_quests", repo.load_quests, iterations=50))
+
+
+@pytest.mark.benchmark
+def test_bench_quest_lookup(check_baseline):
+    """ID によるクエストの検索 (末尾のクエストで最悪ケースを計測)"""
+    repo = QuestRepository(BOOK_FILE)
+    last_id = repo.quests[-1].quest_id
+    check_baseline(
+        run_benchmark(
+            "quest_repository.get_quest_by_id",
+            lambda: repo.get_quest_by_id(last_id),
+            iterations=2000,
+        )
+    )
+
+
+def _evaluator_cases(book_quests, recorded_store):
+    """評価タイプごとの (名前, 評価タイプ, 評価データ, レスポンス) を返す"""
+    client = ReplayEsClient(recorded_store)
+    count_quest = book_quests[1]
+    order_quest = book_quests[17]
+    count_response = client.search(
+        index=INDEX_NAME, body=json.loads(count_quest.correct_query)
+    )
+    order_response = client.search(
+        index=INDEX_NAME, body=json.loads(order_quest.correct_query)
+    )
+    agg_response = {
+        **count_response,
+        "aggregations": {"avg_pages": {"value": 321.5}},
+    }
+    profiled_response = {
+        **count_response,
+        "profile": {
+            "shards": [
+                {
+                    "searches": [
+                        {
+                            "query": [
+                                {
+                                    "type": "BooleanQuery",
+                                    "description": "+author:本橋 #pages:[300 TO *]",
+                                    "time_in_nanos": 120_000,
+                                    "children": [
+                                        {
+                                            "type": "TermQuery",
+                                            "description": "author:本橋",
+                                            "time_in_nanos": 80_000,
+                                        },
+                                        {
+                                            "type": "IndexOrDocValuesQuery",
+                                            "description": "pages:[300 TO *]",
+                                            "time_in_nanos": 30_000,
+                                        },
+                                    ],
+                                }
+                            ]
+                        }
+                    ]
+                }
+            ]
+        },
+    }
+    return [
+        ("result_count", "result_count", count_quest.evaluation_data, count_response),
+        (
+            "doc_ids_in_order",
+            "doc_ids_in_order",
+            order_quest.evaluation_data,
+            order_response,
+        ),
+        ("doc_ids_include", "doc_ids_include", ["18", "10"], order_response),
+        (
+            "aggregation_result",
+            "aggregation_result",
+            {"agg_name": "avg_pages", "expected_value": 321.5},
+            agg_response,
+        ),
+        (
+            "query_performance",
+            "query_performance",
+            {"max_took_ms": 100, "max_scoring_filter_clauses": 0},
+            profiled_response,
+        ),
+        (
+            "composite",
+            "composite",
+            {
+                "criteria": [
+                    {
+                        "evaluation_type": "doc_ids_in_order",
+                        "evaluation_data": order_quest.evaluation_data,
+                    },
+                    {"evaluation_type": "result_count", "evaluation_data": 3},
+                ]
+            },
+            order_response,
+        ),
+    ]
+
+
+@pytest.mark.benchmark
+def test_bench_evaluators(check_baseline, book_quests, recorded_store):
+    """評価タイプごとの評価器の生成と評価"""
+    for name, evaluation_type, evaluation_data, response in _evaluator_cases(
+        book_quests, recorded_store
+    ):
+
+        def evaluate(evaluation_type=evaluation_type, data=evaluation_data):
+            return get_evaluator(evaluation_type, data).evaluate(response)
+
+        assert evaluate()[0], name
+        check_baseline(run_benchmark(f"evaluator.{name}", evaluate, iterations=2000))
+
+
+@pytest.mark.benchmark
+def test_bench_execute_and_evaluate(check_baseline, book_quests, recorded_store):
+    """QuestService によるクエリ実行・評価・フィードバック生成 (ES は再生)"""
+    repo = QuestRepository(BOOK_FILE)
+    service = QuestService(repo, ReplayEsClient(recorded_store), INDEX_NAME)
+    for quest_id in (1, 17):
+        quest = book_quests[quest_id]
+
+        async def submit(quest=quest):
+            return await service.execute_and_evaluate(quest, quest.correct_query)
+
+        assert asyncio.run(submit())[0]
+        check_baseline(
+            run_async_benchmark(
+                f"quest_service.execute_and_evaluate.q{quest_id}",
+                submit,
+                iterations=500,
+            )
+        )
+
+
+@pytest.mark.benchmark
+def test_bench_ui_callbacks(
+    check_baseline, monkeypatch, tmp_path, book_quests, recorded_store
+):
+    """Gradio のコールバック (ES は再生、LLMエージェントは固定応答)"""
+    pytest.importorskip("gradio")
+    import src.bootstrap
+    from src import ui_actions
+    from src.services.agent_service import AgentService
+
+    monkeypatch.setattr(
+        src.bootstrap, "get_es_client", lambda config: ReplayEsClient(recorded_store)
+    )
+    monkeypatch.setenv("ES_INDEX_NAME", INDEX_NAME)
+    monkeypatch.setenv("DB_PATH", str(tmp_path / "attempts.db"))
+
+    def flush_attempts():
+        # 書き込み待ちの記録は書き込み後に解放されるため、flush してから計測する
+        store = find_attempt_store(tmp_path / "attempts.db")
+        if store is not None:
+            store.flush()
+
+    async def fake_agent(self, quest, user_query_str, rule_eval_message):
+        return "固定のフィードバック"
+
+    monkeypatch.setattr(AgentService, "run_evaluation_agent", fake_agent)
+
+    quest = book_quests[17]
+    book_path = str(BOOK_FILE)
+
+    async def load_quest():
+        return await ui_actions.load_quest(quest.quest_id, book_path)
+
+    async def drain(generator):
+        async for _ in generator:
+            pass
+
+    async def test_run_query():
+        await drain(ui_actions.test_run_query(quest.correct_query, []))
+
+    async def submit_answer():
+        await drain(
+            ui_actions.submit_answer(quest.quest_id, quest.correct_query, [], book_path)
+        )
+
+    for name, func in (
+        ("load_quest", load_quest),
+        ("test_run_query", test_run_query),
+        ("submit_answer", submit_answer),
+    ):
+        check_baseline(
+            run_async_benchmark(
+                f"ui.{name}", func, iterations=100, settle=flush_attempts
+            )
+        )
+
+
+class _SyntheticCatalog:
+    """大きなカタログを模したリポジトリ (スキルと難易度を周期的に割り当てる)"""
+
+    HINTS = ["match", "term", "bool, term", "range", "knn, filter", "bool, match"]
+    loadmap: List[dict] = []
+
+    def __init__(self, size: int):
+        self._quests = [
+            Quest(
+                quest_id=i,
+                title=f"quest {i}",
+                description="",
+                difficulty=i % 5 + 1,
+                query_type_hint=self.HINTS[i % len(self.HINTS)],
+                correct_query=None,
+                evaluation_type="result_count",
+                evaluation_data_raw="1",
+                hints_raw=None,
+                created_at="",
+                updated_at="",
+            )
+            for i in range(1, size + 1)
+        ]
+
+    def get_all_quests(self):
+        return self._quests
+
+
+@pytest.mark.benchmark
+def test_bench_recommender(check_baseline, tmp_path):
+    """2万件のカタログで 500 件正解済みのユーザーへのおすすめ"""
+    store = AttemptStore(tmp_path / "attempts.db")
+    try:
+        for quest_id in range(1, 501):
+            store.record("alice", quest_id, True, "{}")
+        recommender = Recommender(store, _SyntheticCatalog(20000))
+        recommender.recommend("alice")
+        check_baseline(
+            run_benchmark(
+                "recommender.recommend",
+                lambda: recommender.recommend("alice"),
+                iterations=1000,
+            )
+        )
+        recommender.close()
+    finally:
+        store.close()
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive を有効にする
+    # ヘッダーと本文を別々に送るため、Nagle と遅延 ACK で待たされないようにする
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'{"cluster_name": "stand-in"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.requests += 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _TlsStandIn(ThreadingHTTPServer):
+    """TLS のハンドシェイクの回数を数えるローカルの HTTPS サーバー"""
+
+    daemon_threads = True
+
+    def __init__(self, context: ssl.SSLContext):
+        super().__init__(("127.0.0.1", 0), _JsonHandler)
+        self.context = context
+        self.handshakes = 0
+        self.requests = 0
+
+    def get_request(self):
+        sock, address = self.socket.accept()
+        # wrap_socket がハンドシェイクを行う
+        tls_sock = self.context.wrap_socket(sock, server_side=True)
+        self.handshakes += 1
+        return tls_sock, address
+
+    def handle_error(self, request, client_address):
+        # クライアントが接続を閉じた場合など
+        pass
+
+
+@pytest.fixture
+def tls_stand_in(tmp_path):
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl が必要です")
+    cert, key = tmp_path / "cert.pem", tmp_path / "key.pem"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt"]
+        + ["ec_paramgen_curve:prime256v1", "-nodes", "-days", "1"]
+        + ["-subj", "/CN=localhost", "-keyout", str(key), "-out", str(cert)],
+        check=True,
+        capture_output=True,
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server = _TlsStandIn(context)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _load_mcp_rest_client():
+    """MCP Server の GeneralRestClient (パッケージ名 src が衝突するため直接読み込む)"""
+    path = MCP_SERVER_DIR / "src" / "clients" / "rest.py"
+    spec = importlib.util.spec_from_file_location("mcp_rest_client", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.GeneralRestClient
+
+
+@pytest.mark.benchmark
+def test_bench_rest_client_keepalive(tls_stand_in):
+    """MCP Server の REST クライアントの接続の使い回し (ローカルの TLS サーバー)"""
+    httpx = pytest.importorskip("httpx")
+    base_url = f"https://127.0.0.1:{tls_stand_in.server_address[1]}"
+
+    def per_call():
+        # 変更前の GeneralRestClient と同じく、呼び出しごとにクライアントを作る
+        with httpx.Client(verify=False) as client:
+            return client.get(f"{base_url}/").json()
+
+    rest_client = _load_mcp_rest_client()(base_url, None, None, verify_certs=False)
+
+    def pooled():
+        return rest_client.request("GET", "/")
+
+    try:
+        results = []
+        for name, func in (("per_call", per_call), ("pooled", pooled)):
+            assert func() == {"cluster_name": "stand-in"}
+            tls_stand_in.handshakes = tls_stand_in.requests = 0
+            result = run_benchmark(f"rest_client.{name}", func, iterations=100)
+            print(f"\n{result.format()} handshakes={tls_stand_in.handshakes}")
+            results.append((result, tls_stand_in.handshakes, tls_stand_in.requests))
+    finally:
+        rest_client.close()
+
+    (
+        (per_call_result, per_call_handshakes, requests),
+        (
+            pooled_result,
+            pooled_handshakes,
+            _,
+        ),
+    ) = results
+    # 呼び出しごとにハンドシェイクしていたものが、接続を使い回すと0回になる
+    assert per_call_handshakes == requests
+    assert pooled_handshakes == 0
+    assert pooled_result.p50_ms < per_call_result.p50_ms
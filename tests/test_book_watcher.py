@@ -0,0 +1,176 @@
+# tests/test_book_watcher.py
+import asyncio
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from src.db.book_watcher import (
+    BookWatcher,
+    RepositoryRegistry,
+    changed_quest_ids,
+    load_snapshot,
+)
+from src.db.compiled_book import compile_book_file
+from src.services import core_logic
+
+BOOK_PATH = Path(__file__).parent.parent / "fixtures" / "books" / "default.json"
+
+
+def _write_book(path: Path, book: dict) -> None:
+    """ブックを書き換え、更新日時を確実に進める"""
+    mtime = path.stat().st_mtime_ns if path.exists() else 0
+    path.write_text(json.dumps(book, ensure_ascii=False), encoding="utf-8")
+    os.utime(path, ns=(mtime + 10**9, mtime + 10**9))
+
+
+@pytest.fixture
+def book_file(tmp_path):
+    path = tmp_path / "book.json"
+    shutil.copy(BOOK_PATH, path)
+    return path
+
+
+@pytest.fixture
+def book():
+    with BOOK_PATH.open(encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_changed_quest_ids():
+    old = {1: "a", 2: "b", 3: "c"}
+    new = {1: "a", 2: "B", 4: "d"}
+    assert changed_quest_ids(old, new) == {2, 3, 4}
+
+
+def test_reload_swaps_snapshot_and_keeps_old_repository(book_file, book):
+    """変更後は新しいリポジトリに差し替わり、取得済みのリポジトリは変わらない"""
+    registry = RepositoryRegistry()
+    notified = []
+    registry.add_reload_listener(lambda snapshot, changed: notified.append(changed))
+
+    async def scenario():
+        old_repo = await registry.get(book_file)
+        assert await registry.get(book_file) is old_repo
+        assert not await registry.reload_if_changed(book_file)
+
+        book["quests"][1]["title"] = "変更後のタイトル"
+        _write_book(book_file, book)
+        assert await registry.reload_if_changed(book_file)
+        return old_repo, await registry.get(book_file)
+
+    old_repo, new_repo = asyncio.run(scenario())
+    assert new_repo is not old_repo
+    assert old_repo.get_quest_by_id(2).title != "変更後のタイトル"
+    assert new_repo.get_quest_by_id(2).title == "変更後のタイトル"
+    assert registry.snapshot(book_file).version == 2
+    assert notified == [{2}]
+
+
+def test_invalid_book_keeps_previous_snapshot(book_file, book):
+    """読み込みに失敗した場合は以前の内容を使い続け、同じ内容で再試行しない"""
+    registry = RepositoryRegistry()
+
+    async def scenario():
+        repo = await registry.get(book_file)
+        book["quests"][0]["evaluation_data"] = "not a number"
+        _write_book(book_file, book)
+        assert not await registry.reload_if_changed(book_file)
+        assert book_file.resolve() in registry._failed
+        assert not await registry.reload_if_changed(book_file)
+        assert await registry.get(book_file) is repo
+
+        # 修正されたら読み込まれる
+        book["quests"][0]["evaluation_data"] = "4"
+        _write_book(book_file, book)
+        assert await registry.reload_if_changed(book_file)
+        return await registry.get(book_file)
+
+    repo = asyncio.run(scenario())
+    assert repo.get_quest_by_id(1).evaluation_data == 4
+
+
+def test_duplicate_quest_ids_are_rejected(book_file, book):
+    registry = RepositoryRegistry()
+
+    async def scenario():
+        await registry.get(book_file)
+        book["quests"].append(dict(book["quests"][0]))
+        _write_book(book_file, book)
+        return await registry.reload_if_changed(book_file)
+
+    assert not asyncio.run(scenario())
+    assert registry.snapshot(book_file).version == 1
+
+
+def test_compiled_book_reload(tmp_path, book):
+    """コンパイル済みブックも差し替えられ、古いリポジトリは読み続けられる"""
+    json_path = tmp_path / "book.json"
+    _write_book(json_path, book)
+    eqb_path = compile_book_file(json_path)
+    registry = RepositoryRegistry()
+
+    async def scenario():
+        old_repo = await registry.get(eqb_path)
+        book["quests"][2]["title"] = "コンパイル後に変更"
+        _write_book(json_path, book)
+        compile_book_file(json_path, eqb_path)
+        mtime = eqb_path.stat().st_mtime_ns + 10**9
+        os.utime(eqb_path, ns=(mtime, mtime))
+        assert await registry.reload_if_changed(eqb_path)
+        return old_repo, await registry.get(eqb_path)
+
+    old_repo, new_repo = asyncio.run(scenario())
+    assert old_repo.get_quest_by_id(3).title != "コンパイル後に変更"
+    assert new_repo.get_quest_by_id(3).title == "コンパイル後に変更"
+
+
+def test_compiled_book_snapshot_does_not_decode_quests(tmp_path, book):
+    """コンパイル済みブックはレコードのバイト列で変更を検出する"""
+    json_path = tmp_path / "book.json"
+    _write_book(json_path, book)
+    eqb_path = compile_book_file(json_path)
+    old = load_snapshot(eqb_path)
+    assert old.repository.compiled_book._decoded == {}
+    assert len(old.fingerprints) == len(book["quests"])
+
+    book["quests"][2]["title"] = "コンパイル後に変更"
+    _write_book(json_path, book)
+    compile_book_file(json_path, eqb_path)
+    new = load_snapshot(eqb_path, version=2)
+    assert changed_quest_ids(old.fingerprints, new.fingerprints) == {3}
+
+
+def test_watcher_evicts_only_changed_evaluators(book_file, book):
+    """監視タスクが変更を検出し、変更されたクエストの Evaluator だけを破棄する"""
+    registry = RepositoryRegistry()
+    registry.add_reload_listener(
+        lambda snapshot, changed: core_logic.evict_quest_evaluators(changed)
+    )
+    core_logic.clear_evaluator_cache()
+
+    async def scenario():
+        repo = await registry.get(book_file)
+        for quest_id in (1, 2):
+            core_logic.get_quest_evaluator(repo.get_quest_by_id(quest_id))
+        watcher = BookWatcher(registry, asyncio.get_running_loop(), 0.01)
+        watcher.start()
+        try:
+            book["quests"][0]["evaluation_data"] = "5"
+            _write_book(book_file, book)
+            for _ in range(200):
+                if registry.snapshot(book_file).version == 2:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            watcher.stop()
+
+    try:
+        asyncio.run(scenario())
+        cached_ids = {key[0] for key in core_logic._evaluator_cache}
+    finally:
+        core_logic.clear_evaluator_cache()
+    assert registry.snapshot(book_file).version == 2
+    assert cached_ids == {2}
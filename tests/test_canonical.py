@@ -0,0 +1,139 @@
+# tests/test_canonical.py
+import asyncio
+import json
+
+import pytest
+
+from src.cli import run_quest_flow
+from src.es import canonical
+from src.es.canonical import ParsedQuery, canonicalize, parse_query
+from src.es.replay import request_key
+from src.exceptions import InvalidQueryError
+from src.services.quest_service import QuestService
+from src.utils.query_loader import load_query_from_source
+from src.view import QuestView
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        # キーの順序
+        (
+            {"size": 5, "query": {"match_all": {}}},
+            {"query": {"match_all": {}}, "size": 5},
+        ),
+        # match / term の省略形
+        (
+            {"query": {"match": {"title": "elastic"}}},
+            {"query": {"match": {"title": {"query": "elastic"}}}},
+        ),
+        (
+            {"query": {"term": {"genre": "SF"}}},
+            {"query": {"term": {"genre": {"value": "SF"}}}},
+        ),
+        # デフォルト値
+        (
+            {"query": {"match": {"title": {"query": "a b", "operator": "OR"}}}},
+            {"query": {"match": {"title": "a b"}}},
+        ),
+        (
+            {"query": {"term": {"genre": {"value": "SF", "boost": 1}}}},
+            {"query": {"term": {"genre": "SF"}}},
+        ),
+        (
+            {"query": {"match_all": {}}, "from": 0, "size": 10},
+            {"query": {"match_all": {}}},
+        ),
+        # bool の句が1つの場合
+        (
+            {"query": {"bool": {"filter": {"term": {"genre": "SF"}}}}},
+            {"query": {"bool": {"filter": [{"term": {"genre": "SF"}}]}}},
+        ),
+    ],
+)
+def test_equivalent_queries_have_the_same_fingerprint(a, b):
+    ca, cb = canonicalize(a), canonicalize(b)
+    assert ca.canonical_json == cb.canonical_json
+    assert ca.fingerprint == cb.fingerprint
+    assert ca.fingerprint64 == cb.fingerprint64
+    assert len(ca.fingerprint) == 32 and 0 <= ca.fingerprint64 < 2**64
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        (
+            {"query": {"match": {"title": {"query": "a b", "operator": "and"}}}},
+            {"query": {"match": {"title": "a b"}}},
+        ),
+        ({"query": {"match_all": {}}, "size": 5}, {"query": {"match_all": {}}}),
+        ({"query": {"term": {"genre": "SF"}}}, {"query": {"match": {"genre": "SF"}}}),
+    ],
+)
+def test_different_queries_have_different_fingerprints(a, b):
+    assert canonicalize(a).fingerprint != canonicalize(b).fingerprint
+
+
+def test_aggregation_names_are_not_normalized():
+    query = {"size": 0, "aggs": {"term": {"terms": {"field": "genre"}}}}
+    assert canonicalize(query).normalized == {
+        "size": 0,
+        "aggs": {"term": {"terms": {"field": "genre"}}},
+    }
+
+
+def test_text_is_parsed_once():
+    text = '{"query": {"match": {"title": "elastic"}}}'
+    assert canonicalize(text) is canonicalize(text)
+    assert canonicalize(text).body == json.loads(text)
+
+
+def test_invalid_queries():
+    with pytest.raises(json.JSONDecodeError):
+        canonicalize("{")
+    with pytest.raises(ValueError):
+        canonicalize("[1, 2]")
+    with pytest.raises(InvalidQueryError):
+        load_query_from_source("[1, 2]", None)
+
+
+def test_replay_key_ignores_equivalent_forms():
+    a = {"query": {"match": {"title": "elastic"}}, "profile": True}
+    b = {"query": {"match": {"title": {"query": "elastic", "operator": "or"}}}}
+    assert request_key("books", a) == request_key("books", b)
+
+
+def test_parsed_query_is_created_once_and_passed_through():
+    text = '{"query":{"match":{"title":"検索"}}}'
+    parsed = load_query_from_source(text, None)
+    assert parsed is parse_query(text)
+    # パース済みのクエリはそのまま返す
+    assert load_query_from_source(parsed, None) is parsed
+    assert ParsedQuery.of(parsed) is parsed
+    assert parsed.text == text
+    assert parsed.pretty == json.dumps(parsed.body, indent=4, ensure_ascii=False)
+    assert parsed.canonical is parsed.canonical
+    assert canonicalize(parsed) is parsed.canonical
+
+
+def test_codecs_produce_the_same_canonical_text(monkeypatch):
+    query = {
+        "query": {"bool": {"filter": {"range": {"price": {"gte": 1.5, "lt": 1e21}}}}},
+        "_source": ["タイトル"],
+        "size": 3,
+    }
+    with_default_codec = canonicalize(query).canonical_json
+    monkeypatch.setattr(canonical, "orjson", None)
+    assert canonicalize(query).canonical_json == with_default_codec
+
+
+class _NoHitsEsClient:
+    def search(self, index, body):
+        return {"took": 1, "hits": {"total": {"value": 0}, "hits": []}}
+
+
+def test_submitted_query_is_displayed_formatted(capsys, quest_repository):
+    service = QuestService(quest_repository, _NoHitsEsClient(), "books")
+    query = '{"query":{"match_all":{}}}'
+    asyncio.run(run_quest_flow(QuestView(), service, None, 1, query, None, True))
+    assert parse_query(query).pretty in capsys.readouterr().out
@@ -0,0 +1,66 @@
+# tests/test_compiled_book.py
+import json
+from pathlib import Path
+
+import pytest
+
+from src.db.book_repository import BookRepository
+from src.db.compiled_book import CompiledBook, compile_book, compile_book_file
+from src.db.quest_repository import QuestRepository
+
+PROJECT_ROOT = Path(__file__).parent.parent
+BOOK_FILE = PROJECT_ROOT / "fixtures" / "books" / "default.json"
+
+
+@pytest.fixture
+def compiled_path(tmp_path: Path) -> Path:
+    return compile_book_file(BOOK_FILE, tmp_path / "default.eqb")
+
+
+def test_compiled_repository_matches_json(compiled_path: Path):
+    """コンパイル済みブックから JSON 版と同じクエストが取得できる"""
+    json_repo = QuestRepository(BOOK_FILE)
+    compiled_repo = QuestRepository(compiled_path)
+    for quest in json_repo.quests:
+        assert compiled_repo.get_quest_by_id(quest.quest_id) == quest
+        assert compiled_repo.get_quest_by_id(str(quest.quest_id)) == quest
+    assert compiled_repo.get_quest_by_id(999) is None
+    assert compiled_repo.get_quest_by_id("abc") is None
+    assert compiled_repo.get_all_quests() == json_repo.get_all_quests()
+
+
+def test_quests_are_decoded_lazily(compiled_path: Path):
+    """ファイルを開いただけではクエストをデコードしない"""
+    with CompiledBook(compiled_path) as book:
+        assert len(book) == 20
+        assert book._decoded == {}
+        book.get_quest(17)
+        assert list(book._decoded) == [17]
+
+
+def test_metadata_and_sample_data(compiled_path: Path):
+    """mappings などのメタデータと sample_data を取り出せる"""
+    with BOOK_FILE.open(encoding="utf-8") as f:
+        book = json.load(f)
+    compiled = BookRepository(compiled_path)
+    assert compiled.load_mappings() == book["mappings"]
+    assert list(compiled.iter_sample_data()) == book["sample_data"]
+    assert compiled.load_quests() == BookRepository(BOOK_FILE).load_quests()
+
+
+def test_invalid_files(tmp_path: Path):
+    """コンパイル済みブックでないファイルや重複 ID は ValueError"""
+    not_compiled = tmp_path / "broken.eqb"
+    not_compiled.write_bytes(b"{}" * 40)
+    with pytest.raises(ValueError):
+        CompiledBook(not_compiled)
+    empty = tmp_path / "empty.eqb"
+    empty.write_bytes(b"")
+    with pytest.raises(ValueError):
+        CompiledBook(empty)
+
+    with BOOK_FILE.open(encoding="utf-8") as f:
+        book = json.load(f)
+    book["quests"].append(book["quests"][0])
+    with pytest.raises(ValueError):
+        compile_book(book, tmp_path / "duplicated.eqb")
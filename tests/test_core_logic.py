@@ -1,14 +1,18 @@
 # tests/test_core_logic.py
 
+import json
 from typing import Any, Dict
 
 import pytest
+from elasticsearch import ConnectionTimeout
 
 from src.db.quest_repository import QuestRepository  # conftestから渡される型ヒント用
-from src.models.quest import Quest
 
 # テスト対象のモジュールとクラスをインポート
-from src.services.core_logic import evaluate_result, get_feedback
+from src.es.resilience import reset_circuit_breaker
+from src.models.quest import Quest
+from src.services.core_logic import evaluate_result, execute_query, get_feedback
+from src.utils.metrics import ES_SEARCH_SECONDS
 
 # --- テスト用ヘルパー (エッジケース Quest 生成用) ---
 
@@ -259,3 +263,272 @@ def test_get_feedback_no_hints():
     assert (
         "利用可能なヒントがありません" in feedback_empty or not quest_empty_hints.hints
     )
+
+
+# --- query_performance のテスト ---
+
+
+def _profile_response(took: int, bool_description: str, children: list) -> dict:
+    """プロファイル付きレスポンスを組み立てるヘルパー"""
+    return {
+        "took": took,
+        "_shards": {"total": 1, "successful": 1, "failed": 0},
+        "hits": {"total": {"value": 3}, "hits": []},
+        "profile": {
+            "shards": [
+                {
+                    "searches": [
+                        {
+                            "query": [
+                                {
+                                    "type": "BooleanQuery",
+                                    "description": bool_description,
+                                    "time_in_nanos": sum(
+                                        c["time_in_nanos"] for c in children
+                                    ),
+                                    "children": children,
+                                }
+                            ]
+                        }
+                    ]
+                }
+            ]
+        },
+    }
+
+
+FILTER_CHILDREN = [
+    {
+        "type": "TermQuery",
+        "description": "publisher.keyword:技術評論社",
+        "time_in_nanos": 100_000,
+    },
+    {
+        "type": "IndexOrDocValuesQuery",
+        "description": "pages:[400 TO 2147483647]",
+        "time_in_nanos": 200_000,
+    },
+]
+
+
+def test_evaluate_result_query_performance_filter_context():
+    """filter 句を使ったクエリは正解になる"""
+    quest = create_edge_case_quest(
+        evaluation_type="query_performance",
+        evaluation_data_raw='{"max_took_ms": 50}',
+    )
+    es_response = _profile_response(
+        5,
+        "#publisher.keyword:技術評論社 #pages:[400 TO 2147483647]",
+        FILTER_CHILDREN,
+    )
+    is_correct, message = evaluate_result(quest, es_response)
+    assert is_correct
+    assert "正解！効率的なクエリです。" in message
+
+
+def test_evaluate_result_query_performance_scoring_clauses():
+    """スコア計算が不要な条件を must に書くと減点される"""
+    quest = create_edge_case_quest(
+        evaluation_type="query_performance",
+        evaluation_data_raw='{"max_took_ms": 50, "max_scoring_filter_clauses": 0}',
+    )
+    es_response = _profile_response(
+        5,
+        "+publisher.keyword:技術評論社 +pages:[400 TO 2147483647]",
+        FILTER_CHILDREN,
+    )
+    is_correct, message = evaluate_result(quest, es_response)
+    assert not is_correct
+    assert "`filter` 句に移す" in message
+    assert "pages:[400 TO 2147483647]" in message
+
+
+def test_evaluate_result_query_performance_scoring_clauses_not_checked():
+    """max_scoring_filter_clauses を指定しない場合は句のコンテキストを評価しない"""
+    quest = create_edge_case_quest(
+        evaluation_type="query_performance",
+        evaluation_data_raw='{"max_took_ms": 50}',
+    )
+    es_response = _profile_response(
+        5,
+        "+publisher.keyword:技術評論社 +pages:[400 TO 2147483647]",
+        FILTER_CHILDREN,
+    )
+    is_correct, _ = evaluate_result(quest, es_response)
+    assert is_correct
+
+
+def test_evaluate_result_query_performance_clause_context_from_tree():
+    """句のコンテキストは部分文字列ではなく、プロファイルのツリーの句で判定する"""
+    quest = create_edge_case_quest(
+        evaluation_type="query_performance",
+        evaluation_data_raw='{"max_scoring_filter_clauses": 0}',
+    )
+    similar = {
+        "type": "TermQuery",
+        "description": "publisher.keyword:技術評論社2",
+        "time_in_nanos": 100_000,
+    }
+    # "+publisher.keyword:技術評論社" は "+publisher.keyword:技術評論社2" の一部
+    es_response = _profile_response(
+        5,
+        "#publisher.keyword:技術評論社 +publisher.keyword:技術評論社2",
+        [FILTER_CHILDREN[0], similar],
+    )
+    is_correct, message = evaluate_result(quest, es_response)
+    assert not is_correct
+    assert "技術評論社2" in message
+    assert "技術評論社," not in message
+
+    # filter 句の中の bool クエリの must 句はスコアを計算しない
+    nested = {
+        "type": "BooleanQuery",
+        "description": "+publisher.keyword:技術評論社 +pages:[400 TO 2147483647]",
+        "time_in_nanos": 300_000,
+        "children": FILTER_CHILDREN,
+    }
+    es_response = _profile_response(
+        5,
+        "#(+publisher.keyword:技術評論社 +pages:[400 TO 2147483647])",
+        [nested],
+    )
+    is_correct, _ = evaluate_result(quest, es_response)
+    assert is_correct
+    es_response = _profile_response(
+        5,
+        "+(+publisher.keyword:技術評論社 +pages:[400 TO 2147483647])^2.0",
+        [nested],
+    )
+    is_correct, message = evaluate_result(quest, es_response)
+    assert not is_correct
+    assert "pages:[400 TO 2147483647]" in message
+
+
+def test_evaluate_result_query_performance_reference_ratio():
+    """正解例のコストとの比較"""
+    quest = create_edge_case_quest(
+        evaluation_type="query_performance",
+        evaluation_data_raw='{"max_reference_ratio": 2.0}',
+    )
+    reference = _profile_response(
+        1, "#publisher.keyword:技術評論社 #pages:[400 TO 2147483647]", FILTER_CHILDREN
+    )
+    slow_children = [
+        dict(c, time_in_nanos=c["time_in_nanos"] * 3) for c in FILTER_CHILDREN
+    ]
+    slow = _profile_response(
+        1, "#publisher.keyword:技術評論社 #pages:[400 TO 2147483647]", slow_children
+    )
+    is_correct, message = evaluate_result(quest, slow, reference)
+    assert not is_correct
+    assert "正解例の 3.0 倍" in message
+
+    is_correct, _ = evaluate_result(quest, reference, reference)
+    assert is_correct
+
+    # 正解例のレスポンスが無い場合はシステムエラー
+    is_correct, message = evaluate_result(quest, reference)
+    assert not is_correct
+    assert "[System Error]" in message
+
+
+def test_evaluate_result_query_performance_without_profile():
+    """プロファイル結果が無いレスポンス"""
+    quest = create_edge_case_quest(
+        evaluation_type="query_performance",
+        evaluation_data_raw='{"max_took_ms": 50}',
+    )
+    is_correct, message = evaluate_result(quest, {"took": 1})
+    assert not is_correct
+    assert "`profile`" in message
+
+
+# --- composite のテスト ---
+
+COMPOSITE_RESPONSE = {
+    "hits": {"total": {"value": 3}, "hits": [{"_id": "1"}, {"_id": "2"}, {"_id": "3"}]},
+    "aggregations": {"max_pages": {"value": 512}},
+}
+
+
+def _composite_quest(short_circuit: bool, total: int) -> Quest:
+    criteria = [
+        {"evaluation_type": "doc_ids_include", "evaluation_data": '["1", "3"]'},
+        {"evaluation_type": "result_count", "evaluation_data": total},
+        {
+            "evaluation_type": "aggregation_result",
+            "evaluation_data": {"agg_name": "max_pages", "expected_value": 512},
+        },
+    ]
+    return create_edge_case_quest(
+        evaluation_type="composite",
+        evaluation_data_raw=json.dumps(
+            {"criteria": criteria, "short_circuit": short_circuit}
+        ),
+    )
+
+
+def test_evaluate_result_composite_all_pass():
+    """すべての評価基準を満たす場合"""
+    is_correct, message = evaluate_result(
+        _composite_quest(False, 3), COMPOSITE_RESPONSE
+    )
+    assert is_correct
+    assert "3件の評価基準をすべて満たしています" in message
+    assert "正解！ヒット数: 3" in message
+
+
+def test_evaluate_result_composite_short_circuit():
+    """short_circuit 指定時は最初の失敗で評価を打ち切る"""
+    is_correct, message = evaluate_result(_composite_quest(True, 5), COMPOSITE_RESPONSE)
+    assert not is_correct
+    assert "不正解... ヒット数: 3 (期待値: 5)" in message
+    assert "max_pages" not in message
+    assert "残り 1 件の評価基準は省略" in message
+
+    is_correct, message = evaluate_result(
+        _composite_quest(False, 5), COMPOSITE_RESPONSE
+    )
+    assert not is_correct
+    assert "max_pages" in message
+
+
+def test_evaluate_result_composite_shares_response_view(monkeypatch):
+    """ヒット情報の抽出はサブ評価の数によらず1回だけ行われる"""
+    from src.evaluators import base
+
+    calls = []
+    original = base._extract_hits_info
+
+    def counting_extract(es_response):
+        calls.append(es_response)
+        return original(es_response)
+
+    monkeypatch.setattr(base, "_extract_hits_info", counting_extract)
+    is_correct, _ = evaluate_result(_composite_quest(False, 3), COMPOSITE_RESPONSE)
+    assert is_correct
+    assert len(calls) == 1
+
+
+def test_evaluate_result_composite_invalid_criteria():
+    """評価基準の定義が不正な場合"""
+    quest = create_edge_case_quest(
+        evaluation_type="composite", evaluation_data_raw='{"criteria": []}'
+    )
+    is_correct, message = evaluate_result(quest, COMPOSITE_RESPONSE)
+    assert not is_correct
+    assert "'criteria' キーが必要です" in message
+
+
+class _TimeoutEsClient:
+    def search(self, index, body):
+        raise ConnectionTimeout("timed out")
+
+
+def test_search_latency_is_recorded_for_failed_calls():
+    before = ES_SEARCH_SECONDS.get_count(outcome="timeout")
+    with pytest.raises(ConnectionTimeout):
+        execute_query(_TimeoutEsClient(), "books", '{"query": {"match_all": {}}}')
+    assert ES_SEARCH_SECONDS.get_count(outcome="timeout") == before + 1
+    reset_circuit_breaker()
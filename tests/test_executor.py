@@ -0,0 +1,93 @@
+# tests/test_executor.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.utils.executor import (
+    BlockingCallCancelled,
+    BlockingExecutor,
+    check_cancelled,
+)
+from src.utils.log import correlation_scope, get_correlation_id
+
+
+def test_run_in_named_thread_with_context():
+    """名前付きのワーカースレッドで実行され、contextvars が引き継がれる"""
+    executor = BlockingExecutor(max_workers=2, name="test-io")
+
+    def work(value):
+        return threading.current_thread().name, get_correlation_id(), value * 2
+
+    async def scenario():
+        with correlation_scope("cid-1"):
+            return await executor.run(work, 21)
+
+    try:
+        thread_name, correlation_id, value = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert thread_name.startswith("test-io")
+    assert correlation_id == "cid-1"
+    assert value == 42
+
+
+def test_event_loop_stays_responsive():
+    """ブロッキング処理の実行中も他のタスクが進む"""
+    executor = BlockingExecutor(max_workers=1)
+
+    async def ticker(ticks):
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            ticks.append(time.perf_counter())
+
+    async def scenario():
+        ticks = []
+        await asyncio.gather(executor.run(time.sleep, 0.2), ticker(ticks))
+        return ticks
+
+    try:
+        ticks = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert len(ticks) == 5
+
+
+def test_cancel_stops_running_and_queued_work():
+    """キャンセルで実行中の処理に通知され、順番待ちの処理は実行されない"""
+    executor = BlockingExecutor(max_workers=1)
+    started = threading.Event()
+    interrupted = threading.Event()
+    queued_ran = threading.Event()
+
+    def long_work():
+        started.set()
+        try:
+            for _ in range(200):
+                check_cancelled()
+                time.sleep(0.01)
+        except BlockingCallCancelled:
+            interrupted.set()
+            raise
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.run(long_work))
+        queued = asyncio.ensure_future(executor.run(queued_ran.set))
+        await asyncio.to_thread(started.wait, 1)
+        running.cancel()
+        queued.cancel()
+        for task in (running, queued):
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert interrupted.is_set()
+    assert not queued_ran.is_set()
+
+
+def test_check_cancelled_outside_executor_is_noop():
+    check_cancelled()
@@ -0,0 +1,76 @@
+# tests/test_json_stream.py
+import io
+import json
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+from src.db.book_repository import BookRepository
+from src.utils.json_stream import iter_array_items, iter_array_items_from, load_keys
+
+PROJECT_ROOT = Path(__file__).parent.parent
+BOOKS_DIR = PROJECT_ROOT / "fixtures" / "books"
+
+TRICKY = {
+    "skip_string": 'brackets ] } [ { and "quotes" and \\ backslash あ',
+    "skip_nested": {"a": [1, {"b": "]}"}, [[], {}]], "c": None},
+    "skip_number": -12.5e3,
+    "skip_literals": [True, False, None],
+    "items": [{"id": 1, "text": 'a"b\\c'}, 1234567, "x", [1, 2], {}],
+    "after": {"value": "tail"},
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 65536])
+def test_iter_array_items_across_chunk_boundaries(chunk_size):
+    """チャンクの境界がどこにあっても json.loads と同じ結果になる"""
+    text = json.dumps(TRICKY, ensure_ascii=False, indent=2)
+    items = list(iter_array_items_from(io.StringIO(text), "items", chunk_size))
+    assert items == TRICKY["items"]
+
+
+@pytest.mark.parametrize("book_path", sorted(BOOKS_DIR.glob("*.json")))
+def test_matches_json_load_for_books(book_path):
+    with book_path.open(encoding="utf-8") as f:
+        book = json.load(f)
+    for key in ("quests", "sample_data"):
+        assert list(iter_array_items(book_path, key, chunk_size=512)) == book[key]
+    assert load_keys(book_path, ["mappings", "loadmap"], chunk_size=512) == {
+        "mappings": book["mappings"],
+        "loadmap": book.get("loadmap"),
+    }
+
+
+def test_missing_key_and_errors():
+    """キーが無い場合は空、壊れた JSON は JSONDecodeError"""
+    assert list(iter_array_items_from(io.StringIO('{"a": 1}'), "items")) == []
+    assert list(iter_array_items_from(io.StringIO("{}"), "items")) == []
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_array_items_from(io.StringIO('{"a": [1, 2'), "items"))
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_array_items_from(io.StringIO('{"items": {"a": 1}}'), "items"))
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_array_items_from(io.StringIO("[1, 2]"), "items"))
+
+
+def test_load_quests_does_not_materialize_sample_data(tmp_path):
+    """大きな sample_data を持つブックでもクエストの読み込みは少ないメモリで済む"""
+    with (BOOKS_DIR / "default.json").open(encoding="utf-8") as f:
+        book = json.load(f)
+    # sample_data を前に置き、約 8MB に増やす
+    big_book = {
+        "sample_data": [{"_id": i, "text": "x" * 1000} for i in range(8000)],
+        "quests": book["quests"],
+    }
+    path = tmp_path / "big_book.json"
+    path.write_text(json.dumps(big_book), encoding="utf-8")
+
+    tracemalloc.start()
+    try:
+        quests = BookRepository(path).load_quests()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(quests) == len(book["quests"])
+    assert peak < 1024 * 1024
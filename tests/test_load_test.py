@@ -0,0 +1,76 @@
+# tests/test_load_test.py
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+from src.db.book_repository import BookRepository
+from src.misc.load_test import (
+    CallbackStats,
+    LoadTestConfig,
+    LoopLagSampler,
+    format_report,
+    make_wrong_query,
+    run_load_test,
+)
+
+PROJECT_ROOT = Path(__file__).parent.parent
+BOOK_FILE = PROJECT_ROOT / "fixtures" / "books" / "default.json"
+RECORDED_FILE = PROJECT_ROOT / "fixtures" / "tests" / "recorded_responses.json"
+
+
+def test_lag_sampler_detects_blocking():
+    """ループを同期処理で止めると遅延として記録される"""
+
+    async def scenario():
+        sampler = LoopLagSampler(interval_seconds=0.01)
+        sampler.start()
+        await asyncio.sleep(0.03)
+        time.sleep(0.1)  # イベントループをブロックする
+        await asyncio.sleep(0.03)
+        await sampler.stop()
+        return sampler.summary()
+
+    summary = asyncio.run(scenario())
+    assert summary["samples"] > 0
+    assert summary["max_ms"] >= 50
+
+
+def test_callback_stats_summary():
+    stats = CallbackStats()
+    for seconds in (0.1, 0.2, 0.3):
+        stats.record(seconds)
+    stats.record(1.0, failed=True)
+    summary = stats.summary(elapsed_seconds=2.0)
+    assert summary["count"] == 4
+    assert summary["errors"] == 1
+    assert summary["per_second"] == 2.0
+    assert summary["max_ms"] == 1000.0
+
+
+def test_make_wrong_query_changes_conditions():
+    """誤答クエリは正解例と異なる JSON になる"""
+    for quest in BookRepository(BOOK_FILE).load_quests():
+        wrong = make_wrong_query(quest)
+        assert json.loads(wrong) != json.loads(quest.correct_query)
+
+
+def test_run_load_test_with_replay():
+    """記録済みレスポンスとスタブのエージェントで短時間の負荷試験が完走する"""
+    pytest.importorskip("gradio")
+    pytest.importorskip("agents")
+    config = LoadTestConfig(
+        students=3,
+        duration_seconds=0.5,
+        book_path=BOOK_FILE,
+        think_time_seconds=0.01,
+        agent_latency_seconds=0.0,
+        replay_path=RECORDED_FILE,
+        seed=0,
+    )
+    report = asyncio.run(run_load_test(config))
+    assert report["callbacks"]["load_quest"]["count"] > 0
+    assert report["callbacks"]["submit_answer"]["errors"] == 0
+    assert "event loop lag" in format_report(report)
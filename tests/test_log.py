@@ -0,0 +1,121 @@
+# tests/test_log.py
+import io
+import json
+import logging
+import threading
+
+from src.utils.log import (
+    LazyJson,
+    SamplingFilter,
+    configure_logging,
+    correlation_scope,
+    get_correlation_id,
+)
+
+
+def _read_lines(stream: io.StringIO) -> list:
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_json_lines_with_correlation_id():
+    """JSON Lines で出力され、相関IDと extra が含まれる"""
+    stream = io.StringIO()
+    configure_logging(
+        level="INFO",
+        log_format="json",
+        sample_rate=1.0,
+        stream=stream,
+        background=False,
+    )
+    logger = logging.getLogger("src.test_log")
+    with correlation_scope("req-1") as correlation_id:
+        assert get_correlation_id() == correlation_id == "req-1"
+        logger.info("hello %s", "world", extra={"quest_id": 3})
+    logger.info("outside")
+    assert get_correlation_id() is None
+
+    first, second = _read_lines(stream)
+    assert first["message"] == "hello world"
+    assert first["correlation_id"] == "req-1"
+    assert first["quest_id"] == 3
+    assert first["level"] == "INFO"
+    assert "correlation_id" not in second
+
+
+def test_lazy_json_is_not_formatted_when_disabled():
+    """レベルが無効なログでは LazyJson の整形が行われない"""
+
+    class Exploding:
+        def __iter__(self):
+            raise AssertionError("should not be formatted")
+
+    stream = io.StringIO()
+    configure_logging(level="INFO", stream=stream, background=False)
+    logging.getLogger("src.test_log").debug("query: %s", LazyJson(Exploding()))
+    assert stream.getvalue() == ""
+    assert str(LazyJson({"a": "日本語"})) == '{"a": "日本語"}'
+
+
+def test_sampling_filter_keeps_warnings():
+    """サンプリングしても WARNING 以上は必ず出力される"""
+    sampling = SamplingFilter(0.0)
+    info = logging.LogRecord("src", logging.INFO, "", 0, "info", (), None)
+    warning = logging.LogRecord("src", logging.WARNING, "", 0, "warn", (), None)
+    assert not sampling.filter(info)
+    assert sampling.filter(warning)
+
+
+def test_background_writer_flushes_on_reconfigure():
+    """バックグラウンド書き込みでも相関IDが保たれ、再設定時に書き出される"""
+    stream = io.StringIO()
+    configure_logging(level="INFO", stream=stream)
+    with correlation_scope("req-bg"):
+        logging.getLogger("src.test_log").info("queued")
+    configure_logging(level="INFO", stream=io.StringIO(), background=False)
+    (entry,) = _read_lines(stream)
+    assert entry["message"] == "queued"
+    assert entry["correlation_id"] == "req-bg"
+
+
+def test_background_writer_formats_off_the_calling_thread():
+    """バックグラウンド書き込みでは整形は書き込みスレッドで行い、exc_info を保つ"""
+    formatted_on = []
+
+    class Recording(LazyJson):
+        def __str__(self):
+            formatted_on.append(threading.current_thread())
+            return "lazy"
+
+    stream = io.StringIO()
+    configure_logging(level="INFO", stream=stream)
+    logger = logging.getLogger("src.test_log")
+    logger.info("value: %s", Recording(None))
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("failed")
+    configure_logging(level="INFO", stream=io.StringIO(), background=False)
+
+    info, error = _read_lines(stream)
+    assert info["message"] == "value: lazy"
+    assert formatted_on and threading.current_thread() not in formatted_on
+    assert error["message"] == "failed"
+    assert "ValueError: boom" in error["exc_info"]
+
+
+def test_background_writer_keeps_arguments_as_logged():
+    """ログ出力後に変更された引数は、ログに渡した時点の内容で出力される"""
+    stream = io.StringIO()
+    configure_logging(level="INFO", stream=stream)
+    logger = logging.getLogger("src.test_log")
+    hits = ["a"]
+    body = {"size": 1}
+    logger.info("hits=%s count=%d ratio=%.1f", hits, 2, 0.5)
+    logger.info("body=%(body)r", {"body": body})
+    hits.append("b")
+    body["size"] = 2
+    configure_logging(level="INFO", stream=io.StringIO(), background=False)
+
+    first, second = _read_lines(stream)
+    assert first["message"] == "hits=['a'] count=2 ratio=0.5"
+    assert second["message"] == "body={'size': 1}"
@@ -0,0 +1,66 @@
+# tests/test_loop_monitor.py
+import asyncio
+import time
+
+from src.utils import loop_monitor
+from src.utils.loop_monitor import LoopMonitor, ensure_loop_monitor
+from src.utils.metrics import LOOP_BLOCKED, LOOP_LAG_SECONDS
+
+
+def blocking_work(seconds: float) -> None:
+    """イベントループをブロックする同期処理"""
+    time.sleep(seconds)
+
+
+def test_debug_monitor_reports_blocking_site():
+    """デバッグモードではブロッキングした関数がスタック付きで報告される"""
+
+    async def scenario():
+        monitor = LoopMonitor(
+            asyncio.get_running_loop(),
+            debug=True,
+            threshold_seconds=0.05,
+            interval_seconds=0.01,
+        )
+        monitor.start()
+        await asyncio.sleep(0.03)
+        blocking_work(0.2)
+        await asyncio.sleep(0.03)
+        monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(scenario())
+    assert len(monitor.reports) == 1
+    report = monitor.reports[0]
+    assert report.site == "tests/test_loop_monitor.py:blocking_work"
+    assert report.blocked_seconds >= 0.05
+    assert "blocking_work" in report.format_stack()
+    assert LOOP_BLOCKED.get(site=report.site) >= 1
+
+
+def test_production_mode_records_lag_only(monkeypatch):
+    """on モードでは遅延のヒストグラムだけを記録し、ループごとに1つだけ起動する"""
+    monkeypatch.setenv(loop_monitor.LOOP_MONITOR_ENV_VAR, "on")
+    before = LOOP_LAG_SECONDS.get_count()
+
+    async def scenario():
+        monitor = ensure_loop_monitor()
+        assert ensure_loop_monitor() is monitor
+        monitor.interval_seconds = 0.01
+        await asyncio.sleep(0.1)
+        monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(scenario())
+    assert not monitor.debug
+    assert monitor.reports == []
+    assert LOOP_LAG_SECONDS.get_count() > before
+
+
+def test_monitor_disabled_by_default(monkeypatch):
+    monkeypatch.delenv(loop_monitor.LOOP_MONITOR_ENV_VAR, raising=False)
+
+    async def scenario():
+        return ensure_loop_monitor()
+
+    assert asyncio.run(scenario()) is None
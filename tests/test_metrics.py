@@ -0,0 +1,83 @@
+# tests/test_metrics.py
+import asyncio
+import inspect
+
+import pytest
+
+from src.utils.metrics import MetricsRegistry, track_callback
+
+
+def test_render_prometheus_text():
+    """Prometheus テキスト形式で出力できる"""
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "テスト用カウンター", ["quest_id"])
+    gauge = registry.gauge("test_depth", "テスト用ゲージ")
+    histogram = registry.histogram("test_seconds", "テスト用", buckets=(0.1, 1.0))
+    counter.inc(quest_id=1)
+    counter.inc(2, quest_id=1)
+    gauge.inc()
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    text = registry.render()
+    assert "# TYPE test_total counter" in text
+    assert 'test_total{quest_id="1"} 3' in text
+    assert "test_depth 1" in text
+    assert 'test_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_seconds_bucket{le="1"} 2' in text
+    assert 'test_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_seconds_count 3" in text
+    assert "test_seconds_sum 5.55" in text
+
+
+def test_label_mismatch_raises():
+    """定義と異なるラベルは ValueError"""
+    registry = MetricsRegistry()
+    counter = registry.counter("labels_total", "ラベル", ["a"])
+    with pytest.raises(ValueError):
+        counter.inc(b=1)
+    with pytest.raises(ValueError):
+        registry.counter("labels_total", "重複")
+
+
+def test_track_callback_keeps_function_kind():
+    """デコレータは async generator を async generator のまま保つ"""
+
+    @track_callback("test_gen")
+    async def gen(x):
+        yield x
+        yield x + 1
+
+    @track_callback("test_coro")
+    async def coro(x):
+        return x * 2
+
+    assert inspect.isasyncgenfunction(gen)
+    assert inspect.iscoroutinefunction(coro)
+
+    async def main():
+        return [item async for item in gen(1)], await coro(2)
+
+    assert asyncio.run(main()) == ([1, 2], 4)
+
+
+def test_queue_depth_is_restored_when_session_is_abandoned():
+    """受信を途中で打ち切っても、送信待ちのメッセージ数は元に戻る"""
+    from src.ui_actions import QueuedQuestView
+    from src.utils.metrics import QUEUE_DEPTH
+
+    async def scenario():
+        before = QUEUE_DEPTH.get()
+        view = QueuedQuestView()
+        for message in ("a", "b", "c"):
+            await view.send_message(message)
+        messages = view.receive_messages()
+        assert await messages.__anext__() == "a"
+        await messages.aclose()
+        # 打ち切った後に送信されたメッセージは数えない
+        await view.send_message("d")
+        return before, QUEUE_DEPTH.get()
+
+    before, after = asyncio.run(scenario())
+    assert after == before
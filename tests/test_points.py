@@ -0,0 +1,164 @@
+# tests/test_points.py
+import asyncio
+import dataclasses
+import sqlite3
+
+from src.db.attempt_store import AttemptStore
+from src.db.points import Leaderboard, PointsEngine, calculate_points
+from src.services.quest_service import QuestService
+
+
+def test_calculate_points_decreases_with_attempts():
+    assert calculate_points(1, 1) == 100
+    assert calculate_points(3, 1) == 300
+    assert calculate_points(3, 2) == 240
+    # 減点しても最低限のポイントは付与する
+    assert calculate_points(1, 100) == 20
+    assert calculate_points(0, 1) == 100
+
+
+def test_leaderboard_ranks_ties_and_updates():
+    board = Leaderboard()
+    for user_id, points in [("a", 100), ("b", 300), ("c", 100), ("d", 50)]:
+        board.update(user_id, points)
+    assert [board.rank(u) for u in "abcd"] == [2, 1, 2, 4]
+    assert board.rank("unknown") is None
+
+    board.update("d", 400)
+    assert board.rank("d") == 1
+    assert [(e.rank, e.user_id, e.points) for e in board.top(3)] == [
+        (1, "d", 400),
+        (2, "b", 300),
+        (3, "a", 100),
+    ]
+    # 途中から取り出しても、同点の順位は offset より前の同点に揃う
+    assert [(e.rank, e.user_id) for e in board.top(2, offset=3)] == [(3, "c")]
+    assert len(board) == 4
+
+
+def test_award_once_per_quest_and_reload(tmp_path, quest_repository):
+    db_path = tmp_path / "attempts.db"
+    quest = dataclasses.replace(quest_repository.get_quest_by_id(1), difficulty=2)
+    store = AttemptStore(db_path)
+    engine = PointsEngine(store)
+    award = engine.award("alice", quest, attempt_number=2)
+    assert (award.points, award.total, award.rank) == (160, 160, 1)
+    # 同じクエストの2回目の正解にはポイントを付与しない
+    assert engine.award("alice", quest, attempt_number=3) is None
+    assert engine.award("bob", quest, attempt_number=1).rank == 1
+    store.close()
+    engine.close()
+
+    # 再起動後も累計と付与済みのクエストが引き継がれる
+    store = AttemptStore(db_path)
+    engine = PointsEngine(store)
+    try:
+        assert engine.leaderboard.score("alice") == 160
+        assert engine.leaderboard.rank("alice") == 2
+        assert engine.award("alice", quest, attempt_number=1) is None
+    finally:
+        store.close()
+        engine.close()
+
+
+def test_sync_picks_up_totals_from_other_processes(tmp_path, quest_repository):
+    """別のワーカーが書き込んだ累計を、sync で差分だけ取り込む"""
+    db_path = tmp_path / "attempts.db"
+    quest = quest_repository.get_quest_by_id(1)
+    store_a, store_b = AttemptStore(db_path), AttemptStore(db_path)
+    engine_a, engine_b = PointsEngine(store_a), PointsEngine(store_b)
+    try:
+        engine_b.award("bob", quest, attempt_number=1)
+        store_b.flush()
+        assert engine_a.leaderboard.score("bob") is None
+        assert engine_a.sync() >= 1
+        assert engine_a.leaderboard.score("bob") == 100
+    finally:
+        for closable in (store_a, store_b, engine_a, engine_b):
+            closable.close()
+
+
+def test_same_clear_on_two_workers_is_counted_once(tmp_path, quest_repository):
+    """別々のワーカーで同じクエストを正解しても、DB の累計には1回だけ加える"""
+    db_path = tmp_path / "attempts.db"
+    quest = quest_repository.get_quest_by_id(1)
+    other = quest_repository.get_quest_by_id(2)
+    store_a, store_b = AttemptStore(db_path), AttemptStore(db_path)
+    engine_a, engine_b = PointsEngine(store_a), PointsEngine(store_b)
+    try:
+        engine_a.award("alice", quest, attempt_number=1)
+        store_a.flush()
+        # engine_b は alice の正解を知らないため、暫定の累計には加える
+        assert engine_b.award("alice", quest, attempt_number=1).total == 100
+        engine_b.award("alice", other, attempt_number=1)
+        engine_b.sync()
+        engine_a.sync()
+        for engine in (engine_a, engine_b):
+            assert engine.leaderboard.score("alice") == 200
+    finally:
+        for closable in (store_a, store_b, engine_a, engine_b):
+            closable.close()
+
+
+def test_clears_are_kept_per_book(tmp_path, quest_repository):
+    db_path = tmp_path / "attempts.db"
+    quest = quest_repository.get_quest_by_id(1)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        """
+        CREATE TABLE quest_clears (
+            user_id TEXT NOT NULL, quest_id INTEGER NOT NULL,
+            attempt_number INTEGER NOT NULL, points INTEGER NOT NULL,
+            cleared_at REAL NOT NULL, PRIMARY KEY (user_id, quest_id)
+        );
+        INSERT INTO quest_clears VALUES ('alice', 1, 1, 100, 0);
+        """
+    )
+    conn.close()
+    store = AttemptStore(db_path)
+    engine = PointsEngine(store)
+    try:
+        # ブックの列が無い記録は既定のブックの正解として扱う
+        assert engine.award("alice", quest, attempt_number=1) is None
+        award = engine.award("alice", quest, attempt_number=1, book="part2")
+        assert award is not None
+        assert engine.award("alice", quest, attempt_number=2, book="part2") is None
+    finally:
+        store.close()
+        engine.close()
+
+
+class _ThreeHitsEsClient:
+    def search(self, index, body):
+        hits = [{"_id": str(i), "_source": {}} for i in range(3)]
+        return {"took": 1, "hits": {"total": {"value": 3}, "hits": hits}}
+
+
+def test_quest_service_awards_points_on_first_correct_answer(
+    tmp_path, quest_repository
+):
+    store = AttemptStore(tmp_path / "attempts.db")
+    engine = PointsEngine(store)
+    quest = quest_repository.get_quest_by_id(1)
+    service = QuestService(
+        quest_repository,
+        _ThreeHitsEsClient(),
+        "books",
+        attempt_store=store,
+        user_id="alice",
+        points_engine=engine,
+    )
+    query = '{"query": {"match_all": {}}}'
+
+    async def scenario():
+        return [await service.execute_and_evaluate(quest, query) for _ in range(2)]
+
+    try:
+        first, second = asyncio.run(scenario())
+    finally:
+        store.close()
+        engine.close()
+    assert first[0] and second[0]
+    assert "100 ポイント獲得" in first[2]
+    assert "ポイント獲得" not in second[2]
+    assert engine.leaderboard.score("alice") == 100
@@ -0,0 +1,274 @@
+# tests/test_query_analyzer.py
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from src.db.book_repository import BookRepository
+from src.es.query_analyzer import (
+    QueryLimits,
+    analyze_query,
+    apply_limits,
+    evict_field_types,
+    get_field_types,
+    mapping_field_types,
+)
+from src.exceptions import InvalidQueryError, QueryRejectedError
+from src.services.core_logic import execute_query
+from src.services.quest_service import QuestService
+
+BOOKS_DIR = Path(__file__).parent.parent / "fixtures" / "books"
+LIMITS = QueryLimits()
+
+
+def _field_types(book_repo: BookRepository):
+    return mapping_field_types({"books": {"mappings": book_repo.load_mappings()}})
+
+
+@pytest.mark.parametrize("book", ["default.json", "part2.json"])
+def test_book_answers_are_accepted(book):
+    book_repo = BookRepository(BOOKS_DIR / book)
+    field_types = _field_types(book_repo)
+    for quest in book_repo.load_quests():
+        analysis = analyze_query(json.loads(quest.correct_query), LIMITS, field_types)
+        assert not analysis.rejected, (quest.quest_id, analysis.violations)
+
+
+@pytest.mark.parametrize(
+    "body, expected",
+    [
+        ({"size": 5000, "query": {"match_all": {}}}, "size (5000)"),
+        ({"from": 990, "size": 20}, "from + size (1010)"),
+        # 数値の文字列や小数も整数として検査する
+        ({"size": "5000"}, "size (5000)"),
+        ({"from": 990.0, "size": "20"}, "from + size (1010)"),
+        ({"size": "many"}, "size ('many') は整数で指定してください"),
+        ({"size": 10.5}, "size (10.5) は整数で指定してください"),
+        (
+            {"query": {"wildcard": {"author.keyword": {"value": "*毅"}}}},
+            "先頭がワイルドカード",
+        ),
+        ({"query": {"regexp": {"isbn": ".*123"}}}, "regexp"),
+        (
+            {"query": {"query_string": {"query": "title:*検索 AND author:佐藤"}}},
+            "先頭がワイルドカードの語を含む query_string",
+        ),
+        (
+            {"query": {"simple_query_string": {"query": "?lastic"}}},
+            "先頭がワイルドカードの語を含む simple_query_string",
+        ),
+        (
+            {
+                "runtime_mappings": {
+                    f"field_{i}": {"type": "long", "script": {"source": "emit(1)"}}
+                    for i in range(21)
+                }
+            },
+            "推定コスト (1050)",
+        ),
+        (
+            {
+                "size": 0,
+                "aggs": {
+                    "by_author": {
+                        "terms": {"field": "author.keyword", "size": 100},
+                        "aggs": {
+                            "by_publisher": {
+                                "terms": {"field": "publisher.keyword", "size": 100}
+                            }
+                        },
+                    }
+                },
+            },
+            "バケット数 (推定 10100)",
+        ),
+        ({"size": 0, "aggs": {"a": {"terms": {"field": "author"}}}}, "text フィールド"),
+        (
+            {
+                "knn": {
+                    "field": "metric_vector",
+                    "query_vector": [1, 2],
+                    "k": 5,
+                    "num_candidates": 5000,
+                }
+            },
+            "num_candidates (5000)",
+        ),
+        (
+            {"query": {"bool": {"filter": [{"script": {"script": "1"}}] * 30}}},
+            "推定コスト (1500)",
+        ),
+        (
+            {"size": 0, "aggs": {"top": {"top_hits": {"size": 5000}}}},
+            "top_hits の size (5000)",
+        ),
+        (
+            {
+                "query": {
+                    "nested": {
+                        "path": "reviews",
+                        "query": {"match_all": {}},
+                        "inner_hits": {"size": 500},
+                    }
+                }
+            },
+            "inner_hits の size (500)",
+        ),
+        (
+            {
+                "collapse": {
+                    "field": "author.keyword",
+                    "inner_hits": [{"name": "latest", "size": 1000}],
+                }
+            },
+            "inner_hits の size (1000)",
+        ),
+        (
+            {"query": {"intervals": {"title": {"wildcard": {"pattern": "*検索"}}}}},
+            "先頭がワイルドカードの wildcard クエリ",
+        ),
+        (
+            {
+                "query": {
+                    "intervals": {
+                        "title": {
+                            "all_of": {
+                                "intervals": [
+                                    {"match": {"query": "検索"}},
+                                    {"regexp": {"pattern": ".*エンジン"}},
+                                ]
+                            }
+                        }
+                    }
+                }
+            },
+            '".*" で始まる regexp クエリ',
+        ),
+        (
+            {"query": {"intervals": {"title": {"prefix": {"prefix": ""}}}}},
+            "空の prefix",
+        ),
+    ],
+)
+def test_expensive_queries_are_rejected(body, expected):
+    field_types = _field_types(BookRepository(BOOKS_DIR / "default.json"))
+    analysis = analyze_query(body, LIMITS, field_types)
+    assert analysis.rejected
+    assert expected in analysis.message()
+
+
+@pytest.mark.parametrize(
+    "query_string",
+    [
+        {"query": "*"},
+        {"query": "title:検索*"},
+        {"query": "title:*", "default_field": "title"},
+        {"query": '"*検索"'},
+        {"query": "*検索", "allow_leading_wildcard": False},
+    ],
+)
+def test_query_string_without_leading_wildcard_is_accepted(query_string):
+    analysis = analyze_query({"query": {"query_string": query_string}}, LIMITS)
+    assert not analysis.rejected, analysis.violations
+
+
+def test_forbidden_query_types():
+    limits = QueryLimits(forbidden_query_types=frozenset({"script_score"}))
+    body = {
+        "query": {
+            "script_score": {"query": {"match_all": {}}, "script": {"source": "1"}}
+        }
+    }
+    assert analyze_query(body, limits).violations == [
+        "script_score クエリは使用できません。"
+    ]
+    assert not analyze_query(body, LIMITS).rejected
+
+
+def test_timeout_is_injected_and_capped():
+    body = {"query": {"match_all": {}}}
+    assert apply_limits(body, LIMITS) == {
+        "query": {"match_all": {}},
+        "timeout": "5s",
+        "terminate_after": 100000,
+    }
+    assert "timeout" not in body
+    assert apply_limits({"timeout": "500ms"}, LIMITS)["timeout"] == "500ms"
+    assert apply_limits({"timeout": "1m"}, LIMITS)["timeout"] == "5s"
+    assert apply_limits({"timeout": "-1"}, LIMITS)["timeout"] == "5s"
+
+
+def test_terminate_after_is_injected_and_capped():
+    assert apply_limits({"terminate_after": 50}, LIMITS)["terminate_after"] == 50
+    assert apply_limits({"terminate_after": 10**9}, LIMITS)["terminate_after"] == (
+        100000
+    )
+    assert apply_limits({"terminate_after": 0}, LIMITS)["terminate_after"] == 100000
+    unlimited = QueryLimits(terminate_after=0)
+    assert "terminate_after" not in apply_limits({}, unlimited)
+
+
+class _Indices:
+    def __init__(self):
+        self.calls = 0
+
+    def get_mapping(self, index):
+        self.calls += 1
+        return {
+            index: {
+                "mappings": {
+                    "properties": {
+                        "author": {
+                            "type": "text",
+                            "fields": {"keyword": {"type": "keyword"}},
+                        }
+                    }
+                }
+            }
+        }
+
+
+class _RecordingEsClient:
+    def __init__(self):
+        self.indices = _Indices()
+        self.bodies = []
+
+    def search(self, index, body):
+        self.bodies.append(body)
+        return {"took": 1, "hits": {"total": {"value": 0}, "hits": []}}
+
+
+def test_execute_query_checks_before_sending():
+    evict_field_types()
+    client = _RecordingEsClient()
+    with pytest.raises(QueryRejectedError) as excinfo:
+        execute_query(client, "books", '{"size": 10000}', limits=LIMITS)
+    assert isinstance(excinfo.value, InvalidQueryError)
+    assert client.bodies == []
+
+    execute_query(client, "books", '{"query": {"match_all": {}}}', limits=LIMITS)
+    assert client.bodies == [
+        {"query": {"match_all": {}}, "timeout": "5s", "terminate_after": 100000}
+    ]
+    # マッピングはインデックスごとに1回だけ取得する
+    assert get_field_types(client, "books") == {
+        "author": "text",
+        "author.keyword": "keyword",
+    }
+    assert client.indices.calls == 1
+    evict_field_types("books")
+
+
+def test_quest_service_reports_rejection(quest_repository):
+    client = _RecordingEsClient()
+    service = QuestService(quest_repository, client, "books", query_limits=LIMITS)
+    quest = quest_repository.get_quest_by_id(1)
+    is_correct, message, _, response = asyncio.run(
+        service.execute_and_evaluate(quest, '{"size": 10000}')
+    )
+    evict_field_types("books")
+    assert not is_correct
+    assert response is None
+    assert "size (10000) が上限 100 を超えています" in message
+    assert client.bodies == []
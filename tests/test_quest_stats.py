@@ -0,0 +1,214 @@
+# tests/test_quest_stats.py
+import asyncio
+import sqlite3
+import time
+
+from src.db.achievements import AttemptEvent
+from src.db.attempt_store import DEFAULT_BOOK, AttemptStore
+from src.db.quest_stats import SECONDS_PER_DAY, QuestStatsStore
+from src.services.quest_service import QuestService
+
+NOW = time.time() - 3600
+
+
+def _event(
+    user_id, attempt_number, is_correct, created_at, quest_id=1, book=DEFAULT_BOOK
+):
+    return AttemptEvent(
+        user_id=user_id,
+        quest_id=quest_id,
+        attempt_number=attempt_number,
+        is_correct=is_correct,
+        difficulty=1,
+        evaluation_type="result_count",
+        created_at=created_at,
+        book=book,
+    )
+
+
+def _scenario(stats_store):
+    # alice: 3回目 (120秒後) に正解、bob: 1回目で正解、carol: 未正解
+    events = [
+        _event("alice", 1, False, NOW),
+        _event("alice", 2, False, NOW + 60),
+        _event("alice", 3, True, NOW + 120),
+        _event("alice", 4, True, NOW + 130),
+        _event("bob", 1, True, NOW + 10),
+        _event("carol", 1, False, NOW - 20 * SECONDS_PER_DAY),
+    ]
+    for event in events:
+        stats_store.record(event)
+
+
+def test_incremental_stats(tmp_path):
+    store = AttemptStore(tmp_path / "attempts.db")
+    stats_store = QuestStatsStore(store)
+    try:
+        assert stats_store.get(1) is None
+        _scenario(stats_store)
+        stats = stats_store.get(1)
+        assert (stats.attempts, stats.correct_attempts) == (6, 3)
+        assert (stats.attempted_users, stats.solved_users) == (3, 2)
+        assert round(stats.pass_rate, 2) == 0.67
+        # 正解までの提出回数は [1, 3] の下側の中央値
+        assert stats.median_attempts_to_solve == 1
+        # 所要時間は [0秒, 120秒] の下側の中央値 (0秒の区間の中央)
+        assert stats.median_seconds_to_solve == 0.5
+        assert "正解 2 人" in stats.summary()
+        assert stats_store.get(2) is None
+    finally:
+        store.close()
+        stats_store.close()
+
+
+def test_stats_are_reloaded_from_aggregates(tmp_path):
+    """再起動後も (提出の記録を走査せずに) 同じ統計になり、続きを集計できる"""
+    db_path = tmp_path / "attempts.db"
+    store = AttemptStore(db_path)
+    stats_store = QuestStatsStore(store)
+    _scenario(stats_store)
+    expected = stats_store.get(1)
+    store.close()
+    stats_store.close()
+
+    store = AttemptStore(db_path)
+    reloaded = QuestStatsStore(store)
+    try:
+        stats = reloaded.get(1)
+        assert (stats.attempts, stats.solved_users) == (6, 2)
+        assert stats.median_attempts_to_solve == expected.median_attempts_to_solve
+        assert stats.median_seconds_to_solve == expected.median_seconds_to_solve
+        # 正解済みのユーザーは二重に数えない
+        reloaded.record(_event("bob", 2, True, NOW + 20))
+        assert reloaded.get(1).solved_users == 2
+        reloaded.record(_event("carol", 2, True, NOW + 20))
+        assert reloaded.get(1).solved_users == 3
+    finally:
+        store.close()
+        reloaded.close()
+
+
+def test_rolling_windows_and_other_workers(tmp_path):
+    db_path = tmp_path / "attempts.db"
+    store_a, store_b = AttemptStore(db_path), AttemptStore(db_path)
+    worker_a, worker_b = QuestStatsStore(store_a), QuestStatsStore(store_b)
+    try:
+        worker_a.record(_event("alice", 1, False, NOW - 10 * SECONDS_PER_DAY))
+        worker_a.record(_event("alice", 2, True, NOW))
+        windows = {w.days: w for w in worker_a.get(1).windows}
+        assert (windows[7].attempts, windows[7].solves) == (1, 1)
+        assert windows[30].attempts == 2
+
+        worker_b.record(_event("bob", 1, True, NOW))
+        store_b.flush()
+        worker_a.refresh()
+        stats = worker_a.get(1)
+        assert (stats.attempted_users, stats.attempts) == (2, 3)
+        assert {w.days: w.solves for w in stats.windows} == {7: 2, 30: 2}
+    finally:
+        for closable in (store_a, store_b, worker_a, worker_b):
+            closable.close()
+
+
+def test_same_user_on_two_workers_is_counted_once(tmp_path):
+    db_path = tmp_path / "attempts.db"
+    store_a, store_b = AttemptStore(db_path), AttemptStore(db_path)
+    worker_a, worker_b = QuestStatsStore(store_a), QuestStatsStore(store_b)
+    try:
+        worker_a.record(_event("alice", 1, False, NOW))
+        worker_a.record(_event("alice", 2, True, NOW + 60))
+        store_a.flush()
+        # worker_b は alice の提出を知らないが、DB の集計では二重に数えない
+        worker_b.record(_event("alice", 3, False, NOW + 70))
+        worker_b.record(_event("alice", 4, True, NOW + 80))
+        store_b.flush()
+        for worker in (worker_a, worker_b):
+            worker.refresh()
+            stats = worker.get(1)
+            assert (stats.attempts, stats.correct_attempts) == (4, 2)
+            assert (stats.attempted_users, stats.solved_users) == (1, 1)
+            assert stats.median_attempts_to_solve == 2
+            assert {w.days: w.solves for w in stats.windows} == {7: 1, 30: 1}
+    finally:
+        for closable in (store_a, store_b, worker_a, worker_b):
+            closable.close()
+
+
+def test_stats_are_kept_per_book(tmp_path):
+    db_path = tmp_path / "attempts.db"
+    store = AttemptStore(db_path)
+    stats_store = QuestStatsStore(store)
+    try:
+        stats_store.record(_event("alice", 1, True, NOW, book="part2"))
+        # 別のブックの同じ ID のクエストの提出は、既定のブックの統計に入らない
+        assert stats_store.get(1) is None
+        assert stats_store.get(1, "part2").solved_users == 1
+        stats_store.record(_event("alice", 1, False, NOW + 10))
+        assert stats_store.get(1).attempted_users == 1
+        assert stats_store.get(1).solved_users == 0
+        stats_store.refresh()
+        assert stats_store.get(1).solved_users == 0
+        assert stats_store.get(1, "part2").solved_users == 1
+    finally:
+        store.close()
+        stats_store.close()
+
+
+def test_stats_without_book_are_migrated_to_default_book(tmp_path):
+    db_path = tmp_path / "attempts.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        """
+        CREATE TABLE quest_stats (
+            quest_id INTEGER PRIMARY KEY, attempts INTEGER NOT NULL,
+            correct_attempts INTEGER NOT NULL, attempted_users INTEGER NOT NULL,
+            solved_users INTEGER NOT NULL
+        );
+        INSERT INTO quest_stats VALUES (1, 3, 1, 2, 1);
+        CREATE TABLE quest_stats_progress (
+            user_id TEXT NOT NULL, quest_id INTEGER NOT NULL,
+            first_attempt_at REAL NOT NULL, solved INTEGER NOT NULL,
+            PRIMARY KEY (user_id, quest_id)
+        ) WITHOUT ROWID;
+        INSERT INTO quest_stats_progress VALUES ('alice', 1, 0, 1);
+        """
+    )
+    conn.close()
+    store = AttemptStore(db_path)
+    stats_store = QuestStatsStore(store)
+    try:
+        stats = stats_store.get(1)
+        assert (stats.attempts, stats.attempted_users, stats.solved_users) == (3, 2, 1)
+        # 移した進捗も使われる (正解済みのユーザーは二重に数えない)
+        stats_store.record(_event("alice", 2, True, NOW))
+        assert stats_store.get(1).solved_users == 1
+    finally:
+        store.close()
+        stats_store.close()
+
+
+class _NoHitsEsClient:
+    def search(self, index, body):
+        return {"took": 1, "hits": {"total": {"value": 0}, "hits": []}}
+
+
+def test_quest_service_updates_stats(tmp_path, quest_repository):
+    store = AttemptStore(tmp_path / "attempts.db")
+    stats_store = QuestStatsStore(store)
+    service = QuestService(
+        quest_repository,
+        _NoHitsEsClient(),
+        "books",
+        attempt_store=store,
+        user_id="alice",
+        quest_stats=stats_store,
+    )
+    quest = quest_repository.get_quest_by_id(1)
+    try:
+        asyncio.run(service.execute_and_evaluate(quest, '{"query": {}}'))
+    finally:
+        store.close()
+        stats_store.close()
+    stats = stats_store.get(1)
+    assert (stats.attempts, stats.attempted_users, stats.solved_users) == (1, 1, 0)
+    assert stats.pass_rate == 0.0
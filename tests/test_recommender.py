@@ -0,0 +1,174 @@
+# tests/test_recommender.py
+import asyncio
+from pathlib import Path
+
+from src.db.achievements import AttemptEvent
+from src.db.attempt_store import AttemptStore
+from src.db.quest_repository import QuestRepository
+from src.services.quest_service import QuestService
+from src.services.recommender import (
+    Recommender,
+    SkillGraph,
+    find_recommender,
+    get_recommender,
+)
+
+
+def _event(user_id, quest, attempt_number, is_correct):
+    return AttemptEvent.from_result(user_id, quest, attempt_number, is_correct)
+
+
+def test_skill_graph_uses_loadmap_and_difficulty(quest_repository):
+    graph = SkillGraph(quest_repository.get_all_quests(), quest_repository.loadmap)
+    assert "knn" in graph.skills and "match_phrase" in graph.skills
+    # "match" は1章、"match_phrase" は2章、"knn" は4章で学ぶ
+    assert graph.chapter[graph.index[1]] == 1
+    assert graph.chapter[graph.index[5]] == 2
+    assert graph.chapter[graph.index[17]] == 4
+    # 1つ下の難易度でスキルが重なるクエストが前提になる
+    assert graph.prerequisites(4) == [2, 14]
+    assert graph.prerequisites(18) == [17]
+    assert graph.prerequisites(1) == []
+
+
+def test_recommendations_follow_mastery(tmp_path, quest_repository):
+    store = AttemptStore(tmp_path / "attempts.db")
+    recommender = Recommender(store, quest_repository)
+    try:
+        first = recommender.recommend("alice", k=3)
+        assert len(first) == 3
+        assert all(r.quest.difficulty == 1 for r in first)
+
+        for quest_id in (1, 2, 9, 14):
+            quest = quest_repository.get_quest_by_id(quest_id)
+            store.record("alice", quest_id, True, "{}")
+            recommender.observe(_event("alice", quest, 1, True))
+        recommended = recommender.recommend("alice", k=5)
+        ids = [r.quest.quest_id for r in recommended]
+        assert not {1, 2, 9, 14} & set(ids)
+        # 難易度 1 を解き終えたので、次は難易度 2 のまだ習っていないスキルのクエスト
+        assert all(r.quest.difficulty == 2 for r in recommended)
+        assert ids[0] == 3
+        scores = [r.score for r in recommended]
+        assert scores == sorted(scores, reverse=True)
+    finally:
+        store.close()
+        recommender.close()
+
+
+def test_user_state_is_loaded_from_attempts(tmp_path, quest_repository):
+    store = AttemptStore(tmp_path / "attempts.db")
+    for quest_id in (1, 2, 9, 14):
+        store.record("bob", quest_id, True, "{}")
+    store.record("bob", 3, False, "{}")
+    recommender = Recommender(store, quest_repository)
+    try:
+        # 記録から作成した状態と、提出ごとに更新した状態は一致する
+        loaded = [r.quest.quest_id for r in recommender.recommend("bob", k=5)]
+        live = Recommender(store, quest_repository)
+        live.recommend("carol")
+        for quest_id, is_correct in ((1, 1), (2, 1), (9, 1), (14, 1), (3, 0)):
+            quest = quest_repository.get_quest_by_id(quest_id)
+            live.observe(_event("carol", quest, 1, bool(is_correct)))
+        assert [r.quest.quest_id for r in live.recommend("carol", k=5)] == loaded
+        live.close()
+    finally:
+        store.close()
+        recommender.close()
+
+
+class _ThreeHitsEsClient:
+    def search(self, index, body):
+        hits = [{"_id": str(i), "_source": {}} for i in range(3)]
+        return {"took": 1, "hits": {"total": {"value": 3}, "hits": hits}}
+
+
+def test_quest_service_suggests_next_quest(tmp_path, quest_repository):
+    store = AttemptStore(tmp_path / "attempts.db")
+    recommender = Recommender(store, quest_repository)
+    service = QuestService(
+        quest_repository,
+        _ThreeHitsEsClient(),
+        "books",
+        attempt_store=store,
+        user_id="alice",
+        recommender=recommender,
+    )
+    quest = quest_repository.get_quest_by_id(1)
+    try:
+        is_correct, _, feedback, _ = asyncio.run(
+            service.execute_and_evaluate(quest, '{"query": {}}')
+        )
+    finally:
+        store.close()
+        recommender.close()
+    assert is_correct
+    assert "次のおすすめ: クエスト" in feedback
+    assert "クエスト 1 " not in feedback
+
+
+def test_recommenders_are_kept_per_book(tmp_path, quest_repository):
+    books_dir = Path(__file__).parent.parent / "fixtures" / "books"
+    other_repository = QuestRepository(books_dir / "part2.json")
+    store = AttemptStore(tmp_path / "attempts.db")
+    try:
+        default = get_recommender(store, "default", quest_repository)
+        default.recommend("alice")
+        default.observe(_event("alice", quest_repository.get_quest_by_id(1), 1, True))
+        graph = default.graph
+        # 別のブックを使っても、元のブックのグラフとユーザーの状態は残る
+        part2 = get_recommender(store, "part2", other_repository)
+        assert part2 is not default
+        assert part2.graph.quests == other_repository.get_all_quests()
+        assert get_recommender(store, "default", quest_repository) is default
+        assert find_recommender(store, "default") is default
+        assert default.graph is graph
+        assert "alice" in default._users
+    finally:
+        store.close()
+
+
+def test_attempts_of_other_books_are_not_replayed(tmp_path, quest_repository):
+    books_dir = Path(__file__).parent.parent / "fixtures" / "books"
+    other_repository = QuestRepository(books_dir / "part2.json")
+    store = AttemptStore(tmp_path / "attempts.db")
+    for quest in other_repository.get_all_quests():
+        store.record("alice", quest.quest_id, True, "{}", book="part2")
+    recommender = Recommender(store, quest_repository)
+    try:
+        # 別のブックで同じ ID のクエストを解いても、このブックでは未回答のまま
+        first = recommender.recommend("alice", k=3)
+        assert len(first) == 3
+        assert all(r.quest.difficulty == 1 for r in first)
+        quest = other_repository.get_all_quests()[0]
+        event = AttemptEvent.from_result("alice", quest, 1, True, book="part2")
+        recommender.observe(event)
+        assert recommender.recommend("alice", k=3) == first
+    finally:
+        store.close()
+        recommender.close()
+
+
+def test_attempt_observed_while_loading_is_not_lost(tmp_path, quest_repository):
+    store = AttemptStore(tmp_path / "attempts.db")
+    quest = quest_repository.get_quest_by_id(1)
+
+    class _Racing(Recommender):
+        raced = False
+
+        def _load_user(self, graph, user_id):
+            if not self.raced:
+                # 記録を読み込んでいる間に提出が届く
+                self.raced = True
+                store.record(user_id, 1, True, "{}")
+                self.observe(_event(user_id, quest, 1, True))
+            return super()._load_user(graph, user_id)
+
+    recommender = _Racing(store, quest_repository)
+    try:
+        ids = [r.quest.quest_id for r in recommender.recommend("alice", k=20)]
+        assert 1 not in ids
+        assert not recommender._loading
+    finally:
+        store.close()
+        recommender.close()
@@ -0,0 +1,203 @@
+# tests/test_resilience.py
+import asyncio
+
+import pytest
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig
+from elasticsearch import ApiError, ConnectionError, ConnectionTimeout
+
+from src.config import AppConfig
+from src.db.attempt_store import AttemptStore
+from src.es import resilience
+from src.es.resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    configure_resilience,
+    es_operation,
+    get_circuit_breaker,
+    is_unavailable_error,
+    reset_circuit_breaker,
+)
+from src.exceptions import CircuitOpenError, ElasticsearchError
+from src.services.core_logic import execute_query
+from src.services.quest_service import QuestService
+
+
+@pytest.fixture(autouse=True)
+def _reset_breaker():
+    reset_circuit_breaker()
+    yield
+    reset_circuit_breaker()
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _api_error(status: int) -> ApiError:
+    meta = ApiResponseMeta(
+        status=status,
+        http_version="1.1",
+        headers=HttpHeaders(),
+        duration=0.0,
+        node=NodeConfig("http", "localhost", 9200),
+    )
+    return ApiError("error", meta, {})
+
+
+def test_breaker_opens_after_consecutive_failures():
+    clock = _Clock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30.0, clock=clock)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    # 成功すると失敗の回数は数え直す
+    breaker.before_call()
+    breaker.record_success()
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    clock.now += 10
+    with pytest.raises(CircuitOpenError, match="20 秒ほどで再試行") as excinfo:
+        breaker.before_call()
+    assert isinstance(excinfo.value, ElasticsearchError)
+    assert breaker.status() == {"state": OPEN, "failures": 3, "retry_in": 20.0}
+
+
+def test_half_open_allows_a_single_trial():
+    clock = _Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0, clock=clock)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
+    # 試しのリクエストが終わるまでは他のリクエストは送信しない
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_disabled_breaker_never_opens():
+    breaker = CircuitBreaker(failure_threshold=0)
+    for _ in range(100):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_only_unavailability_counts_as_failure():
+    assert is_unavailable_error(ConnectionError("refused"))
+    assert is_unavailable_error(ConnectionTimeout("timed out"))
+    assert is_unavailable_error(_api_error(503))
+    assert is_unavailable_error(_api_error(429))
+    assert not is_unavailable_error(_api_error(400))
+    assert not is_unavailable_error(ValueError("bad query"))
+
+
+def test_unrelated_errors_do_not_close_the_breaker():
+    clock = _Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0, clock=clock)
+    resilience._breaker = breaker
+    breaker.record_failure()
+    clock.now += 30
+    # 呼び出し元のエラーやキャンセルでは成功とみなさない
+    for error in (ValueError("bad body"), KeyboardInterrupt()):
+        with pytest.raises(type(error)):
+            with es_operation(None, "search"):
+                raise error
+        assert breaker.state == HALF_OPEN
+    # 応答のあったエラーは成功として数える
+    with pytest.raises(ApiError):
+        with es_operation(None, "search"):
+            raise _api_error(400)
+    assert breaker.state == CLOSED
+
+
+class _OptionsClient:
+    def __init__(self):
+        self.options_calls = []
+
+    def options(self, **kwargs):
+        self.options_calls.append(kwargs)
+        return self
+
+
+def test_operation_timeouts_come_from_config():
+    configure_resilience(
+        AppConfig(
+            ES_QUEST_ES_SEARCH_TIMEOUT=3,
+            ES_QUEST_ES_BULK_TIMEOUT=90,
+            ES_QUEST_ES_BREAKER_FAILURES=2,
+        )
+    )
+    client = _OptionsClient()
+    with es_operation(client, "search") as search_client:
+        assert search_client is client
+    with es_operation(client, "bulk"):
+        pass
+    assert client.options_calls == [{"request_timeout": 3.0}, {"request_timeout": 90.0}]
+    assert get_circuit_breaker().failure_threshold == 2
+
+
+class _FailingEsClient:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def search(self, index, body):
+        self.calls += 1
+        raise self.error
+
+
+def test_execute_query_fails_fast_while_cluster_is_down():
+    client = _FailingEsClient(ConnectionTimeout("timed out"))
+    for _ in range(get_circuit_breaker().failure_threshold):
+        with pytest.raises(ConnectionTimeout):
+            execute_query(client, "books", '{"query": {"match_all": {}}}')
+    calls = client.calls
+    with pytest.raises(CircuitOpenError):
+        execute_query(client, "books", '{"query": {"match_all": {}}}')
+    assert client.calls == calls
+    assert resilience.ES_REJECTED.get(operation="search") >= 1
+
+
+def test_query_errors_do_not_open_the_breaker():
+    client = _FailingEsClient(_api_error(400))
+    for _ in range(get_circuit_breaker().failure_threshold + 1):
+        with pytest.raises(ApiError):
+            execute_query(client, "books", '{"query": {"match_all": {}}}')
+    assert get_circuit_breaker().state == CLOSED
+
+
+def test_quest_service_does_not_record_while_cluster_is_down(
+    tmp_path, quest_repository
+):
+    breaker = get_circuit_breaker()
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    store = AttemptStore(tmp_path / "attempts.db")
+    client = _FailingEsClient(ConnectionError("refused"))
+    service = QuestService(
+        quest_repository, client, "books", attempt_store=store, user_id="alice"
+    )
+    quest = quest_repository.get_quest_by_id(1)
+    try:
+        with pytest.raises(CircuitOpenError):
+            asyncio.run(service.execute_and_evaluate(quest, '{"query": {}}'))
+        assert store.attempt_count("alice", 1) == 0
+    finally:
+        store.close()
+    assert client.calls == 0
@@ -0,0 +1,105 @@
+# tests/test_serve.py
+import asyncio
+
+import httpx
+import pytest
+
+from src.serve import WORKER_COOKIE, WorkerPool, create_proxy_app
+
+WORKERS = ["http://worker0", "http://worker1", "http://worker2"]
+
+
+def _backend(down=()):
+    """どのワーカーに届いたかを返すスタブのワーカー群"""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        worker = request.url.host
+        if worker in down:
+            raise httpx.ConnectError("connection refused", request=request)
+        body = (
+            f"{worker} {request.method} {request.url.path}?{request.url.query.decode()}"
+        )
+        content = f"{body} {request.content.decode()}".encode()
+        # 実際のワーカーと同じくストリーミングの応答を返す
+        return httpx.Response(200, stream=httpx.ByteStream(content))
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def _run(app, requests):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://proxy"
+        ) as client:
+            return [await request(client) for request in requests]
+
+    return asyncio.run(scenario())
+
+
+def test_worker_pool_round_robin_and_sticky():
+    pool = WorkerPool(WORKERS)
+    assert [pool.choose(None) for _ in range(4)] == [0, 1, 2, 0]
+    assert pool.choose("2") == 2
+    assert pool.choose("9") == 1
+    pool.mark_down(2)
+    assert pool.choose("2") == 0
+
+
+def test_worker_pool_requires_workers():
+    with pytest.raises(ValueError):
+        WorkerPool([])
+
+
+def test_sticky_session_by_cookie():
+    """最初の応答で Cookie が付き、以降は同じワーカーに振り分けられる"""
+    app = create_proxy_app(WORKERS, client=_backend())
+
+    async def first(client):
+        return await client.post("/gradio_api/queue/join?a=1", content="payload")
+
+    async def second(client):
+        return await client.get("/gradio_api/queue/data", params={"session": "s"})
+
+    responses = _run(app, [first, second, second])
+    assert responses[0].text == "worker0 POST /gradio_api/queue/join?a=1 payload"
+    assert responses[0].cookies[WORKER_COOKIE] == "0"
+    assert responses[1].text.startswith("worker0 GET /gradio_api/queue/data")
+    assert responses[2].text.startswith("worker0 GET")
+
+
+def test_new_clients_are_distributed():
+    app = create_proxy_app(WORKERS, client=_backend())
+
+    async def fresh(client):
+        client.cookies.clear()
+        return await client.get("/")
+
+    responses = _run(app, [fresh, fresh, fresh])
+    assert [r.cookies[WORKER_COOKIE] for r in responses] == ["0", "1", "2"]
+
+
+def test_failover_when_worker_is_down():
+    """Cookie のワーカーが落ちていたら別のワーカーに振り分け直す"""
+    app = create_proxy_app(WORKERS, client=_backend(down={"worker1"}))
+
+    async def pinned(client):
+        client.cookies.set(WORKER_COOKIE, "1")
+        return await client.get("/")
+
+    (response,) = _run(app, [pinned])
+    assert response.status_code == 200
+    assert response.text.startswith("worker0")
+    assert response.cookies[WORKER_COOKIE] == "0"
+
+
+def test_all_workers_down():
+    app = create_proxy_app(
+        WORKERS, client=_backend(down={"worker0", "worker1", "worker2"})
+    )
+
+    async def request(client):
+        return await client.get("/")
+
+    (response,) = _run(app, [request])
+    assert response.status_code == 502
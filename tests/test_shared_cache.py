@@ -0,0 +1,158 @@
+# tests/test_shared_cache.py
+import asyncio
+import json
+import multiprocessing
+import time
+
+from src.models.quest import Quest
+from src.services.agent_service import AgentService
+from src.services.quest_service import QuestService
+from src.utils.shared_cache import SHARED_CACHE_ENV_VAR, SharedCache, get_shared_cache
+
+
+def _writer(path, key, value):
+    SharedCache(path).set("ns", key, value)
+
+
+def test_set_get_and_clear(tmp_path):
+    cache = SharedCache(tmp_path / "cache.sqlite3")
+    assert cache.get("ns", "a") is None
+    cache.set("ns", "a", {"hits": [1, 2], "名前": "値"})
+    cache.set("other", "a", 1)
+    assert cache.get("ns", "a") == {"hits": [1, 2], "名前": "値"}
+
+    cache.clear("ns")
+    assert cache.get("ns", "a") is None
+    assert cache.get("other", "a") == 1
+
+
+def test_ttl_expires(tmp_path):
+    cache = SharedCache(tmp_path / "cache.sqlite3")
+    cache.set("ns", "a", 1, ttl=-1)
+    cache.set("ns", "b", 2, ttl=60)
+    assert cache.get("ns", "a") is None
+    assert cache.get("ns", "b") == 2
+    assert cache.purge_expired() == 1
+
+
+def test_shared_between_processes(tmp_path):
+    """別プロセスが書き込んだ値を読める (WAL モード)"""
+    path = tmp_path / "cache.sqlite3"
+    cache = SharedCache(path)
+    context = multiprocessing.get_context("spawn")
+    process = context.Process(target=_writer, args=(path, "k", {"from": "child"}))
+    process.start()
+    process.join(30)
+    assert process.exitcode == 0
+    assert cache.get("ns", "k") == {"from": "child"}
+    mode = cache._connection().execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "wal"
+
+
+def test_get_shared_cache_from_env(tmp_path, monkeypatch):
+    monkeypatch.delenv(SHARED_CACHE_ENV_VAR, raising=False)
+    assert get_shared_cache() is None
+    monkeypatch.setenv(SHARED_CACHE_ENV_VAR, str(tmp_path / "cache.sqlite3"))
+    cache = get_shared_cache()
+    assert cache is not None
+    assert get_shared_cache() is cache
+    cache.set("ns", "t", time.time())
+
+
+class _CountingEsClient:
+    """search の呼び出しを記録するスタブ"""
+
+    def __init__(self):
+        self.bodies = []
+
+    def search(self, index, body):
+        self.bodies.append(body)
+        return {"took": 3, "hits": {"total": {"value": 0}, "hits": []}, "profile": {}}
+
+
+def _performance_quest():
+    return Quest(
+        quest_id=99,
+        title="t",
+        description="d",
+        difficulty=1,
+        query_type_hint=None,
+        correct_query=json.dumps({"query": {"match_all": {}}}),
+        evaluation_type="query_performance",
+        evaluation_data_raw=json.dumps({"max_reference_ratio": 2.0}),
+        hints_raw=None,
+        created_at="",
+        updated_at="",
+    )
+
+
+def test_reference_response_is_shared(tmp_path, monkeypatch):
+    """正解例の実行結果は共有キャッシュに保存され、別のサービスからも使われる"""
+    monkeypatch.setenv(SHARED_CACHE_ENV_VAR, str(tmp_path / "cache.sqlite3"))
+    quest = _performance_quest()
+    user_queries = [
+        json.dumps({"query": {"term": {"name": name}}}) for name in ("x", "y")
+    ]
+    clients = [_CountingEsClient(), _CountingEsClient()]
+
+    async def scenario():
+        for client, user_query in zip(clients, user_queries):
+            await QuestService(None, client, "books").execute_and_evaluate(
+                quest, user_query
+            )
+
+    asyncio.run(scenario())
+    # 1つ目はユーザーのクエリと正解例、2つ目はユーザーのクエリのみ
+    assert len(clients[0].bodies) == 2
+    assert len(clients[1].bodies) == 1
+
+
+def test_user_query_response_is_shared_by_fingerprint(tmp_path, monkeypatch):
+    """書き方だけが違うクエリは、別のサービスでも同じ実行結果を使う"""
+    monkeypatch.setenv(SHARED_CACHE_ENV_VAR, str(tmp_path / "cache.sqlite3"))
+    quest = _performance_quest()
+    user_queries = [
+        json.dumps({"query": {"term": {"name": "x"}}}),
+        json.dumps({"query": {"term": {"name": {"value": "x"}}}}, indent=2),
+    ]
+    clients = [_CountingEsClient(), _CountingEsClient()]
+
+    async def scenario():
+        return [
+            await QuestService(None, client, "books").execute_and_evaluate(
+                quest, user_query
+            )
+            for client, user_query in zip(clients, user_queries)
+        ]
+
+    first, second = asyncio.run(scenario())
+    assert len(clients[0].bodies) == 2
+    assert clients[1].bodies == []
+    assert first[:2] == second[:2]
+
+
+def test_agent_feedback_is_shared_by_fingerprint(tmp_path, monkeypatch):
+    monkeypatch.setenv(SHARED_CACHE_ENV_VAR, str(tmp_path / "cache.sqlite3"))
+    quest = _performance_quest()
+    calls = []
+
+    async def run_agent(self, quest, user_query, rule_eval_message):
+        calls.append(user_query)
+        return f"feedback {len(calls)}"
+
+    monkeypatch.setattr(AgentService, "_run_evaluation_agent", run_agent)
+    service = AgentService(None, None)
+
+    async def scenario():
+        return [
+            await service.run_evaluation_agent(quest, user_query, message)
+            for user_query, message in [
+                ('{"query": {"term": {"name": "x"}}}', "正解"),
+                ('{"query":{"term":{"name":{"value":"x"}}}}', "正解"),
+                ('{"query": {"term": {"name": "x"}}}', "不正解"),
+            ]
+        ]
+
+    # 評価の結果が変わった場合はエージェントを実行し直す
+    assert asyncio.run(scenario()) == ["feedback 1", "feedback 1", "feedback 2"]
+    assert len(calls) == 2
@@ -0,0 +1,40 @@
+# tests/test_skiplist.py
+import bisect
+import random
+
+import pytest
+
+from src.utils.skiplist import IndexableSkiplist
+
+
+def test_matches_sorted_list_under_random_operations():
+    """挿入・削除を繰り返しても、ソート済みリストと同じ順位・位置を返す"""
+    rng = random.Random(0)
+    skiplist = IndexableSkiplist(seed=1)
+    expected = []
+    for _ in range(3000):
+        value = rng.randrange(200)
+        if expected and rng.random() < 0.4:
+            victim = rng.choice(expected)
+            skiplist.remove(victim)
+            expected.remove(victim)
+        else:
+            skiplist.insert(value)
+            bisect.insort(expected, value)
+        probe = rng.randrange(200)
+        assert skiplist.bisect_left(probe) == bisect.bisect_left(expected, probe)
+    assert len(skiplist) == len(expected)
+    assert list(skiplist) == expected
+    assert [skiplist[i] for i in range(len(expected))] == expected
+    assert skiplist[-1] == expected[-1]
+    assert list(skiplist.iter_from(10)) == expected[10:]
+
+
+def test_remove_missing_value_and_index_out_of_range():
+    skiplist = IndexableSkiplist()
+    skiplist.insert(1)
+    with pytest.raises(ValueError):
+        skiplist.remove(2)
+    with pytest.raises(IndexError):
+        skiplist[1]
+    assert list(skiplist.iter_from(5)) == []
@@ -0,0 +1,140 @@
+# tests/test_sqlite_quest_repository.py
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from src.bootstrap import initialize_database
+from src.config import load_config
+from src.db.connection_pool import ConnectionPool
+from src.db.quest_repository import QuestRepository
+from src.db.sqlite_quest_repository import (
+    SqliteQuestRepository,
+    get_sqlite_quest_repository,
+    import_books,
+    main,
+)
+from src.exceptions import DatabaseError, QuestNotFoundError
+from src.services.quest_service import QuestService
+
+BOOKS_DIR = Path(__file__).parent.parent / "fixtures" / "books"
+BOOKS = [BOOKS_DIR / "default.json", BOOKS_DIR / "part2.json"]
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = tmp_path / "catalog.db"
+    assert import_books(path, BOOKS) == {"default": 20, "part2": 40}
+    return path
+
+
+def test_same_quests_as_json_backend(catalog):
+    pool = ConnectionPool(catalog, size=2)
+    try:
+        for book_path in BOOKS:
+            expected = QuestRepository(book_path)
+            repository = SqliteQuestRepository(pool, book_path.stem)
+            assert repository.quests == expected.quests
+            assert repository.get_all_quests() == expected.get_all_quests()
+            assert repository.get_quest_by_id("3") == expected.get_quest_by_id(3)
+            assert repository.get_quest_by_id(999) is None
+            assert repository.get_quest_by_id("abc") is None
+            assert repository.get_quests_by_difficulty(1) == [
+                q for q in expected.get_all_quests() if q.difficulty == 1
+            ]
+    finally:
+        pool.close()
+
+
+def test_reimport_replaces_only_that_book(catalog):
+    import_books(catalog, [BOOKS[0]])
+    pool = ConnectionPool(catalog)
+    try:
+        assert len(SqliteQuestRepository(pool, "default").quests) == 20
+        assert len(SqliteQuestRepository(pool, "part2").quests) == 40
+        with pytest.raises(FileNotFoundError):
+            SqliteQuestRepository(pool, "missing")
+    finally:
+        pool.close()
+
+
+def test_pool_limits_connections_across_threads(catalog):
+    pool = ConnectionPool(catalog, size=2)
+    repository = SqliteQuestRepository(pool, "part2")
+    thread_ids = set()
+    lock = threading.Lock()
+
+    def lookup(quest_id):
+        with lock:
+            thread_ids.add(threading.get_ident())
+        return repository.get_quest_by_id(quest_id).quest_id
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            ids = list(executor.map(lookup, [i % 40 + 1 for i in range(400)]))
+        assert ids == [i % 40 + 1 for i in range(400)]
+        assert len(pool._all) <= 2
+        # 読み込み専用の接続なので書き込みはできない
+        with pool.connection() as conn, pytest.raises(Exception):
+            conn.execute("DELETE FROM catalog_quests")
+    finally:
+        pool.close()
+
+
+def test_pool_timeout_raises_database_error(catalog):
+    pool = ConnectionPool(catalog, size=1, timeout_seconds=0.05)
+    try:
+        with pool.connection():
+            with pytest.raises(DatabaseError, match="貸し出し中"):
+                with pool.connection():
+                    pass
+    finally:
+        pool.close()
+
+
+def test_fetch_quest_reads_catalog_off_the_event_loop(catalog):
+    pool = ConnectionPool(catalog)
+    repository = SqliteQuestRepository(pool, "part2")
+    lookup_threads = []
+    get_quest_by_id = repository.get_quest_by_id
+
+    def recording_lookup(quest_id):
+        lookup_threads.append(threading.get_ident())
+        return get_quest_by_id(quest_id)
+
+    repository.get_quest_by_id = recording_lookup
+    service = QuestService(repository, None, "books")
+
+    async def fetch():
+        quest = await service.fetch_quest(3)
+        with pytest.raises(QuestNotFoundError):
+            await service.fetch_quest(999)
+        return quest, threading.get_ident()
+
+    try:
+        quest, loop_thread = asyncio.run(fetch())
+    finally:
+        pool.close()
+    assert quest.quest_id == 3
+    assert len(lookup_threads) == 2
+    assert loop_thread not in lookup_threads
+
+
+def test_import_command(tmp_path):
+    catalog_path = tmp_path / "catalog.db"
+    result = CliRunner().invoke(main, [str(BOOKS[0]), "--db", str(catalog_path)])
+    assert result.exit_code == 0, result.output
+    assert "default: 20 quests" in result.output
+
+
+def test_backend_is_selected_by_config(catalog, monkeypatch):
+    monkeypatch.setenv("ES_QUEST_REPOSITORY_BACKEND", "sqlite")
+    monkeypatch.setenv("ES_QUEST_CATALOG_PATH", str(catalog))
+    config = load_config(book_path_override=BOOKS[1])
+    repository = asyncio.run(initialize_database(config))
+    assert isinstance(repository, SqliteQuestRepository)
+    assert repository.book == "part2"
+    assert repository is get_sqlite_quest_repository(catalog, "part2")
@@ -0,0 +1,59 @@
+# tests/test_startup.py
+"""
+起動時間の予算テスト。
+
+CLI で1件採点するだけの場合に、重い依存 (openai-agents SDK、MCP クライアント、
+Gradio、numpy) を読み込まないこと、インポート時に .env を読み込まないことを確認する。
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# CLI のインポートにかけてよい時間 (秒)。遅い環境では環境変数で緩められる
+IMPORT_BUDGET_SECONDS = float(os.environ.get("ES_QUEST_IMPORT_BUDGET_SECONDS", "2.0"))
+
+HEAVY_MODULES = ("agents", "agents.mcp", "mcp", "gradio", "openai", "numpy")
+
+
+def _run_python(code: str) -> str:
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": str(PROJECT_ROOT)},
+    )
+    return result.stdout.strip()
+
+
+def test_cli_import_skips_heavy_dependencies():
+    """src.cli のインポートでは重い依存を読み込まない"""
+    loaded = _run_python(
+        "import sys, src.cli\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    assert loaded == ""
+
+
+def test_config_import_does_not_load_env():
+    """.env はインポート時ではなく load_env() の呼び出し時に読み込む"""
+    loaded = _run_python("import src.config\nprint(src.config._env_loaded)")
+    assert loaded == "False"
+
+
+def test_cli_import_within_budget():
+    """src.cli のインポート時間が予算内に収まる"""
+    elapsed = float(
+        _run_python(
+            "import time\n"
+            "started = time.perf_counter()\n"
+            "import src.cli\n"
+            "print(time.perf_counter() - started)"
+        )
+    )
+    assert elapsed < IMPORT_BUDGET_SECONDS, f"import src.cli took {elapsed:.2f}s"
@@ -0,0 +1,74 @@
+# tests/test_timing.py
+import asyncio
+
+from src.utils import timing
+
+
+def test_span_is_noop_when_disabled():
+    """記録もリスナーも無い場合は共有の何もしないスパンが返る"""
+    assert timing.current_recorder() is None
+    assert timing.span("a") is timing.span("b")
+    with timing.recording("disabled", enabled=False) as recorder:
+        assert recorder is None
+        with timing.span("noop"):
+            pass
+
+
+def test_recording_collects_spans():
+    """記録中のスパンが内訳として保持される"""
+    with timing.recording("test", enabled=True) as recorder:
+        with timing.span("first"):
+            pass
+        second = timing.span("second")
+        second.finish()
+        second.finish()  # 二重に終了しても1回だけ記録される
+        timing.record_span("measured", 0.5)
+    assert timing.current_recorder() is None
+    names = [name for name, _ in recorder.breakdown()]
+    assert names == ["first", "second", "measured"]
+    assert recorder.breakdown()[-1][1] == 500.0
+    assert "test total=" in recorder.format()
+
+
+def test_recording_enabled_by_env(monkeypatch):
+    """環境変数で計測を有効化できる"""
+    monkeypatch.setenv(timing.TIMING_ENV_VAR, "1")
+    with timing.recording("env") as recorder:
+        assert recorder is not None
+    monkeypatch.setenv(timing.TIMING_ENV_VAR, "0")
+    with timing.recording("env") as recorder:
+        assert recorder is None
+
+
+def test_recording_is_isolated_per_task():
+    """非同期タスクごとに別々の記録になる"""
+
+    async def run(name):
+        with timing.recording(name, enabled=True) as recorder:
+            with timing.span(f"{name}.span"):
+                await asyncio.sleep(0)
+        return recorder
+
+    async def main():
+        return await asyncio.gather(run("a"), run("b"))
+
+    recorder_a, recorder_b = asyncio.run(main())
+    assert [n for n, _ in recorder_a.breakdown()] == ["a.span"]
+    assert [n for n, _ in recorder_b.breakdown()] == ["b.span"]
+
+
+def test_span_listener():
+    """リスナーは記録の有無によらずスパン終了時に呼び出される"""
+    received = []
+
+    def listener(name, seconds):
+        received.append(name)
+
+    timing.add_span_listener(listener)
+    try:
+        with timing.span("listened"):
+            pass
+    finally:
+        timing.remove_span_listener(listener)
+    assert received == ["listened"]
+    assert timing.span("after") is timing.span("after2")